@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Recall-vs-latency benchmark for the capsule ANN index against brute force.
+
+Example: python scripts/bench_capsule_ann.py --rows 50000 --dim 768 --nprobe 4 8 16
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'server'))
+
+from app.services.runtime.ann_index import BruteForceIndex, IVFIndex  # noqa: E402
+from app.services.runtime.vectors import normalize_vector  # noqa: E402
+
+
+def _dataset(rows: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, size=rows)
+    data = centers[labels] + rng.normal(scale=0.6, size=(rows, dim))
+    return data.astype(np.float32)
+
+
+def _timed_search(index: BruteForceIndex, queries: np.ndarray, k: int) -> tuple[list[set[int]], list[float]]:
+    results: list[set[int]] = []
+    latencies: list[float] = []
+    for q in queries:
+        started = time.perf_counter()
+        hits = index.search(q, k)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        results.append({cid for cid, _ in hits})
+    return results, latencies
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare IVF capsule index recall and latency with the brute-force path.')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--clusters', type=int, default=64)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=300, help='candidate set size handed to the multi-factor scorer')
+    parser.add_argument('--nlist', type=int, default=0)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    data = _dataset(args.rows, args.dim, args.clusters, args.seed)
+    queries = np.vstack([normalize_vector(v) for v in _dataset(args.queries, args.dim, args.clusters, args.seed + 1)])
+
+    brute = BruteForceIndex()
+    started = time.perf_counter()
+    for i, vec in enumerate(data):
+        brute.add(i, 0, normalize_vector(vec))
+    print(f'brute build: {(time.perf_counter() - started):.2f}s rows={args.rows} dim={args.dim}')
+    truth, brute_lat = _timed_search(brute, queries, args.k)
+    print(f'brute      p50={statistics.median(brute_lat):7.2f}ms p95={np.percentile(brute_lat, 95):7.2f}ms recall=1.000')
+
+    for nprobe in args.nprobe:
+        ivf = IVFIndex(nlist=args.nlist, nprobe=nprobe)
+        started = time.perf_counter()
+        for i, vec in enumerate(data):
+            ivf.add(i, 0, normalize_vector(vec))
+        build_s = time.perf_counter() - started
+        found, lat = _timed_search(ivf, queries, args.k)
+        recall = statistics.mean(len(f & t) / max(1, len(t)) for f, t in zip(found, truth))
+        print(
+            f'ivf nprobe={nprobe:<3} p50={statistics.median(lat):7.2f}ms p95={np.percentile(lat, 95):7.2f}ms '
+            f'recall={recall:.3f} lists={ivf._centroids.shape[0]} build={build_s:.2f}s'
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Mixed read/write concurrency benchmark for the SQLite engine profiles.
+
+Reader threads page through run traces the way list endpoints do, while
+writer threads append traces and update a watched row the way the mission
+watcher does. Compares the legacy rollback-journal engine with the WAL
+profile (tuned pragmas, read-only pool, serialized writer).
+
+Example: python scripts/bench_db_concurrency.py --readers 6 --writers 3 --seconds 5
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'server'))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlmodel import Session, SQLModel, select  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db import _build_engine, writer_gate  # noqa: E402
+from app.models import IntegrationRun, RunTrace  # noqa: E402
+
+
+def _seed(engine, runs: int, traces: int) -> None:
+    SQLModel.metadata.create_all(engine, tables=[RunTrace.__table__, IntegrationRun.__table__])
+    with Session(engine) as session:
+        session.add_all([IntegrationRun(mission_title=f'mission {i}') for i in range(runs)])
+        session.add_all([RunTrace(run_id=i % runs, event_type='seed', payload_json='{"n": %d}' % i) for i in range(traces)])
+        session.commit()
+
+
+def _bench(profile: str, args: argparse.Namespace) -> None:
+    settings.agentora_db_serialize_writes = profile == 'wal'
+    path = Path(tempfile.mkdtemp(prefix='agentora-dbbench-')) / 'bench.db'
+    url = f'sqlite:///{path}'
+    writer = _build_engine(url, profile=profile)
+    _seed(writer, args.runs, args.traces)
+    reader = _build_engine(url, read_only=True, profile=profile) if profile == 'wal' else writer
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies: dict[str, list[float]] = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+
+    def record(kind: str, started: float, ok: bool) -> None:
+        with lock:
+            if ok:
+                latencies[kind].append((time.perf_counter() - started) * 1000.0)
+            else:
+                errors[kind] += 1
+
+    def read_loop(seed: int) -> None:
+        i = seed
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with Session(reader) as session:
+                    list(session.exec(select(RunTrace).where(RunTrace.run_id == i % args.runs).order_by(RunTrace.id.desc()).limit(50)))
+                    list(session.exec(select(IntegrationRun).order_by(IntegrationRun.updated_at.desc()).limit(20)))
+                record('read', started, True)
+            except OperationalError:
+                record('read', started, False)
+            i += 1
+
+    def write_loop(seed: int) -> None:
+        i = seed
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with Session(writer) as session:
+                    run = session.get(IntegrationRun, 1 + i % args.runs)
+                    run.refresh_count += 1
+                    session.add(run)
+                    session.add_all([RunTrace(run_id=run.id, event_type='watch', payload_json='{}') for _ in range(args.batch)])
+                    session.commit()
+                record('write', started, True)
+            except OperationalError:
+                record('write', started, False)
+            i += 1
+
+    threads = [threading.Thread(target=read_loop, args=(n,)) for n in range(args.readers)]
+    threads += [threading.Thread(target=write_loop, args=(n,)) for n in range(args.writers)]
+    gate_before = writer_gate.stats()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    for kind in ('read', 'write'):
+        lat = sorted(latencies[kind]) or [0.0]
+        p95 = lat[max(0, int(len(lat) * 0.95) - 1)]
+        print(
+            f'{profile:<7} {kind:<5} ops/s={len(latencies[kind]) / args.seconds:8.1f}  p50={statistics.median(lat):7.2f}ms  '
+            f'p95={p95:7.2f}ms  max={lat[-1]:8.2f}ms  locked_errors={errors[kind]}'
+        )
+    if profile == 'wal':
+        gate = writer_gate.stats()
+        print(f'{profile:<7} gate  contended={gate["contended"] - gate_before["contended"]}  timeouts={gate["timeouts"] - gate_before["timeouts"]}')
+    writer.dispose()
+    if reader is not writer:
+        reader.dispose()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare legacy and WAL SQLite engine profiles under mixed concurrent load.')
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=3)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--traces', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=5, help='trace rows appended per write transaction')
+    parser.add_argument('--profiles', nargs='+', default=['legacy', 'wal'])
+    args = parser.parse_args()
+    for profile in args.profiles:
+        _bench(profile, args)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Step-latency benchmark: layered_retrieval with inline side-effect writes vs the write-behind queue.
+
+Example: python scripts/bench_retrieval_write_behind.py --capsules 400 --steps 300
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'server'))
+
+_DB_DIR = tempfile.mkdtemp(prefix='agentora-bench-')
+os.environ.setdefault('AGENTORA_DATABASE_URL', f'sqlite:///{_DB_DIR}/bench.db')
+
+import numpy as np  # noqa: E402
+from sqlmodel import Session  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db import create_db_and_tables, engine  # noqa: E402
+from app.models import Capsule, CapsuleEmbedding  # noqa: E402
+from app.services.runtime.layers import layered_retrieval  # noqa: E402
+from app.services.runtime.write_behind import memory_write_behind  # noqa: E402
+
+
+def _seed(session: Session, run_id: int, count: int, dim: int, rng: np.random.Generator) -> None:
+    layers = ['L0_HOT', 'L1_SHORT', 'L2_SESSION', 'L3_DURABLE']
+    caps = [
+        Capsule(run_id=run_id, source='bench', text=f'bench {run_id} fact {i}', memory_layer=layers[i % len(layers)], project_key=f'run:{run_id}', session_key=f'run:{run_id}', trust_score=0.8, consolidation_score=0.8)
+        for i in range(count)
+    ]
+    session.add_all(caps)
+    session.commit()
+    vectors = rng.normal(size=(count, dim)).round(4)
+    session.add_all([CapsuleEmbedding(capsule_id=c.id, vector_json='[' + ','.join(str(x) for x in v) + ']') for c, v in zip(caps, vectors)])
+    session.commit()
+
+
+def _run(label: str, run_id: int, steps: int, dim: int, rng: np.random.Generator) -> list[list[int]]:
+    latencies: list[float] = []
+    admitted: list[list[int]] = []
+    with Session(engine) as session:
+        for _ in range(steps):
+            query = rng.normal(size=dim).tolist()
+            started = time.perf_counter()
+            result = layered_retrieval(session, query_vector=query, query='bench', run_id=run_id, top_k=6)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            admitted.append([item['capsule_id'] for item in result['items']])
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'{label:<13} p50={statistics.median(latencies):7.2f}ms  p95={p95:7.2f}ms  max={latencies[-1]:7.2f}ms  {memory_write_behind.stats()}')
+    return admitted
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare retrieval step latency with inline writes and with the write-behind queue.')
+    parser.add_argument('--capsules', type=int, default=400)
+    parser.add_argument('--steps', type=int, default=300)
+    parser.add_argument('--dim', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        for run_id in (1, 2):
+            _seed(session, run_id, args.capsules, args.dim, np.random.default_rng(args.seed))
+
+    settings.agentora_memory_write_behind_enabled = False
+    inline = _run('inline', 1, args.steps, args.dim, np.random.default_rng(args.seed + 1))
+    settings.agentora_memory_write_behind_enabled = True
+    memory_write_behind.start()
+    try:
+        deferred = _run('write-behind', 2, args.steps, args.dim, np.random.default_rng(args.seed + 1))
+    finally:
+        memory_write_behind.stop()
+    # Both runs were seeded identically, so admitted positions must match.
+    offset = args.capsules
+    same = sum(1 for a, b in zip(inline, deferred) if a == [cid - offset for cid in b])
+    print(f'identical admissions: {same}/{len(inline)}  (db: {settings.database_url})')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
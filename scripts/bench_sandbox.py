@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Per-call latency of python_exec: one interpreter per call versus the warm sandbox pool.
+
+Example: python scripts/bench_sandbox.py --calls 200 --pool-size 2
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'server'))
+
+from app.core.config import settings  # noqa: E402
+from app.services.tools.sandbox import SandboxPool, _run_cold  # noqa: E402
+
+SNIPPET = "import json\nprint(json.dumps({'total': sum(range(1000))}))"
+
+
+def _p95(values: list[float]) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def _timed(run, calls: int) -> tuple[list[float], dict]:
+    latencies: list[float] = []
+    result: dict = {}
+    for _ in range(calls):
+        started = time.perf_counter()
+        result = run(SNIPPET, 2)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return latencies, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare python_exec latency of cold interpreters and warm sandboxes.')
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--max-executions', type=int, default=100)
+    args = parser.parse_args()
+
+    settings.agentora_sandbox_pool_size = args.pool_size
+    settings.agentora_sandbox_max_executions = args.max_executions
+
+    cold, cold_result = _timed(_run_cold, args.calls)
+    print(f'cold  p50={statistics.median(cold):7.2f}ms p95={_p95(cold):7.2f}ms calls={args.calls}')
+
+    pool = SandboxPool()
+    if not pool.enabled:
+        print('warm  unavailable (pool size 0 or no fork on this platform)')
+        return 0
+    started = time.perf_counter()
+    pool.start(wait=True)
+    print(f'warm  startup={(time.perf_counter() - started) * 1000.0:.1f}ms sandboxes={args.pool_size}')
+    try:
+        warm, warm_result = _timed(pool.execute, args.calls)
+        stats = pool.stats()
+    finally:
+        pool.stop()
+    print(
+        f'warm  p50={statistics.median(warm):7.2f}ms p95={_p95(warm):7.2f}ms calls={args.calls} '
+        f'spawned={stats["spawned"]} recycled={stats["recycled"]} crashed={stats["crashed"]}'
+    )
+    print(f'speedup p50={statistics.median(cold) / max(1e-9, statistics.median(warm)):.1f}x same_output={cold_result == warm_result}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
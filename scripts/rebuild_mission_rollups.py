@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Rebuild the mission analytics rollups from the integration run table.
+
+Rollups are kept up to date as runs change and runs that predate them are
+folded in at startup; run this after restoring a backup, editing runs by hand
+or to repair drift.
+
+Example: python scripts/rebuild_mission_rollups.py --database-url sqlite:///server/data/agentora.db
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'server'))
+
+from sqlmodel import Session  # noqa: E402
+
+from app import db  # noqa: E402
+from app.services import mission_rollups  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=None, help='defaults to AGENTORA_DATABASE_URL')
+    args = parser.parse_args()
+    engine = db.init_db(args.database_url)
+    with Session(engine) as session:
+        result = mission_rollups.rebuild(session)
+        result.update(mission_rollups.rollup_status(session))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
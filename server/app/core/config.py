@@ -13,6 +13,13 @@ class Settings(BaseSettings):
         alias='AGENTORA_RELEASE_TITLE',
     )
     database_url: str = Field(default='sqlite:///server/data/agentora.db', alias='AGENTORA_DATABASE_URL')
+    agentora_db_profile: str = Field(default='wal', alias='AGENTORA_DB_PROFILE')
+    agentora_sqlite_synchronous: str = Field(default='NORMAL', alias='AGENTORA_SQLITE_SYNCHRONOUS')
+    agentora_sqlite_mmap_size_mb: int = Field(default=256, alias='AGENTORA_SQLITE_MMAP_SIZE_MB')
+    agentora_sqlite_cache_size_mb: int = Field(default=64, alias='AGENTORA_SQLITE_CACHE_SIZE_MB')
+    agentora_sqlite_busy_timeout_ms: int = Field(default=5000, alias='AGENTORA_SQLITE_BUSY_TIMEOUT_MS')
+    agentora_db_read_pool_size: int = Field(default=8, alias='AGENTORA_DB_READ_POOL_SIZE')
+    agentora_db_serialize_writes: bool = Field(default=True, alias='AGENTORA_DB_SERIALIZE_WRITES')
     ollama_url: str = Field(default='http://localhost:11434', alias='OLLAMA_URL')
     ollama_model_default: str = Field(default='llama3.1', alias='OLLAMA_MODEL_DEFAULT')
     agentora_vision_model_fallback: str = Field(default='llava:latest', alias='AGENTORA_VISION_MODEL_FALLBACK')
@@ -25,6 +32,9 @@ class Settings(BaseSettings):
     agentora_default_max_seconds: int = Field(default=90, alias='AGENTORA_DEFAULT_MAX_SECONDS')
     agentora_enable_http_fetch: bool = Field(default=False, alias='AGENTORA_ENABLE_HTTP_FETCH')
     agentora_enable_code_exec: bool = Field(default=False, alias='AGENTORA_ENABLE_CODE_EXEC')
+    agentora_sandbox_pool_size: int = Field(default=2, alias='AGENTORA_SANDBOX_POOL_SIZE')
+    agentora_sandbox_max_executions: int = Field(default=100, alias='AGENTORA_SANDBOX_MAX_EXECUTIONS')
+    agentora_sandbox_memory_mb: int = Field(default=512, alias='AGENTORA_SANDBOX_MEMORY_MB')
     agentora_enable_lan_mode: bool = Field(default=False, alias='AGENTORA_ENABLE_LAN_MODE')
     agentora_encryption_key: str | None = Field(default=None, alias='AGENTORA_ENCRYPTION_KEY')
     voice_enabled: bool = Field(default=False, alias='VOICE_ENABLED')
@@ -36,11 +46,27 @@ class Settings(BaseSettings):
     agentora_gathering_encryption_key: str = Field(default='', alias='AGENTORA_GATHERING_ENCRYPTION_KEY')
 
     agentora_embed_model: str = Field(default='embeddinggemma', alias='AGENTORA_EMBED_MODEL')
+    agentora_embed_batch_size: int = Field(default=32, alias='AGENTORA_EMBED_BATCH_SIZE')
+    agentora_embed_batch_max_chars: int = Field(default=32000, alias='AGENTORA_EMBED_BATCH_MAX_CHARS')
+    agentora_embed_concurrency: int = Field(default=4, alias='AGENTORA_EMBED_CONCURRENCY')
+    agentora_embed_retries: int = Field(default=2, alias='AGENTORA_EMBED_RETRIES')
+    agentora_embed_retry_backoff_seconds: float = Field(default=0.5, alias='AGENTORA_EMBED_RETRY_BACKOFF_SECONDS')
+    agentora_embed_cache_enabled: bool = Field(default=True, alias='AGENTORA_EMBED_CACHE_ENABLED')
+    agentora_embed_cache_path: str = Field(default='', alias='AGENTORA_EMBED_CACHE_PATH')
+    agentora_embed_cache_max_entries: int = Field(default=50000, alias='AGENTORA_EMBED_CACHE_MAX_ENTRIES')
+    agentora_embed_cache_memory_entries: int = Field(default=2048, alias='AGENTORA_EMBED_CACHE_MEMORY_ENTRIES')
+    agentora_chunk_max_tokens: int = Field(default=200, alias='AGENTORA_CHUNK_MAX_TOKENS')
+    agentora_chunk_overlap_tokens: int = Field(default=32, alias='AGENTORA_CHUNK_OVERLAP_TOKENS')
+    agentora_ingest_pipeline_depth: int = Field(default=4, alias='AGENTORA_INGEST_PIPELINE_DEPTH')
     agentora_tool_model: str = Field(default='qwen3:14b', alias='AGENTORA_TOOL_MODEL')
     agentora_chat_model: str = Field(default='gemma3:12b', alias='AGENTORA_CHAT_MODEL')
     agentora_worker_urls: str = Field(default='', alias='AGENTORA_WORKER_URLS')
+    agentora_http_pool_limits: str = Field(default='', alias='AGENTORA_HTTP_POOL_LIMITS')
+    agentora_http_pool_keepalive_seconds: float = Field(default=30.0, alias='AGENTORA_HTTP_POOL_KEEPALIVE_SECONDS')
     agentora_capsule_top_k: int = Field(default=6, alias='AGENTORA_CAPSULE_TOP_K')
     agentora_max_tool_steps: int = Field(default=4, alias='AGENTORA_MAX_TOOL_STEPS')
+    agentora_tool_max_parallel: int = Field(default=4, alias='AGENTORA_TOOL_MAX_PARALLEL')
+    agentora_tool_timeout_seconds: float = Field(default=60.0, alias='AGENTORA_TOOL_TIMEOUT_SECONDS')
 
     agentora_vision_model: str = Field(default='', alias='AGENTORA_VISION_MODEL')
     agentora_extraction_model: str = Field(default='', alias='AGENTORA_EXTRACTION_MODEL')
@@ -50,6 +76,23 @@ class Settings(BaseSettings):
     agentora_http_allowlist: str = Field(default='', alias='AGENTORA_HTTP_ALLOWLIST')
     agentora_file_write_root: str = Field(default='server/data/artifacts', alias='AGENTORA_FILE_WRITE_ROOT')
     agentora_max_worker_retries: int = Field(default=2, alias='AGENTORA_MAX_WORKER_RETRIES')
+    agentora_worker_lease_seconds: float = Field(default=30.0, alias='AGENTORA_WORKER_LEASE_SECONDS')
+    agentora_worker_wait_seconds: float = Field(default=5.0, alias='AGENTORA_WORKER_WAIT_SECONDS')
+    agentora_worker_queued_ttl_seconds: float = Field(default=600.0, alias='AGENTORA_WORKER_QUEUED_TTL_SECONDS')
+    agentora_worker_affinity_seconds: float = Field(default=2.0, alias='AGENTORA_WORKER_AFFINITY_SECONDS')
+    agentora_worker_breaker_failures: int = Field(default=3, alias='AGENTORA_WORKER_BREAKER_FAILURES')
+    agentora_worker_breaker_cooldown_seconds: float = Field(default=30.0, alias='AGENTORA_WORKER_BREAKER_COOLDOWN_SECONDS')
+    agentora_worker_breaker_probes: int = Field(default=1, alias='AGENTORA_WORKER_BREAKER_PROBES')
+    agentora_worker_retry_backoff_seconds: float = Field(default=0.5, alias='AGENTORA_WORKER_RETRY_BACKOFF_SECONDS')
+    agentora_worker_retry_backoff_max_seconds: float = Field(default=30.0, alias='AGENTORA_WORKER_RETRY_BACKOFF_MAX_SECONDS')
+    agentora_worker_hedge_enabled: bool = Field(default=False, alias='AGENTORA_WORKER_HEDGE_ENABLED')
+    agentora_worker_hedge_percentile: float = Field(default=95.0, alias='AGENTORA_WORKER_HEDGE_PERCENTILE')
+    agentora_worker_mode: bool = Field(default=False, alias='AGENTORA_WORKER_MODE')
+    agentora_worker_hub_url: str = Field(default='', alias='AGENTORA_WORKER_HUB_URL')
+    agentora_worker_name: str = Field(default='agentora-worker', alias='AGENTORA_WORKER_NAME')
+    agentora_worker_capabilities: str = Field(default='', alias='AGENTORA_WORKER_CAPABILITIES')
+    agentora_worker_concurrency: int = Field(default=2, alias='AGENTORA_WORKER_CONCURRENCY')
+    agentora_worker_poll_seconds: float = Field(default=1.0, alias='AGENTORA_WORKER_POLL_SECONDS')
     agentora_enable_layered_memory: bool = Field(default=True, alias='AGENTORA_ENABLE_LAYERED_MEMORY')
     agentora_context_top_k: int = Field(default=8, alias='AGENTORA_CONTEXT_TOP_K')
     agentora_max_active_contexts: int = Field(default=6, alias='AGENTORA_MAX_ACTIVE_CONTEXTS')
@@ -70,10 +113,38 @@ class Settings(BaseSettings):
     agentora_cross_project_memory_enabled: bool = Field(default=False, alias='AGENTORA_CROSS_PROJECT_MEMORY_ENABLED')
     agentora_global_memory_fallback_enabled: bool = Field(default=True, alias='AGENTORA_GLOBAL_MEMORY_FALLBACK_ENABLED')
     agentora_duplicate_suppression_enabled: bool = Field(default=True, alias='AGENTORA_DUPLICATE_SUPPRESSION_ENABLED')
+    agentora_memory_ann_backend: str = Field(default='ivf', alias='AGENTORA_MEMORY_ANN_BACKEND')
+    agentora_memory_ann_min_rows: int = Field(default=2000, alias='AGENTORA_MEMORY_ANN_MIN_ROWS')
+    agentora_memory_ann_candidates: int = Field(default=300, alias='AGENTORA_MEMORY_ANN_CANDIDATES')
+    agentora_memory_ann_nlist: int = Field(default=0, alias='AGENTORA_MEMORY_ANN_NLIST')
+    agentora_memory_ann_nprobe: int = Field(default=16, alias='AGENTORA_MEMORY_ANN_NPROBE')
+    agentora_memory_write_behind_enabled: bool = Field(default=True, alias='AGENTORA_MEMORY_WRITE_BEHIND_ENABLED')
+    agentora_memory_write_behind_max_pending: int = Field(default=256, alias='AGENTORA_MEMORY_WRITE_BEHIND_MAX_PENDING')
+    agentora_memory_write_behind_interval_ms: int = Field(default=500, alias='AGENTORA_MEMORY_WRITE_BEHIND_INTERVAL_MS')
+    agentora_memory_write_behind_max_retries: int = Field(default=5, alias='AGENTORA_MEMORY_WRITE_BEHIND_MAX_RETRIES')
+    agentora_blocking_pool_size: int = Field(default=8, alias='AGENTORA_BLOCKING_POOL_SIZE')
+    agentora_loop_lag_interval_ms: int = Field(default=50, alias='AGENTORA_LOOP_LAG_INTERVAL_MS')
+    agentora_loop_lag_warn_ms: int = Field(default=100, alias='AGENTORA_LOOP_LAG_WARN_MS')
+    agentora_run_scheduler_max_concurrent: int = Field(default=4, alias='AGENTORA_RUN_SCHEDULER_MAX_CONCURRENT')
+    agentora_run_scheduler_max_per_team: int = Field(default=2, alias='AGENTORA_RUN_SCHEDULER_MAX_PER_TEAM')
+    agentora_run_scheduler_max_queue: int = Field(default=200, alias='AGENTORA_RUN_SCHEDULER_MAX_QUEUE')
+    agentora_stream_buffer_size: int = Field(default=256, alias='AGENTORA_STREAM_BUFFER_SIZE')
+    agentora_stream_overflow_policy: str = Field(default='drop_oldest', alias='AGENTORA_STREAM_OVERFLOW_POLICY')
+    agentora_stream_history_size: int = Field(default=128, alias='AGENTORA_STREAM_HISTORY_SIZE')
+    agentora_stream_heartbeat_seconds: float = Field(default=15.0, alias='AGENTORA_STREAM_HEARTBEAT_SECONDS')
+    agentora_stream_idle_seconds: float = Field(default=300.0, alias='AGENTORA_STREAM_IDLE_SECONDS')
+    agentora_trace_level: str = Field(default='debug', alias='AGENTORA_TRACE_LEVEL')
+    agentora_trace_sample_rates: str = Field(default='', alias='AGENTORA_TRACE_SAMPLE_RATES')
+    agentora_trace_max_payload_bytes: int = Field(default=65536, alias='AGENTORA_TRACE_MAX_PAYLOAD_BYTES')
+    agentora_trace_compress_bytes: int = Field(default=2048, alias='AGENTORA_TRACE_COMPRESS_BYTES')
+    agentora_trace_buffer_events: int = Field(default=256, alias='AGENTORA_TRACE_BUFFER_EVENTS')
     agentora_enable_team_debate: bool = Field(default=True, alias='AGENTORA_ENABLE_TEAM_DEBATE')
     agentora_default_team_mode: str = Field(default='careful', alias='AGENTORA_DEFAULT_TEAM_MODE')
     agentora_max_team_turns: int = Field(default=6, alias='AGENTORA_MAX_TEAM_TURNS')
     agentora_max_handoffs: int = Field(default=8, alias='AGENTORA_MAX_HANDOFFS')
+    agentora_team_llm_concurrency: int = Field(default=3, alias='AGENTORA_TEAM_LLM_CONCURRENCY')
+    agentora_team_fanout_plans: bool = Field(default=False, alias='AGENTORA_TEAM_FANOUT_PLANS')
+    agentora_team_fanout_width: int = Field(default=3, alias='AGENTORA_TEAM_FANOUT_WIDTH')
     agentora_enable_single_agent_fallback: bool = Field(default=True, alias='AGENTORA_ENABLE_SINGLE_AGENT_FALLBACK')
     agentora_force_synthesis_on_budget_exhaust: bool = Field(default=True, alias='AGENTORA_FORCE_SYNTHESIS_ON_BUDGET_EXHAUST')
     agentora_enable_desktop_actions: bool = Field(default=True, alias='AGENTORA_ENABLE_DESKTOP_ACTIONS')
@@ -149,6 +220,7 @@ class Settings(BaseSettings):
     agentora_analytics_cache_enabled: bool = Field(default=True, alias='AGENTORA_ANALYTICS_CACHE_ENABLED')
     agentora_analytics_cache_ttl_seconds: int = Field(default=120, alias='AGENTORA_ANALYTICS_CACHE_TTL_SECONDS')
     agentora_analytics_cache_max_entries: int = Field(default=100, alias='AGENTORA_ANALYTICS_CACHE_MAX_ENTRIES')
+    agentora_analytics_cache_max_bytes: int = Field(default=8388608, alias='AGENTORA_ANALYTICS_CACHE_MAX_BYTES')
 
 
     @property
@@ -175,6 +247,14 @@ class Settings(BaseSettings):
         except Exception:
             return {}
 
+    @property
+    def http_pool_limits(self) -> dict[str, int]:
+        try:
+            raw = json.loads(self.agentora_http_pool_limits or '{}')
+            return {str(k): int(v) for k, v in raw.items()}
+        except Exception:
+            return {}
+
     @property
     def context_layer_budgets(self) -> dict[str, int]:
         try:
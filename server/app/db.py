@@ -1,6 +1,13 @@
+import asyncio
+import json
+import threading
+import time
+from contextvars import ContextVar
 from pathlib import Path
 from typing import Optional
 
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
 from sqlmodel import SQLModel, Session, create_engine
 
 from .core.config import settings
@@ -14,19 +21,188 @@ def _normalize_sqlite_url(url: str) -> str:
     return f'sqlite:///{db_path.as_posix()}'
 
 
-def _build_engine(database_url: str):
-    return create_engine(_normalize_sqlite_url(database_url), connect_args={'check_same_thread': False})
+def _is_sqlite_file(url: str) -> bool:
+    return url.startswith('sqlite:///') and ':memory:' not in url and 'mode=memory' not in url
+
+
+def _sqlite_pragmas(read_only: bool, profile: str) -> list[str]:
+    pragmas = [f'PRAGMA busy_timeout = {max(0, settings.agentora_sqlite_busy_timeout_ms)}']
+    if profile == 'wal':
+        pragmas += [
+            'PRAGMA journal_mode = WAL',
+            f'PRAGMA synchronous = {settings.agentora_sqlite_synchronous.upper()}',
+            f'PRAGMA mmap_size = {max(0, settings.agentora_sqlite_mmap_size_mb) * 1024 * 1024}',
+            # Negative cache_size is in KiB rather than pages.
+            f'PRAGMA cache_size = -{max(0, settings.agentora_sqlite_cache_size_mb) * 1024}',
+            'PRAGMA temp_store = MEMORY',
+        ]
+    if read_only:
+        pragmas.append('PRAGMA query_only = 1')
+    return pragmas
+
+
+def _build_engine(database_url: str, read_only: bool = False, profile: Optional[str] = None):
+    profile = (profile or settings.agentora_db_profile).lower()
+    url = _normalize_sqlite_url(database_url)
+    if not _is_sqlite_file(url):
+        return create_engine(url, connect_args={'check_same_thread': False} if url.startswith('sqlite') else {})
+    if profile == 'legacy' and not read_only:
+        return create_engine(url, connect_args={'check_same_thread': False})
+    pool_size = max(1, settings.agentora_db_read_pool_size) if read_only else 5
+    built = create_engine(url, connect_args={'check_same_thread': False}, pool_size=pool_size, max_overflow=pool_size * 2 if read_only else 10)
+    pragmas = _sqlite_pragmas(read_only, profile)
+
+    @event.listens_for(built, 'connect')
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return built
+
+
+def _build_read_engine(database_url: str, write_engine):
+    url = _normalize_sqlite_url(database_url)
+    if settings.agentora_db_profile.lower() == 'legacy' or not _is_sqlite_file(url):
+        return write_engine
+    return _build_engine(database_url, read_only=True)
+
+
+# Identifies one logical writer across threads: work offloaded from an async task carries the
+# task's id, so its sessions are recognised as the same writer whichever pool thread runs them.
+writer_flow: ContextVar[Optional[int]] = ContextVar('agentora_writer_flow', default=None)
+
+
+class WriterBusyError(RuntimeError):
+    """The writer gate stayed held past the busy timeout; the write was not attempted."""
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class WriterGate:
+    """Serializes write transactions across threads.
+
+    A session takes the gate on its first flush or DML statement and releases
+    it when its transaction ends, so concurrent writers queue here instead of
+    spinning on SQLite's busy handler. Only sessions of the holder's
+    :data:`writer_flow` pass through while it is held. A waiter that outlasts
+    the busy timeout gets :class:`WriterBusyError` (a 503 from the API); on an
+    event-loop thread, where waiting would stall every other task, a held gate
+    fails at once, so loop code hands its writes to ``blocking_pool``.
+    """
+
+    _KEY = '_agentora_writer_gate'
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._holder: Optional[int] = None
+        self._holder_flow: Optional[int] = None
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.loop_refusals = 0
+        self.wait_ms = 0.0
+
+    def acquire(self, session: OrmSession) -> None:
+        if not settings.agentora_db_serialize_writes or session.info.get(self._KEY):
+            return
+        flow = writer_flow.get()
+        deadline = time.monotonic() + max(0, settings.agentora_sqlite_busy_timeout_ms) / 1000.0
+        with self._cond:
+            if self._holder is not None and flow is not None and self._holder_flow == flow:
+                return
+            started = time.monotonic()
+            if self._holder is not None:
+                self.contended += 1
+                if _on_event_loop():
+                    self.loop_refusals += 1
+                    raise WriterBusyError('database writer busy: a write on the event loop cannot wait for the writer gate; run it through blocking_pool')
+            while self._holder is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    waited_ms = (time.monotonic() - started) * 1000.0
+                    self.timeouts += 1
+                    self.wait_ms += waited_ms
+                    raise WriterBusyError(f'database writer busy: gave up after {waited_ms:.0f} ms waiting for another write transaction')
+                self._cond.wait(remaining)
+            self.wait_ms += (time.monotonic() - started) * 1000.0
+            self._holder = id(session)
+            self._holder_flow = flow
+            self.acquired += 1
+            session.info[self._KEY] = True
+
+    def holds(self, session: OrmSession) -> bool:
+        return bool(session.info.get(self._KEY))
+
+    def release(self, session: OrmSession) -> None:
+        if not session.info.pop(self._KEY, False):
+            return
+        with self._cond:
+            if self._holder == id(session):
+                self._holder = None
+                self._holder_flow = None
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'enabled': settings.agentora_db_serialize_writes,
+                'held': self._holder is not None,
+                'acquired': self.acquired,
+                'contended': self.contended,
+                'timeouts': self.timeouts,
+                'loop_refusals': self.loop_refusals,
+                'wait_ms_total': round(self.wait_ms, 3),
+            }
+
+
+writer_gate = WriterGate()
+
+
+@event.listens_for(OrmSession, 'before_flush')
+def _gate_flush(session, _flush_context, _instances):
+    writer_gate.acquire(session)
+
+
+@event.listens_for(OrmSession, 'do_orm_execute')
+def _gate_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        writer_gate.acquire(orm_execute_state.session)
+
+
+@event.listens_for(OrmSession, 'after_transaction_end')
+def _release_gate(session, transaction):
+    if transaction.parent is None:
+        writer_gate.release(session)
 
 
 engine = _build_engine(settings.database_url)
+read_engine = _build_read_engine(settings.database_url, engine)
 
 
 def set_engine(database_url: str):
-    global engine
+    global engine, read_engine
     engine = _build_engine(database_url)
+    read_engine = _build_read_engine(database_url, engine)
     return engine
 
 
+def db_profile() -> dict:
+    info: dict = {'profile': settings.agentora_db_profile, 'dialect': engine.dialect.name, 'split_read_pool': read_engine is not engine, 'writer_gate': writer_gate.stats()}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size'):
+                info[pragma] = conn.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+    return info
+
+
 def _ensure_integrationrun_columns() -> None:
     required = {
         'mission_title': "TEXT NOT NULL DEFAULT ''",
@@ -87,18 +263,114 @@ def _ensure_integrationrun_columns() -> None:
         'operator_override_note': "TEXT NOT NULL DEFAULT ''",
         'recommendation_state': "TEXT NOT NULL DEFAULT 'pending'",
     }
+    return _ensure_columns('integrationrun', required)
+
+
+def _ensure_columns(table: str, required: dict[str, str]) -> list[str]:
+    added: list[str] = []
     with engine.connect() as conn:
         try:
-            rows = conn.exec_driver_sql("PRAGMA table_info('integrationrun')").fetchall()
+            rows = conn.exec_driver_sql(f"PRAGMA table_info('{table}')").fetchall()
         except Exception:
-            return
+            return added
         if not rows:
-            return
+            return added
         existing = {row[1] for row in rows}
         for col, col_def in required.items():
             if col not in existing:
-                conn.exec_driver_sql(f'ALTER TABLE integrationrun ADD COLUMN {col} {col_def}')
+                conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {col} {col_def}')
+                added.append(f'{table}.{col}')
+        conn.commit()
+    return added
+
+
+def _ensure_capsuleembedding_columns() -> list[str]:
+    return _ensure_columns('capsuleembedding', {'vector_blob': 'BLOB', 'vector_dim': 'INTEGER NOT NULL DEFAULT 0'})
+
+
+def _ensure_run_columns() -> list[str]:
+    return _ensure_columns('run', {
+        'prompt': "TEXT NOT NULL DEFAULT ''",
+        'reflection': 'BOOLEAN NOT NULL DEFAULT 0',
+        'priority': 'INTEGER NOT NULL DEFAULT 5',
+        'queued_at': 'DATETIME',
+        'wait_ms': 'FLOAT NOT NULL DEFAULT 0',
+    })
+
+
+def _ensure_runtrace_columns() -> list[str]:
+    return _ensure_columns('runtrace', {'payload_blob': 'BLOB'})
+
+
+def _ensure_workerjob_columns() -> list[str]:
+    return _ensure_columns('workerjob', {
+        'lease_token': "TEXT NOT NULL DEFAULT ''",
+        'lease_expires_at': 'DATETIME',
+        'claimed_at': 'DATETIME',
+        'finished_at': 'DATETIME',
+        'available_at': 'DATETIME',
+        'hedge_of': 'INTEGER',
+        'hedged': 'BOOLEAN NOT NULL DEFAULT 0',
+    })
+
+
+def _ensure_indexes() -> list[str]:
+    """Create declared indexes that ``create_all`` skips because their table already existed."""
+    created: list[str] = []
+    with engine.connect() as conn:
+        existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()} if engine.dialect.name == 'sqlite' else None
+        for table in SQLModel.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda i: i.name or ''):
+                if existing is not None and index.name in existing:
+                    continue
+                index.create(conn, checkfirst=existing is None)
+                created.append(index.name)
         conn.commit()
+    return created
+
+
+def upgrade_schema() -> dict[str, list[str]]:
+    """Idempotent in-place upgrade for databases created by older releases: missing columns, then indexes."""
+    columns = _ensure_integrationrun_columns() + _ensure_capsuleembedding_columns() + _ensure_run_columns() + _ensure_workerjob_columns() + _ensure_runtrace_columns()
+    return {'columns_added': columns, 'indexes_created': _ensure_indexes()}
+
+
+def migrate_capsule_embedding_vectors(batch_size: int = 500) -> int:
+    """Pack legacy JSON embeddings into normalized float32 blobs in place."""
+    from .services.runtime.vectors import normalize_vector
+
+    converted = 0
+    last_id = 0
+    with engine.connect() as conn:
+        while True:
+            # Keyset pages, so only one batch of legacy JSON is held in memory at a time.
+            try:
+                rows = conn.exec_driver_sql('SELECT id, vector_json FROM capsuleembedding WHERE id > ? AND vector_blob IS NULL ORDER BY id LIMIT ?', (last_id, batch_size)).fetchall()
+            except Exception:
+                return converted
+            if not rows:
+                break
+            params = []
+            for row_id, vector_json in rows:
+                try:
+                    raw = json.loads(vector_json or '[]')
+                except Exception:
+                    raw = []
+                packed = normalize_vector(raw)
+                params.append((packed.tobytes(), int(packed.size), row_id))
+            conn.exec_driver_sql("UPDATE capsuleembedding SET vector_blob = ?, vector_dim = ?, vector_json = '[]' WHERE id = ?", params)
+            conn.commit()
+            converted += len(params)
+            last_id = rows[-1][0]
+    return converted
+
+
+def backfill_mission_rollups() -> int:
+    """Fold runs recorded before the analytics rollups existed into them."""
+    from .services import mission_rollups
+
+    with Session(engine) as session:
+        return mission_rollups.backfill(session)
 
 
 def create_db_and_tables() -> None:
@@ -106,7 +378,9 @@ def create_db_and_tables() -> None:
     from . import models  # noqa: F401
 
     SQLModel.metadata.create_all(engine)
-    _ensure_integrationrun_columns()
+    upgrade_schema()
+    migrate_capsule_embedding_vectors()
+    backfill_mission_rollups()
 
 
 def init_db(database_url: Optional[str] = None):
@@ -119,3 +393,9 @@ def init_db(database_url: Optional[str] = None):
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+def get_read_session():
+    """Session on the read-only pool for list and analytics endpoints; writes raise."""
+    with Session(read_engine) as session:
+        yield session
@@ -1,8 +1,7 @@
 from datetime import datetime, timezone
 
-import httpx
-
 from app.core.config import settings
+from app.services.http_pool import http_pool
 from app.integrations.phios_client import IntegrationClientError
 from app.integrations.schemas import AgentCeptionJobStatus, AgentCeptionLaunchRequest, AgentCeptionLaunchResponse
 
@@ -42,7 +41,7 @@ class AgentCeptionClient:
             )
         url = f'{self.base_url}{self.launch_path}'
         try:
-            response = httpx.post(url, json=request.model_dump(), headers=self._headers(), timeout=self.timeout_seconds)
+            response = http_pool.sync_client('agentception').post(url, json=request.model_dump(), headers=self._headers(), timeout=self.timeout_seconds)
             response.raise_for_status()
             return AgentCeptionLaunchResponse.model_validate(response.json())
         except Exception as exc:
@@ -64,7 +63,7 @@ class AgentCeptionClient:
             )
         url = f"{self.base_url}{self.job_status_path.format(job_id=job_id)}"
         try:
-            response = httpx.get(url, headers=self._headers(), timeout=self.timeout_seconds)
+            response = http_pool.sync_client('agentception').get(url, headers=self._headers(), timeout=self.timeout_seconds)
             response.raise_for_status()
             return AgentCeptionJobStatus.model_validate(response.json())
         except Exception as exc:
@@ -76,7 +75,7 @@ class AgentCeptionClient:
             return {'job_id': job_id, 'artifacts': ['https://example.com/mock/artifacts/log.txt']}
         url = f"{self.base_url}{self.artifacts_path.format(job_id=job_id)}"
         try:
-            response = httpx.get(url, headers=self._headers(), timeout=self.timeout_seconds)
+            response = http_pool.sync_client('agentception').get(url, headers=self._headers(), timeout=self.timeout_seconds)
             response.raise_for_status()
             return response.json()
         except Exception as exc:
@@ -89,7 +88,7 @@ class AgentCeptionClient:
             return {'ok': False, 'service': 'agentception', 'detail': 'disabled'}
         for path in self.health_paths:
             try:
-                response = httpx.get(f'{self.base_url}{path}', headers=self._headers(), timeout=self.timeout_seconds)
+                response = http_pool.sync_client('agentception').get(f'{self.base_url}{path}', headers=self._headers(), timeout=self.timeout_seconds)
                 response.raise_for_status()
                 payload = response.json() if response.content else {}
                 return {'ok': True, 'service': 'agentception', 'payload': payload}
@@ -1,8 +1,7 @@
 from datetime import datetime, timezone
 
-import httpx
-
 from app.core.config import settings
+from app.services.http_pool import http_pool
 from app.integrations.schemas import (
     ArchitecturalPrinciple,
     CodingStylePreference,
@@ -94,7 +93,7 @@ class PhiOSClient:
         last_exc: Exception | None = None
         for path in paths:
             try:
-                response = httpx.post(f'{self.base_url}{path}', json=payload, headers=self._headers(), timeout=self.timeout_seconds)
+                response = http_pool.sync_client('phios').post(f'{self.base_url}{path}', json=payload, headers=self._headers(), timeout=self.timeout_seconds)
                 response.raise_for_status()
                 return response.json()
             except Exception as exc:
@@ -107,7 +106,7 @@ class PhiOSClient:
             return self._mock_persona(persona_id)
         try:
             path = self.endpoint_candidates['persona'].format(persona_id=persona_id)
-            response = httpx.get(f'{self.base_url}{path}', headers=self._headers(), timeout=self.timeout_seconds)
+            response = http_pool.sync_client('phios').get(f'{self.base_url}{path}', headers=self._headers(), timeout=self.timeout_seconds)
             response.raise_for_status()
             return PersonaSummary.model_validate(response.json())
         except Exception as exc:
@@ -160,7 +159,7 @@ class PhiOSClient:
         if not self.enabled:
             return {'ok': False, 'service': 'phios', 'detail': 'disabled'}
         try:
-            response = httpx.get(f"{self.base_url}{self.endpoint_candidates['health']}", headers=self._headers(), timeout=self.timeout_seconds)
+            response = http_pool.sync_client('phios').get(f"{self.base_url}{self.endpoint_candidates['health']}", headers=self._headers(), timeout=self.timeout_seconds)
             response.raise_for_status()
             payload = response.json() if response.content else {}
             return {'ok': True, 'service': 'phios', 'payload': payload}
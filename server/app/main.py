@@ -1,14 +1,22 @@
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from app.core.config import settings
-from app.db import init_db
+from app.db import WriterBusyError, init_db
 from app.routers import health, ollama, agents, teams, runs, tools, exports, snapshot
 from app.routers import marketplace, multimodal, voice, analytics, integrations, lan, studio, band, arena, gathering, legacy, cosmos, open_cosmos, garden, world_garden, capsules, workers, memory, team, actions, workflows, operator, system
+from app.services.http_pool import http_pool
 from app.services.mission_watcher import mission_watcher
 from app.services.mission_compactor import mission_compactor
+from app.services.orchestration.scheduler import run_scheduler
+from app.services.runtime.embedding_cache import embedding_cache
+from app.services.runtime.offload import blocking_pool, loop_lag
+from app.services.runtime.worker_runtime import worker_runtime
+from app.services.runtime.write_behind import memory_write_behind
+from app.services.tools.sandbox import sandbox_pool
 
 
 @asynccontextmanager
@@ -16,11 +24,25 @@ async def lifespan(_app: FastAPI):
     init_db()
     mission_watcher.start()
     mission_compactor.start()
+    memory_write_behind.start()
+    loop_lag.start()
+    run_scheduler.start()
+    sandbox_pool.start()
+    worker_runtime.start()
     try:
         yield
     finally:
         mission_watcher.stop()
         mission_compactor.stop()
+        worker_runtime.stop()
+        run_scheduler.stop()
+        await loop_lag.stop()
+        # The final drain writes; the writer gate does not wait on the loop thread.
+        await blocking_pool.run('db', memory_write_behind.stop)
+        blocking_pool.shutdown()
+        sandbox_pool.stop()
+        embedding_cache.close()
+        await http_pool.aclose()
 
 
 def create_app() -> FastAPI:
@@ -33,6 +55,9 @@ def create_app() -> FastAPI:
         allow_headers=['*'],
     )
 
+    @app.exception_handler(WriterBusyError)
+    async def _writer_busy(_request: Request, exc: WriterBusyError):
+        return JSONResponse(status_code=503, content={'ok': False, 'error': 'database_busy', 'detail': str(exc)}, headers={'Retry-After': '1'})
 
     app.include_router(health.router)
     app.include_router(ollama.router)
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
@@ -47,6 +48,11 @@ class Run(SQLModel, table=True):
     consensus_threshold: int = 1
     result_summary: str = ''
     paused_reason: str = ''
+    prompt: str = ''
+    reflection: bool = False
+    priority: int = 5
+    queued_at: Optional[datetime] = None
+    wait_ms: float = 0.0
 
 
 class Message(SQLModel, table=True):
@@ -138,7 +144,7 @@ class RunMetric(SQLModel, table=True):
 
 class Capsule(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    run_id: int
+    run_id: int = Field(index=True)
     attachment_id: Optional[int] = None
     source: str = ''
     chunk_index: int = 0
@@ -186,7 +192,7 @@ class MemoryLayer(SQLModel, table=True):
 
 class MemoryCapsuleState(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    capsule_id: int
+    capsule_id: int = Field(index=True)
     layer: str = 'L1_SHORT'
     status: str = 'active'
     confidence: float = 0.5
@@ -199,9 +205,11 @@ class MemoryCapsuleState(SQLModel, table=True):
 
 
 class MemoryEdge(SQLModel, table=True):
+    __table_args__ = (Index('ix_memoryedge_from_to_type', 'from_capsule_id', 'to_capsule_id', 'edge_type'),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     from_capsule_id: int
-    to_capsule_id: int
+    to_capsule_id: int = Field(index=True)
     edge_type: str = 'semantic'
     weight: float = 0.5
     confidence: float = 0.5
@@ -223,7 +231,7 @@ class MemorySummary(SQLModel, table=True):
 
 class ContextActivation(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    run_id: int
+    run_id: int = Field(index=True)
     capsule_id: int
     layer: str
     query: str
@@ -248,9 +256,11 @@ class MemoryMaintenanceJob(SQLModel, table=True):
 
 
 class MemoryConflict(SQLModel, table=True):
+    __table_args__ = (Index('ix_memoryconflict_left_right', 'left_capsule_id', 'right_capsule_id'),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     left_capsule_id: int
-    right_capsule_id: int
+    right_capsule_id: int = Field(index=True)
     conflict_type: str = 'contradiction'
     conflict_score: float = 0.0
     status: str = 'open'
@@ -261,7 +271,7 @@ class MemoryConflict(SQLModel, table=True):
 
 class DuplicateCluster(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    hash_key: str
+    hash_key: str = Field(index=True)
     canonical_capsule_id: int
     member_capsule_ids_json: str = '[]'
     cluster_size: int = 1
@@ -271,7 +281,7 @@ class DuplicateCluster(SQLModel, table=True):
 
 class MemoryUsefulnessMetric(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    capsule_id: int
+    capsule_id: int = Field(index=True)
     retrieved_count: int = 0
     retrieved_and_used_count: int = 0
     retrieved_but_unused_count: int = 0
@@ -286,8 +296,10 @@ class MemoryUsefulnessMetric(SQLModel, table=True):
 
 class CapsuleEmbedding(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    capsule_id: int
+    capsule_id: int = Field(index=True)
     vector_json: str = '[]'
+    vector_blob: Optional[bytes] = None
+    vector_dim: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -302,6 +314,11 @@ class WorkerNode(SQLModel, table=True):
 
 
 class WorkerJob(SQLModel, table=True):
+    __table_args__ = (
+        Index('ix_workerjob_status_priority_created', 'status', 'priority', 'created_at'),
+        Index('ix_workerjob_status_lease_expires', 'status', 'lease_expires_at'),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     job_type: str
     payload_json: str = '{}'
@@ -313,16 +330,27 @@ class WorkerJob(SQLModel, table=True):
     used_fallback_local: bool = False
     result_json: str = '{}'
     error: str = ''
+    lease_token: str = ''
+    lease_expires_at: Optional[datetime] = None
+    claimed_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    available_at: Optional[datetime] = None
+    hedge_of: Optional[int] = None
+    hedged: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class RunTrace(SQLModel, table=True):
+    __table_args__ = (Index('ix_runtrace_run_event_type', 'run_id', 'event_type'),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    run_id: int
+    run_id: int = Field(index=True)
     agent_id: int = 0
     event_type: str
+    # Empty when the payload is compressed into payload_blob; read it with trace.decode_payload.
     payload_json: str = '{}'
+    payload_blob: Optional[bytes] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -336,8 +364,13 @@ class TemplateUsage(SQLModel, table=True):
 
 
 class IntegrationRun(SQLModel, table=True):
+    __table_args__ = (
+        Index('ix_integrationrun_status_created', 'status', 'created_at'),
+        Index('ix_integrationrun_watch_updated', 'watch_enabled', 'updated_at'),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     status: str = 'created'
     persona_id: str = ''
@@ -382,8 +415,8 @@ class IntegrationRun(SQLModel, table=True):
     risk_signal: str = 'high'
     mission_snapshot_json: str = '{}'
     snapshot_hash: str = ''
-    parent_run_id: Optional[int] = None
-    root_run_id: Optional[int] = None
+    parent_run_id: Optional[int] = Field(default=None, index=True)
+    root_run_id: Optional[int] = Field(default=None, index=True)
     lineage_depth: int = 0
     replay_source_snapshot_hash: str = ''
     replay_kind: str = ''
@@ -410,14 +443,58 @@ class IntegrationRun(SQLModel, table=True):
 
 
 
+class MissionRollup(SQLModel, table=True):
+    """Per-day mission aggregates, maintained as integration runs change."""
+
+    __table_args__ = (Index('ux_missionrollup_key', 'day', 'repo', 'persona', 'strategy', 'status', unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    day: str
+    repo: str = ''
+    persona: str = ''
+    strategy: str = ''
+    status: str = ''
+    count: int = 0
+    score_sum: int = 0
+    refresh_sum: int = 0
+    pr_count: int = 0
+    writeback_written: int = 0
+    shortlisted: int = 0
+    eliminated: int = 0
+    overrides: int = 0
+    override_total: int = 0
+    override_accept: int = 0
+    risk_low: int = 0
+    risk_medium: int = 0
+    risk_high: int = 0
+    risk_sum: int = 0
+    confidence_high: int = 0
+    confidence_sum: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class MissionRollupMember(SQLModel, table=True):
+    """The rollup key and measures a run last contributed, so updates apply as deltas."""
+
+    run_id: int = Field(primary_key=True)
+    day: str
+    repo: str = ''
+    persona: str = ''
+    strategy: str = ''
+    status: str = ''
+    measures_json: str = '{}'
+
+
 class WatcherEvent(SQLModel, table=True):
+    __table_args__ = (Index('ix_watcherevent_run_created', 'run_id', 'created_at'),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     run_id: Optional[int] = None
     event_type: str
     status: str = ''
     latency_ms: float = 0.0
     detail_json: str = '{}'
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 class AlertEvent(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -4,14 +4,14 @@ from fastapi import APIRouter, Depends
 from fastapi.responses import Response
 from sqlmodel import Session, select
 
-from app.db import get_session
+from app.db import get_read_session
 from app.models import RunMetric, Run, TemplateUsage
 
 router = APIRouter(prefix='/api/analytics', tags=['analytics'])
 
 
 @router.get('/overview')
-def overview(session: Session = Depends(get_session)):
+def overview(session: Session = Depends(get_read_session)):
     metrics = list(session.exec(select(RunMetric)))
     runs = list(session.exec(select(Run)))
     usages = list(session.exec(select(TemplateUsage)))
@@ -24,13 +24,13 @@ def overview(session: Session = Depends(get_session)):
 
 
 @router.get('/runs/{run_id}')
-def run_metrics(run_id: int, session: Session = Depends(get_session)):
+def run_metrics(run_id: int, session: Session = Depends(get_read_session)):
     rows = list(session.exec(select(RunMetric).where(RunMetric.run_id == run_id)))
     return {'metrics': rows}
 
 
 @router.get('/export.csv')
-def export_csv(session: Session = Depends(get_session)):
+def export_csv(session: Session = Depends(get_read_session)):
     rows = list(session.exec(select(RunMetric)))
     buf = io.StringIO()
     w = csv.writer(buf)
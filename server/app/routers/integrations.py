@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlmodel import Session
 
 from app.core.config import settings
-from app.db import get_session
+from app.db import get_read_session, get_session
 from app.integrations.agentception_client import AgentCeptionClient
 from app.integrations.phios_client import IntegrationClientError, PhiOSClient
 from app.integrations.schemas import ApplyPolicyTemplateRequest, BranchSetCreateRequest, ContextPackRequest, DecisionStateRequest, LaunchMissionRequest, PatternActionRequest, PersonaBranchSetCreateRequest, PersonaPolicyCheckRequest, PortfolioDecisionRequest, PrepareMissionRequest, ReplayDraftRequest, ReplayLaunchRequest, SoftwareTaskRequest, WritebackRequest
@@ -133,7 +133,7 @@ def integration_runs(
     search: str | None = Query(default=None),
     limit: int = Query(default=50, ge=1, le=500),
     offset: int = Query(default=0, ge=0),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     start_dt = datetime.fromisoformat(start_date) if start_date else None
     end_dt = datetime.fromisoformat(end_date) if end_date else None
@@ -421,17 +421,17 @@ def integration_timeline(run_id: int, session: Session = Depends(get_session)):
 
 
 @router.get('/api/integrations/metrics')
-def integration_metrics(session: Session = Depends(get_session)):
+def integration_metrics(session: Session = Depends(get_read_session)):
     return IntegrationOrchestrator(session).get_metrics()
 
 
 @router.get('/api/integrations/watcher/events')
-def integration_watcher_events(limit: int = 100, session: Session = Depends(get_session)):
+def integration_watcher_events(limit: int = 100, session: Session = Depends(get_read_session)):
     return {'events': IntegrationOrchestrator(session).list_watcher_events(limit=limit)}
 
 
 @router.get('/api/integrations/alerts/events')
-def integration_alert_events(limit: int = 50, session: Session = Depends(get_session)):
+def integration_alert_events(limit: int = 50, session: Session = Depends(get_read_session)):
     return {'events': IntegrationOrchestrator(session).list_alert_events(limit=limit)}
 
 
@@ -452,7 +452,22 @@ def integration_analytics_cache(session: Session = Depends(get_session)):
 
 @router.post('/api/integrations/analytics/cache/invalidate')
 def integration_analytics_cache_invalidate(payload: dict, session: Session = Depends(get_session)):
-    return IntegrationOrchestrator(session).invalidate_analytics_cache(payload.get('prefix'))
+    tags = payload.get('tags')
+    if isinstance(tags, str):
+        tags = [tags]
+    elif tags is not None and not (isinstance(tags, list) and all(isinstance(t, str) for t in tags)):
+        raise HTTPException(status_code=400, detail='tags must be a string or a list of strings')
+    return IntegrationOrchestrator(session).invalidate_analytics_cache(payload.get('prefix'), tags)
+
+
+@router.get('/api/integrations/analytics/rollups')
+def integration_analytics_rollups(session: Session = Depends(get_session)):
+    return IntegrationOrchestrator(session).analytics_rollup_status()
+
+
+@router.post('/api/integrations/analytics/rollups/rebuild')
+def integration_analytics_rollups_rebuild(session: Session = Depends(get_session)):
+    return IntegrationOrchestrator(session).rebuild_analytics_rollups()
 
 
 @router.get('/api/integrations/insights')
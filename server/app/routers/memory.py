@@ -2,11 +2,13 @@ import json
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 
-from app.db import get_session
+from app.db import get_read_session, get_session
 from app.models import Capsule, ContextActivation, DuplicateCluster, MemoryConflict, MemoryEdge, MemoryLayer, MemoryMaintenanceJob, MemorySummary, MemoryUsefulnessMetric
-from app.services.runtime.conflicts import detect_conflicts_for_run, list_duplicates, upsert_duplicate_cluster
+from app.services.runtime.bookkeeping import retrieval_bookkeeping
+from app.services.runtime.conflicts import detect_conflicts_for_run, list_duplicates, upsert_duplicate_clusters
 from app.services.runtime.maintenance import demote_capsule, promote_capsule, refine_capsule, run_maintenance
 from app.services.runtime.trace import get_run_trace
+from app.services.runtime.write_behind import memory_write_behind
 
 router = APIRouter(prefix='/api/memory', tags=['memory'])
 
@@ -63,7 +65,7 @@ def capsule_neighbors(capsule_id: int, session: Session = Depends(get_session)):
 
 
 @router.get('/runs/{run_id}/contexts')
-def run_contexts(run_id: int, session: Session = Depends(get_session)):
+def run_contexts(run_id: int, session: Session = Depends(get_read_session)):
     rows = list(session.exec(select(ContextActivation).where(ContextActivation.run_id == run_id).order_by(ContextActivation.id.desc())))
     items = []
     for row in rows:
@@ -77,20 +79,20 @@ def run_contexts(run_id: int, session: Session = Depends(get_session)):
 
 
 @router.get('/runs/{run_id}/retrieval')
-def run_retrieval(run_id: int, session: Session = Depends(get_session)):
+def run_retrieval(run_id: int, session: Session = Depends(get_read_session)):
     rows = list(session.exec(select(ContextActivation).where(ContextActivation.run_id == run_id).order_by(ContextActivation.id.desc()).limit(40)))
     return {'ok': True, 'run_id': run_id, 'items': [{'capsule_id': r.capsule_id, 'layer': r.layer, 'score': r.score, 'reason': json.loads(r.reason_json or '{}')} for r in rows]}
 
 
 @router.get('/runs/{run_id}/trace')
-def run_memory_trace(run_id: int, session: Session = Depends(get_session)):
-    allow = {'memory_layer_query', 'context_admission', 'retrieval_score_breakdown', 'context_admission_reason', 'memory_promotion', 'memory_demotion', 'memory_refinement', 'graph_rerank', 'archive_promotion', 'maintenance_job', 'maintenance_summary', 'memory_conflict_detected', 'memory_conflict_admitted', 'duplicate_capsule_detected', 'memory_usefulness_update'}
-    trace = [t for t in get_run_trace(session, run_id) if t['event_type'] in allow]
+def run_memory_trace(run_id: int, session: Session = Depends(get_read_session)):
+    allow = {'memory_layer_query', 'context_admission', 'retrieval_score_breakdown', 'context_admission_reason', 'memory_promotion', 'memory_demotion', 'memory_refinement', 'graph_rerank', 'archive_promotion', 'maintenance_job', 'maintenance_summary', 'memory_conflict_detected', 'memory_conflict_admitted', 'duplicate_capsule_detected', 'memory_usefulness_update', 'memory_bookkeeping_flush'}
+    trace = get_run_trace(session, run_id, allow)
     return {'ok': True, 'run_id': run_id, 'trace': trace}
 
 
 @router.get('/health')
-def memory_health(session: Session = Depends(get_session)):
+def memory_health(session: Session = Depends(get_read_session)):
     capsules = list(session.exec(select(Capsule)))
     by_layer: dict[str, int] = {}
     for c in capsules:
@@ -107,11 +109,13 @@ def memory_health(session: Session = Depends(get_session)):
         'active_context_runs': len({r.run_id for r in session.exec(select(ContextActivation))}),
         'maintenance_status': [{'id': j.id, 'status': j.status, 'job_type': j.job_type, 'used_worker': j.used_worker, 'details_json': j.details_json, 'updated_at': j.updated_at.isoformat()} for j in jobs],
         'last_maintenance': {'id': last_job.id, 'status': last_job.status} if last_job else None,
+        'bookkeeping': retrieval_bookkeeping.stats(),
+        'write_behind': memory_write_behind.stats(),
     }
 
 
 @router.get('/conflicts')
-def memory_conflicts(session: Session = Depends(get_session)):
+def memory_conflicts(session: Session = Depends(get_read_session)):
     rows = list(session.exec(select(MemoryConflict).order_by(MemoryConflict.conflict_score.desc()).limit(100)))
     return {'ok': True, 'items': rows}
 
@@ -141,10 +145,8 @@ def maintenance_conflicts(payload: dict | None = None, session: Session = Depend
 @router.post('/maintenance/duplicates')
 def maintenance_duplicates(session: Session = Depends(get_session)):
     caps = list(session.exec(select(Capsule).order_by(Capsule.id.desc()).limit(200)))
-    touched = 0
-    for c in caps:
-        upsert_duplicate_cluster(session, c)
-        touched += 1
+    touched = len(upsert_duplicate_clusters(session, caps))
+    session.commit()
     return {'ok': True, 'touched_capsules': touched, 'clusters': list_duplicates(session)}
 
 
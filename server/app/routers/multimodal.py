@@ -1,38 +1,68 @@
-import asyncio
-import json
 from fastapi import APIRouter, Depends, UploadFile, File
 from sqlmodel import Session
 
 from app.db import get_session
 from app.models import Attachment, AttachmentExtract
-from app.services.multimodal.service import store_upload, extract_pdf_text
-from app.services.runtime.router import route_capsule_ingest
+from app.services.multimodal.service import store_upload, extract_pdf_text, iter_pdf_pages
+from app.services.runtime.capsules import IngestDocument
+from app.services.runtime.offload import blocking_pool
+from app.services.runtime.router import route_documents_ingest
 
 router = APIRouter(tags=['multimodal'])
 
 
-@router.post('/api/runs/{run_id}/attachments')
-def upload_attachment(run_id: int, file: UploadFile = File(...), session: Session = Depends(get_session)):
-    data = file.file.read()
-    path, sha = store_upload(run_id, file.filename, data)
-    a = Attachment(run_id=run_id, filename=file.filename, mime=file.content_type or 'application/octet-stream', sha256=sha, path=path, meta_json='{}')
+def _store_attachment(session: Session, run_id: int, filename: str, content_type: str | None, data: bytes) -> tuple[Attachment, str, list[str] | None]:
+    path, sha = store_upload(run_id, filename, data)
+    a = Attachment(run_id=run_id, filename=filename, mime=content_type or 'application/octet-stream', sha256=sha, path=path, meta_json='{}')
     session.add(a)
     session.commit()
     session.refresh(a)
     extract = ''
-    if (file.content_type or '').lower() == 'application/pdf' or file.filename.lower().endswith('.pdf'):
-        extract = extract_pdf_text(path)
+    pages = None
+    if (content_type or '').lower() == 'application/pdf' or filename.lower().endswith('.pdf'):
+        # Parsed once: the pages feed both the stored extract and capsule ingest.
+        pages = list(iter_pdf_pages(path))
+        extract = extract_pdf_text(pages)
         session.add(AttachmentExtract(attachment_id=a.id, text=extract))
         session.commit()
-    elif (file.content_type or '').lower().startswith('text/'):
+    elif (content_type or '').lower().startswith('text/'):
         extract = data.decode('utf-8', errors='ignore')[:50000]
         if extract.strip():
             session.add(AttachmentExtract(attachment_id=a.id, text=extract))
             session.commit()
+    return a, extract, pages
+
+
+async def _store_upload(session: Session, run_id: int, file: UploadFile) -> tuple[Attachment, str, list[str] | None]:
+    data = await file.read()
+    return await blocking_pool.run('db', _store_attachment, session, run_id, file.filename, file.content_type, data)
+
+
+def _ingest_document(run_id: int, a: Attachment, extract: str, pages: list[str] | None) -> IngestDocument:
+    # PDFs are chunked from every page, not just the stored (truncated) extract, on single and batch uploads alike.
+    return IngestDocument(run_id=run_id, text=extract, source=a.filename, attachment_id=a.id, blocks=pages)
+
+
+@router.post('/api/runs/{run_id}/attachments')
+async def upload_attachment(run_id: int, file: UploadFile = File(...), session: Session = Depends(get_session)):
+    a, extract, pages = await _store_upload(session, run_id, file)
 
     capsules_created = 0
     if extract.strip():
-        result = asyncio.run(route_capsule_ingest(session=session, run_id=run_id, text=extract, source=file.filename, attachment_id=a.id))
+        result = await route_documents_ingest(session, [_ingest_document(run_id, a, extract, pages)])
         capsules_created = int(result.get('capsules_created', 0))
 
     return {'ok': True, 'attachment_id': a.id, 'extract_preview': extract[:500], 'capsules_created': capsules_created}
+
+
+@router.post('/api/runs/{run_id}/attachments/batch')
+async def upload_attachments(run_id: int, files: list[UploadFile] = File(...), session: Session = Depends(get_session)):
+    stored = [await _store_upload(session, run_id, f) for f in files]
+    docs = [_ingest_document(run_id, a, extract, pages) for a, extract, pages in stored if extract.strip()]
+    result = await route_documents_ingest(session, docs)
+    created = {item['attachment_id']: item['capsules_created'] for item in result['items']}
+    return {
+        'ok': True,
+        'capsules_created': result['capsules_created'],
+        'attachments': [{'attachment_id': a.id, 'filename': a.filename, 'capsules_created': created.get(a.id, 0)} for a, _, _ in stored],
+    }
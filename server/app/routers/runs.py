@@ -1,14 +1,21 @@
-import asyncio
 import json
-from fastapi import APIRouter, Depends, HTTPException
+import time
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 
-from app.db import get_session
+from app.core.config import settings
+from app import db
+from app.db import get_read_session, get_session
 from app.models import Run, Team, Message, Agent, TeamAgent, AgentHandoff, CollaborationMetric, TeamPlan, TeamSubgoal, ActionRequest, ActionExecution, ActionArtifact
 from app.schemas import RunIn
 from app.services.orchestration.engine import OrchestrationEngine
-from app.services.runtime.trace import get_run_trace
+from app.services.orchestration.scheduler import run_scheduler
+from app.services.runtime.run_events import run_events
+from app.services.runtime.offload import blocking_pool
+from app.services.runtime.trace import count_run_events, get_run_trace, iter_run_trace, run_trace_page
 from app.services.runtime.team import collaboration_trace, list_plan
 
 router = APIRouter(prefix='/api/runs', tags=['runs'])
@@ -16,32 +23,58 @@ engine = OrchestrationEngine()
 
 
 @router.get('')
-def list_runs(session: Session = Depends(get_session)):
+def list_runs(session: Session = Depends(get_read_session)):
     return list(session.exec(select(Run).order_by(Run.id.desc())))
 
 
-@router.post('')
-async def create_run(payload: RunIn, session: Session = Depends(get_session)):
+def _start_run(session: Session, payload: RunIn) -> Run:
     team = session.get(Team, payload.team_id)
     if not team:
         raise HTTPException(404, 'team not found')
-    run = Run(team_id=payload.team_id, mode=team.mode, status='running', max_turns=payload.max_turns, max_seconds=payload.max_seconds, token_budget=payload.token_budget, consensus_threshold=payload.consensus_threshold)
+    run = Run(team_id=payload.team_id, mode=team.mode, status='running', max_turns=payload.max_turns, max_seconds=payload.max_seconds, token_budget=payload.token_budget, consensus_threshold=payload.consensus_threshold, prompt=payload.prompt, reflection=payload.reflection, priority=max(1, min(10, payload.priority)))
+    if payload.background:
+        run.status = 'queued'
+        # started_at stays at queued_at until the scheduler dispatches the run.
+        run.queued_at = run.started_at = datetime.utcnow()
     session.add(run)
     session.commit()
     session.refresh(run)
-    state = await engine.execute(session, run, payload.prompt, payload.reflection)
+    return run
+
+
+@router.post('')
+async def create_run(payload: RunIn, response: Response, session: Session = Depends(get_session)):
+    if payload.background and not run_scheduler.accepting():
+        raise HTTPException(429, 'run queue is full')
+    run = await blocking_pool.run('db', _start_run, session, payload)
+    if payload.background:
+        position = run_scheduler.submit(run.id, run.team_id, payload.prompt, payload.reflection, run.priority)
+        response.status_code = 202
+        return {'run_id': run.id, 'status': run.status, 'queue_position': position, 'poll': f'/api/runs/{run.id}'}
+    try:
+        state = await engine.execute(session, run, payload.prompt, payload.reflection)
+    finally:
+        run_scheduler.forget(run.id)
     return {'run_id': run.id, 'messages': state.messages, 'status': run.status}
 
 
+@router.get('/scheduler')
+def scheduler_stats():
+    return {'ok': True, **run_scheduler.stats()}
+
+
 @router.post('/{run_id}/pause')
 def pause_run(run_id: int, session: Session = Depends(get_session)):
     run = session.get(Run, run_id)
     if not run:
         raise HTTPException(404, 'run not found')
+    if run.status not in {'queued', 'running'}:
+        raise HTTPException(409, f'run is {run.status}')
     run.status = 'paused'
     run.paused_reason = 'manual'
     session.add(run)
     session.commit()
+    run_scheduler.pause(run_id)
     return {'ok': True}
 
 
@@ -50,10 +83,14 @@ def resume_run(run_id: int, session: Session = Depends(get_session)):
     run = session.get(Run, run_id)
     if not run:
         raise HTTPException(404, 'run not found')
-    run.status = 'running'
+    if run.status != 'paused':
+        raise HTTPException(409, f'run is {run.status}')
+    run.status = 'queued' if run_scheduler.is_queued(run_id) else 'running'
+    run.paused_reason = ''
     session.add(run)
     session.commit()
-    return {'ok': True}
+    run_scheduler.resume(run_id)
+    return {'ok': True, 'status': run.status}
 
 
 @router.post('/{run_id}/clone-agent')
@@ -87,22 +124,102 @@ def get_run(run_id: int, session: Session = Depends(get_session)):
 
 
 @router.get('/{run_id}/trace')
-def run_trace(run_id: int, session: Session = Depends(get_session)):
+def run_trace(
+    run_id: int,
+    event_type: list[str] | None = Query(default=None),
+    after_id: int = Query(default=0, ge=0),
+    limit: int | None = Query(default=None, ge=1, le=5000),
+    session: Session = Depends(get_read_session),
+):
+    """A run's trace, optionally filtered by event type. With ``limit`` it is one page, and ``next_after_id`` is the cursor for the next."""
     run = session.get(Run, run_id)
     if not run:
         raise HTTPException(404, 'run not found')
-    return {'ok': True, 'run_id': run_id, 'trace': get_run_trace(session, run_id)}
+    if limit is None and not after_id:
+        return {'ok': True, 'run_id': run_id, 'trace': get_run_trace(session, run_id, event_type)}
+    page, next_after_id = run_trace_page(session, run_id, event_type, after_id=after_id, limit=limit or 500)
+    return {'ok': True, 'run_id': run_id, 'trace': page, 'next_after_id': next_after_id}
+
+
+@router.get('/{run_id}/trace/ndjson')
+def run_trace_ndjson(
+    run_id: int,
+    event_type: list[str] | None = Query(default=None),
+    after_id: int = Query(default=0, ge=0),
+    session: Session = Depends(get_read_session),
+):
+    """The whole trace as newline-delimited JSON, read and written a batch at a time."""
+    if not session.get(Run, run_id):
+        raise HTTPException(404, 'run not found')
+
+    def lines():
+        # The request's session may be closed before the body is sent; the stream reads on its own.
+        with Session(db.read_engine) as stream_session:
+            for item in iter_run_trace(stream_session, run_id, event_type, after_id=after_id):
+                yield json.dumps(item, default=str) + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+@router.get('/{run_id}/trace/counts')
+def run_trace_counts(run_id: int, event_type: list[str] | None = Query(default=None), session: Session = Depends(get_read_session)):
+    if not session.get(Run, run_id):
+        raise HTTPException(404, 'run not found')
+    counts = count_run_events(session, run_id, event_type)
+    return {'ok': True, 'run_id': run_id, 'total': sum(counts.values()), 'counts': counts}
+
+_ACTIVE_STATUSES = {'queued', 'running', 'paused'}
+
+
+def _run_status(run_id: int) -> str:
+    with Session(db.read_engine) as session:
+        run = session.get(Run, run_id)
+        return run.status if run else 'deleted'
+
+
+def _sse(event: dict) -> str:
+    head = f"id: {event['seq']}\n" if event.get('seq') is not None else ''
+    return f"{head}event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
 
 @router.get('/{run_id}/stream')
-def stream_run(run_id: int, session: Session = Depends(get_session)):
-    messages = list(session.exec(select(Message).where(Message.run_id == run_id).order_by(Message.id)))
+def stream_run(run_id: int, replay: bool = True, session: Session = Depends(get_read_session)):
+    """Server-sent events for a run: live actions, tool results, traces and model tokens while it executes.
+
+    A run that finished before this process saw it (no live history) is replayed
+    from its persisted messages instead.
+    """
+    run = session.get(Run, run_id)
+    if not run:
+        raise HTTPException(404, 'run not found')
+    active = run.status in _ACTIVE_STATUSES
+    live = active or run_events.has_history(run_id)
+    messages = [] if live else list(session.exec(select(Message).where(Message.run_id == run_id).order_by(Message.id)))
 
     async def event_gen():
-        for m in messages:
-            yield f"data: {json.dumps({'role': m.role, 'content': m.content})}\n\n"
-            await asyncio.sleep(0.01)
+        if not live:
+            for m in messages:
+                yield _sse({'run_id': run_id, 'type': 'message', 'seq': None, 'data': {'role': m.role, 'content': m.content}})
+            yield _sse({'run_id': run_id, 'type': 'end', 'seq': None, 'data': {'status': run.status}})
+            return
+        sub = run_events.subscribe(run_id, replay=replay)
+        # Re-read once subscribed: a run that ended after the check above published its end before we listened.
+        status = await blocking_pool.run('db', _run_status, run_id) if active else run.status
+        if status not in _ACTIVE_STATUSES:
+            # Already over: send what is buffered and end instead of waiting on a run that will publish nothing more.
+            sub.close(status)
+        idle_limit = settings.agentora_stream_idle_seconds
+        last_event = time.monotonic()
+        async for event in sub.events(heartbeat_seconds=settings.agentora_stream_heartbeat_seconds):
+            if event is not None:
+                last_event = time.monotonic()
+            elif idle_limit > 0 and time.monotonic() - last_event >= idle_limit and not run_scheduler.owns(run_id):
+                # The scheduler is not executing it (another process's run, or one left by a crash): stop waiting for an end.
+                status = await blocking_pool.run('db', _run_status, run_id)
+                sub.close(status if status not in _ACTIVE_STATUSES else 'idle')
+            yield ': keep-alive\n\n' if event is None else _sse(event)
 
-    return StreamingResponse(event_gen(), media_type='text/event-stream')
+    return StreamingResponse(event_gen(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @router.get('/{run_id}/plan')
@@ -2,9 +2,18 @@ from fastapi import APIRouter, Depends
 from sqlmodel import Session
 
 from app.core.config import settings
-from app.db import get_session
+from app.db import db_profile, get_session
+from app.services.http_pool import http_pool
+from app.services.ollama_client import chat_metrics, embed_metrics
 from app.services.runtime.bootstrap import run_bootstrap
+from app.services.runtime.embedding_cache import embedding_cache
+from app.services.runtime.offload import blocking_pool, loop_lag
+from app.services.runtime.query_plans import explain_hot_queries
+from app.services.runtime.run_events import run_events
 from app.services.runtime.system_doctor import run_doctor
+from app.services.runtime.tool_exec import tool_executor
+from app.services.runtime.trace import trace_writer
+from app.services.tools.sandbox import sandbox_pool
 
 router = APIRouter(prefix='/api/system', tags=['system'])
 
@@ -32,6 +41,46 @@ def doctor():
     return {'ok': True, **report}
 
 
+@router.get('/embeddings')
+def embeddings():
+    return {'ok': True, 'model': settings.agentora_embed_model, 'batches': embed_metrics.snapshot(), 'cache': embedding_cache.stats()}
+
+
+@router.get('/http-pool')
+def http_pool_stats():
+    return {'ok': True, **http_pool.stats()}
+
+
+@router.get('/db')
+def db_settings():
+    return {'ok': True, **db_profile()}
+
+
+@router.get('/query-plans')
+def query_plans():
+    return explain_hot_queries()
+
+
+@router.get('/streaming')
+def streaming_stats():
+    return {'ok': True, 'events': run_events.stats(), 'ttft': chat_metrics.snapshot()}
+
+
+@router.get('/traces')
+def trace_stats():
+    return {'ok': True, 'traces': trace_writer.stats()}
+
+
+@router.get('/loop-lag')
+def loop_lag_stats():
+    return {'ok': True, 'loop_lag': loop_lag.stats(), 'blocking_pool': blocking_pool.stats()}
+
+
+@router.get('/tool-exec')
+def tool_exec_stats():
+    return {'ok': True, **tool_executor.stats(), 'sandbox': sandbox_pool.stats()}
+
+
 @router.post('/bootstrap')
 def bootstrap(payload: dict | None = None, session: Session = Depends(get_session)):
     auto_fix = bool((payload or {}).get('auto_fix', False))
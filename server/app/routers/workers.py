@@ -1,10 +1,13 @@
+import json
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session
 
 from app.db import get_session
 from app.models import WorkerJob
-from app.schemas import WorkerIn, WorkerHeartbeatIn, WorkerDispatchIn
+from app.schemas import WorkerIn, WorkerHeartbeatIn, WorkerDispatchIn, WorkerClaimIn, WorkerLeaseIn, WorkerResultIn
 from app.services.runtime.worker_queue import worker_queue
+from app.services.runtime.worker_runtime import worker_runtime
 
 router = APIRouter(prefix='/api/workers', tags=['workers'])
 worker_router = APIRouter(prefix='/api/worker', tags=['worker-node-contract'])
@@ -22,6 +25,7 @@ def _job_payload(job: WorkerJob) -> dict:
         'used_fallback_local': job.used_fallback_local,
         'result_json': job.result_json,
         'error': job.error,
+        'lease_expires_at': job.lease_expires_at.isoformat() if job.lease_expires_at else '',
         'created_at': job.created_at.isoformat() if job.created_at else '',
         'updated_at': job.updated_at.isoformat() if job.updated_at else '',
     }
@@ -48,7 +52,47 @@ def heartbeat(payload: WorkerHeartbeatIn, session: Session = Depends(get_session
 
 @router.post('/dispatch')
 def dispatch_job(payload: WorkerDispatchIn, session: Session = Depends(get_session)):
-    job = worker_queue.dispatch(session, payload.job_type, payload.payload, priority=payload.priority)
+    job = worker_queue.dispatch(session, payload.job_type, payload.payload, priority=payload.priority, wait=payload.wait)
+    return {'ok': True, 'job': _job_payload(job)}
+
+
+@router.get('/queue')
+def queue_stats(session: Session = Depends(get_session)):
+    return {'ok': True, 'queue': worker_queue.stats(session)}
+
+
+@router.get('/routing')
+def routing_state(session: Session = Depends(get_session)):
+    return {'ok': True, 'nodes': worker_queue.routing(session), 'breaker_transitions': worker_queue.nodes.breaker_history()}
+
+
+@router.post('/claim')
+def claim_jobs(payload: WorkerClaimIn, session: Session = Depends(get_session)):
+    jobs = worker_queue.claim(session, payload.worker_id, payload.capabilities, max_jobs=min(payload.max_jobs, 16), lease_seconds=payload.lease_seconds)
+    if jobs is None:
+        raise HTTPException(404, 'worker not found')
+    return {
+        'ok': True,
+        'jobs': [
+            {'id': j.id, 'job_type': j.job_type, 'payload': json.loads(j.payload_json or '{}'), 'priority': j.priority, 'lease_token': j.lease_token, 'lease_expires_at': j.lease_expires_at.isoformat()}
+            for j in jobs
+        ],
+    }
+
+
+@router.post('/jobs/{job_id}/heartbeat')
+def extend_job_lease(job_id: int, payload: WorkerLeaseIn, session: Session = Depends(get_session)):
+    expires = worker_queue.extend_lease(session, job_id, payload.lease_token, payload.lease_seconds)
+    if expires is None:
+        raise HTTPException(409, 'lease lost')
+    return {'ok': True, 'job_id': job_id, 'lease_expires_at': expires.isoformat()}
+
+
+@router.post('/jobs/{job_id}/complete')
+def complete_job(job_id: int, payload: WorkerResultIn, session: Session = Depends(get_session)):
+    job = worker_queue.complete(session, job_id, payload.lease_token, payload.ok, payload.result, payload.error)
+    if job is None:
+        raise HTTPException(409, 'lease lost')
     return {'ok': True, 'job': _job_payload(job)}
 
 
@@ -73,9 +117,21 @@ def worker_contract_heartbeat(payload: dict):
 
 @worker_router.post('/execute')
 def worker_contract_execute(payload: dict):
-    return {'ok': True, 'result': {'mode': 'mock-worker', 'echo': payload}}
+    """Run a job on this node directly; pulled jobs go through the same handlers."""
+    result = worker_runtime.execute(str(payload.get('type', '')), payload.get('payload') or {})
+    if payload.get('job_id') is not None:
+        worker_runtime.record(int(payload['job_id']), 'done' if result.get('ok', True) else 'failed', result)
+    return {'ok': bool(result.get('ok', True)), 'result': result}
+
+
+@worker_router.get('/status')
+def worker_contract_status():
+    return {'ok': True, 'worker': worker_runtime.stats()}
 
 
 @worker_router.get('/jobs/{job_id}')
 def worker_contract_job(job_id: int):
-    return {'ok': True, 'job_id': job_id, 'status': 'done'}
+    job = worker_runtime.job(job_id)
+    if job is None:
+        raise HTTPException(404, 'job not found on this worker')
+    return {'ok': True, **job}
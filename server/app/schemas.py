@@ -26,6 +26,8 @@ class RunIn(BaseModel):
     token_budget: int = 3000
     consensus_threshold: int = 1
     reflection: bool = False
+    background: bool = False
+    priority: int = 5
 
 
 class WorkerIn(BaseModel):
@@ -43,6 +45,26 @@ class WorkerDispatchIn(BaseModel):
     job_type: str
     payload: dict = {}
     priority: int = 5
+    wait: bool = True
+
+
+class WorkerClaimIn(BaseModel):
+    worker_id: int
+    capabilities: list[str] | None = None
+    max_jobs: int = 1
+    lease_seconds: float | None = None
+
+
+class WorkerLeaseIn(BaseModel):
+    lease_token: str
+    lease_seconds: float | None = None
+
+
+class WorkerResultIn(BaseModel):
+    lease_token: str
+    ok: bool = True
+    result: dict = {}
+    error: str = ""
 
 
 
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Iterable
+
+from app.core.config import settings
+
+ALL_REPOS_TAG = 'repo:*'
+
+
+def repo_tag(repo: str | None) -> str:
+    """Tag for an aggregate over one repo; aggregates across repos carry :data:`ALL_REPOS_TAG`."""
+    return f'repo:{repo}' if repo else ALL_REPOS_TAG
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    payload: dict
+    tags: frozenset[str]
+    source_filters: dict
+    row_count: int
+    size_bytes: int
+    generated_at: datetime
+    stored_at: float
+    hits: int = 0
+
+    def metadata(self) -> dict:
+        return {
+            'cache_key': self.key,
+            'generated_at': self.generated_at.isoformat(),
+            'source_filters': self.source_filters,
+            'row_count': self.row_count,
+            'freshness_seconds': max(0, int(time.monotonic() - self.stored_at)),
+        }
+
+
+@dataclass
+class _Pending:
+    done: threading.Event = field(default_factory=threading.Event)
+    entry: CacheEntry | None = None
+
+
+class AnalyticsCache:
+    """Process-wide LRU cache for analytics payloads.
+
+    Entries expire after ``AGENTORA_ANALYTICS_CACHE_TTL_SECONDS`` and the
+    least recently used ones are evicted once ``..._MAX_ENTRIES`` or
+    ``..._MAX_BYTES`` (serialized payload size) is exceeded. Each entry carries
+    tags, so a write can drop just the aggregates it affects. Concurrent
+    misses on one key are coalesced: the first caller computes, the others
+    wait for its result. A result whose computation overlapped an
+    invalidation is returned but not stored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._by_tag: dict[str, set[str]] = {}
+        self._pending: dict[str, _Pending] = {}
+        self._generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.uncached = 0
+
+    def _drop(self, key: str) -> CacheEntry | None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.bytes -= entry.size_bytes
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+        return entry
+
+    def _lookup(self, key: str) -> CacheEntry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.stored_at > settings.agentora_analytics_cache_ttl_seconds:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        return entry
+
+    def get(self, key: str) -> CacheEntry | None:
+        if not settings.agentora_analytics_cache_enabled:
+            return None
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+            return entry
+
+    def _store(self, entry: CacheEntry) -> None:
+        self._drop(entry.key)
+        self._entries[entry.key] = entry
+        self.bytes += entry.size_bytes
+        for tag in entry.tags:
+            self._by_tag.setdefault(tag, set()).add(entry.key)
+        max_entries = max(1, settings.agentora_analytics_cache_max_entries)
+        max_bytes = settings.agentora_analytics_cache_max_bytes
+        while len(self._entries) > max_entries or (max_bytes > 0 and self.bytes > max_bytes and len(self._entries) > 1):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _build(self, key: str, payload: dict, tags: Iterable[str], source_filters: dict, row_count: int) -> CacheEntry:
+        size = len(json.dumps(payload, separators=(',', ':'), default=str))
+        return CacheEntry(key=key, payload=payload, tags=frozenset(tags), source_filters=source_filters, row_count=row_count, size_bytes=size, generated_at=datetime.utcnow(), stored_at=time.monotonic())
+
+    def get_or_compute(self, key: str, compute: Callable[[], dict], *, tags: Iterable[str] = (), source_filters: dict | None = None, row_count: Callable[[dict], int] | None = None) -> CacheEntry:
+        """Cached entry for ``key``, running ``compute`` once across concurrent misses."""
+        tags = frozenset(tags)
+        filters = dict(source_filters or {})
+        if not settings.agentora_analytics_cache_enabled:
+            payload = compute()
+            return self._build(key, payload, tags, filters, row_count(payload) if row_count else 0)
+        while True:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = _Pending()
+                    generation = self._generation
+                    self.misses += 1
+                    break
+                self.coalesced += 1
+            pending.done.wait(max(1.0, settings.agentora_analytics_cache_ttl_seconds))
+            if pending.entry is not None:
+                return pending.entry
+            # The leader failed or timed out: take over rather than wait again.
+        try:
+            payload = compute()
+            entry = self._build(key, payload, tags, filters, row_count(payload) if row_count else 0)
+            with self._lock:
+                if self._generation == generation:
+                    self._store(entry)
+                else:
+                    self.uncached += 1
+            pending.entry = entry
+            return entry
+        finally:
+            with self._lock:
+                if self._pending.get(key) is pending:
+                    del self._pending[key]
+            pending.done.set()
+
+    def invalidate(self, *, tags: Iterable[str] | None = None, prefix: str | None = None) -> int:
+        """Drop entries carrying any of ``tags`` and/or whose key starts with ``prefix``; everything when neither is given."""
+        with self._lock:
+            self._generation += 1
+            if tags is None and not prefix:
+                keys = list(self._entries)
+            else:
+                keys = {key for tag in (tags or ()) for key in self._by_tag.get(tag, ())}
+                if prefix:
+                    keys |= {key for key in self._entries if key.startswith(prefix)}
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def invalidate_repos(self, repos: Iterable[str]) -> int:
+        """A run in these repos changed: drop their aggregates and every cross-repo one."""
+        return self.invalidate(tags={ALL_REPOS_TAG, *(repo_tag(r) for r in repos if r)})
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def status(self) -> dict:
+        with self._lock:
+            entries = [{**entry.metadata(), 'tags': sorted(entry.tags), 'size_bytes': entry.size_bytes, 'hits': entry.hits} for entry in reversed(self._entries.values())]
+            lookups = self.hits + self.misses
+            return {
+                'enabled': settings.agentora_analytics_cache_enabled,
+                'ttl_seconds': settings.agentora_analytics_cache_ttl_seconds,
+                'max_entries': settings.agentora_analytics_cache_max_entries,
+                'max_bytes': settings.agentora_analytics_cache_max_bytes,
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'coalesced': self.coalesced,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'uncached_after_invalidation': self.uncached,
+                'entries': entries,
+            }
+
+
+analytics_cache = AnalyticsCache()
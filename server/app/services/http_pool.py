@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import threading
+import weakref
+from dataclasses import dataclass, field
+
+import httpx
+
+from app.core.config import settings
+
+
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Default per-upstream pool sizes; AGENTORA_HTTP_POOL_LIMITS overrides max_connections by name.
+UPSTREAM_DEFAULTS: dict[str, dict[str, float]] = {
+    'ollama': {'max_connections': 8, 'timeout': 120.0},
+    'worker': {'max_connections': 16, 'timeout': 12.0},
+    'phios': {'max_connections': 4, 'timeout': 20.0},
+    'agentception': {'max_connections': 4, 'timeout': 45.0},
+    'webhook': {'max_connections': 2, 'timeout': 5.0},
+}
+
+
+def _upstream_timeout(name: str) -> float:
+    if name == 'phios':
+        return float(settings.agentora_phios_timeout_seconds)
+    if name == 'agentception':
+        return float(settings.agentora_agentception_timeout_seconds)
+    return float(UPSTREAM_DEFAULTS.get(name, {}).get('timeout', 30.0))
+
+
+def _upstream_max_connections(name: str) -> int:
+    override = settings.http_pool_limits.get(name)
+    if override:
+        return max(1, override)
+    return int(UPSTREAM_DEFAULTS.get(name, {}).get('max_connections', 10))
+
+
+@dataclass
+class UpstreamStats:
+    max_connections: int
+    requests: int = 0
+    errors: int = 0
+    new_connections: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    saturated_requests: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def begin(self) -> None:
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.max_connections:
+                self.saturated_requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self, failed: bool) -> None:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if failed:
+                self.errors += 1
+
+    def connected(self) -> None:
+        with self._lock:
+            self.new_connections += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.errors - self.new_connections)
+            return {
+                'max_connections': self.max_connections,
+                'requests': self.requests,
+                'errors': self.errors,
+                'new_connections': self.new_connections,
+                'reused_connections': reused,
+                'reuse_rate': round(reused / self.requests, 4) if self.requests else 0.0,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'saturation': round(self.in_flight / self.max_connections, 4),
+                'peak_saturation': round(self.peak_in_flight / self.max_connections, 4),
+                'saturated_requests': self.saturated_requests,
+            }
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    def __init__(self, inner: httpx.BaseTransport, stats: UpstreamStats):
+        self._inner = inner
+        self._stats = stats
+
+    def _trace(self, event: str, _info: dict) -> None:
+        if event == 'connection.connect_tcp.complete':
+            self._stats.connected()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions['trace'] = self._trace
+        self._stats.begin()
+        failed = True
+        try:
+            response = self._inner.handle_request(request)
+            failed = False
+            return response
+        finally:
+            self._stats.end(failed)
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class _MeteredAsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, stats: UpstreamStats):
+        self._inner = inner
+        self._stats = stats
+
+    async def _trace(self, event: str, _info: dict) -> None:
+        if event == 'connection.connect_tcp.complete':
+            self._stats.connected()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions['trace'] = self._trace
+        self._stats.begin()
+        failed = True
+        try:
+            response = await self._inner.handle_async_request(request)
+            failed = False
+            return response
+        finally:
+            self._stats.end(failed)
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+class HttpPool:
+    """Keep-alive httpx clients shared per upstream, owned by the app lifespan.
+
+    Async clients are bound to the event loop that created them, so they are
+    kept per loop and each loop closes its own with :meth:`aclose_loop` before
+    it finishes; sync clients are shared across threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync: dict[str, httpx.Client] = {}
+        self._async: dict[str, weakref.WeakKeyDictionary] = {}
+        self._stats: dict[str, UpstreamStats] = {}
+        self.abandoned_async_clients = 0
+
+    def _limits(self, name: str) -> httpx.Limits:
+        max_connections = _upstream_max_connections(name)
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=float(settings.agentora_http_pool_keepalive_seconds),
+        )
+
+    def _stats_for(self, name: str) -> UpstreamStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = UpstreamStats(max_connections=_upstream_max_connections(name))
+        return stats
+
+    def sync_client(self, name: str) -> httpx.Client:
+        with self._lock:
+            client = self._sync.get(name)
+            if client is None or client.is_closed:
+                inner = httpx.HTTPTransport(limits=self._limits(name), http2=HTTP2_AVAILABLE)
+                client = httpx.Client(transport=_MeteredTransport(inner, self._stats_for(name)), timeout=_upstream_timeout(name))
+                self._sync[name] = client
+            return client
+
+    def _forget_finished_loops(self) -> None:
+        # A loop that finished without aclose_loop() cannot close its clients any more; drop them and count the leak.
+        for per_loop in self._async.values():
+            for loop in [loop for loop in list(per_loop.keys()) if loop.is_closed()]:
+                if not per_loop.pop(loop).is_closed:
+                    self.abandoned_async_clients += 1
+
+    def async_client(self, name: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            per_loop = self._async.setdefault(name, weakref.WeakKeyDictionary())
+            client = per_loop.get(loop)
+            if client is None or client.is_closed:
+                self._forget_finished_loops()
+                inner = httpx.AsyncHTTPTransport(limits=self._limits(name), http2=HTTP2_AVAILABLE)
+                client = httpx.AsyncClient(transport=_MeteredAsyncTransport(inner, self._stats_for(name)), timeout=_upstream_timeout(name))
+                per_loop[loop] = client
+            return client
+
+    async def aclose_loop(self) -> int:
+        """Close the async clients bound to the running loop; returns how many were open."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = [per_loop.pop(loop) for per_loop in self._async.values() if loop in per_loop]
+        for client in clients:
+            await client.aclose()
+        return len(clients)
+
+    async def aclose(self) -> None:
+        await self.aclose_loop()
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._sync.values())
+            self._sync.clear()
+        for client in clients:
+            client.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            upstreams = {name: stats.as_dict() for name, stats in sorted(self._stats.items())}
+            open_async = sum(1 for per_loop in self._async.values() for client in per_loop.values() if not client.is_closed)
+        return {'http2': HTTP2_AVAILABLE, 'async_clients_open': open_async, 'abandoned_async_clients': self.abandoned_async_clients, 'upstreams': upstreams}
+
+
+http_pool = HttpPool()
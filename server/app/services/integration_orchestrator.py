@@ -4,7 +4,6 @@ import json
 from datetime import datetime, timedelta
 from uuid import uuid4
 
-import httpx
 from sqlmodel import Session, select
 
 from app.core.config import settings
@@ -34,6 +33,9 @@ from app.integrations.schemas import (
     SoftwareTaskRequest,
 )
 from app.models import AlertEvent, IntegrationRun, MissionPatternMemory, OperatorDecisionEvent, WatcherEvent
+from app.services import mission_rollups
+from app.services.analytics_cache import analytics_cache, repo_tag
+from app.services.http_pool import http_pool
 
 ACTIVE_STATUSES = {'preparing_launch', 'launched', 'running', 'queued'}
 TERMINAL_STATUSES = {'completed', 'failed', 'cancelled', 'error'}
@@ -97,18 +99,7 @@ POLICY_TEMPLATES = {
 }
 
 
-def _risk_value(signal: str) -> int:
-    return {'low': 1, 'medium': 2, 'high': 3}.get(signal or 'medium', 2)
-
-
-def _confidence_value(level: str) -> int:
-    return {'low': 1, 'medium': 2, 'high': 3}.get(level or 'low', 1)
-
-
-
 class IntegrationOrchestrator:
-    _analytics_cache: dict[str, dict] = {}
-
     def __init__(self, session: Session):
         self.session = session
         self.phios = PhiOSClient()
@@ -170,52 +161,22 @@ class IntegrationOrchestrator:
     def _cache_key(self, name: str, **filters) -> str:
         return f"{name}:{json.dumps(filters, sort_keys=True, default=str)}"
 
-    def _cache_get(self, key: str):
-        if not settings.agentora_analytics_cache_enabled:
-            return None
-        entry = self._analytics_cache.get(key)
-        if not entry:
-            return None
-        age = (datetime.utcnow() - datetime.fromisoformat(entry['generated_at'])).total_seconds()
-        if age > settings.agentora_analytics_cache_ttl_seconds:
-            self._analytics_cache.pop(key, None)
-            return None
-        return entry
-
-    def _cache_set(self, key: str, payload: dict, filters: dict, row_count: int):
-        if not settings.agentora_analytics_cache_enabled:
-            return payload
-        if len(self._analytics_cache) >= settings.agentora_analytics_cache_max_entries:
-            oldest = sorted(self._analytics_cache.items(), key=lambda x: x[1].get('generated_at', ''))[0][0]
-            self._analytics_cache.pop(oldest, None)
-        entry = {
-            'cache_key': key,
-            'generated_at': datetime.utcnow().isoformat(),
-            'source_filters': filters,
-            'row_count': row_count,
-            'freshness_seconds': 0,
-            'payload': payload,
-        }
-        self._analytics_cache[key] = entry
-        return payload
+    def _cached_analytics(self, name: str, filters: dict, compute, rows_field: str) -> dict:
+        entry = analytics_cache.get_or_compute(self._cache_key(name, **filters), compute, tags={repo_tag(filters.get('repo'))}, source_filters=filters, row_count=lambda payload: len(payload[rows_field]))
+        return {**entry.payload, 'cache_metadata': entry.metadata()}
 
     def analytics_cache_status(self) -> dict:
-        now = datetime.utcnow()
-        entries = []
-        for k, v in self._analytics_cache.items():
-            age = (now - datetime.fromisoformat(v['generated_at'])).total_seconds()
-            entries.append({'cache_key': k, 'generated_at': v['generated_at'], 'source_filters': v.get('source_filters', {}), 'row_count': v.get('row_count', 0), 'freshness_seconds': max(0, int(age))})
-        return {'enabled': settings.agentora_analytics_cache_enabled, 'ttl_seconds': settings.agentora_analytics_cache_ttl_seconds, 'max_entries': settings.agentora_analytics_cache_max_entries, 'entries': entries}
-
-    def invalidate_analytics_cache(self, prefix: str | None = None) -> dict:
-        before = len(self._analytics_cache)
-        if prefix:
-            keys = [k for k in self._analytics_cache.keys() if k.startswith(prefix)]
-            for k in keys:
-                self._analytics_cache.pop(k, None)
-        else:
-            self._analytics_cache.clear()
-        return {'ok': True, 'invalidated': before - len(self._analytics_cache), 'remaining': len(self._analytics_cache)}
+        return analytics_cache.status()
+
+    def invalidate_analytics_cache(self, prefix: str | None = None, tags: list[str] | None = None) -> dict:
+        invalidated = analytics_cache.invalidate(prefix=prefix, tags=tags)
+        return {'ok': True, 'invalidated': invalidated, 'remaining': len(analytics_cache)}
+
+    def analytics_rollup_status(self) -> dict:
+        return mission_rollups.rollup_status(self.session)
+
+    def rebuild_analytics_rollups(self) -> dict:
+        return mission_rollups.rebuild(self.session)
 
     def _log_event(self, event_type: str, *, run_id: int | None = None, status: str = '', latency_ms: float = 0.0, detail: dict | None = None):
         evt = WatcherEvent(run_id=run_id, event_type=event_type, status=status, latency_ms=latency_ms, detail_json=dumps_json(detail or {}))
@@ -275,7 +236,7 @@ class IntegrationOrchestrator:
                 'detail': detail,
                 'at': datetime.utcnow().isoformat(),
             }
-            httpx.post(settings.agentora_missions_alerts_webhook_url, json=payload, timeout=5)
+            http_pool.sync_client('webhook').post(settings.agentora_missions_alerts_webhook_url, json=payload)
             self._log_alert(row.id, alert_type, severity, detail, delivery_status='sent')
         except Exception as exc:
             self._log_alert(row.id, alert_type, severity, {'error': str(exc), **detail}, delivery_status='failed')
@@ -634,31 +595,26 @@ class IntegrationOrchestrator:
         }
 
     def get_insights(self) -> dict:
-        runs = self.session.exec(select(IntegrationRun)).all()
-        by_status, by_persona, by_repo, risk_counts = {}, {}, {}, {}
-        for r in runs:
-            by_status[r.status] = by_status.get(r.status, 0) + 1
-            by_persona[r.persona_id] = by_persona.get(r.persona_id, 0) + 1
-            by_repo[r.repo] = by_repo.get(r.repo, 0) + 1
-            risk_counts[r.risk_signal] = risk_counts.get(r.risk_signal, 0) + 1
-        total = len(runs) or 1
-        writeback_written = sum(1 for r in runs if r.writeback_status == 'written')
-        terminal_success = sum(1 for r in runs if r.status == 'completed')
-        terminal_total = sum(1 for r in runs if r.status in TERMINAL_STATUSES) or 1
-        avg_score = sum(r.mission_score for r in runs) / total
-        avg_refresh_by_status = {s: (sum(r.refresh_count for r in runs if r.status == s) / c) for s, c in by_status.items()}
+        rows = mission_rollups.totals(self.session, ('repo', 'persona', 'status'))
+        by_status = {k: b['count'] for k, b in mission_rollups.merge(rows, lambda r: r['status']).items()}
+        by_persona = {k: b['count'] for k, b in mission_rollups.merge(rows, lambda r: r['persona']).items()}
+        by_repo = {k: b['count'] for k, b in mission_rollups.merge(rows, lambda r: r['repo']).items()}
+        overall = mission_rollups.merge(rows, lambda r: None).get(None) or {**dict.fromkeys(mission_rollups.MEASURES, 0), 'terminal_success': 0, 'terminal_total': 0}
+        refresh_by_status = {k: b['refresh_sum'] for k, b in mission_rollups.merge(rows, lambda r: r['status']).items()}
+        risk_counts = {signal: overall[f'risk_{signal}'] for signal in ('low', 'medium', 'high') if overall[f'risk_{signal}']}
+        total = overall['count'] or 1
+        avg_refresh_by_status = {s: (refresh_by_status[s] / c) for s, c in by_status.items()}
         top_repos = sorted(by_repo.items(), key=lambda x: x[1], reverse=True)[:5]
-        pr_presence = sum(1 for r in runs if r.pr_url) / total
         return {
             'missions_by_status': by_status,
             'missions_by_persona': by_persona,
-            'writeback_success_rate': writeback_written / total,
+            'writeback_success_rate': overall['writeback_written'] / total,
             'average_watcher_refresh_count_by_status': avg_refresh_by_status,
             'top_repos_by_mission_count': top_repos,
-            'terminal_success_rate': terminal_success / terminal_total,
-            'average_mission_score': avg_score,
+            'terminal_success_rate': overall['terminal_success'] / (overall['terminal_total'] or 1),
+            'average_mission_score': overall['score_sum'] / total,
             'top_risk_signals': sorted(risk_counts.items(), key=lambda x: x[1], reverse=True),
-            'average_pr_presence_rate': pr_presence,
+            'average_pr_presence_rate': overall['pr_count'] / total,
             'persona_performance_summary': self.get_persona_performance_summary(),
         }
 
@@ -1106,7 +1062,6 @@ class IntegrationOrchestrator:
             if auto_launch or spec.get('launch'):
                 launched_runs.append(self.launch_replay_draft(draft.id, dry_run=bool(payload.get('dry_run', True))))
         self._log_event('branch-set-created', run_id=source_run_id, status='ok', detail={'branch_set_id': branch_set_id, 'created': len(created_drafts), 'launched': len(launched_runs)})
-        self.invalidate_analytics_cache()
         return BranchSetCreateResponse(root_run_id=source.root_run_id or source.id or source_run_id, branch_set_id=branch_set_id, created_drafts=created_drafts, launched_runs=launched_runs)
 
     def create_persona_branch_set(self, source_run_id: int, payload: dict) -> PersonaBranchSetCreateResponse:
@@ -1148,7 +1103,6 @@ class IntegrationOrchestrator:
             if auto_launch or spec.get('launch'):
                 launched_runs.append(self.launch_replay_draft(draft.id, dry_run=bool(payload.get('dry_run', True))))
         self._log_event('persona-branch-set-created', run_id=source_run_id, status='ok', detail={'branch_set_id': branch_set_id, 'created': len(created_drafts), 'launched': len(launched_runs)})
-        self.invalidate_analytics_cache()
         return PersonaBranchSetCreateResponse(root_run_id=source.root_run_id or source.id or source_run_id, branch_set_id=branch_set_id, created_drafts=created_drafts, launched_runs=launched_runs)
 
     def get_persona_portfolio(self, root_run_id: int) -> PersonaPortfolioSummary:
@@ -1227,41 +1181,22 @@ class IntegrationOrchestrator:
         self._log_event('operator-override', run_id=run_id, status=decision, detail={'note': row.operator_override_note, 'decision_status': row.decision_status})
         event_map = {'accept_recommendation': 'recommendation_accepted', 'reject_recommendation': 'recommendation_rejected', 'manual_override': 'override_applied', 'remove_override': 'override_removed'}
         self.record_operator_decision_event(run_id=row.id or run_id, root_run_id=row.root_run_id or row.parent_run_id or row.id or run_id, event_type=event_map.get(decision, 'override_applied'), actor_type='operator', previous_state=prev, new_state={'operator_override_status': row.operator_override_status, 'recommendation_state': row.recommendation_state, 'decision_status': row.decision_status}, rationale=row.operator_override_note, related_persona_id=row.assigned_persona_id or row.persona_id, related_strategy=row.branch_strategy)
-        self.invalidate_analytics_cache()
         return self._to_record(row)
 
     def get_persona_performance_summary(self, root_run_id: int | None = None) -> dict:
-        rows = self.list_runs(limit=10000)
-        if root_run_id is not None:
-            allowed = {root_run_id} | {r['id'] for r in self.get_descendants(root_run_id)}
-            rows = [r for r in rows if r.id in allowed]
-        by_persona = {}
-        for r in rows:
-            key = r.assigned_persona_id or r.persona_id or 'unassigned'
-            bucket = by_persona.setdefault(key, {'count': 0, 'score_sum': 0, 'pr': 0, 'writeback_ok': 0, 'shortlisted': 0, 'eliminated': 0, 'overrides': 0, 'risk_high': 0, 'confidence_high': 0, 'terminal_success': 0, 'terminal_total': 0, 'override_accept': 0, 'override_total': 0})
-            bucket['count'] += 1
-            bucket['score_sum'] += r.mission_score
-            bucket['pr'] += 1 if r.pr_url else 0
-            bucket['writeback_ok'] += 1 if r.writeback_status == 'written' else 0
-            bucket['shortlisted'] += 1 if r.shortlisted else 0
-            bucket['eliminated'] += 1 if r.eliminated else 0
-            bucket['overrides'] += 1 if r.operator_override_status != 'none' else 0
-            bucket['risk_high'] += 1 if r.risk_signal == 'high' else 0
-            bucket['confidence_high'] += 1 if r.confidence_level == 'high' else 0
-            bucket['terminal_success'] += 1 if r.status == 'completed' else 0
-            bucket['terminal_total'] += 1 if r.status in TERMINAL_STATUSES else 0
-            if r.operator_override_status in {'accept_recommendation', 'reject_recommendation', 'manual_override'}:
-                bucket['override_total'] += 1
-                bucket['override_accept'] += 1 if r.operator_override_status == 'accept_recommendation' else 0
+        if root_run_id is None:
+            rows = mission_rollups.totals(self.session, ('persona', 'status'))
+        else:
+            rows = mission_rollups.fold(self._lineage_runs_for_root(root_run_id), ('persona', 'status'))
         out = []
-        for persona, b in by_persona.items():
+        for persona, b in mission_rollups.merge(rows, lambda r: r['persona']).items():
             c = b['count'] or 1
             out.append({
                 'persona_id': persona,
                 'mission_count': b['count'],
                 'average_score': b['score_sum'] / c,
-                'pr_rate': b['pr'] / c,
-                'writeback_success_rate': b['writeback_ok'] / c,
+                'pr_rate': b['pr_count'] / c,
+                'writeback_success_rate': b['writeback_written'] / c,
                 'shortlist_rate': b['shortlisted'] / c,
                 'eliminate_rate': b['eliminated'] / c,
                 'override_frequency': b['overrides'] / c,
@@ -1309,91 +1244,29 @@ class IntegrationOrchestrator:
         return self.get_persona_trends(**kwargs)
 
     def get_persona_trends(self, *, window: str = '30d', repo: str | None = None, strategy: str | None = None, status: str | None = None) -> dict:
-        cache_key = self._cache_key('persona_trends', window=window, repo=repo, strategy=strategy, status=status)
-        cached = self._cache_get(cache_key)
-        if cached:
-            payload = dict(cached['payload'])
-            payload['cache_metadata'] = {k: cached[k] for k in ['cache_key', 'generated_at', 'source_filters', 'row_count', 'freshness_seconds']}
-            return payload
+        def compute() -> dict:
+            rows = mission_rollups.totals(self.session, ('persona', 'status'), since_day=mission_rollups.window_start_day(window), repo=repo, strategy=strategy, status=status)
+            trends = []
+            for persona, b in mission_rollups.merge(rows, lambda r: r['persona']).items():
+                c = b['count'] or 1
+                trends.append({'persona_id': persona, 'mission_count': b['count'], 'average_score': b['score_sum']/c, 'pr_rate': b['pr_count']/c, 'writeback_success_rate': b['writeback_written']/c, 'shortlist_rate': b['shortlisted']/c, 'eliminate_rate': b['eliminated']/c, 'override_acceptance_rate': b['override_accept']/(b['override_total'] or 1), 'average_risk_level': b['risk_sum']/c, 'average_confidence_level': b['confidence_sum']/c, 'terminal_success_rate': b['terminal_success']/(b['terminal_total'] or 1)})
+            return {'window': window, 'filters': {'repo': repo, 'strategy': strategy, 'status': status}, 'persona_trends': sorted(trends, key=lambda x: x['mission_count'], reverse=True), 'note': 'Trend analytics are operator aids and not objective truth.'}
 
-        rows = self.session.exec(select(IntegrationRun)).all()
-        now = datetime.utcnow()
-        if window == '7d':
-            cutoff = now - timedelta(days=7)
-            rows = [r for r in rows if r.created_at >= cutoff]
-        elif window == '30d':
-            cutoff = now - timedelta(days=30)
-            rows = [r for r in rows if r.created_at >= cutoff]
-        if repo:
-            rows = [r for r in rows if r.repo == repo]
-        if strategy:
-            rows = [r for r in rows if r.branch_strategy == strategy]
-        if status:
-            rows = [r for r in rows if r.status == status]
-        by_persona = {}
-        for r in rows:
-            key = r.assigned_persona_id or r.persona_id or 'unassigned'
-            b = by_persona.setdefault(key, {'count': 0, 'score_sum': 0, 'pr': 0, 'wb': 0, 'short': 0, 'elim': 0, 'override_accept': 0, 'override_total': 0, 'risk_sum': 0, 'confidence_sum': 0, 'terminal_success': 0, 'terminal_total': 0})
-            b['count'] += 1; b['score_sum'] += r.mission_score; b['pr'] += 1 if r.pr_url else 0; b['wb'] += 1 if r.writeback_status == 'written' else 0
-            b['short'] += 1 if r.shortlisted else 0; b['elim'] += 1 if r.eliminated else 0
-            if r.operator_override_status in {'accept_recommendation', 'reject_recommendation', 'manual_override'}:
-                b['override_total'] += 1; b['override_accept'] += 1 if r.operator_override_status == 'accept_recommendation' else 0
-            b['risk_sum'] += _risk_value(r.risk_signal)
-            b['confidence_sum'] += _confidence_value(r.confidence_level)
-            b['terminal_total'] += 1 if r.status in TERMINAL_STATUSES else 0
-            b['terminal_success'] += 1 if r.status == 'completed' else 0
-        trends = []
-        for persona, b in by_persona.items():
-            c = b['count'] or 1
-            trends.append({'persona_id': persona, 'mission_count': b['count'], 'average_score': b['score_sum']/c, 'pr_rate': b['pr']/c, 'writeback_success_rate': b['wb']/c, 'shortlist_rate': b['short']/c, 'eliminate_rate': b['elim']/c, 'override_acceptance_rate': b['override_accept']/(b['override_total'] or 1), 'average_risk_level': b['risk_sum']/c, 'average_confidence_level': b['confidence_sum']/c, 'terminal_success_rate': b['terminal_success']/(b['terminal_total'] or 1)})
-        payload = {'window': window, 'filters': {'repo': repo, 'strategy': strategy, 'status': status}, 'persona_trends': sorted(trends, key=lambda x: x['mission_count'], reverse=True), 'note': 'Trend analytics are operator aids and not objective truth.'}
-        self._cache_set(cache_key, payload, {'window': window, 'repo': repo, 'strategy': strategy, 'status': status}, len(payload['persona_trends']))
-        cached = self._analytics_cache.get(cache_key, {})
-        payload['cache_metadata'] = {k: cached.get(k) for k in ['cache_key', 'generated_at', 'source_filters', 'row_count', 'freshness_seconds']}
-        return payload
+        return self._cached_analytics('persona_trends', {'window': window, 'repo': repo, 'strategy': strategy, 'status': status}, compute, 'persona_trends')
 
     def get_cached_persona_matrix(self, **kwargs) -> dict:
         return self.get_persona_strategy_matrix(**kwargs)
 
     def get_persona_strategy_matrix(self, *, window: str = '30d', repo: str | None = None, status: str | None = None) -> dict:
-        cache_key = self._cache_key('persona_matrix', window=window, repo=repo, status=status)
-        cached = self._cache_get(cache_key)
-        if cached:
-            payload = dict(cached['payload'])
-            payload['cache_metadata'] = {k: cached[k] for k in ['cache_key', 'generated_at', 'source_filters', 'row_count', 'freshness_seconds']}
-            return payload
+        def compute() -> dict:
+            rows = mission_rollups.totals(self.session, ('persona', 'strategy'), since_day=mission_rollups.window_start_day(window), repo=repo, status=status)
+            rows_out = []
+            for (persona, strat), b in mission_rollups.merge(rows, lambda r: (r['persona'], r['strategy'] or 'unspecified')).items():
+                c = b['count'] or 1
+                rows_out.append({'persona_id': persona, 'strategy': strat, 'count': b['count'], 'average_score': b['score_sum']/c, 'average_risk_level': b['risk_sum']/c, 'shortlist_rate': b['shortlisted']/c, 'pr_rate': b['pr_count']/c, 'override_rate': b['overrides']/c})
+            return {'window': window, 'filters': {'repo': repo, 'status': status}, 'matrix': sorted(rows_out, key=lambda x: x['count'], reverse=True), 'interpretation_note': 'Persona×strategy matrix is heuristic and intended for operator guidance only.'}
 
-        rows = self.session.exec(select(IntegrationRun)).all()
-        now = datetime.utcnow()
-        if window == '7d':
-            rows = [r for r in rows if r.created_at >= now - timedelta(days=7)]
-        elif window == '30d':
-            rows = [r for r in rows if r.created_at >= now - timedelta(days=30)]
-        if repo:
-            rows = [r for r in rows if r.repo == repo]
-        if status:
-            rows = [r for r in rows if r.status == status]
-        matrix = {}
-        for r in rows:
-            persona = r.assigned_persona_id or r.persona_id or 'unassigned'
-            strat = r.branch_strategy or 'unspecified'
-            key = (persona, strat)
-            b = matrix.setdefault(key, {'count': 0, 'score_sum': 0, 'risk_sum': 0, 'short': 0, 'pr': 0, 'overrides': 0})
-            b['count'] += 1
-            b['score_sum'] += r.mission_score
-            b['risk_sum'] += _risk_value(r.risk_signal)
-            b['short'] += 1 if r.shortlisted else 0
-            b['pr'] += 1 if r.pr_url else 0
-            b['overrides'] += 1 if r.operator_override_status != 'none' else 0
-        rows_out = []
-        for (persona, strat), b in matrix.items():
-            c = b['count'] or 1
-            rows_out.append({'persona_id': persona, 'strategy': strat, 'count': b['count'], 'average_score': b['score_sum']/c, 'average_risk_level': b['risk_sum']/c, 'shortlist_rate': b['short']/c, 'pr_rate': b['pr']/c, 'override_rate': b['overrides']/c})
-        payload = {'window': window, 'filters': {'repo': repo, 'status': status}, 'matrix': sorted(rows_out, key=lambda x: x['count'], reverse=True), 'interpretation_note': 'Persona×strategy matrix is heuristic and intended for operator guidance only.'}
-        self._cache_set(cache_key, payload, {'window': window, 'repo': repo, 'status': status}, len(payload['matrix']))
-        cached = self._analytics_cache.get(cache_key, {})
-        payload['cache_metadata'] = {k: cached.get(k) for k in ['cache_key', 'generated_at', 'source_filters', 'row_count', 'freshness_seconds']}
-        return payload
+        return self._cached_analytics('persona_matrix', {'window': window, 'repo': repo, 'status': status}, compute, 'matrix')
 
     def maybe_require_dual_review(self, row: IntegrationRun) -> tuple[bool, str]:
         if not settings.agentora_persona_policy_require_dual_review_on_high_risk:
@@ -1515,7 +1388,6 @@ class IntegrationOrchestrator:
         self.session.add(row)
         self.session.commit()
         self.record_operator_decision_event(run_id=0, root_run_id=0, event_type='pattern_promoted', actor_type='operator', previous_state=prev, new_state=self._pattern_to_dict(row), rationale=note, related_persona_id=row.persona_scope, related_strategy=row.strategy_scope, metadata={'pattern_id': row.id})
-        self.invalidate_analytics_cache()
         return self._pattern_to_dict(row)
 
     def reject_pattern(self, pattern_id: int, note: str = '') -> dict:
@@ -1529,7 +1401,6 @@ class IntegrationOrchestrator:
         self.session.add(row)
         self.session.commit()
         self.record_operator_decision_event(run_id=0, root_run_id=0, event_type='pattern_rejected', actor_type='operator', previous_state=prev, new_state=self._pattern_to_dict(row), rationale=note, related_persona_id=row.persona_scope, related_strategy=row.strategy_scope, metadata={'pattern_id': row.id})
-        self.invalidate_analytics_cache()
         return self._pattern_to_dict(row)
 
     def archive_pattern(self, pattern_id: int, note: str = '') -> dict:
@@ -1544,7 +1415,6 @@ class IntegrationOrchestrator:
         self.session.add(row)
         self.session.commit()
         self.record_operator_decision_event(run_id=0, root_run_id=0, event_type='pattern_archived', actor_type='operator', previous_state=prev, new_state=self._pattern_to_dict(row), rationale=note, related_persona_id=row.persona_scope, related_strategy=row.strategy_scope, metadata={'pattern_id': row.id})
-        self.invalidate_analytics_cache()
         return self._pattern_to_dict(row)
 
     def get_pattern_summaries(self, **filters) -> dict:
@@ -1647,7 +1517,6 @@ class IntegrationOrchestrator:
         self.session.commit()
         self.session.refresh(row)
         self.record_operator_decision_event(run_id=row.id or run_id, root_run_id=row.root_run_id or row.parent_run_id or row.id or run_id, event_type='manual_reprioritization', actor_type='operator', previous_state=previous, new_state={'decision_note': row.decision_note}, rationale=f'Applied policy template: {template_name}', related_persona_id=row.assigned_persona_id or row.persona_id, related_strategy=row.branch_strategy, metadata={'template': template_name, 'template_rules': tpl})
-        self.invalidate_analytics_cache()
         policy = self.evaluate_persona_policy(row, action='writeback')
         return {'ok': True, 'template_name': template_name, 'template': tpl, 'policy_check': policy}
 
@@ -1729,7 +1598,6 @@ class IntegrationOrchestrator:
         self.session.refresh(row)
         event_type = 'shortlist_applied' if row.shortlisted else ('eliminate_applied' if row.eliminated else 'manual_reprioritization')
         self.record_operator_decision_event(run_id=row.id or run_id, root_run_id=row.root_run_id or row.parent_run_id or row.id or run_id, event_type=event_type, actor_type='operator', previous_state={}, new_state={'decision_status': row.decision_status}, rationale=decision_note, related_persona_id=row.assigned_persona_id or row.persona_id, related_strategy=row.branch_strategy)
-        self.invalidate_analytics_cache()
         return self._to_record(row)
 
     def _lineage_runs_for_root(self, root_run_id: int) -> list[IntegrationRun]:
@@ -1981,6 +1849,14 @@ class IntegrationOrchestrator:
         }
 
     def cohorts(self, *, group_by: str = 'repo', status: str | None = None, writeback_status: str | None = None, confidence_level: str | None = None, mission_score_min: int | None = None, mission_score_max: int | None = None, start_date: datetime | None = None, end_date: datetime | None = None) -> dict:
+        rollup_filters = (writeback_status, confidence_level, mission_score_min, mission_score_max, start_date, end_date)
+        if group_by in {'repo', 'status'} and all(f is None for f in rollup_filters):
+            rows = mission_rollups.totals(self.session, ('repo', 'status'), status=status)
+            groups = []
+            for key, b in mission_rollups.merge(rows, lambda r: r[group_by] or 'unknown').items():
+                c = b['count'] or 1
+                groups.append({'group': key, 'count': b['count'], 'average_mission_score': b['score_sum'] / c, 'average_refresh_count': b['refresh_sum'] / c, 'writeback_success_rate': b['writeback_written'] / c, 'terminal_success_rate': b['terminal_success'] / (b['terminal_total'] or 1), 'average_pr_presence_rate': b['pr_count'] / c, 'top_risk_signal': 'high' if b['risk_high'] > 0 else 'low_or_medium'})
+            return {'group_by': group_by, 'groups': sorted(groups, key=lambda x: x['count'], reverse=True)}
         runs = self.list_runs(status=status, writeback_status=writeback_status, confidence_level=confidence_level, mission_score_min=mission_score_min, mission_score_max=mission_score_max, start_date=start_date, end_date=end_date, limit=10000)
         valid_groups = {'repo', 'persona_id', 'status', 'writeback_status', 'confidence_level'}
         if group_by not in valid_groups:
@@ -0,0 +1,253 @@
+"""Materialized mission analytics.
+
+Every integration run contributes one row's worth of measures to the
+:class:`MissionRollup` bucket keyed by (day, repo, persona, strategy, status).
+The contribution a run last made is remembered in
+:class:`MissionRollupMember`, so when a flush changes a run (refresh,
+override, branch decision, writeback, import...) only the difference is
+applied, in the same transaction as the change itself, and once it commits
+the cached aggregates for the repos involved are dropped. Analytics then sum
+a handful of rollup rows instead of scanning ``integrationrun``.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Iterable
+
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from app.models import IntegrationRun, MissionRollup, MissionRollupMember
+from app.services.analytics_cache import analytics_cache
+
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled', 'error'}
+OVERRIDE_DECISIONS = {'accept_recommendation', 'reject_recommendation', 'manual_override'}
+KEY_FIELDS = ('day', 'repo', 'persona', 'strategy', 'status')
+MEASURES = (
+    'count', 'score_sum', 'refresh_sum', 'pr_count', 'writeback_written', 'shortlisted', 'eliminated', 'overrides',
+    'override_total', 'override_accept', 'risk_low', 'risk_medium', 'risk_high', 'risk_sum', 'confidence_high', 'confidence_sum',
+)
+_RISK = {'low': 1, 'medium': 2, 'high': 3}
+_CONFIDENCE = {'low': 1, 'medium': 2, 'high': 3}
+
+_rollup = MissionRollup.__table__
+_member = MissionRollupMember.__table__
+_TOUCHED_KEY = '_agentora_rollup_repos'
+
+
+def run_persona(row: Any) -> str:
+    return row.assigned_persona_id or row.persona_id or 'unassigned'
+
+
+def run_contribution(row: Any) -> tuple[tuple[str, ...], dict[str, int]]:
+    """The rollup key a run belongs to and the measures it adds there."""
+    created = row.created_at or datetime.utcnow()
+    key = (created.date().isoformat(), row.repo or '', run_persona(row), row.branch_strategy or '', row.status or '')
+    risk = row.risk_signal or 'medium'
+    override = row.operator_override_status or 'none'
+    measures = {
+        'count': 1,
+        'score_sum': int(row.mission_score or 0),
+        'refresh_sum': int(row.refresh_count or 0),
+        'pr_count': 1 if row.pr_url else 0,
+        'writeback_written': 1 if row.writeback_status == 'written' else 0,
+        'shortlisted': 1 if row.shortlisted else 0,
+        'eliminated': 1 if row.eliminated else 0,
+        'overrides': 1 if override != 'none' else 0,
+        'override_total': 1 if override in OVERRIDE_DECISIONS else 0,
+        'override_accept': 1 if override == 'accept_recommendation' else 0,
+        'risk_low': 1 if risk == 'low' else 0,
+        'risk_medium': 1 if risk == 'medium' else 0,
+        'risk_high': 1 if risk == 'high' else 0,
+        'risk_sum': _RISK.get(risk, 2),
+        'confidence_high': 1 if row.confidence_level == 'high' else 0,
+        'confidence_sum': _CONFIDENCE.get(row.confidence_level or 'low', 1),
+    }
+    return key, measures
+
+
+def _apply(conn, key: tuple[str, ...], measures: dict[str, int], sign: int) -> None:
+    where = [getattr(_rollup.c, name) == value for name, value in zip(KEY_FIELDS, key)]
+    values = {name: getattr(_rollup.c, name) + sign * measures.get(name, 0) for name in MEASURES}
+    done = conn.execute(update(_rollup).where(*where).values(**values, updated_at=datetime.utcnow())).rowcount
+    if not done and sign > 0:
+        conn.execute(insert(_rollup).values(**dict(zip(KEY_FIELDS, key)), **{name: measures.get(name, 0) for name in MEASURES}, updated_at=datetime.utcnow()))
+    elif sign < 0:
+        conn.execute(delete(_rollup).where(*where, _rollup.c.count <= 0))
+
+
+def sync_run(conn, row: Any) -> set[str]:
+    """Bring the rollups in line with ``row``; returns the repos whose rollups changed (none when nothing did).
+
+    ``conn`` is the flushing session's connection, or the session itself outside a flush.
+    """
+    key, measures = run_contribution(row)
+    prev = conn.execute(select(_member).where(_member.c.run_id == row.id)).first()
+    if prev is not None:
+        prev_key = tuple(getattr(prev, name) for name in KEY_FIELDS)
+        prev_measures = json.loads(prev.measures_json or '{}')
+        if prev_key == key and prev_measures == measures:
+            return set()
+        _apply(conn, prev_key, prev_measures, -1)
+        conn.execute(update(_member).where(_member.c.run_id == row.id).values(**dict(zip(KEY_FIELDS, key)), measures_json=json.dumps(measures, sort_keys=True)))
+    else:
+        conn.execute(insert(_member).values(run_id=row.id, **dict(zip(KEY_FIELDS, key)), measures_json=json.dumps(measures, sort_keys=True)))
+    _apply(conn, key, measures, +1)
+    return {key[1]} | ({prev.repo} if prev is not None else set())
+
+
+def drop_run(conn, run_id: int) -> set[str]:
+    prev = conn.execute(select(_member).where(_member.c.run_id == run_id)).first()
+    if prev is None:
+        return set()
+    _apply(conn, tuple(getattr(prev, name) for name in KEY_FIELDS), json.loads(prev.measures_json or '{}'), -1)
+    conn.execute(delete(_member).where(_member.c.run_id == run_id))
+    return {prev.repo}
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def _sync_flushed_runs(session, _flush_context):
+    changed = [obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, IntegrationRun)]
+    removed = [obj for obj in session.deleted if isinstance(obj, IntegrationRun)]
+    if not changed and not removed:
+        return
+    conn = session.connection()
+    touched = session.info.setdefault(_TOUCHED_KEY, set())
+    for row in changed:
+        if row.id is not None:
+            touched |= sync_run(conn, row)
+    for row in removed:
+        touched |= drop_run(conn, row.id)
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _invalidate_committed_repos(session):
+    # Only once the change is visible to other sessions, so a concurrent miss cannot re-cache the old numbers.
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if touched:
+        analytics_cache.invalidate_repos(touched)
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _forget_rolled_back_repos(session):
+    session.info.pop(_TOUCHED_KEY, None)
+
+
+# Column-level reads keep backfills out of the identity map.
+ROLLUP_COLUMNS = (
+    IntegrationRun.id, IntegrationRun.created_at, IntegrationRun.repo, IntegrationRun.persona_id, IntegrationRun.assigned_persona_id,
+    IntegrationRun.branch_strategy, IntegrationRun.status, IntegrationRun.mission_score, IntegrationRun.refresh_count, IntegrationRun.pr_url,
+    IntegrationRun.writeback_status, IntegrationRun.shortlisted, IntegrationRun.eliminated, IntegrationRun.operator_override_status,
+    IntegrationRun.risk_signal, IntegrationRun.confidence_level,
+)
+
+
+def _iter_runs(session: Session, batch_size: int = 1000):
+    last_id = 0
+    while True:
+        batch = session.exec(select(*ROLLUP_COLUMNS).where(IntegrationRun.id > last_id).order_by(IntegrationRun.id).limit(batch_size)).all()
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1].id
+
+
+def rebuild(session: Session) -> dict:
+    """Recompute every rollup from ``integrationrun``: the backfill and repair path."""
+    # Clearing first takes the writer gate, so no run changes between the read below and the insert.
+    session.execute(delete(MissionRollupMember))
+    session.execute(delete(MissionRollup))
+    buckets: dict[tuple[str, ...], dict[str, int]] = {}
+    members = []
+    for row in _iter_runs(session):
+        key, measures = run_contribution(row)
+        bucket = buckets.setdefault(key, dict.fromkeys(MEASURES, 0))
+        for name in MEASURES:
+            bucket[name] += measures[name]
+        members.append({'run_id': row.id, **dict(zip(KEY_FIELDS, key)), 'measures_json': json.dumps(measures, sort_keys=True)})
+    now = datetime.utcnow()
+    if members:
+        session.execute(insert(MissionRollupMember), members)
+        session.execute(insert(MissionRollup), [{**dict(zip(KEY_FIELDS, key)), **bucket, 'updated_at': now} for key, bucket in buckets.items()])
+    session.commit()
+    analytics_cache.invalidate()
+    return {'ok': True, 'runs': len(members), 'rollup_rows': len(buckets)}
+
+
+def backfill(session: Session) -> int:
+    """Add runs that predate the rollup tables; returns how many were added."""
+    # Runs every startup: two counts settle the usual case where every run is already tracked.
+    runs = session.scalar(select(func.count()).select_from(IntegrationRun))
+    if runs == session.scalar(select(func.count()).select_from(MissionRollupMember)):
+        return 0
+    missing = list(session.scalars(select(IntegrationRun.id).where(IntegrationRun.id.not_in(select(MissionRollupMember.run_id)))))
+    if not missing:
+        return 0
+    touched = session.info.setdefault(_TOUCHED_KEY, set())
+    for start in range(0, len(missing), 500):
+        for row in session.exec(select(*ROLLUP_COLUMNS).where(IntegrationRun.id.in_(missing[start : start + 500]))).all():
+            # Through the session rather than its connection, so the writes take the writer gate like any other.
+            touched |= sync_run(session, row)
+    session.commit()
+    return len(missing)
+
+
+def totals(session: Session, group_by: Iterable[str] = (), *, since_day: str | None = None, repo: str | None = None, persona: str | None = None, strategy: str | None = None, status: str | None = None) -> list[dict]:
+    """Summed measures per ``group_by`` key columns, optionally narrowed to a key slice."""
+    columns = [getattr(MissionRollup, name) for name in group_by]
+    stmt = select(*columns, *(func.coalesce(func.sum(getattr(MissionRollup, name)), 0).label(name) for name in MEASURES))
+    for name, value in (('repo', repo), ('persona', persona), ('strategy', strategy), ('status', status)):
+        if value:
+            stmt = stmt.where(getattr(MissionRollup, name) == value)
+    if since_day:
+        stmt = stmt.where(MissionRollup.day >= since_day)
+    if columns:
+        stmt = stmt.group_by(*columns)
+    rows = [dict(row._mapping) for row in session.exec(stmt).all()]
+    return [r for r in rows if r['count']]
+
+
+def fold(rows: Iterable[Any], group_by: Iterable[str] = ()) -> list[dict]:
+    """:func:`totals` over run rows in memory, for slices the rollup key does not cover (one lineage, say)."""
+    names = list(group_by)
+    buckets: dict[tuple, dict] = {}
+    for row in rows:
+        key, measures = run_contribution(row)
+        keyed = dict(zip(KEY_FIELDS, key))
+        group = tuple(keyed[name] for name in names)
+        bucket = buckets.setdefault(group, {**dict(zip(names, group)), **dict.fromkeys(MEASURES, 0)})
+        for name, value in measures.items():
+            bucket[name] += value
+    return list(buckets.values())
+
+
+def rollup_status(session: Session) -> dict:
+    updated = session.scalar(select(func.max(MissionRollup.updated_at)))
+    return {
+        'rollup_rows': session.scalar(select(func.count()).select_from(MissionRollup)),
+        'runs_tracked': session.scalar(select(func.count()).select_from(MissionRollupMember)),
+        'last_updated_at': updated.isoformat() if updated else None,
+    }
+
+
+def merge(rows: Iterable[dict], key) -> dict[Any, dict]:
+    """Re-bucket :func:`totals` rows by ``key(row)``; rows grouped by status also get terminal counts."""
+    out: dict[Any, dict] = {}
+    for row in rows:
+        bucket = out.setdefault(key(row), {**dict.fromkeys(MEASURES, 0), 'terminal_success': 0, 'terminal_total': 0})
+        for name in MEASURES:
+            bucket[name] += row[name]
+        if 'status' in row:
+            bucket['terminal_success'] += row['count'] if row['status'] == 'completed' else 0
+            bucket['terminal_total'] += row['count'] if row['status'] in TERMINAL_STATUSES else 0
+    return out
+
+
+def window_start_day(window: str, now: datetime | None = None) -> str | None:
+    """First rollup day inside a '7d'/'30d' window; rollups are daily, so the oldest day counts whole."""
+    days = {'7d': 7, '30d': 30}.get(window)
+    if days is None:
+        return None
+    return ((now or datetime.utcnow()) - timedelta(days=days)).date().isoformat()
@@ -1,5 +1,7 @@
 import hashlib
 from pathlib import Path
+from typing import Iterable, Iterator
+
 from pypdf import PdfReader
 
 
@@ -11,12 +13,18 @@ def store_upload(run_id: int, filename: str, data: bytes) -> tuple[str, str]:
     return str(p), hashlib.sha256(data).hexdigest()
 
 
-def extract_pdf_text(path: str) -> str:
+def iter_pdf_pages(path: str) -> Iterator[str]:
     try:
         reader = PdfReader(path)
-        return '\n'.join([page.extract_text() or '' for page in reader.pages]).strip()[:20000]
+        for page in reader.pages:
+            yield page.extract_text() or ''
     except Exception:
-        return ''
+        return
+
+
+def extract_pdf_text(pages: Iterable[str]) -> str:
+    """The stored extract for already parsed PDF pages; ingestion chunks the pages themselves."""
+    return '\n'.join(pages).strip()[:20000]
 
 
 def model_can_vision(name: str) -> bool:
@@ -1,24 +1,41 @@
-from collections.abc import AsyncGenerator
+from collections import deque
+from collections.abc import AsyncGenerator, Callable
+import asyncio
 import json
 import base64
 import hashlib
+import threading
+import time
+
 import httpx
 
 from app.core.config import settings
 from app.core.security import ensure_url_allowed
+from app.services.http_pool import http_pool
+from app.services.runtime.percentiles import percentile
 
 
 class OllamaClient:
+    _batch_embed_supported = True
+
     async def list_models(self) -> list[str]:
         if settings.agentora_use_mock_ollama:
             return [settings.ollama_model_default, settings.agentora_vision_model_fallback, 'mock-mini']
         ensure_url_allowed(settings.ollama_url)
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(f'{settings.ollama_url}/api/tags')
-            r.raise_for_status()
-            return [m['name'] for m in r.json().get('models', [])]
+        r = await http_pool.async_client('ollama').get(f'{settings.ollama_url}/api/tags', timeout=20)
+        r.raise_for_status()
+        return [m['name'] for m in r.json().get('models', [])]
 
     async def stream_chat(self, model: str, system: str, prompt: str, image_paths: list[str] | None = None) -> AsyncGenerator[str, None]:
+        timer = chat_metrics.timer('stream_chat', model)
+        try:
+            async for token in self._stream_chat(model, system, prompt, image_paths):
+                timer.token()
+                yield token
+        finally:
+            timer.done()
+
+    async def _stream_chat(self, model: str, system: str, prompt: str, image_paths: list[str] | None = None) -> AsyncGenerator[str, None]:
         if settings.agentora_use_mock_ollama:
             text = f'MOCK[{model}] {prompt[:80]}'
             for token in text.split(' '):
@@ -34,22 +51,22 @@ class OllamaClient:
             'stream': True,
             'messages': [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt, 'images': images}],
         }
-        async with httpx.AsyncClient(timeout=120) as client:
-            async with client.stream('POST', f'{settings.ollama_url}/api/chat', json=payload) as resp:
-                resp.raise_for_status()
-                async for line in resp.aiter_lines():
-                    if line:
-                        try:
-                            obj = json.loads(line)
-                            msg = obj.get('message', {}).get('content', '')
-                            if msg:
-                                yield msg
-                        except Exception:
-                            yield line
+        async with http_pool.async_client('ollama').stream('POST', f'{settings.ollama_url}/api/chat', json=payload) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if line:
+                    try:
+                        obj = json.loads(line)
+                        msg = obj.get('message', {}).get('content', '')
+                        if msg:
+                            yield msg
+                    except Exception:
+                        yield line
 
-    async def chat_structured(self, model: str, system: str, prompt: str, schema: dict) -> dict:
+    async def chat_structured(self, model: str, system: str, prompt: str, schema: dict, on_token: Callable[[str], None] | None = None) -> dict:
+        """Structured (JSON schema) chat. With ``on_token`` the reply is streamed and each chunk is forwarded as it arrives."""
         if settings.agentora_use_mock_ollama:
-            return {
+            mock = {
                 'thought': 'mock planner',
                 'need_memory': True,
                 'memory_queries': ['key context'],
@@ -58,28 +75,54 @@ class OllamaClient:
                 'handoff': '',
                 'done': True,
             }
+            if on_token is not None:
+                timer = chat_metrics.timer('chat_structured', model)
+                for token in json.dumps(mock).split(' '):
+                    timer.token()
+                    on_token(token + ' ')
+                timer.done()
+            return mock
         ensure_url_allowed(settings.ollama_url)
-        payload = {'model': model, 'stream': False, 'format': schema, 'messages': [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}]}
-        async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.post(f'{settings.ollama_url}/api/chat', json=payload)
+        payload = {'model': model, 'stream': on_token is not None, 'format': schema, 'messages': [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}]}
+        if on_token is None:
+            r = await http_pool.async_client('ollama').post(f'{settings.ollama_url}/api/chat', json=payload)
             r.raise_for_status()
             content = r.json().get('message', {}).get('content', '{}')
-            if isinstance(content, dict):
-                return content
+        else:
+            timer = chat_metrics.timer('chat_structured', model)
+            parts: list[str] = []
             try:
-                return json.loads(content)
-            except Exception:
-                return {'invalid_payload': content}
+                async with http_pool.async_client('ollama').stream('POST', f'{settings.ollama_url}/api/chat', json=payload) as resp:
+                    resp.raise_for_status()
+                    async for line in resp.aiter_lines():
+                        if not line:
+                            continue
+                        try:
+                            chunk = json.loads(line).get('message', {}).get('content', '')
+                        except Exception:
+                            continue
+                        if chunk:
+                            timer.token()
+                            parts.append(chunk)
+                            on_token(chunk)
+            finally:
+                timer.done()
+            content = ''.join(parts) or '{}'
+        if isinstance(content, dict):
+            return content
+        try:
+            return json.loads(content)
+        except Exception:
+            return {'invalid_payload': content}
 
     async def chat_with_tools(self, model: str, system: str, prompt: str, tools: list[dict]) -> dict:
         if settings.agentora_use_mock_ollama:
             return {'message': {'content': f'MOCK TOOL CHAT: {prompt[:100]}', 'tool_calls': []}}
         ensure_url_allowed(settings.ollama_url)
         payload = {'model': model, 'stream': False, 'messages': [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}], 'tools': tools}
-        async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.post(f'{settings.ollama_url}/api/chat', json=payload)
-            r.raise_for_status()
-            return r.json()
+        r = await http_pool.async_client('ollama').post(f'{settings.ollama_url}/api/chat', json=payload)
+        r.raise_for_status()
+        return r.json()
 
     async def embed_texts(self, texts: list[str], model: str | None = None) -> list[list[float]]:
         if not texts:
@@ -92,10 +135,187 @@ class OllamaClient:
             return out
         ensure_url_allowed(settings.ollama_url)
         embed_model = model or settings.agentora_embed_model
-        async with httpx.AsyncClient(timeout=120) as client:
-            vecs: list[list[float]] = []
-            for text in texts:
-                r = await client.post(f'{settings.ollama_url}/api/embeddings', json={'model': embed_model, 'prompt': text})
+        client = http_pool.async_client('ollama')
+        vecs: list[list[float]] = []
+        for batch in _split_batches(texts, settings.agentora_embed_batch_size, settings.agentora_embed_batch_max_chars):
+            vecs.extend(await self._embed_batch(client, embed_model, batch))
+        return vecs
+
+    async def _embed_batch(self, client: httpx.AsyncClient, model: str, batch: list[str]) -> list[list[float]]:
+        started = time.perf_counter()
+        mode = 'batch'
+        split = False
+        try:
+            if OllamaClient._batch_embed_supported:
+                try:
+                    vecs = await self._post_embed(client, model, batch)
+                except httpx.HTTPStatusError as exc:
+                    if exc.response.status_code == 404:
+                        OllamaClient._batch_embed_supported = False
+                    elif len(batch) > 1 and _is_oversized(exc.response):
+                        # Oversized input (context window or request body): halve and retry.
+                        mid = len(batch) // 2
+                        split = True
+                        embed_metrics.record_split()
+                        return await self._embed_batch(client, model, batch[:mid]) + await self._embed_batch(client, model, batch[mid:])
+                    else:
+                        raise
+                else:
+                    if len(vecs) == len(batch):
+                        return vecs
+            mode = 'concurrent'
+            return await self._embed_concurrent(client, model, batch)
+        finally:
+            if not split:
+                embed_metrics.record_batch(mode, len(batch), sum(len(t) for t in batch), time.perf_counter() - started)
+
+    async def _post_embed(self, client: httpx.AsyncClient, model: str, batch: list[str]) -> list[list[float]]:
+        attempt = 0
+        while True:
+            r = await client.post(f'{settings.ollama_url}/api/embed', json={'model': model, 'input': batch})
+            if r.status_code < 500 or attempt >= max(0, settings.agentora_embed_retries):
+                r.raise_for_status()
+                return r.json().get('embeddings', [])
+            # Server-side failure (model loading, outage): retry the same batch with backoff, never split it.
+            await asyncio.sleep(settings.agentora_embed_retry_backoff_seconds * (2 ** attempt))
+            attempt += 1
+
+    async def _embed_concurrent(self, client: httpx.AsyncClient, model: str, batch: list[str]) -> list[list[float]]:
+        semaphore = asyncio.Semaphore(max(1, settings.agentora_embed_concurrency))
+
+        async def one(text: str) -> list[float]:
+            async with semaphore:
+                r = await client.post(f'{settings.ollama_url}/api/embeddings', json={'model': model, 'prompt': text})
                 r.raise_for_status()
-                vecs.append(r.json().get('embedding', []))
-            return vecs
+                return r.json().get('embedding', [])
+
+        return list(await asyncio.gather(*(one(t) for t in batch)))
+
+
+def _is_oversized(response: httpx.Response) -> bool:
+    if response.status_code == 413:
+        return True
+    if response.status_code != 400:
+        return False
+    text = response.text.lower()
+    return 'context' in text or 'too long' in text or 'too large' in text or 'exceeds' in text
+
+
+def _split_batches(texts: list[str], max_items: int, max_chars: int) -> list[list[str]]:
+    batches: list[list[str]] = []
+    current: list[str] = []
+    chars = 0
+    for text in texts:
+        if current and (len(current) >= max(1, max_items) or chars + len(text) > max_chars):
+            batches.append(current)
+            current, chars = [], 0
+        current.append(text)
+        chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbedMetrics:
+    """Rolling per-batch latency/throughput for sizing embed batches."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._recent: deque[dict] = deque(maxlen=window)
+        self.batches = 0
+        self.texts = 0
+        self.chars = 0
+        self.seconds = 0.0
+        self.splits = 0
+
+    def record_batch(self, mode: str, size: int, chars: int, seconds: float) -> None:
+        with self._lock:
+            self.batches += 1
+            self.texts += size
+            self.chars += chars
+            self.seconds += seconds
+            self._recent.append({'mode': mode, 'size': size, 'chars': chars, 'latency_ms': round(seconds * 1000.0, 2), 'texts_per_second': round(size / seconds, 2) if seconds > 0 else 0.0})
+
+    def record_split(self) -> None:
+        with self._lock:
+            self.splits += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = list(self._recent)
+            latencies = [b['latency_ms'] for b in recent]
+            return {
+                'batch_endpoint_supported': OllamaClient._batch_embed_supported,
+                'batch_size': settings.agentora_embed_batch_size,
+                'batch_max_chars': settings.agentora_embed_batch_max_chars,
+                'concurrency': settings.agentora_embed_concurrency,
+                'batches': self.batches,
+                'texts': self.texts,
+                'chars': self.chars,
+                'splits': self.splits,
+                'texts_per_second': round(self.texts / self.seconds, 2) if self.seconds > 0 else 0.0,
+                'p50_batch_latency_ms': percentile(latencies, 0.50),
+                'p95_batch_latency_ms': percentile(latencies, 0.95),
+                'recent': recent[-20:],
+            }
+
+
+embed_metrics = EmbedMetrics()
+
+
+class _ChatTimer:
+    def __init__(self, metrics: 'ChatMetrics', kind: str, model: str):
+        self._metrics = metrics
+        self.kind = kind
+        self.model = model
+        self.started = time.perf_counter()
+        self.ttft: float | None = None
+        self.tokens = 0
+
+    def token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+        self.tokens += 1
+
+    def done(self) -> None:
+        self._metrics.record(self.kind, self.model, self.ttft, time.perf_counter() - self.started, self.tokens)
+
+
+class ChatMetrics:
+    """Rolling time-to-first-token and streamed-token throughput for chat calls."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._recent: deque[dict] = deque(maxlen=window)
+        self.calls = 0
+        self.tokens = 0
+        self.no_token_calls = 0
+
+    def timer(self, kind: str, model: str) -> _ChatTimer:
+        return _ChatTimer(self, kind, model)
+
+    def record(self, kind: str, model: str, ttft: float | None, seconds: float, tokens: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.tokens += tokens
+            if ttft is None:
+                self.no_token_calls += 1
+                return
+            self._recent.append({'kind': kind, 'model': model, 'ttft_ms': round(ttft * 1000.0, 2), 'total_ms': round(seconds * 1000.0, 2), 'tokens': tokens})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = list(self._recent)
+            ttfts = [c['ttft_ms'] for c in recent]
+            return {
+                'calls': self.calls,
+                'tokens': self.tokens,
+                'no_token_calls': self.no_token_calls,
+                'p50_ttft_ms': percentile(ttfts, 0.50),
+                'p95_ttft_ms': percentile(ttfts, 0.95),
+                'max_ttft_ms': max(ttfts, default=0.0),
+                'recent': recent[-20:],
+            }
+
+
+chat_metrics = ChatMetrics()
@@ -1,128 +1,217 @@
+import asyncio
 import json
+import time
 from datetime import datetime
 from sqlmodel import Session, select
 
+from app import db
+
 from app.core.config import settings
 from app.models import Agent, Attachment, Message, Run, RunMetric, TeamAgent, TemplateUsage, TeamSubgoal
 from app.services.runtime.loop import runtime_loop
+from app.services.runtime.offload import blocking_pool
+from app.services.runtime.run_events import run_events
 from app.services.runtime.actions import create_action_request, execute_action_request
 from app.services.runtime.team import complete_handoff, create_handoff, create_team_plan, ensure_capability_profile, record_collaboration_metrics
 from app.services.runtime.trace import add_trace
-from .state import RunState
+from .scheduler import run_scheduler
+from .state import RunState, SubgoalNode
 
 
 class OrchestrationEngine:
     def __init__(self):
         pass
 
-    async def execute(self, session: Session, run: Run, prompt: str, reflection: bool = False) -> RunState:
+    def _prepare(self, session: Session, run: Run, prompt: str):
         links = list(session.exec(select(TeamAgent).where(TeamAgent.team_id == run.team_id).order_by(TeamAgent.position)))
         agents = [session.get(Agent, link.agent_id) for link in links if session.get(Agent, link.agent_id)]
         for a in agents:
             ensure_capability_profile(session, a)
 
         attachments = list(session.exec(select(Attachment).where(Attachment.run_id == run.id)))
-        state = RunState(run_id=run.id, prompt=prompt, mode=run.mode, max_turns=run.max_turns, max_seconds=run.max_seconds, token_budget=run.token_budget, reflection=reflection)
-        state.add('user', prompt)
-
         plan = create_team_plan(session, run_id=run.id, prompt=prompt, agents=agents, requested_mode=run.mode)
         subgoals = list(session.exec(select(TeamSubgoal).where(TeamSubgoal.plan_id == plan.id).order_by(TeamSubgoal.id)))
-
-        image_paths = [a.path for a in attachments if a.mime.startswith('image/')]
-        handoffs = 0
-        no_progress = 0
-        debate_turns = 0
-
+        nodes: list[SubgoalNode] = []
         for idx, sg in enumerate(subgoals[: settings.agentora_max_team_turns]):
-            if handoffs >= settings.agentora_max_handoffs:
-                add_trace(session, run.id, 'handoff_escalated', {'reason': 'max_handoffs_reached', 'max_handoffs': settings.agentora_max_handoffs}, agent_id=0)
-                break
             agent = next((a for a in agents if (a.id or 0) == (sg.assigned_agent_id or -1)), agents[min(idx, len(agents) - 1)] if agents else None)
             if not agent:
                 continue
-
-            add_trace(session, run.id, 'subgoal_assigned', {'subgoal_id': sg.id, 'title': sg.title, 'assigned_agent_id': agent.id, 'assigned_role': agent.role, 'needs_worker': sg.needs_worker, 'deliverable_type': sg.deliverable_type}, agent_id=agent.id or 0)
-            prev = state.messages[-1]['content'] if state.messages else prompt
-            handoff = None
-            if idx > 0 and len(agents) > 1:
-                prev_agent = next((a for a in agents if (a.id or 0) == (subgoals[idx - 1].assigned_agent_id or -1)), None)
-                if prev_agent and prev_agent.id != agent.id:
-                    handoff = create_handoff(
-                        session,
-                        run_id=run.id,
-                        from_agent_id=prev_agent.id or 0,
-                        to_agent_id=agent.id or 0,
-                        reason=f'{sg.title} requires {agent.role}',
-                        context=prev,
-                        expected_output=sg.deliverable_type,
-                        allow_tools=True,
-                        allow_memory=True,
-                        max_steps=min(sg.max_steps, settings.agentora_max_tool_steps),
-                    )
-                    handoffs += 1
-
-            if settings.agentora_enable_team_debate and 'critic' in (agent.role or '').lower() and debate_turns == 0:
-                add_trace(session, run.id, 'debate_started', {'subgoal_id': sg.id, 'mode': plan.mode}, agent_id=agent.id or 0)
-                debate_turns += 1
-
-            sg_lower = (sg.detail or '').lower()
-            if any(k in sg_lower for k in ['inspect files', 'scan folder', 'list files']):
-                req = create_action_request(session, run_id=run.id, agent_id=agent.id or 0, subgoal_id=sg.id, action_class='desktop', tool_name='desktop_list_dir', params={'path': '.'}, requested_worker=False, agent_role=agent.role)
-                if req.status == 'approved':
-                    execute_action_request(session, req.id)
-            if any(k in sg_lower for k in ['browse', 'search docs', 'open url']):
-                req = create_action_request(session, run_id=run.id, agent_id=agent.id or 0, subgoal_id=sg.id, action_class='browser', tool_name='browser_page_summary', params={'url': 'http://localhost:8088/api/health'}, requested_worker=True, agent_role=agent.role)
-                if req.status == 'approved':
-                    execute_action_request(session, req.id)
-
-            rt = await runtime_loop.run_agent(
-                session=session,
-                run_id=run.id,
-                agent=agent,
-                prompt=f"Subgoal: {sg.title}\nRequired deliverable: {sg.deliverable_type}\nContext: {prev}\nTask detail: {sg.detail}",
-                image_paths=image_paths,
-                max_steps=min(sg.max_steps, settings.agentora_max_tool_steps),
-            )
-
-            reply = rt.final_text
-            if 'critic' in (agent.role or '').lower():
-                add_trace(session, run.id, 'critique_issued', {'subgoal_id': sg.id, 'agent_id': agent.id, 'excerpt': reply[:240]}, agent_id=agent.id or 0)
-                if 'fail' in reply.lower() or 'cannot verify' in reply.lower():
-                    add_trace(session, run.id, 'verification_failed', {'subgoal_id': sg.id, 'agent_id': agent.id}, agent_id=agent.id or 0)
-
-            if state.repeated(reply):
-                no_progress += 1
-            else:
-                no_progress = 0
-            if no_progress >= 2:
-                add_trace(session, run.id, 'team_plan_revised', {'reason': 'no_progress_detected', 'subgoal_id': sg.id}, agent_id=0)
-                if settings.agentora_force_synthesis_on_budget_exhaust:
-                    break
-
-            in_toks = max(1, len(sg.detail) // 4)
-            out_toks = max(1, len(reply) // 4)
-            session.add(RunMetric(run_id=run.id, agent_id=agent.id or 0, tokens_in=in_toks, tokens_out=out_toks, seconds=0.0, tool_calls=rt.tool_calls_count))
-            state.add('assistant', reply, agent.id, meta={'subgoal_id': sg.id, 'deliverable_type': sg.deliverable_type, 'stop_reason': rt.stop_reason, 'model_used': rt.model_used, 'worker_used': rt.worker_used})
-
+            try:
+                deps = [int(d) for d in json.loads(sg.dependency_subgoal_ids_json or '[]')]
+            except (TypeError, ValueError):
+                deps = [idx - 1] if idx > 0 else []
+            nodes.append(SubgoalNode(idx, sg.id or 0, sg.title, sg.detail, sg.deliverable_type, sg.needs_worker, sg.max_steps, agent.id or 0, agent.role or '', agent.name, deps))
+        session.commit()
+        image_paths = [a.path for a in attachments if a.mime.startswith('image/')]
+        return [a.id or 0 for a in agents], image_paths, plan.mode, len(subgoals), nodes
+
+    def _run_action(self, session: Session, **request) -> None:
+        req = create_action_request(session, **request)
+        if req.status == 'approved':
+            execute_action_request(session, req.id)
+
+    async def _run_subgoal(self, run_id: int, node: SubgoalNode, prompt: str, image_paths: list[str]):
+        # Each branch gets its own session so parallel subgoals never share one connection.
+        with Session(db.engine) as branch:
+            agent = await blocking_pool.run('db', branch.get, Agent, node.agent_id)
+            rt = await runtime_loop.run_agent(session=branch, run_id=run_id, agent=agent, prompt=prompt, image_paths=image_paths, max_steps=min(node.max_steps, settings.agentora_max_tool_steps))
+            await blocking_pool.run('db', branch.commit)
+            return rt
+
+    def _complete_subgoal(self, session: Session, run_id: int, node: SubgoalNode, reply: str, tool_calls: int, handoff_id: int | None) -> None:
+        session.add(RunMetric(run_id=run_id, agent_id=node.agent_id, tokens_in=max(1, len(node.detail) // 4), tokens_out=max(1, len(reply) // 4), seconds=0.0, tool_calls=tool_calls))
+        sg = session.get(TeamSubgoal, node.subgoal_id)
+        if sg is not None:
             sg.status = 'done'
             sg.output_text = reply[:2000]
             sg.updated_at = datetime.utcnow()
             session.add(sg)
-            add_trace(session, run.id, 'subgoal_completed', {'subgoal_id': sg.id, 'agent_id': agent.id, 'deliverable_type': sg.deliverable_type}, agent_id=agent.id or 0)
+        add_trace(session, run_id, 'subgoal_completed', {'subgoal_id': node.subgoal_id, 'agent_id': node.agent_id, 'deliverable_type': node.deliverable_type}, agent_id=node.agent_id)
+        if handoff_id:
+            complete_handoff(session, handoff_id, accepted=True, escalated=False)
+        session.commit()
 
-            if handoff:
-                complete_handoff(session, handoff.id, accepted=True, escalated=False)
+    async def _launch(self, session: Session, run_id: int, node: SubgoalNode, context: str, by_position: dict[int, SubgoalNode], multi_agent: bool, plan_mode: str, debate_open: bool) -> int | None:
+        """Record a subgoal's assignment, handoff and side actions; returns the handoff id, if any."""
+        add_trace(session, run_id, 'subgoal_assigned', {'subgoal_id': node.subgoal_id, 'title': node.title, 'assigned_agent_id': node.agent_id, 'assigned_role': node.agent_role, 'needs_worker': node.needs_worker, 'deliverable_type': node.deliverable_type, 'depends_on': [by_position[d].subgoal_id for d in node.deps if d in by_position]}, agent_id=node.agent_id)
+        handoff_id = None
+        source = by_position.get(max(node.deps)) if node.deps else None
+        if multi_agent and source and source.agent_id != node.agent_id:
+            handoff = await blocking_pool.run(
+                'db',
+                create_handoff,
+                session,
+                run_id=run_id,
+                from_agent_id=source.agent_id,
+                to_agent_id=node.agent_id,
+                reason=f'{node.title} requires {node.agent_role}',
+                context=context,
+                expected_output=node.deliverable_type,
+                allow_tools=True,
+                allow_memory=True,
+                max_steps=min(node.max_steps, settings.agentora_max_tool_steps),
+            )
+            handoff_id = handoff.id
 
-            if state.reflection:
-                state.add('system', f'Reflection {agent.name}: quality=0.8 uncertainty=0.2', agent.id)
+        if debate_open and 'critic' in node.agent_role.lower():
+            add_trace(session, run_id, 'debate_started', {'subgoal_id': node.subgoal_id, 'mode': plan_mode}, agent_id=node.agent_id)
 
-        if plan.mode != 'single_agent':
-            synthesis = '\n\n'.join([m['content'] for m in state.messages if m.get('role') == 'assistant'][-3:])
-            state.add('assistant', f"Final synthesis:\n{synthesis[:2000]}", agents[-1].id if agents else None)
-            add_trace(session, run.id, 'synthesis_completed', {'mode': plan.mode, 'subgoals': len(subgoals)}, agent_id=(agents[-1].id if agents else 0))
+        sg_lower = (node.detail or '').lower()
+        if any(k in sg_lower for k in ['inspect files', 'scan folder', 'list files']):
+            await blocking_pool.run('subprocess', self._run_action, session, run_id=run_id, agent_id=node.agent_id, subgoal_id=node.subgoal_id, action_class='desktop', tool_name='desktop_list_dir', params={'path': '.'}, requested_worker=False, agent_role=node.agent_role)
+        if any(k in sg_lower for k in ['browse', 'search docs', 'open url']):
+            await blocking_pool.run('http', self._run_action, session, run_id=run_id, agent_id=node.agent_id, subgoal_id=node.subgoal_id, action_class='browser', tool_name='browser_page_summary', params={'url': 'http://localhost:8088/api/health'}, requested_worker=True, agent_role=node.agent_role)
+        # Commit the bookkeeping so the coordinator does not hold the write lock while branches run.
+        await blocking_pool.run('db', session.commit)
+        return handoff_id
 
+    async def execute(self, session: Session, run: Run, prompt: str, reflection: bool = False) -> RunState:
+        # Every synchronous DB, HTTP or subprocess call below goes through the blocking pool so a slow
+        # tool or worker never stalls the event loop; the session is only touched by one call at a time.
+        run_id = run.id
+        # Subscribers always get a terminal event, also when the run raises or is cancelled.
+        status = 'failed'
+        try:
+            state = RunState(run_id=run_id, prompt=prompt, mode=run.mode, max_turns=run.max_turns, max_seconds=run.max_seconds, token_budget=run.token_budget, reflection=reflection)
+            agent_ids, image_paths, plan_mode, subgoal_count, nodes = await blocking_pool.run('db', self._prepare, session, run, prompt)
+            state.add('user', prompt)
+
+            by_position = {n.position: n for n in nodes}
+            pending = dict(by_position)
+            outputs: dict[int, str] = {}
+            running: dict[asyncio.Task, tuple[SubgoalNode, int | None]] = {}
+            limit = max(1, settings.agentora_team_llm_concurrency)
+            handoffs = 0
+            no_progress = 0
+            debate_turns = 0
+            max_parallel = 0
+            launching = True
+            started = time.perf_counter()
+
+            # Subgoals run as a DAG: every pending step whose dependencies are done is launched, up to the
+            # per-run concurrency cap, and results are folded in as branches finish.
+            try:
+                while pending or running:
+                    ready = [n for n in pending.values() if all(d in outputs for d in n.deps)] if launching else []
+                    for node in ready:
+                        if len(running) >= limit:
+                            break
+                        if handoffs >= settings.agentora_max_handoffs:
+                            add_trace(session, run_id, 'handoff_escalated', {'reason': 'max_handoffs_reached', 'max_handoffs': settings.agentora_max_handoffs}, agent_id=0)
+                            launching = False
+                            break
+                        if run_scheduler.is_paused(run_id):
+                            add_trace(session, run_id, 'run_paused', {'subgoal_id': node.subgoal_id}, agent_id=0)
+                            await blocking_pool.run('db', session.commit)
+                            await run_scheduler.wait_if_paused(run_id)
+                            add_trace(session, run_id, 'run_resumed', {'subgoal_id': node.subgoal_id}, agent_id=0)
+                        context = '\n\n'.join(outputs[d] for d in node.deps) if node.deps else prompt
+                        handoff_id = await self._launch(session, run_id, node, context, by_position, len(agent_ids) > 1, plan_mode, settings.agentora_enable_team_debate and debate_turns == 0)
+                        if handoff_id:
+                            handoffs += 1
+                        if settings.agentora_enable_team_debate and 'critic' in node.agent_role.lower():
+                            debate_turns += 1
+                        subgoal_prompt = f"Subgoal: {node.title}\nRequired deliverable: {node.deliverable_type}\nContext: {context}\nTask detail: {node.detail}"
+                        task = asyncio.create_task(self._run_subgoal(run_id, node, subgoal_prompt, image_paths))
+                        running[task] = (node, handoff_id)
+                        del pending[node.position]
+                        max_parallel = max(max_parallel, len(running))
+
+                    if not running:
+                        if pending and launching:
+                            add_trace(session, run_id, 'subgoal_blocked', {'reason': 'unsatisfiable_dependencies', 'subgoal_ids': [n.subgoal_id for n in pending.values()]}, agent_id=0)
+                        break
+
+                    finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in sorted(finished, key=lambda t: running[t][0].position):
+                        node, handoff_id = running.pop(task)
+                        rt = task.result()
+                        reply = rt.final_text
+                        if 'critic' in node.agent_role.lower():
+                            add_trace(session, run_id, 'critique_issued', {'subgoal_id': node.subgoal_id, 'agent_id': node.agent_id, 'excerpt': reply[:240]}, agent_id=node.agent_id)
+                            if 'fail' in reply.lower() or 'cannot verify' in reply.lower():
+                                add_trace(session, run_id, 'verification_failed', {'subgoal_id': node.subgoal_id, 'agent_id': node.agent_id}, agent_id=node.agent_id)
+
+                        if state.repeated(reply):
+                            no_progress += 1
+                        else:
+                            no_progress = 0
+                        if no_progress >= 2:
+                            add_trace(session, run_id, 'team_plan_revised', {'reason': 'no_progress_detected', 'subgoal_id': node.subgoal_id}, agent_id=0)
+                            if settings.agentora_force_synthesis_on_budget_exhaust:
+                                launching = False
+
+                        state.add('assistant', reply, node.agent_id, meta={'subgoal_id': node.subgoal_id, 'deliverable_type': node.deliverable_type, 'stop_reason': rt.stop_reason, 'model_used': rt.model_used, 'worker_used': rt.worker_used})
+                        await blocking_pool.run('db', self._complete_subgoal, session, run_id, node, reply, rt.tool_calls_count, handoff_id)
+                        outputs[node.position] = reply
+
+                        if state.reflection:
+                            state.add('system', f'Reflection {node.agent_name}: quality=0.8 uncertainty=0.2', node.agent_id)
+            finally:
+                for task in running:
+                    task.cancel()
+                if running:
+                    await asyncio.gather(*running, return_exceptions=True)
+
+            add_trace(session, run_id, 'team_schedule_summary', {'subgoals': len(nodes), 'completed': len(outputs), 'max_parallel': max_parallel, 'concurrency_limit': limit, 'handoffs': handoffs, 'wall_ms': round((time.perf_counter() - started) * 1000.0, 3)}, agent_id=0)
+            if plan_mode != 'single_agent':
+                last_agent = agent_ids[-1] if agent_ids else None
+                synthesis = '\n\n'.join([m['content'] for m in state.messages if m.get('role') == 'assistant'][-3:])
+                state.add('assistant', f"Final synthesis:\n{synthesis[:2000]}", last_agent)
+                add_trace(session, run_id, 'synthesis_completed', {'mode': plan_mode, 'subgoals': subgoal_count}, agent_id=last_agent or 0)
+
+            status = await blocking_pool.run('db', self._finish, session, run, state)
+            return state
+        except asyncio.CancelledError:
+            status = 'interrupted'
+            raise
+        finally:
+            run_events.close_run(run_id, status)
+
+    def _finish(self, session: Session, run: Run, state: RunState) -> str:
         run.finished_at = datetime.utcnow()
-        if run.status == 'running':
+        # A pause that lands after the last subgoal has nothing left to gate.
+        if run.status in {'running', 'paused'}:
             run.status = 'completed'
         run.result_summary = state.messages[-1]['content'][:300] if state.messages else ''
         session.add(run)
@@ -135,6 +224,7 @@ class OrchestrationEngine:
         usage.last_used_at = datetime.utcnow()
         session.add(usage)
 
+        status = run.status
         record_collaboration_metrics(session, run.id)
         session.commit()
-        return state
+        return status
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlmodel import Session, select
+
+from app import db
+from app.core.config import settings
+from app.models import Run
+from app.services.http_pool import http_pool
+from app.services.runtime.offload import blocking_pool
+from app.services.runtime.percentiles import percentile
+from app.services.runtime.run_events import run_events
+from app.services.runtime.trace import add_trace
+
+
+def _summary(values: deque) -> dict:
+    samples = list(values)
+    return {
+        'p50': round(percentile(samples, 0.50), 3),
+        'p95': round(percentile(samples, 0.95), 3),
+        'max': round(max(samples), 3) if samples else 0.0,
+    }
+
+
+@dataclass
+class _Ticket:
+    run_id: int
+    team_id: int
+    priority: int
+    seq: int
+    prompt: str
+    reflection: bool
+    enqueued_at: float = field(default_factory=time.monotonic)
+    wait_ms: float = 0.0
+
+
+class RunScheduler:
+    """Executes submitted team runs in the background under global and per-team limits.
+
+    Lower priority values go first. Within a priority, the team served longest
+    ago goes next, so one busy team cannot starve the others. Paused runs stay
+    queued, and runs already executing wait at their next subgoal until resumed.
+    The scheduler owns a daemon thread with its own event loop.
+    """
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._queue: list[_Ticket] = []
+        self._running: dict[int, int] = {}
+        self._paused: set[int] = set()
+        self._team_last_served: dict[int, int] = {}
+        self._seq = itertools.count()
+        self._served = itertools.count()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._ready = threading.Event()
+        self._stopping = False
+        self._wait_ms: deque[float] = deque(maxlen=window)
+        self._run_ms: deque[float] = deque(maxlen=window)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        self._ready.clear()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name='agentora-run-scheduler', daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5.0)
+        self.recover()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping = True
+        self._notify()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def recover(self) -> int:
+        """Re-enqueue runs left queued by a previous process, including queued runs paused before they started."""
+        with Session(db.engine) as session:
+            # A queued run's started_at equals queued_at until _mark_started moves it.
+            paused_unstarted = (Run.status == 'paused') & (Run.queued_at != None) & (Run.started_at <= Run.queued_at)  # noqa: E711
+            rows = list(session.exec(select(Run).where((Run.status == 'queued') | paused_unstarted, Run.finished_at == None).order_by(Run.id)))  # noqa: E711
+        with self._lock:
+            known = {t.run_id for t in self._queue} | set(self._running)
+            fresh = [r for r in rows if r.id not in known and r.prompt]
+            for run in fresh:
+                self._queue.append(_Ticket(run.id, run.team_id, run.priority, next(self._seq), run.prompt, run.reflection))
+                if run.status == 'paused':
+                    self._paused.add(run.id)
+        self._notify()
+        return len(fresh)
+
+    def accepting(self) -> bool:
+        with self._lock:
+            if len(self._queue) < max(1, settings.agentora_run_scheduler_max_queue):
+                return True
+            self.rejected += 1
+            return False
+
+    def submit(self, run_id: int, team_id: int, prompt: str, reflection: bool = False, priority: int = 5) -> int:
+        """Enqueue a persisted run and return its position in dispatch order (0 = next)."""
+        if not self.running:
+            self.start()
+        ticket = _Ticket(run_id, team_id, max(1, min(10, priority)), next(self._seq), prompt, reflection)
+        with self._lock:
+            if run_id in self._running:
+                return 0
+            # Starting the scheduler may already have recovered this run from the database.
+            existing = next((t for t in self._queue if t.run_id == run_id), None)
+            if existing is not None:
+                ticket = existing
+            else:
+                self._queue.append(ticket)
+                self.submitted += 1
+            ordered = sorted(self._queue, key=self._order_key)
+            position = ordered.index(ticket)
+        self._notify()
+        return position
+
+    def _order_key(self, ticket: _Ticket) -> tuple[int, int, int]:
+        return (ticket.priority, self._team_last_served.get(ticket.team_id, -1), ticket.seq)
+
+    def is_queued(self, run_id: int) -> bool:
+        with self._lock:
+            return any(t.run_id == run_id for t in self._queue)
+
+    def owns(self, run_id: int) -> bool:
+        """Whether the run is queued or executing here, so its stream will see an end event."""
+        with self._lock:
+            return run_id in self._running or any(t.run_id == run_id for t in self._queue)
+
+    def is_paused(self, run_id: int) -> bool:
+        with self._lock:
+            return run_id in self._paused
+
+    def pause(self, run_id: int) -> None:
+        with self._lock:
+            self._paused.add(run_id)
+
+    def resume(self, run_id: int) -> None:
+        with self._lock:
+            self._paused.discard(run_id)
+        self._notify()
+
+    def forget(self, run_id: int) -> None:
+        """Drop the pause flag of a run that executed inline, outside the scheduler."""
+        with self._lock:
+            self._paused.discard(run_id)
+
+    async def wait_if_paused(self, run_id: int, poll_seconds: float = 0.1) -> bool:
+        """Block the calling run between subgoals while it is paused; returns whether it waited."""
+        waited = False
+        while self.is_paused(run_id) and not self._stopping:
+            waited = True
+            await asyncio.sleep(poll_seconds)
+        return waited
+
+    def _notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass
+
+    def _next_ticket(self) -> _Ticket | None:
+        with self._lock:
+            if len(self._running) >= max(1, settings.agentora_run_scheduler_max_concurrent):
+                return None
+            per_team = Counter(self._running.values())
+            limit = max(1, settings.agentora_run_scheduler_max_per_team)
+            eligible = [t for t in self._queue if t.run_id not in self._paused and per_team[t.team_id] < limit]
+            if not eligible:
+                return None
+            ticket = min(eligible, key=self._order_key)
+            self._queue.remove(ticket)
+            self._running[ticket.run_id] = ticket.team_id
+            self._team_last_served[ticket.team_id] = next(self._served)
+            ticket.wait_ms = (time.monotonic() - ticket.enqueued_at) * 1000.0
+            self._wait_ms.append(ticket.wait_ms)
+            return ticket
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._ready.set()
+        tasks: set[asyncio.Task] = set()
+        try:
+            while not self._stopping:
+                while (ticket := self._next_ticket()) is not None:
+                    task = asyncio.create_task(self._execute(ticket))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await http_pool.aclose_loop()
+            self._loop = None
+            self._wake = None
+
+    async def _execute(self, ticket: _Ticket) -> None:
+        from .engine import OrchestrationEngine
+
+        started = time.monotonic()
+        failed = False
+        # Failures are recorded from a fresh session: a cancelled step may still be using the run's one.
+        with Session(db.engine) as session:
+            try:
+                run = await blocking_pool.run('db', self._mark_started, session, ticket)
+                if run is not None:
+                    await OrchestrationEngine().execute(session, run, ticket.prompt, ticket.reflection)
+            except asyncio.CancelledError:
+                failed = True
+                await asyncio.shield(blocking_pool.run('db', self._mark_ended, ticket.run_id, 'interrupted', 'scheduler stopped before the run finished'))
+                raise
+            except Exception as exc:
+                failed = True
+                # The failed transaction may still hold the write lock the fresh session needs.
+                await blocking_pool.run('db', session.rollback)
+                await blocking_pool.run('db', self._mark_ended, ticket.run_id, 'failed', f'{type(exc).__name__}: {exc}')
+            finally:
+                with self._lock:
+                    self._running.pop(ticket.run_id, None)
+                    self._paused.discard(ticket.run_id)
+                    self._run_ms.append((time.monotonic() - started) * 1000.0)
+                    if failed:
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+                self._notify()
+
+    @staticmethod
+    def _mark_started(session: Session, ticket: _Ticket) -> Run | None:
+        run = session.get(Run, ticket.run_id)
+        if run is None:
+            return None
+        run.status = 'running'
+        run.started_at = datetime.utcnow()
+        run.wait_ms = round(ticket.wait_ms, 3)
+        session.add(run)
+        add_trace(session, run.id, 'run_started', {'priority': ticket.priority, 'wait_ms': run.wait_ms, 'scheduled': True}, agent_id=0)
+        session.commit()
+        session.refresh(run)
+        return run
+
+    @staticmethod
+    def _mark_ended(run_id: int, status: str, reason: str) -> None:
+        with Session(db.engine) as session:
+            run = session.get(Run, run_id)
+            if run is None:
+                return
+            run.status = status
+            run.finished_at = datetime.utcnow()
+            run.result_summary = reason[:300]
+            session.add(run)
+            add_trace(session, run_id, f'run_{status}', {'reason': reason[:500]}, agent_id=0)
+            session.commit()
+        run_events.close_run(run_id, status)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'running': self.running,
+                'max_concurrent': settings.agentora_run_scheduler_max_concurrent,
+                'max_per_team': settings.agentora_run_scheduler_max_per_team,
+                'max_queue': settings.agentora_run_scheduler_max_queue,
+                'queue_depth': len(self._queue),
+                'queue_depth_by_team': dict(Counter(t.team_id for t in self._queue)),
+                'active_runs': len(self._running),
+                'active_by_team': dict(Counter(self._running.values())),
+                'paused': len(self._paused),
+                'oldest_wait_seconds': round(max((now - t.enqueued_at for t in self._queue), default=0.0), 3),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'wait_ms': _summary(self._wait_ms),
+                'run_ms': _summary(self._run_ms),
+            }
+
+
+run_scheduler = RunScheduler()
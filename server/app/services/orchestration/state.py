@@ -20,3 +20,20 @@ class RunState:
     def repeated(self, text: str) -> bool:
         hits = [m for m in self.messages if m['content'] == text]
         return len(hits) >= 2
+
+
+@dataclass
+class SubgoalNode:
+    """Plain snapshot of one plan step, so scheduling never reloads expired ORM rows on the event loop."""
+
+    position: int
+    subgoal_id: int
+    title: str
+    detail: str
+    deliverable_type: str
+    needs_worker: bool
+    max_steps: int
+    agent_id: int
+    agent_role: str
+    agent_name: str
+    deps: list[int] = field(default_factory=list)
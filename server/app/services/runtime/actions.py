@@ -162,13 +162,13 @@ def execute_action_request(session: Session, action_id: int, approved_by: str =
     use_worker = req.requested_worker and req.tool_name in {'browser_extract_text', 'browser_page_summary', 'browser_download', 'desktop_shell'}
     if use_worker:
         add_trace(session, req.run_id, 'action_worker_route_selected', {'action_id': req.id, 'tool_name': req.tool_name}, agent_id=req.agent_id)
-        job = route_worker_job(session, 'long_tool_job', {'run_id': req.run_id, 'action_id': req.id, 'tool_name': req.tool_name, 'params': params}, priority=4)
+        job = route_worker_job(session, 'long_tool_job', {'run_id': req.run_id, 'action_id': req.id, 'tool_name': req.tool_name, 'params': params}, priority=4, wait=False)
         if job.used_fallback_local:
             add_trace(session, req.run_id, 'action_worker_fallback', {'action_id': req.id, 'reason': job.error or 'worker_unavailable'}, agent_id=req.agent_id)
         else:
             exec_row.execution_mode = 'worker'
             exec_row.worker_job_id = job.id
-            add_trace(session, req.run_id, 'action_worker_completed', {'action_id': req.id, 'worker_job_id': job.id, 'status': job.status}, agent_id=req.agent_id)
+            add_trace(session, req.run_id, 'action_worker_queued', {'action_id': req.id, 'worker_job_id': job.id, 'status': job.status}, agent_id=req.agent_id)
 
     if req.action_class == 'desktop':
         result = _desktop_execute(req.tool_name, params)
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import threading
+from typing import Sequence
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.models import Capsule, CapsuleEmbedding
+from app.services.runtime.vectors import VECTOR_DTYPE, embedding_vector, normalize_vector, top_k_indices
+
+
+class BruteForceIndex:
+    """Exact inner-product index over unit vectors kept in one growable matrix."""
+
+    name = 'brute'
+
+    def __init__(self):
+        self.dim = 0
+        self._matrix = np.zeros((0, 0), dtype=VECTOR_DTYPE)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._runs = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._pos: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def __contains__(self, capsule_id: int) -> bool:
+        return capsule_id in self._pos
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 256)
+        matrix = np.zeros((new_capacity, self.dim), dtype=VECTOR_DTYPE)
+        matrix[: self._size] = self._matrix[: self._size]
+        self._matrix = matrix
+        self._ids = np.resize(self._ids, new_capacity)
+        self._runs = np.resize(self._runs, new_capacity)
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[: self._size] = self._alive[: self._size]
+        self._alive = alive
+
+    def add(self, capsule_id: int, run_id: int, vector: np.ndarray) -> bool:
+        if vector.size == 0:
+            return False
+        if not self.dim:
+            self.dim = int(vector.size)
+            self._matrix = np.zeros((0, self.dim), dtype=VECTOR_DTYPE)
+        if vector.size != self.dim:
+            return False
+        self.remove(capsule_id)
+        self._grow(self._size + 1)
+        row = self._size
+        self._matrix[row] = vector
+        self._ids[row] = capsule_id
+        self._runs[row] = run_id
+        self._alive[row] = True
+        self._pos[capsule_id] = row
+        self._size += 1
+        self._on_add(row)
+        return True
+
+    def remove(self, capsule_id: int) -> None:
+        row = self._pos.pop(capsule_id, None)
+        if row is not None:
+            self._alive[row] = False
+            if self._size - len(self._pos) > max(256, self._size // 4):
+                self.compact()
+
+    def compact(self) -> None:
+        """Drop removed rows from the matrix, keeping live rows in insertion order."""
+        keep = np.flatnonzero(self._alive[: self._size])
+        self._matrix = self._matrix[keep].copy()
+        self._ids = self._ids[keep].copy()
+        self._runs = self._runs[keep].copy()
+        self._alive = np.ones(keep.size, dtype=bool)
+        self._compact_extra(keep)
+        self._size = int(keep.size)
+        self._pos = {int(cid): row for row, cid in enumerate(self._ids[: self._size])}
+
+    def _compact_extra(self, keep: np.ndarray) -> None:
+        return None
+
+    def count(self, run_id: int | None = None) -> int:
+        if run_id is None:
+            return len(self._pos)
+        return int(np.count_nonzero(self._alive[: self._size] & (self._runs[: self._size] == run_id)))
+
+    def _mask(self, run_id: int | None) -> np.ndarray:
+        mask = self._alive[: self._size].copy()
+        if run_id is not None:
+            mask &= self._runs[: self._size] == run_id
+        return mask
+
+    def _on_add(self, row: int) -> None:
+        return None
+
+    def _rank(self, rows: np.ndarray, query: np.ndarray, k: int) -> list[tuple[int, float]]:
+        if rows.size == 0:
+            return []
+        scores = self._matrix[rows] @ query
+        return [(int(self._ids[rows[i]]), float(scores[i])) for i in top_k_indices(scores, k)]
+
+    def search(self, query: np.ndarray, k: int, run_id: int | None = None) -> list[tuple[int, float]]:
+        if not self.dim or query.size != self.dim:
+            return []
+        return self._rank(np.flatnonzero(self._mask(run_id)), query, k)
+
+
+class IVFIndex(BruteForceIndex):
+    """Inverted-file index: k-means coarse quantizer, probe the nearest lists only."""
+
+    name = 'ivf'
+
+    def __init__(self, nlist: int = 0, nprobe: int = 16, train_iters: int = 8):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self._centroids = np.zeros((0, 0), dtype=VECTOR_DTYPE)
+        self._assign = np.zeros(0, dtype=np.int64)
+        self._trained_size = 0
+
+    def _grow(self, needed: int) -> None:
+        super()._grow(needed)
+        if self._assign.shape[0] < self._matrix.shape[0]:
+            assign = np.full(self._matrix.shape[0], -1, dtype=np.int64)
+            assign[: self._assign.shape[0]] = self._assign
+            self._assign = assign
+
+    def _compact_extra(self, keep: np.ndarray) -> None:
+        self._assign = self._assign[keep].copy()
+
+    def _on_add(self, row: int) -> None:
+        if self._centroids.shape[0]:
+            self._assign[row] = int(np.argmax(self._centroids @ self._matrix[row]))
+
+    @property
+    def needs_training(self) -> bool:
+        """Grown to twice the size the current lists were trained on (first training at 64 rows)."""
+        return len(self) >= max(64, self._trained_size * 2)
+
+    def training_data(self) -> np.ndarray:
+        """A copy of the live vectors, so k-means can run without holding whatever guards this index."""
+        return self._matrix[np.flatnonzero(self._alive[: self._size])].copy()
+
+    def kmeans(self, data: np.ndarray) -> np.ndarray:
+        """Coarse-quantizer centroids for ``data``; touches no index state."""
+        if data.shape[0] < 64:
+            return np.zeros((0, self.dim), dtype=VECTOR_DTYPE)
+        nlist = self.nlist or int(max(4, min(1024, round(np.sqrt(data.shape[0])))))
+        nlist = min(nlist, data.shape[0])
+        rng = np.random.default_rng(data.shape[0])
+        centroids = data[rng.choice(data.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[labels == c]
+                if members.shape[0]:
+                    centroids[c] = normalize_vector(members.mean(axis=0))
+        return centroids
+
+    def install(self, centroids: np.ndarray, trained_size: int) -> None:
+        """Switch to new lists and assign every live row, including rows added while they were trained."""
+        if not centroids.shape[0]:
+            return
+        rows = np.flatnonzero(self._alive[: self._size])
+        self._centroids = centroids
+        self._assign[: self._size] = -1
+        self._assign[rows] = np.argmax(self._matrix[rows] @ centroids.T, axis=1)
+        self._trained_size = trained_size
+
+    def train(self) -> None:
+        data = self.training_data()
+        self.install(self.kmeans(data), data.shape[0])
+
+    def search(self, query: np.ndarray, k: int, run_id: int | None = None) -> list[tuple[int, float]]:
+        if not self.dim or query.size != self.dim:
+            return []
+        mask = self._mask(run_id)
+        if not self._centroids.shape[0]:
+            return self._rank(np.flatnonzero(mask), query, k)
+        probe = top_k_indices(self._centroids @ query, min(self.nprobe, self._centroids.shape[0]))
+        probed = np.flatnonzero(mask & np.isin(self._assign[: self._size], probe))
+        if probed.size < k:
+            # Sparse scopes (one run inside a large store) rarely fill the probed
+            # lists, and an exact scan over a small scope is already cheap.
+            return self._rank(np.flatnonzero(mask), query, k)
+        return self._rank(probed, query, k)
+
+
+INDEX_BACKENDS = {'brute': BruteForceIndex, 'ivf': IVFIndex}
+
+
+def _indexable(capsule: Capsule) -> bool:
+    return not (capsule.memory_layer == 'L5_COLD' and capsule.archive_status == 'cold')
+
+
+class CapsuleIndex:
+    """Process-wide ANN index over active capsule embeddings, one index per dimension.
+
+    New embeddings are picked up incrementally by id on every ``sync``; layer and
+    archive changes are pushed through ``refresh``/``remove`` by the memory paths
+    that mutate them. Vectors written by a different embedding model (another
+    dimension) live in their own index and never mix into a query's candidates.
+    An IVF index that has doubled since its last training is retrained on a
+    background thread from a snapshot, so neither ``sync`` nor a search waits on
+    k-means; until it finishes, the previous lists keep serving.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bind_key = ''
+        self._backend = ''
+        self._last_embedding_id = 0
+        self._indexes: dict[int, BruteForceIndex] = {}
+        self._training: dict[int, threading.Thread] = {}
+        self.trainings = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.agentora_memory_ann_backend in INDEX_BACKENDS
+
+    def _new_index(self) -> BruteForceIndex:
+        if self._backend == 'ivf':
+            return IVFIndex(nlist=settings.agentora_memory_ann_nlist, nprobe=settings.agentora_memory_ann_nprobe)
+        return BruteForceIndex()
+
+    def _add(self, capsule: Capsule, vector: np.ndarray) -> None:
+        if vector.size == 0:
+            return
+        index = self._indexes.get(int(vector.size))
+        if index is None:
+            index = self._indexes[int(vector.size)] = self._new_index()
+        index.add(capsule.id, capsule.run_id, vector)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._bind_key = ''
+            self._backend = ''
+            self._last_embedding_id = 0
+            self._indexes = {}
+            self._training = {}
+
+    def sync(self, session: Session) -> None:
+        if not self.enabled:
+            return
+        bind_key = str(session.get_bind().url)
+        with self._lock:
+            if bind_key != self._bind_key or self._backend != settings.agentora_memory_ann_backend:
+                self.reset()
+                self._bind_key = bind_key
+                self._backend = settings.agentora_memory_ann_backend
+            stmt = (
+                select(Capsule, CapsuleEmbedding)
+                .join(CapsuleEmbedding, Capsule.id == CapsuleEmbedding.capsule_id)
+                .where(CapsuleEmbedding.id > self._last_embedding_id)
+                .order_by(CapsuleEmbedding.id)
+            )
+            for cap, emb in session.exec(stmt):
+                self._last_embedding_id = max(self._last_embedding_id, emb.id or 0)
+                if _indexable(cap):
+                    self._add(cap, embedding_vector(emb))
+            self._schedule_training()
+
+    def _schedule_training(self) -> None:
+        for dim, index in self._indexes.items():
+            if isinstance(index, IVFIndex) and index.needs_training and dim not in self._training:
+                thread = threading.Thread(target=self._train, args=(dim, index, index.training_data()), name=f'agentora-ann-train-{dim}', daemon=True)
+                self._training[dim] = thread
+                thread.start()
+
+    def _train(self, dim: int, index: IVFIndex, data: np.ndarray) -> None:
+        try:
+            centroids = index.kmeans(data)
+            with self._lock:
+                # A reset while training dropped this index; its lists are of no use.
+                if self._indexes.get(dim) is index:
+                    index.install(centroids, data.shape[0])
+                    self.trainings += 1
+        finally:
+            with self._lock:
+                if self._training.get(dim) is threading.current_thread():
+                    del self._training[dim]
+
+    def wait_trained(self, timeout: float = 10.0) -> bool:
+        """Block until background training started so far has finished; False on timeout."""
+        with self._lock:
+            threads = list(self._training.values())
+        for thread in threads:
+            thread.join(timeout)
+        return not any(thread.is_alive() for thread in threads)
+
+    def refresh(self, session: Session, capsule: Capsule) -> None:
+        if not self._bind_key or capsule.id is None:
+            return
+        with self._lock:
+            if not _indexable(capsule):
+                self.remove(capsule.id)
+                return
+            if any(capsule.id in index for index in self._indexes.values()):
+                return
+            emb = session.exec(select(CapsuleEmbedding).where(CapsuleEmbedding.capsule_id == capsule.id)).first()
+            if emb and emb.id and emb.id <= self._last_embedding_id:
+                self._add(capsule, embedding_vector(emb))
+
+    def remove(self, capsule_id: int) -> None:
+        with self._lock:
+            for index in self._indexes.values():
+                index.remove(capsule_id)
+
+    def count(self, run_id: int | None = None, dim: int | None = None) -> int:
+        with self._lock:
+            indexes = [self._indexes[dim]] if dim in self._indexes else ([] if dim else list(self._indexes.values()))
+            return sum(index.count(run_id) for index in indexes)
+
+    def covers(self, query_vector: Sequence[float]) -> bool:
+        return len(query_vector) in self._indexes
+
+    def search(self, query_vector: Sequence[float], k: int, run_id: int | None = None) -> list[tuple[int, float]]:
+        with self._lock:
+            index = self._indexes.get(len(query_vector))
+            if index is None:
+                return []
+            return index.search(normalize_vector(query_vector), k, run_id=run_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'backend': self._backend or settings.agentora_memory_ann_backend,
+                'last_embedding_id': self._last_embedding_id,
+                'trainings': self.trainings,
+                'training_dims': sorted(self._training),
+                'indexes': [
+                    {'dim': dim, 'size': len(index), 'lists': int(index._centroids.shape[0]) if isinstance(index, IVFIndex) else 0}
+                    for dim, index in sorted(self._indexes.items())
+                ],
+            }
+
+
+capsule_index = CapsuleIndex()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from sqlmodel import Session, select
+
+from app.models import Capsule
+from app.services.runtime.conflicts import detect_conflicts_for_run, upsert_duplicate_clusters
+
+
+class RetrievalBookkeeping:
+    """Duplicate-cluster and contradiction bookkeeping deferred off the retrieval path.
+
+    Retrieval only records which capsules and runs need attention; ``flush``
+    folds them in with one cluster lookup and one conflict scan per run. A
+    flush that fails puts the ids it took back in the queue for the next one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._capsule_ids: set[int] = set()
+        self._run_ids: set[int] = set()
+        self._oldest: float | None = None
+        self.flushes = 0
+        self.clustered = 0
+        self.conflicts = 0
+        self.errors = 0
+
+    def defer(self, capsule_ids: list[int], run_id: int | None = None) -> None:
+        with self._lock:
+            self._capsule_ids.update(int(c) for c in capsule_ids if c)
+            if run_id is not None:
+                self._run_ids.add(int(run_id))
+            if self._oldest is None and (self._capsule_ids or self._run_ids):
+                self._oldest = time.monotonic()
+
+    def _take(self) -> tuple[list[int], list[int]]:
+        with self._lock:
+            capsule_ids, run_ids = sorted(self._capsule_ids), sorted(self._run_ids)
+            self._capsule_ids.clear()
+            self._run_ids.clear()
+            self._oldest = None
+            return capsule_ids, run_ids
+
+    def _restore(self, capsule_ids: list[int], run_ids: list[int]) -> None:
+        with self._lock:
+            self.errors += 1
+            self._capsule_ids.update(capsule_ids)
+            self._run_ids.update(run_ids)
+            if self._oldest is None and (self._capsule_ids or self._run_ids):
+                self._oldest = time.monotonic()
+
+    def flush(self, session: Session) -> dict:
+        capsule_ids, run_ids = self._take()
+        clustered = 0
+        try:
+            if capsule_ids:
+                caps = list(session.exec(select(Capsule).where(Capsule.id.in_(capsule_ids))))
+                clustered = len(upsert_duplicate_clusters(session, caps))
+                session.commit()
+            conflicts = sum(len(detect_conflicts_for_run(session, run_id)) for run_id in run_ids)
+        except Exception:
+            # Clustering and conflict detection are idempotent, so redoing work that did commit is harmless.
+            session.rollback()
+            self._restore(capsule_ids, run_ids)
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.clustered += clustered
+            self.conflicts += conflicts
+        return {'clustered': clustered, 'runs_scanned': len(run_ids), 'conflicts': conflicts}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'pending_capsules': len(self._capsule_ids),
+                'pending_runs': len(self._run_ids),
+                'oldest_pending_seconds': round(time.monotonic() - self._oldest, 3) if self._oldest is not None else 0.0,
+                'flushes': self.flushes,
+                'clustered': self.clustered,
+                'conflicts': self.conflicts,
+                'errors': self.errors,
+            }
+
+
+retrieval_bookkeeping = RetrievalBookkeeping()
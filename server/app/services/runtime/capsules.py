@@ -1,28 +1,22 @@
 from __future__ import annotations
 
+import asyncio
 import json
-import math
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
 
+from sqlalchemy import insert
 from sqlmodel import Session, select
 
 from app.core.config import settings
 from app.models import Capsule, CapsuleEmbedding
-from app.services.ollama_client import OllamaClient
-from app.services.runtime.layers import layered_retrieval
-
-
-def chunk_text(text: str, chunk_size: int = 850, overlap: int = 150) -> list[str]:
-    clean = ' '.join(text.split())
-    if not clean:
-        return []
-    out: list[str] = []
-    i = 0
-    step = max(1, chunk_size - overlap)
-    while i < len(clean):
-        out.append(clean[i : i + chunk_size])
-        i += step
-    return out
+from app.services.runtime.ann_index import capsule_index
+from app.services.runtime.chunking import iter_chunks
+from app.services.runtime.embedding_cache import cached_embed_texts
+from app.services.runtime.layers import layered_retrieval_many
+from app.services.runtime.offload import blocking_pool
+from app.services.runtime.vectors import build_embedding, cosine_scores_many, embedding_vector
 
 
 def _summary_chunk(text: str) -> str:
@@ -43,74 +37,160 @@ def _derive_layer(source: str, is_summary: bool, text_len: int) -> tuple[str, st
     return 'L2_SESSION', 'medium'
 
 
-async def ingest_text_as_capsules(
-    session: Session,
-    run_id: int,
-    text: str,
-    source: str,
-    attachment_id: int | None = None,
-    tags: list[str] | None = None,
-) -> int:
-    chunks = chunk_text(text)
+@dataclass
+class IngestDocument:
+    run_id: int
+    text: str
+    source: str
+    attachment_id: int | None = None
+    tags: list[str] = field(default_factory=list)
+    # Optional lazy source (e.g. PDF pages); when set it is chunked instead of ``text``.
+    blocks: Iterable[str] | None = None
+
+
+def _document_chunks(doc: IngestDocument) -> tuple[list[str], bool]:
+    head: list[str] = []
+    head_chars = 0
+    total_chars = 0
+
+    def counted(blocks: Iterable[str]) -> Iterator[str]:
+        nonlocal head_chars, total_chars
+        for block in blocks:
+            total_chars += len(block)
+            if head_chars < 2000:
+                head.append(block)
+                head_chars += len(block)
+            yield block
+
+    chunks = list(iter_chunks(counted(doc.blocks if doc.blocks is not None else [doc.text])))
+    if chunks and total_chars > 4000 and settings.agentora_enable_memory_summaries:
+        return [_summary_chunk('\n'.join(head))] + chunks, True
+    return chunks, False
+
+
+def insert_capsules_bulk(session: Session, doc: IngestDocument, chunks: list[str], vectors: list[list[float]], summary_added: bool = False) -> list[int]:
+    """Insert one document's capsules and embeddings as two executemany statements.
+
+    Ids come back through ``RETURNING`` in chunk order. The caller owns the
+    transaction, so a whole document lands in a single commit.
+    """
     if not chunks:
-        return 0
-    created_chunks = chunks[:]
-    summary_added = False
-    if len(text) > 4000 and settings.agentora_enable_memory_summaries:
-        created_chunks = [_summary_chunk(text)] + created_chunks
-        summary_added = True
-
-    vectors = await OllamaClient().embed_texts(created_chunks, model=settings.agentora_embed_model)
-    inserted = 0
-    tags_json = json.dumps(tags or [])
-    for idx, chunk in enumerate(created_chunks):
+        return []
+    now = datetime.utcnow()
+    tags_json = json.dumps(doc.tags or [])
+    rows: list[dict] = []
+    for idx, chunk in enumerate(chunks):
         is_summary = summary_added and idx == 0
-        layer, decay = _derive_layer(source=source, is_summary=is_summary, text_len=len(chunk))
+        layer, decay = _derive_layer(source=doc.source, is_summary=is_summary, text_len=len(chunk))
         capsule = Capsule(
-            run_id=run_id,
-            attachment_id=attachment_id,
-            source=source,
+            run_id=doc.run_id,
+            attachment_id=doc.attachment_id,
+            source=doc.source,
             chunk_index=idx,
             text=chunk,
             tags_json=tags_json,
             is_summary=is_summary,
             memory_layer=layer,
-            source_type='attachment' if attachment_id else 'run',
-            project_key=f'run:{run_id}',
-            session_key=f'run:{run_id}',
+            source_type='attachment' if doc.attachment_id else 'run',
+            project_key=f'run:{doc.run_id}',
+            session_key=f'run:{doc.run_id}',
             archive_status='cold' if layer == 'L5_COLD' else 'active',
             decay_class=decay,
             confidence=0.55,
             consolidation_score=0.5,
             trust_score=0.55,
             recency_score=1.0,
-            created_from_run_id=run_id,
-            created_at=datetime.utcnow(),
+            created_from_run_id=doc.run_id,
+            created_at=now,
         )
-        session.add(capsule)
-        session.commit()
-        session.refresh(capsule)
-        vec = vectors[idx] if idx < len(vectors) else []
-        session.add(CapsuleEmbedding(capsule_id=capsule.id, vector_json=json.dumps(vec)))
-        inserted += 1
+        rows.append(capsule.model_dump(exclude={'id'}))
+    ids = list(session.execute(insert(Capsule).returning(Capsule.id, sort_by_parameter_order=True), rows).scalars())
+    embeddings = [build_embedding(cid, vectors[idx] if idx < len(vectors) else []).model_dump(exclude={'id'}) for idx, cid in enumerate(ids)]
+    session.execute(insert(CapsuleEmbedding), embeddings)
+    return ids
+
+
+def _insert_and_commit(session: Session, doc: IngestDocument, chunks: list[str], vectors: list[list[float]], summary_added: bool) -> list[int]:
+    ids = insert_capsules_bulk(session, doc, chunks, vectors, summary_added)
     session.commit()
-    return inserted
+    return ids
+
+
+async def ingest_text_as_capsules(
+    session: Session,
+    run_id: int,
+    text: str,
+    source: str,
+    attachment_id: int | None = None,
+    tags: list[str] | None = None,
+) -> int:
+    doc = IngestDocument(run_id=run_id, text=text, source=source, attachment_id=attachment_id, tags=tags or [])
+    chunks, summary_added = _document_chunks(doc)
+    if not chunks:
+        return 0
+    vectors = await cached_embed_texts(chunks, model=settings.agentora_embed_model)
+    ids = await blocking_pool.run('db', _insert_and_commit, session, doc, chunks, vectors, summary_added)
+    await blocking_pool.run('db', capsule_index.sync, session)
+    return len(ids)
+
+
+async def _iter_documents(documents: Iterable[IngestDocument] | AsyncIterable[IngestDocument]) -> AsyncIterator[IngestDocument]:
+    if hasattr(documents, '__aiter__'):
+        async for doc in documents:
+            yield doc
+    else:
+        for doc in documents:
+            yield doc
+
+
+async def ingest_documents(
+    session: Session,
+    documents: Iterable[IngestDocument] | AsyncIterable[IngestDocument],
+    depth: int | None = None,
+) -> dict:
+    """Stream many documents through chunk -> embed -> insert stages.
+
+    Stages are joined by bounded queues, so a slow embedder stalls chunking
+    instead of buffering the whole folder in memory. Each document is
+    committed in its own transaction as soon as its vectors arrive.
+    """
+    depth = max(1, depth or settings.agentora_ingest_pipeline_depth)
+    chunked: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    embedded: asyncio.Queue = asyncio.Queue(maxsize=depth)
+
+    async def chunk_stage() -> None:
+        try:
+            async for doc in _iter_documents(documents):
+                # Chunking pulls the document's blocks (possibly file or PDF reads) off the loop.
+                chunks, summary_added = await blocking_pool.run('io', _document_chunks, doc)
+                await chunked.put((doc, chunks, summary_added))
+        finally:
+            await chunked.put(None)
 
+    async def embed_stage() -> None:
+        try:
+            while (item := await chunked.get()) is not None:
+                doc, chunks, summary_added = item
+                vectors = await cached_embed_texts(chunks, model=settings.agentora_embed_model) if chunks else []
+                await embedded.put((doc, chunks, vectors, summary_added))
+        finally:
+            await embedded.put(None)
 
-def _cosine_similarity(a: list[float], b: list[float]) -> float:
-    if not a or not b:
-        return 0.0
-    n = min(len(a), len(b))
-    if n == 0:
-        return 0.0
-    a = a[:n]
-    b = b[:n]
-    dot = sum(x * y for x, y in zip(a, b))
-    na = math.sqrt(sum(x * x for x in a))
-    nb = math.sqrt(sum(y * y for y in b))
-    if na == 0 or nb == 0:
-        return 0.0
-    return dot / (na * nb)
+    stages = [asyncio.create_task(chunk_stage()), asyncio.create_task(embed_stage())]
+    items: list[dict] = []
+    try:
+        while (item := await embedded.get()) is not None:
+            doc, chunks, vectors, summary_added = item
+            ids = await blocking_pool.run('db', _insert_and_commit, session, doc, chunks, vectors, summary_added)
+            items.append({'source': doc.source, 'attachment_id': doc.attachment_id, 'run_id': doc.run_id, 'capsules_created': len(ids)})
+        # Downstream first: a failed embed stage can leave chunking blocked on a full queue.
+        for task in reversed(stages):
+            await task
+    finally:
+        for task in stages:
+            task.cancel()
+    await blocking_pool.run('db', capsule_index.sync, session)
+    return {'documents': len(items), 'capsules_created': sum(i['capsules_created'] for i in items), 'items': items}
 
 
 def _recency_boost(created_at: datetime) -> float:
@@ -128,9 +208,21 @@ def search_capsules_sync(
     source_weight: dict[str, float] | None = None,
     query: str = '',
 ) -> list[dict]:
+    return search_capsules_many_sync(session, [query_vector], [query], run_id=run_id, top_k=top_k, source_weight=source_weight)[0]
+
+
+def search_capsules_many_sync(
+    session: Session,
+    query_vectors: list[list[float]],
+    queries: list[str],
+    run_id: int | None = None,
+    top_k: int | None = None,
+    source_weight: dict[str, float] | None = None,
+) -> list[list[dict]]:
+    """Search for several queries at once; capsules are loaded once and scored in one multi-query pass."""
     if settings.agentora_enable_layered_memory and run_id is not None:
-        layered = layered_retrieval(session, query_vector=query_vector, query=query or 'query', run_id=run_id, top_k=top_k)
-        return layered['items']
+        layered = layered_retrieval_many(session, query_vectors=query_vectors, queries=[q or 'query' for q in queries], run_id=run_id, top_k=top_k)
+        return [result['items'] for result in layered]
 
     top_k = top_k or settings.agentora_capsule_top_k
     source_weight = source_weight or {}
@@ -141,16 +233,20 @@ def search_capsules_sync(
     rows = list(session.exec(stmt))
 
     seen_text: set[str] = set()
-    scored: list[dict] = []
+    unique: list[tuple[Capsule, CapsuleEmbedding]] = []
     for cap, emb in rows:
         if cap.text in seen_text:
             continue
         seen_text.add(cap.text)
-        try:
-            vec = json.loads(emb.vector_json)
-        except Exception:
-            vec = []
-        sim = _cosine_similarity(query_vector, vec)
+        unique.append((cap, emb))
+    similarities = cosine_scores_many(query_vectors, [embedding_vector(emb) for _, emb in unique])
+    return [_flat_ranking(unique, row, top_k, source_weight) for row in similarities]
+
+
+def _flat_ranking(unique: list[tuple[Capsule, CapsuleEmbedding]], similarities, top_k: int, source_weight: dict[str, float]) -> list[dict]:
+    scored: list[dict] = []
+    for (cap, _emb), similarity in zip(unique, similarities):
+        sim = float(similarity)
         recency = _recency_boost(cap.created_at)
         src_w = float(source_weight.get(cap.source, 1.0))
         summary_boost = 1.08 if cap.is_summary else 1.0
@@ -194,5 +290,18 @@ async def search_capsules(
     top_k: int | None = None,
     source_weight: dict[str, float] | None = None,
 ) -> list[dict]:
-    qv = (await OllamaClient().embed_texts([query], model=settings.agentora_embed_model))[0]
-    return search_capsules_sync(session=session, query_vector=qv, run_id=run_id, top_k=top_k, source_weight=source_weight, query=query)
+    return (await search_capsules_many(session, [query], run_id=run_id, top_k=top_k, source_weight=source_weight))[0]
+
+
+async def search_capsules_many(
+    session: Session,
+    queries: list[str],
+    run_id: int | None = None,
+    top_k: int | None = None,
+    source_weight: dict[str, float] | None = None,
+) -> list[list[dict]]:
+    """Results for each query, in order; all queries share one embedding request and one scoring pass."""
+    if not queries:
+        return []
+    vectors = await cached_embed_texts(list(queries), model=settings.agentora_embed_model)
+    return await blocking_pool.run('db', search_capsules_many_sync, session=session, query_vectors=vectors, queries=list(queries), run_id=run_id, top_k=top_k, source_weight=source_weight)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, Iterator
+
+from app.core.config import settings
+
+
+# Context windows of common Ollama embedding models; unknown models fall back to the configured budget.
+EMBED_MODEL_CONTEXT_TOKENS = {
+    'embeddinggemma': 2048,
+    'nomic-embed-text': 8192,
+    'mxbai-embed-large': 512,
+    'snowflake-arctic-embed': 512,
+    'all-minilm': 256,
+    'bge-m3': 8192,
+}
+
+_PARAGRAPH_RE = re.compile(r'\n[ \t\r\f\v]*\n')
+_SENTENCE_END_RE = re.compile(r'([.!?]["\')\]]?)\s+')
+# A block run without any sentence boundary is flushed once it grows past this.
+_MAX_PENDING_CHARS = 20000
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap subword estimate: about four characters per token of whitespace-collapsed text."""
+    return (len(_clean(text)) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def chunk_token_budget(model: str | None = None) -> int:
+    model = (model or settings.agentora_embed_model).split(':', 1)[0]
+    budget = max(8, settings.agentora_chunk_max_tokens)
+    context = EMBED_MODEL_CONTEXT_TOKENS.get(model)
+    if context:
+        # Leave headroom for the model's own special tokens and estimate error.
+        budget = min(budget, int(context * 0.9))
+    return budget
+
+
+def _clean(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def _split_sentences(text: str) -> list[str]:
+    parts: list[str] = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        parts.append(text[start : match.end(1)])
+        start = match.end()
+    parts.append(text[start:])
+    return parts
+
+
+def _split_paragraph(paragraph: str) -> list[str]:
+    return [s for s in (_clean(part) for part in _split_sentences(paragraph)) if s]
+
+
+def iter_sentences(blocks: Iterable[str]) -> Iterator[tuple[str, bool]]:
+    """Yield ``(sentence, ends_paragraph)`` from a stream of text blocks.
+
+    Blocks are treated as line-separated (pages, paragraphs, file reads split on
+    newlines); a sentence or paragraph may continue across block boundaries.
+    """
+    pending = ''
+    for block in blocks:
+        if not block:
+            continue
+        pending += block + '\n'
+        paragraphs = _PARAGRAPH_RE.split(pending)
+        pending = paragraphs.pop()
+        for paragraph in paragraphs:
+            sentences = _split_paragraph(paragraph)
+            for i, sentence in enumerate(sentences):
+                yield sentence, i == len(sentences) - 1
+        parts = _split_sentences(pending)
+        if len(parts) > 1:
+            for part in parts[:-1]:
+                part = _clean(part)
+                if part:
+                    yield part, False
+            pending = parts[-1]
+        if len(pending) > _MAX_PENDING_CHARS:
+            tail = _clean(pending)
+            if tail:
+                yield tail, False
+            pending = ''
+    sentences = _split_paragraph(pending)
+    for i, sentence in enumerate(sentences):
+        yield sentence, i == len(sentences) - 1
+
+
+def _fit(sentence: str, max_chars: int) -> Iterator[str]:
+    if len(sentence) <= max_chars:
+        yield sentence
+        return
+    # Oversized sentence: fall back to word boundaries, slicing only words that alone exceed the budget.
+    words: list[str] = []
+    used = 0
+    for word in sentence.split(' '):
+        if len(word) > max_chars:
+            if words:
+                yield ' '.join(words)
+                words, used = [], 0
+            for i in range(0, len(word), max_chars):
+                yield word[i : i + max_chars]
+            continue
+        if words and used + 1 + len(word) > max_chars:
+            yield ' '.join(words)
+            words, used = [], 0
+        used += len(word) + (1 if words else 0)
+        words.append(word)
+    if words:
+        yield ' '.join(words)
+
+
+def _overlap_tail(current: list[str], overlap_chars: int) -> tuple[list[str], int]:
+    tail: list[str] = []
+    used = -1
+    for sentence in reversed(current):
+        if used + 1 + len(sentence) > overlap_chars:
+            break
+        tail.append(sentence)
+        used += 1 + len(sentence)
+    tail.reverse()
+    return tail, max(0, used)
+
+
+def iter_chunks(blocks: Iterable[str], max_tokens: int | None = None, overlap_tokens: int | None = None) -> Iterator[str]:
+    """Lazily pack sentences from ``blocks`` into chunks under a token budget.
+
+    Chunks break on sentence boundaries, prefer paragraph ends once they are
+    reasonably full, and repeat trailing whole sentences up to
+    ``overlap_tokens`` at the start of the next chunk.
+    """
+    max_tokens = max(8, max_tokens or chunk_token_budget())
+    overlap = settings.agentora_chunk_overlap_tokens if overlap_tokens is None else overlap_tokens
+    overlap = min(max(0, overlap), max_tokens // 2)
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap * CHARS_PER_TOKEN
+    soft_limit = int(max_chars * 0.6)
+
+    # ``used`` is the joined length of ``current``, so the budget check is exact.
+    current: list[str] = []
+    used = 0
+    fresh = False
+    for sentence, ends_paragraph in iter_sentences(blocks):
+        for piece in _fit(sentence, max_chars):
+            added = len(piece) + (1 if current else 0)
+            if fresh and used + added > max_chars:
+                yield ' '.join(current)
+                current, used = _overlap_tail(current, overlap_chars)
+                fresh = False
+                added = len(piece) + (1 if current else 0)
+            if used + added > max_chars:
+                current, used, added = [], 0, len(piece)
+            current.append(piece)
+            used += added
+            fresh = True
+        if ends_paragraph and fresh and used >= soft_limit:
+            yield ' '.join(current)
+            current, used = _overlap_tail(current, overlap_chars)
+            fresh = False
+    if fresh:
+        yield ' '.join(current)
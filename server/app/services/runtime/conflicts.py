@@ -16,7 +16,7 @@ def _normalize(text: str) -> str:
     return ' '.join((text or '').lower().split())
 
 
-def _text_hash(text: str) -> str:
+def text_hash(text: str) -> str:
     return hashlib.sha1(_normalize(text).encode('utf-8')).hexdigest()[:16]
 
 
@@ -40,61 +40,99 @@ def contradiction_score(a: Capsule, b: Capsule) -> float:
     return max(0.0, min(1.0, overlap * 0.6 + polarity_gap * 0.35 + layer_penalty))
 
 
-def upsert_duplicate_cluster(session: Session, capsule: Capsule) -> DuplicateCluster:
-    h = _text_hash(capsule.text)
-    cluster = session.exec(select(DuplicateCluster).where(DuplicateCluster.hash_key == h)).first()
+def cluster_ids_by_hash(session: Session, hashes: list[str]) -> dict[str, int]:
+    if not hashes:
+        return {}
+    rows = session.exec(select(DuplicateCluster).where(DuplicateCluster.hash_key.in_(sorted(set(hashes)))))
+    return {c.hash_key: c.id for c in rows if c.id is not None}
+
+
+def upsert_duplicate_clusters(session: Session, capsules: list[Capsule]) -> dict[int, DuplicateCluster]:
+    """Fold capsules into their text-hash clusters with one lookup; the caller commits."""
+    by_hash: dict[str, list[Capsule]] = {}
+    for capsule in capsules:
+        if capsule.id is not None:
+            by_hash.setdefault(text_hash(capsule.text), []).append(capsule)
+    if not by_hash:
+        return {}
+    existing = {c.hash_key: c for c in session.exec(select(DuplicateCluster).where(DuplicateCluster.hash_key.in_(sorted(by_hash))))}
     now = datetime.utcnow()
-    if not cluster:
-        cluster = DuplicateCluster(hash_key=h, canonical_capsule_id=capsule.id, member_capsule_ids_json=json.dumps([capsule.id]), cluster_size=1, updated_at=now)
-    else:
-        members = set(json.loads(cluster.member_capsule_ids_json or '[]'))
-        members.add(capsule.id)
-        cluster.member_capsule_ids_json = json.dumps(sorted(members))
-        cluster.cluster_size = len(members)
-        cluster.updated_at = now
-    session.add(cluster)
-    session.commit()
-    session.refresh(cluster)
-    capsule.duplicate_cluster_id = cluster.id
-    capsule.duplicate_score = min(1.0, max(capsule.duplicate_score, 0.35 if cluster.cluster_size > 1 else 0.0))
-    session.add(capsule)
+    for h, members in by_hash.items():
+        cluster = existing.get(h)
+        ids = {c.id for c in members}
+        if not cluster:
+            ordered = sorted(ids)
+            cluster = DuplicateCluster(hash_key=h, canonical_capsule_id=members[0].id, member_capsule_ids_json=json.dumps(ordered), cluster_size=len(ordered), updated_at=now)
+            existing[h] = cluster
+        else:
+            merged = set(json.loads(cluster.member_capsule_ids_json or '[]')) | ids
+            cluster.member_capsule_ids_json = json.dumps(sorted(merged))
+            cluster.cluster_size = len(merged)
+            cluster.updated_at = now
+        session.add(cluster)
+    session.flush()
+    out: dict[int, DuplicateCluster] = {}
+    for h, members in by_hash.items():
+        cluster = existing[h]
+        for capsule in members:
+            capsule.duplicate_cluster_id = cluster.id
+            capsule.duplicate_score = min(1.0, max(capsule.duplicate_score, 0.35 if cluster.cluster_size > 1 else 0.0))
+            session.add(capsule)
+            out[capsule.id] = cluster
+    return out
+
+
+def upsert_duplicate_cluster(session: Session, capsule: Capsule) -> DuplicateCluster:
+    cluster = upsert_duplicate_clusters(session, [capsule])[capsule.id]
     session.commit()
     return cluster
 
 
-def detect_conflicts_for_run(session: Session, run_id: int) -> list[MemoryConflict]:
-    rows = list(session.exec(select(Capsule).where(Capsule.run_id == run_id).order_by(Capsule.id.desc()).limit(30)))
-    created: list[MemoryConflict] = []
+def recent_run_capsules(session: Session, run_id: int) -> list[Capsule]:
+    return list(session.exec(select(Capsule).where(Capsule.run_id == run_id).order_by(Capsule.id.desc()).limit(30)))
+
+
+def contradiction_pairs(rows: list[Capsule]) -> list[tuple[Capsule, Capsule, float]]:
+    """Pure scan used by both detection and the read-only retrieval path."""
+    pairs: list[tuple[Capsule, Capsule, float]] = []
     for i, left in enumerate(rows):
         for right in rows[i + 1 : i + 8]:
             score = contradiction_score(left, right)
-            if score < 0.55:
-                continue
-            conflict = session.exec(
-                select(MemoryConflict).where(
-                    MemoryConflict.left_capsule_id == left.id,
-                    MemoryConflict.right_capsule_id == right.id,
-                )
-            ).first()
-            if conflict:
-                conflict.conflict_score = max(conflict.conflict_score, score)
-                conflict.updated_at = datetime.utcnow()
-            else:
-                conflict = MemoryConflict(
-                    left_capsule_id=left.id,
-                    right_capsule_id=right.id,
-                    conflict_type='contradiction',
-                    conflict_score=score,
-                    status='open',
-                    detail_json=json.dumps({'run_id': run_id, 'overlap': _token_jaccard(left.text, right.text)}),
-                    updated_at=datetime.utcnow(),
-                )
-            left.contradiction_flag = True
-            right.contradiction_flag = True
-            session.add(left)
-            session.add(right)
-            session.add(conflict)
-            created.append(conflict)
+            if score >= 0.55:
+                pairs.append((left, right, score))
+    return pairs
+
+
+def detect_conflicts_for_run(session: Session, run_id: int) -> list[MemoryConflict]:
+    rows = recent_run_capsules(session, run_id)
+    ids = [c.id for c in rows]
+    existing = {
+        (c.left_capsule_id, c.right_capsule_id): c
+        for c in session.exec(select(MemoryConflict).where(MemoryConflict.left_capsule_id.in_(ids), MemoryConflict.right_capsule_id.in_(ids)))
+    } if ids else {}
+    created: list[MemoryConflict] = []
+    for left, right, score in contradiction_pairs(rows):
+        conflict = existing.get((left.id, right.id))
+        if conflict:
+            conflict.conflict_score = max(conflict.conflict_score, score)
+            conflict.updated_at = datetime.utcnow()
+        else:
+            conflict = MemoryConflict(
+                left_capsule_id=left.id,
+                right_capsule_id=right.id,
+                conflict_type='contradiction',
+                conflict_score=score,
+                status='open',
+                detail_json=json.dumps({'run_id': run_id, 'overlap': _token_jaccard(left.text, right.text)}),
+                updated_at=datetime.utcnow(),
+            )
+            existing[(left.id, right.id)] = conflict
+        left.contradiction_flag = True
+        right.contradiction_flag = True
+        session.add(left)
+        session.add(right)
+        session.add(conflict)
+        created.append(conflict)
     session.commit()
     return created
 
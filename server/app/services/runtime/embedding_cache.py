@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.ollama_client import OllamaClient
+from app.services.runtime.vectors import VECTOR_DTYPE
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join((text or '').split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f'{model}\x00{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+def _default_cache_path() -> Path:
+    if settings.agentora_embed_cache_path:
+        return Path(settings.agentora_embed_cache_path)
+    if settings.database_url.startswith('sqlite:///'):
+        db_path = Path(settings.database_url.replace('sqlite:///', '', 1))
+        return db_path.with_name(f'{db_path.stem}-embed-cache.db')
+    return Path('server/data/embed-cache.db')
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: in-process LRU in front of a sidecar SQLite file.
+
+    The cache lives in its own database so lookups and inserts never contend
+    with the write transaction a runtime session may be holding on the main DB.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self._lock = threading.Lock()
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            path = self._path or _default_cache_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), check_same_thread=False, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS embedding_cache ('
+                'key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, '
+                'hits INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_used ON embedding_cache (last_used_at)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, vec: list[float]) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > max(0, settings.agentora_embed_cache_memory_entries):
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self.memory_hits += 1
+            pending = [k for k in dict.fromkeys(keys) if k not in found]
+            if pending:
+                db = self._db()
+                marks = ','.join('?' for _ in pending)
+                rows = db.execute(f'SELECT key, vector FROM embedding_cache WHERE key IN ({marks})', pending).fetchall()
+                for key, blob in rows:
+                    vec = np.frombuffer(blob, dtype=VECTOR_DTYPE).tolist()
+                    found[key] = vec
+                    self._remember(key, vec)
+                    self.db_hits += 1
+                if rows:
+                    db.executemany('UPDATE embedding_cache SET hits = hits + 1, last_used_at = ? WHERE key = ?', [(time.time(), key) for key, _ in rows])
+                    db.commit()
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, model: str, items: dict[str, list[float]]) -> None:
+        rows = [(key, model, len(vec), np.asarray(vec, dtype=VECTOR_DTYPE).tobytes(), time.time(), time.time()) for key, vec in items.items() if vec]
+        if not rows:
+            return
+        with self._lock:
+            db = self._db()
+            db.executemany('INSERT OR IGNORE INTO embedding_cache (key, model, dim, vector, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)', rows)
+            for key, vec in items.items():
+                self._remember(key, vec)
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        limit = settings.agentora_embed_cache_max_entries
+        total = db.execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+        if total <= limit:
+            return
+        # Trim to 90% so steady-state inserts don't trigger an eviction every call.
+        excess = total - int(limit * 0.9)
+        db.execute('DELETE FROM embedding_cache WHERE key IN (SELECT key FROM embedding_cache ORDER BY last_used_at LIMIT ?)', (excess,))
+        self.evictions += excess
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._db().execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0])
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return self._db().execute('SELECT 1 FROM embedding_cache WHERE key = ?', (key,)).fetchone() is not None
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'enabled': settings.agentora_embed_cache_enabled,
+                'memory_entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'hits': hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'max_entries': settings.agentora_embed_cache_max_entries,
+            }
+
+
+embedding_cache = EmbeddingCache()
+
+
+async def cached_embed_texts(texts: list[str], model: str | None = None) -> list[list[float]]:
+    """Embed texts, serving repeats from the cache and sending only misses to Ollama."""
+    if not texts:
+        return []
+    model = model or settings.agentora_embed_model
+    if not settings.agentora_embed_cache_enabled:
+        return await OllamaClient().embed_texts(texts, model=model)
+
+    keys = [cache_key(model, t) for t in texts]
+    found = embedding_cache.get_many(keys)
+    missing: dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    if missing:
+        vecs = await OllamaClient().embed_texts(list(missing.values()), model=model)
+        # Round through float32 so a later cache hit returns exactly what this call did.
+        fresh = {key: np.asarray(vec, dtype=VECTOR_DTYPE).tolist() for key, vec in zip(missing, vecs)}
+        embedding_cache.put_many(model, fresh)
+        found.update(fresh)
+    return [found.get(key, []) for key in keys]
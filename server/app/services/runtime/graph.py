@@ -48,7 +48,62 @@ def reinforce_edge(
     return edge
 
 
-def graph_rerank(session: Session, candidate_ids: list[int], base_scores: dict[int, float]) -> dict[int, float]:
+def reinforce_edges(
+    session: Session,
+    pairs: list[tuple[int, int]],
+    edge_type: str = 'co_retrieval',
+    weight: float = 0.6,
+    confidence: float = 0.6,
+    trust_score: float = 0.6,
+) -> list[MemoryEdge]:
+    """Set-based ``reinforce_edge``: one lookup for every pair, no commit."""
+    pairs = [(a, b) for a, b in dict.fromkeys(pairs) if a != b]
+    if not pairs:
+        return []
+    sources = sorted({a for a, _ in pairs})
+    targets = sorted({b for _, b in pairs})
+    existing = {
+        (e.from_capsule_id, e.to_capsule_id): e
+        for e in session.exec(
+            select(MemoryEdge).where(
+                MemoryEdge.from_capsule_id.in_(sources),
+                MemoryEdge.to_capsule_id.in_(targets),
+                MemoryEdge.edge_type == edge_type,
+            )
+        )
+    }
+    now = datetime.utcnow()
+    out: list[MemoryEdge] = []
+    for source, target in pairs:
+        edge = existing.get((source, target))
+        if edge:
+            edge.weight = max(edge.weight, weight)
+            edge.confidence = max(edge.confidence, confidence)
+            edge.trust_score = max(edge.trust_score, trust_score)
+            edge.usage_count += 1
+            edge.last_reinforced_at = now
+        else:
+            edge = MemoryEdge(
+                from_capsule_id=source,
+                to_capsule_id=target,
+                edge_type=edge_type,
+                weight=weight,
+                confidence=confidence,
+                trust_score=trust_score,
+                usage_count=1,
+                last_reinforced_at=now,
+            )
+        session.add(edge)
+        out.append(edge)
+    return out
+
+
+def graph_rerank(
+    session: Session,
+    candidate_ids: list[int],
+    base_scores: dict[int, float],
+    pending_edges: list[MemoryEdge] | None = None,
+) -> dict[int, float]:
     if not candidate_ids:
         return {}
     neighbor_edges = list(
@@ -58,6 +113,24 @@ def graph_rerank(session: Session, candidate_ids: list[int], base_scores: dict[i
             )
         )
     )
+    if pending_edges:
+        # Overlay reinforcements that are queued but not yet written, without touching the stored rows.
+        by_key = {(e.from_capsule_id, e.to_capsule_id, e.edge_type): i for i, e in enumerate(neighbor_edges)}
+        for pending in pending_edges:
+            i = by_key.get((pending.from_capsule_id, pending.to_capsule_id, pending.edge_type))
+            if i is None:
+                by_key[(pending.from_capsule_id, pending.to_capsule_id, pending.edge_type)] = len(neighbor_edges)
+                neighbor_edges.append(pending)
+                continue
+            stored = neighbor_edges[i]
+            neighbor_edges[i] = MemoryEdge(
+                from_capsule_id=stored.from_capsule_id,
+                to_capsule_id=stored.to_capsule_id,
+                edge_type=stored.edge_type,
+                weight=max(stored.weight, pending.weight),
+                confidence=max(stored.confidence, pending.confidence),
+                trust_score=max(stored.trust_score, pending.trust_score),
+            )
     boosted = dict(base_scores)
     for edge in neighbor_edges:
         source = edge.from_capsule_id
@@ -1,33 +1,24 @@
 from __future__ import annotations
 
 import json
-import math
 from datetime import datetime, timezone
 from typing import Any
 
 from sqlmodel import Session, select
 
 from app.core.config import settings
-from app.models import Capsule, CapsuleEmbedding, ContextActivation, MemoryCapsuleState, MemoryConflict
-from app.services.runtime.conflicts import detect_conflicts_for_run, upsert_duplicate_cluster
-from app.services.runtime.graph import graph_rerank, reinforce_edge
+from app.models import Capsule, CapsuleEmbedding, ContextActivation, MemoryConflict
+from app.services.runtime.ann_index import capsule_index
+from app.services.runtime.bookkeeping import retrieval_bookkeeping
+from app.services.runtime.conflicts import cluster_ids_by_hash, contradiction_pairs, recent_run_capsules, text_hash
+from app.services.runtime.graph import graph_rerank
+from app.services.runtime.vectors import cosine_scores_many, embedding_vector
+from app.services.runtime.write_behind import memory_write_behind
 
 
 LAYER_ORDER = ['L0_HOT', 'L1_SHORT', 'L2_SESSION', 'L3_DURABLE', 'L4_SPARSE', 'L5_COLD']
 
 
-def _cosine_similarity(a: list[float], b: list[float]) -> float:
-    if not a or not b:
-        return 0.0
-    n = min(len(a), len(b))
-    if n == 0:
-        return 0.0
-    dot = sum(x * y for x, y in zip(a[:n], b[:n]))
-    na = math.sqrt(sum(x * x for x in a[:n]))
-    nb = math.sqrt(sum(y * y for y in b[:n]))
-    return 0.0 if na == 0 or nb == 0 else dot / (na * nb)
-
-
 def _decay_value(capsule: Capsule, now: datetime) -> float:
     dt = (now - capsule.created_at.replace(tzinfo=timezone.utc)).total_seconds() / 3600.0
     horizon = max(0.0, dt)
@@ -50,12 +41,12 @@ def _project_match(capsule: Capsule, project_key: str, session_key: str) -> floa
     return 0.0
 
 
-def _score_capsule(capsule: Capsule, similarity: float, project_key: str, session_key: str) -> dict[str, float]:
+def _score_capsule(capsule: Capsule, similarity: float, project_key: str, session_key: str, pending_hits: int = 0) -> dict[str, float]:
     now = datetime.now(timezone.utc)
     factors = {
         'semantic': similarity,
         'decay': _decay_value(capsule, now),
-        'access_frequency': min(1.0, capsule.retrieval_count / 16.0),
+        'access_frequency': min(1.0, (capsule.retrieval_count + pending_hits) / 16.0),
         'trust': max(0.0, min(1.0, capsule.trust_score)),
         'consolidation': max(0.0, min(1.0, capsule.consolidation_score)),
         'project_match': _project_match(capsule, project_key, session_key),
@@ -77,6 +68,34 @@ def _score_capsule(capsule: Capsule, similarity: float, project_key: str, sessio
     return factors
 
 
+def _candidate_rows(session: Session, query_vectors: list[list[float]], run_id: int) -> list[tuple[Capsule, CapsuleEmbedding]]:
+    base = select(Capsule, CapsuleEmbedding).join(CapsuleEmbedding, Capsule.id == CapsuleEmbedding.capsule_id)
+    if capsule_index.enabled and query_vectors:
+        capsule_index.sync(session)
+        dim = len(query_vectors[0])
+        scope: int | None = run_id
+        if not capsule_index.count(run_id, dim=dim) and settings.agentora_global_memory_fallback_enabled:
+            scope = None
+        covered = [qv for qv in query_vectors if capsule_index.covers(qv)]
+        if covered and len(covered) == len(query_vectors) and capsule_index.count(scope, dim=dim) > settings.agentora_memory_ann_min_rows:
+            # Every query contributes its own shortlist; the union is loaded in one statement.
+            hit_ids = dict.fromkeys(cid for qv in covered for cid, _ in capsule_index.search(qv, settings.agentora_memory_ann_candidates, run_id=scope))
+            if hit_ids:
+                return list(session.exec(base.where(Capsule.id.in_(list(hit_ids)))))
+
+    rows = list(session.exec(base.where(Capsule.run_id == run_id)))
+    if not rows and settings.agentora_global_memory_fallback_enabled:
+        rows = list(session.exec(base))
+    return rows
+
+
+def _load_candidates(session: Session, query_vectors: list[list[float]], run_id: int) -> tuple[list[tuple[Capsule, CapsuleEmbedding]], dict[int, int]]:
+    # Rows and the queued admission counts must come from the same side of any write-behind commit.
+    with memory_write_behind.consistent_read():
+        rows = _candidate_rows(session, query_vectors, run_id)
+        return rows, memory_write_behind.pending_hits([cap.id for cap, _ in rows])
+
+
 def layered_retrieval(
     session: Session,
     query_vector: list[float],
@@ -86,19 +105,31 @@ def layered_retrieval(
     project_key: str | None = None,
     session_key: str | None = None,
 ) -> dict[str, Any]:
+    return layered_retrieval_many(session, [query_vector], [query], run_id, top_k=top_k, project_key=project_key, session_key=session_key)[0]
+
+
+def layered_retrieval_many(
+    session: Session,
+    query_vectors: list[list[float]],
+    queries: list[str],
+    run_id: int,
+    top_k: int | None = None,
+    project_key: str | None = None,
+    session_key: str | None = None,
+) -> list[dict[str, Any]]:
+    """Layered retrieval for several queries of one run: candidates are loaded once and
+    scored against every query in a single matrix pass, then admitted per query."""
     top_k = top_k or settings.agentora_context_top_k
     project_key = project_key or f'run:{run_id}'
     session_key = session_key or f'run:{run_id}'
 
-    stmt = select(Capsule, CapsuleEmbedding).join(CapsuleEmbedding, Capsule.id == CapsuleEmbedding.capsule_id)
-    stmt = stmt.where(Capsule.run_id == run_id)
-    rows = list(session.exec(stmt))
-    if not rows and settings.agentora_global_memory_fallback_enabled:
-        stmt = select(Capsule, CapsuleEmbedding).join(CapsuleEmbedding, Capsule.id == CapsuleEmbedding.capsule_id)
-        rows = list(session.exec(stmt))
+    rows, pending_hits = _load_candidates(session, query_vectors, run_id)
+    if memory_write_behind.has_pending_usefulness([cap.id for cap, _ in rows]):
+        # Queued usefulness updates move trust and consolidation; have the writer land them soon
+        # rather than paying for the write on the read path.
+        memory_write_behind.nudge()
 
-    candidates: list[dict[str, Any]] = []
-    low_score_candidates: list[dict[str, Any]] = []
+    eligible: list[tuple[Capsule, CapsuleEmbedding]] = []
     seen_text: set[str] = set()
     for cap, emb in rows:
         if cap.memory_layer == 'L5_COLD' and cap.archive_status == 'cold':
@@ -108,11 +139,58 @@ def layered_retrieval(
         seen_text.add(cap.text)
         if not settings.agentora_cross_project_memory_enabled and cap.project_key and cap.project_key != project_key and rows and cap.run_id != run_id:
             continue
-        try:
-            vec = json.loads(emb.vector_json)
-        except Exception:
-            vec = []
-        factors = _score_capsule(cap, _cosine_similarity(query_vector, vec), project_key=project_key, session_key=session_key)
+        eligible.append((cap, emb))
+    similarities = cosine_scores_many(query_vectors, [embedding_vector(emb) for _, emb in eligible])
+    ranked = [_rank_and_admit(session, query, run_id, eligible, row, pending_hits, top_k, project_key, session_key) for query, row in zip(queries, similarities)]
+
+    # Only the activation log is written inline; counters and edges go through the write-behind queue.
+    session.commit()
+    # Contradictions are scored read-only here; persisting them is deferred.
+    pending_pairs = {(left.id, right.id) for left, right, _ in contradiction_pairs(recent_run_capsules(session, run_id))}
+    run_conflict_ids = {cid for pair in pending_pairs for cid in pair}
+    results: list[dict[str, Any]] = []
+    for query, (admitted, candidate_count, unclustered) in zip(queries, ranked):
+        top_ids = [a['capsule_id'] for a in admitted[:4]]
+        memory_write_behind.record_admissions([(item['capsule_id'], item['layer']) for item in admitted], session=session)
+        memory_write_behind.record_edges([(source, target) for i, source in enumerate(top_ids) for target in top_ids[i + 1 :]], edge_type='co_retrieval', weight=0.65, confidence=0.65, session=session)
+        retrieval_bookkeeping.defer(unclustered, run_id=run_id)
+
+        admitted_ids = [item['capsule_id'] for item in admitted]
+        stored = session.exec(select(MemoryConflict).where((MemoryConflict.left_capsule_id.in_(admitted_ids)) | (MemoryConflict.right_capsule_id.in_(admitted_ids)))) if admitted_ids else []
+        conflict_pairs = pending_pairs | {(c.left_capsule_id, c.right_capsule_id) for c in stored}
+        for item in admitted:
+            if item['capsule_id'] in run_conflict_ids:
+                item['conflict_flag'] = True
+
+        retrieval_meta = {
+            'run_id': run_id,
+            'query': query,
+            'layers_used': sorted({x['layer'] for x in admitted}, key=lambda x: LAYER_ORDER.index(x) if x in LAYER_ORDER else 99),
+            'candidate_count': candidate_count,
+            'admitted_count': len(admitted),
+            'conflict_count': sum(1 for left, right in conflict_pairs if left in top_ids or right in top_ids),
+        }
+        results.append({'items': admitted[:top_k], 'meta': retrieval_meta})
+    return results
+
+
+def _rank_and_admit(
+    session: Session,
+    query: str,
+    run_id: int,
+    eligible: list[tuple[Capsule, CapsuleEmbedding]],
+    similarities,
+    pending_hits: dict[int, int],
+    top_k: int,
+    project_key: str,
+    session_key: str,
+) -> tuple[list[dict[str, Any]], int, list[int]]:
+    """Score one query's candidates and stage its context activations; returns (admitted, candidate count, unclustered ids)."""
+    candidates: list[dict[str, Any]] = []
+    low_score_candidates: list[dict[str, Any]] = []
+    clustered_caps: list[Capsule] = []
+    for (cap, _emb), similarity in zip(eligible, similarities):
+        factors = _score_capsule(cap, float(similarity), project_key=project_key, session_key=session_key, pending_hits=pending_hits.get(cap.id, 0))
         if factors['final_score'] < settings.agentora_context_min_score:
             low_score_candidates.append({
                 'capsule_id': cap.id,
@@ -129,7 +207,7 @@ def layered_retrieval(
                 'duplicate_score': cap.duplicate_score,
             })
             continue
-        upsert_duplicate_cluster(session, cap)
+        clustered_caps.append(cap)
         candidates.append(
             {
                 'capsule_id': cap.id,
@@ -147,6 +225,17 @@ def layered_retrieval(
             }
         )
 
+    # Cluster membership is written later by the bookkeeping flush; read the
+    # existing clusters now so suppression matches an inline upsert.
+    cap_hashes = {cap.id: text_hash(cap.text) for cap in clustered_caps}
+    known_clusters = cluster_ids_by_hash(session, list(cap_hashes.values()))
+    dedupe_keys: dict[int, Any] = {}
+    for item in candidates:
+        h = cap_hashes[item['capsule_id']]
+        cluster_id = known_clusters.get(h)
+        item['duplicate_cluster_id'] = cluster_id or item['duplicate_cluster_id']
+        dedupe_keys[item['capsule_id']] = cluster_id or ('hash', h)
+
     if not candidates and low_score_candidates:
         low_score_candidates.sort(key=lambda x: x['score'], reverse=True)
         candidates = low_score_candidates[: max(top_k * 2, 2)]
@@ -157,7 +246,7 @@ def layered_retrieval(
 
     graph_boosts: dict[int, float] = {k: 0.0 for k in base_scores}
     if settings.agentora_enable_graph_rerank:
-        reranked = graph_rerank(session, list(base_scores.keys()), base_scores)
+        reranked = graph_rerank(session, list(base_scores.keys()), base_scores, pending_edges=memory_write_behind.pending_edges(list(base_scores.keys())))
         for item in base:
             cid = int(item['capsule_id'])
             graph_boosts[cid] = max(0.0, reranked.get(cid, item['score']) - item['score'])
@@ -167,13 +256,13 @@ def layered_retrieval(
 
     if settings.agentora_duplicate_suppression_enabled:
         deduped: list[dict[str, Any]] = []
-        seen_cluster: set[int] = set()
+        seen_cluster: set[Any] = set()
         for item in sorted(base, key=lambda x: x['score'], reverse=True):
-            cluster_id = item.get('duplicate_cluster_id') or 0
-            if cluster_id and cluster_id in seen_cluster:
+            cluster_key = dedupe_keys.get(item['capsule_id']) or item.get('duplicate_cluster_id') or 0
+            if cluster_key and cluster_key in seen_cluster:
                 continue
-            if cluster_id:
-                seen_cluster.add(cluster_id)
+            if cluster_key:
+                seen_cluster.add(cluster_key)
             deduped.append(item)
         base = deduped
     else:
@@ -198,39 +287,7 @@ def layered_retrieval(
         item['admission_reason'] = reason
         admitted.append(item)
 
-    for item in admitted:
-        cap = session.get(Capsule, item['capsule_id'])
-        if not cap:
-            continue
-        cap.retrieval_count += 1
-        cap.last_accessed_at = datetime.utcnow()
-        cap.recency_score = min(1.0, cap.recency_score + 0.03)
-        session.add(cap)
-        state = session.exec(select(MemoryCapsuleState).where(MemoryCapsuleState.capsule_id == cap.id)).first() or MemoryCapsuleState(capsule_id=cap.id, layer=cap.memory_layer)
-        state.retrieval_count += 1
-        state.usage_count += 1
-        state.last_accessed_at = datetime.utcnow()
-        state.updated_at = datetime.utcnow()
-        session.add(state)
-
-    top_ids = [a['capsule_id'] for a in admitted[:4]]
-    for i, source in enumerate(top_ids):
-        for target in top_ids[i + 1 :]:
-            reinforce_edge(session, source, target, edge_type='co_retrieval', weight=0.65, confidence=0.65)
-
-    conflicts = detect_conflicts_for_run(session, run_id)
-    conflict_ids = {c.left_capsule_id for c in conflicts} | {c.right_capsule_id for c in conflicts}
-    for item in admitted:
-        if item['capsule_id'] in conflict_ids:
-            item['conflict_flag'] = True
-
-    session.commit()
-    retrieval_meta = {
-        'run_id': run_id,
-        'query': query,
-        'layers_used': sorted({x['layer'] for x in admitted}, key=lambda x: LAYER_ORDER.index(x) if x in LAYER_ORDER else 99),
-        'candidate_count': len(candidates),
-        'admitted_count': len(admitted),
-        'conflict_count': len(list(session.exec(select(MemoryConflict).where((MemoryConflict.left_capsule_id.in_(top_ids)) | (MemoryConflict.right_capsule_id.in_(top_ids)))))) if top_ids else 0,
-    }
-    return {'items': admitted[:top_k], 'meta': retrieval_meta}
+    # Capsules already pointing at their text-hash cluster are members; skip them. Read before the
+    # commit expires the loaded rows.
+    unclustered = [cap.id for cap in clustered_caps if not cap.duplicate_cluster_id or cap.duplicate_cluster_id != known_clusters.get(cap_hashes[cap.id])]
+    return admitted, len(candidates), unclustered
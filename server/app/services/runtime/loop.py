@@ -1,30 +1,68 @@
 from __future__ import annotations
 
 import json
+import time
 from datetime import datetime
 
 from pydantic import ValidationError
 from sqlmodel import Session, select
 
 from app.core.config import settings
+from app import db
+from app.db import writer_gate
 from app.models import AgentCapabilityProfile, ToolCall
 from app.services.ollama_client import OllamaClient
 from app.services.tools.registry import registry
 
-from .capsules import search_capsules
+from .capsules import search_capsules, search_capsules_many
+from .offload import blocking_pool
+from .run_events import TokenSink
 from .router import choose_model_for_role, route_worker_job
-from .schemas import RuntimeAction, RuntimeResult
-from .trace import add_trace
-from .quality import update_usefulness
+from .schemas import RuntimeAction, RuntimeResult, ToolInvocation
+from .tool_exec import tool_executor
+from .trace import add_trace, trace_writer
+from .write_behind import memory_write_behind
 
 
 WORKER_TOOL_TYPES = {'python_exec': 'python_exec'}
+# Pool label per tool for offload stats; anything unlisted is reported as 'tool'.
+TOOL_OFFLOAD_KINDS = {'python_exec': 'subprocess', 'http_fetch': 'http'}
+
+
+def checkpoint(session: Session) -> None:
+    """Commit pending writes without expiring loaded rows, which the caller keeps using on the event loop."""
+    expire, session.expire_on_commit = session.expire_on_commit, False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire
+
+
+def _dispatch_worker(job_type: str, payload: dict) -> dict:
+    # Own session: worker calls from one step run concurrently and the dispatcher commits as it goes.
+    with Session(db.engine) as session:
+        job = route_worker_job(session, job_type, payload, priority=3)
+        return {'id': job.id, 'status': job.status, 'used_fallback_local': job.used_fallback_local, 'error': job.error, 'result': json.loads(job.result_json or '{}')}
+
+
+def _capability_profile(session: Session, agent_id: int) -> AgentCapabilityProfile | None:
+    return session.exec(select(AgentCapabilityProfile).where(AgentCapabilityProfile.agent_id == agent_id)).first()
 
 
 class RuntimeLoop:
     def __init__(self):
         self.client = OllamaClient()
 
+    async def _invoke_tool(self, session: Session, run_id: int, tc: ToolInvocation, denied: dict | None, allowed: list):
+        if denied is not None:
+            return denied
+        if tc.name in WORKER_TOOL_TYPES:
+            # The worker checks the call again against the run's allowed tools and its own policy.
+            return await blocking_pool.run('http', _dispatch_worker, WORKER_TOOL_TYPES[tc.name], {'args': tc.args, 'run_id': run_id, 'allowed_tools': list(allowed)})
+        # Only session-bound tools get the run's session; the executor runs those one at a time.
+        shared = session if registry.uses_session(tc.name) else None
+        return await blocking_pool.run(TOOL_OFFLOAD_KINDS.get(tc.name, 'tool'), registry.invoke, tc.name, run_id=run_id, session=shared, **tc.args)
+
     async def run_agent(
         self,
         session: Session,
@@ -46,7 +84,7 @@ class RuntimeLoop:
         prev_observations_len = 0
 
         allowed = []
-        profile = session.exec(select(AgentCapabilityProfile).where(AgentCapabilityProfile.agent_id == (agent.id or 0))).first()
+        profile = await blocking_pool.run('db', _capability_profile, session, agent.id or 0)
         try:
             allowed = json.loads(agent.tools_json or '[]')
         except Exception:
@@ -82,7 +120,7 @@ class RuntimeLoop:
             if any(m.get('conflict_flag') for m in memory[: settings.agentora_max_active_contexts]):
                 add_trace(session, run_id, 'memory_conflict_detected', {'step': step, 'capsule_ids': [m.get('capsule_id') for m in memory if m.get('conflict_flag')]}, agent_id=agent.id or 0)
             memory_text = '\n'.join([f"[{i+1}] {m['text']}" for i, m in enumerate(memory)])
-            planning_model, route_warnings = choose_model_for_role(session, role='tool_planning', has_images=bool(image_paths))
+            planning_model, route_warnings = await blocking_pool.run('db', choose_model_for_role, session, role='tool_planning', has_images=bool(image_paths))
             warnings.extend(route_warnings)
             models_used.append(planning_model)
 
@@ -95,13 +133,21 @@ class RuntimeLoop:
                 "Return structured action JSON that conforms to schema."
             )
 
+            # Step boundary: checkpoint before the model call so this run does not hold the write lock while it
+            # waits on the LLM; other runs and parallel subgoals of this run would otherwise queue behind it.
+            # The commit also writes the buffered trace in one insert, on the pool thread rather than the loop.
+            if trace_writer.pending(session) or writer_gate.holds(session):
+                await blocking_pool.run('db', checkpoint, session)
+            sink = TokenSink(run_id, agent.id or 0, step, planning_model)
             try:
                 action_data = await self.client.chat_structured(
                     model=planning_model,
                     system=agent.system_prompt,
                     prompt=runtime_prompt,
                     schema=RuntimeAction.model_json_schema(),
+                    on_token=sink,
                 )
+                add_trace(session, run_id, 'model_timing', sink.summary(), agent_id=agent.id or 0)
                 action = RuntimeAction.model_validate(action_data)
                 add_trace(session, run_id, 'action_payload', {'step': step, 'payload': action.model_dump()}, agent_id=agent.id or 0)
             except ValidationError as exc:
@@ -117,47 +163,69 @@ class RuntimeLoop:
                 final_text = final_text or 'Planner unavailable; returning safe degraded response.'
                 break
 
-            for q in action.memory_queries:
-                mq = await search_capsules(session, q, run_id=run_id, top_k=2)
+            # All of the step's memory queries share one embedding request and one scoring pass.
+            queries = list(action.memory_queries)
+            for q, mq in zip(queries, await search_capsules_many(session, queries, run_id=run_id, top_k=2)):
                 if mq:
                     observations.append(f"memory[{q}]: {mq[0]['text'][:280]}")
 
-            for tc in action.tool_calls:
-                add_trace(session, run_id, 'tool_call', {'step': step, 'tool': tc.name, 'args': tc.args}, agent_id=agent.id or 0)
-                try:
-                    if tc.name in WORKER_TOOL_TYPES:
-                        job = route_worker_job(session, WORKER_TOOL_TYPES[tc.name], {'args': tc.args, 'run_id': run_id}, priority=3)
-                        worker_used = worker_used or not job.used_fallback_local
-                        result = {'ok': job.status == 'done', 'job_id': job.id, 'status': job.status, 'fallback_local': job.used_fallback_local}
-                        if job.status == 'fallback_local':
-                            add_trace(session, run_id, 'worker_fallback', {'step': step, 'job_id': job.id, 'reason': job.error or 'worker_failed'}, agent_id=agent.id or 0)
-                        else:
-                            add_trace(session, run_id, 'worker_dispatch', {'step': step, 'job_id': job.id, 'status': job.status}, agent_id=agent.id or 0)
-                        if job.error == 'worker_timeout':
-                            stop_reason = 'worker_timeout'
-                    else:
-                        result = registry.call(tc.name, allowed=allowed, run_id=run_id, session=session, **tc.args)
-                    session.add(
-                        ToolCall(
-                            run_id=run_id,
-                            agent_id=agent.id or 0,
-                            tool_name=tc.name,
-                            args_json=json.dumps(tc.args),
-                            result_json=json.dumps(result),
-                            approved=bool(result.get('ok', False)),
-                        )
-                    )
-                    tool_calls += 1
-                    observations.append(f"tool[{tc.name}] => {json.dumps(result)[:350]}")
-                    add_trace(session, run_id, 'tool_result', {'step': step, 'tool': tc.name, 'result': result}, agent_id=agent.id or 0)
-                    if not result.get('ok', True) and stop_reason == 'max_steps':
-                        warnings.append(f'tool_failed:{tc.name}')
-                except Exception as exc:
+            calls = list(action.tool_calls)
+            denials = {}
+            for idx, tc in enumerate(calls):
+                add_trace(session, run_id, 'tool_call', {'step': step, 'tool': tc.name, 'args': tc.args, 'ordered': tc.ordered}, agent_id=agent.id or 0)
+                denied = registry.denial(tc.name, allowed)
+                if denied:
+                    add_trace(session, run_id, 'warning', {'message': denied[0]})
+                    denials[idx] = {'ok': False, 'error': denied[1]}
+            # Independent calls run concurrently; results are recorded below in request order.
+            batch_started = time.perf_counter()
+            outcomes = await tool_executor.run(calls, lambda idx, tc: self._invoke_tool(session, run_id, tc, denials.get(idx), allowed))
+            if len(calls) > 1:
+                add_trace(session, run_id, 'tool_batch', {'step': step, 'calls': len(calls), 'wall_ms': round((time.perf_counter() - batch_started) * 1000.0, 3), 'serial_ms': round(sum(o.elapsed_ms for o in outcomes), 3)}, agent_id=agent.id or 0)
+            for outcome in outcomes:
+                tc = outcome.call
+                if outcome.skipped:
+                    warnings.append(f'tool_skipped:{tc.name}')
+                    add_trace(session, run_id, 'warning', {'step': step, 'message': f'tool {tc.name} skipped after an earlier call failed'}, agent_id=agent.id or 0)
+                    observations.append(f'tool[{tc.name}] skipped')
+                    continue
+                if outcome.error is not None:
                     stop_reason = 'tool_error'
-                    warnings.append(f'tool_exception:{tc.name}:{exc}')
-                    add_trace(session, run_id, 'warning', {'step': step, 'message': f'tool {tc.name} crashed', 'error': str(exc)}, agent_id=agent.id or 0)
+                    warnings.append(f'tool_exception:{tc.name}:{outcome.error}')
+                    add_trace(session, run_id, 'warning', {'step': step, 'message': f'tool {tc.name} crashed', 'error': str(outcome.error)}, agent_id=agent.id or 0)
                     observations.append(f'tool[{tc.name}] crashed')
-                    break
+                    continue
+                result = outcome.result
+                if tc.name in WORKER_TOOL_TYPES and not outcome.timed_out and outcome.index not in denials:
+                    job = result
+                    worker_used = worker_used or not job['used_fallback_local']
+                    result = {'ok': job['status'] == 'done', 'job_id': job['id'], 'status': job['status'], 'fallback_local': job['used_fallback_local']}
+                    if job['status'] == 'done':
+                        result['output'] = job['result']
+                    if job['status'] == 'fallback_local':
+                        add_trace(session, run_id, 'worker_fallback', {'step': step, 'job_id': job['id'], 'reason': job['error'] or 'worker_failed'}, agent_id=agent.id or 0)
+                    else:
+                        add_trace(session, run_id, 'worker_dispatch', {'step': step, 'job_id': job['id'], 'status': job['status']}, agent_id=agent.id or 0)
+                    if job['error'] == 'worker_timeout':
+                        stop_reason = 'worker_timeout'
+                session.add(
+                    ToolCall(
+                        run_id=run_id,
+                        agent_id=agent.id or 0,
+                        tool_name=tc.name,
+                        args_json=json.dumps(tc.args),
+                        result_json=json.dumps(result),
+                        approved=bool(result.get('ok', False)),
+                    )
+                )
+                tool_calls += 1
+                observations.append(f"tool[{tc.name}] => {json.dumps(result)[:350]}")
+                add_trace(session, run_id, 'tool_result', {'step': step, 'tool': tc.name, 'result': result, 'elapsed_ms': outcome.elapsed_ms}, agent_id=agent.id or 0)
+                if not result.get('ok', True) and stop_reason == 'max_steps':
+                    warnings.append(f'tool_failed:{tc.name}')
+            if trace_writer.due(session):
+                # A large tool batch filled the trace buffer: write it now rather than at the next step boundary.
+                await blocking_pool.run('db', checkpoint, session)
 
             if action.final:
                 final_text = action.final
@@ -185,8 +253,11 @@ class RuntimeLoop:
 
         retrieved_ids = [m.get('capsule_id') for m in memory if m.get('capsule_id')] if 'memory' in locals() else []
         used_ids = [m.get('capsule_id') for m in memory[:2] if m.get('capsule_id')] if 'memory' in locals() else []
-        metrics = update_usefulness(session, run_id=run_id, retrieved_capsule_ids=retrieved_ids, used_capsule_ids=used_ids, helped_final_answer=bool(final_text and final_text != 'No final answer generated.'), helped_tool_execution=tool_calls > 0)
-        add_trace(session, run_id, 'memory_usefulness_update', {'metrics_updated': len(metrics), 'retrieved_ids': retrieved_ids[:8], 'used_ids': used_ids[:8]}, agent_id=agent.id or 0)
+        queued = await blocking_pool.run('db', memory_write_behind.record_usefulness, retrieved_capsule_ids=retrieved_ids, used_capsule_ids=used_ids, helped_final_answer=bool(final_text and final_text != 'No final answer generated.'), helped_tool_execution=tool_calls > 0, session=session)
+        add_trace(session, run_id, 'memory_usefulness_update', {'metrics_queued': queued, 'retrieved_ids': retrieved_ids[:8], 'used_ids': used_ids[:8]}, agent_id=agent.id or 0)
+        # With the writer thread running the flush happens off the run; otherwise drain here so nothing is stranded.
+        bookkeeping = {'deferred': True, **memory_write_behind.stats()} if memory_write_behind.running else await blocking_pool.run('db', memory_write_behind.flush, session)
+        add_trace(session, run_id, 'memory_bookkeeping_flush', bookkeeping, agent_id=agent.id or 0)
 
         add_trace(session, run_id, 'final_answer', {'final_text': final_text[:1000], 'stop_reason': stop_reason, 'warnings': warnings, 'models_used': models_used}, agent_id=agent.id or 0)
         return RuntimeResult(
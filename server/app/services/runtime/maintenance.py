@@ -7,9 +7,11 @@ from sqlmodel import Session, select
 
 from app.core.config import settings
 from app.models import Capsule, MemoryConflict, MemoryEdge, MemoryMaintenanceJob, MemorySummary
+from app.services.runtime.ann_index import capsule_index
 from app.services.runtime.router import route_worker_job
 from app.services.runtime.conflicts import detect_conflicts_for_run, upsert_duplicate_cluster
 from app.services.runtime.trace import add_trace
+from app.services.runtime.write_behind import memory_write_behind
 
 
 LAYER_PROMOTE = {
@@ -32,6 +34,7 @@ def promote_capsule(session: Session, capsule_id: int, reason: str = 'manual') -
     cap.last_accessed_at = datetime.utcnow()
     session.add(cap)
     session.commit()
+    capsule_index.refresh(session, cap)
     return cap
 
 
@@ -44,6 +47,7 @@ def demote_capsule(session: Session, capsule_id: int, reason: str = 'manual') ->
         cap.archive_status = 'cold'
     session.add(cap)
     session.commit()
+    capsule_index.refresh(session, cap)
     return cap
 
 
@@ -125,6 +129,7 @@ def refine_capsule(session: Session, capsule_id: int) -> dict:
         )
     )
     session.commit()
+    capsule_index.sync(session)
     return {'ok': True, 'created': created + 1, 'summary_capsule_id': summary.id}
 
 
@@ -135,7 +140,7 @@ def run_maintenance(session: Session, run_id: int | None = None, try_worker: boo
     session.refresh(job)
 
     if try_worker:
-        worker_job = route_worker_job(session, 'memory_maintenance', {'run_id': run_id}, priority=4)
+        worker_job = route_worker_job(session, 'memory_maintenance', {'run_id': run_id}, priority=4, wait=False)
         job.used_worker = not worker_job.used_fallback_local
 
     promoted = 0
@@ -147,6 +152,7 @@ def run_maintenance(session: Session, run_id: int | None = None, try_worker: boo
     now = datetime.utcnow()
     old_cutoff = now - timedelta(days=settings.agentora_cold_archive_after_days)
 
+    memory_write_behind.flush(session)
     caps = list(session.exec(select(Capsule)))
     for cap in caps:
         utility = (cap.success_count - cap.failure_count) / max(1, cap.retrieval_count)
@@ -161,6 +167,7 @@ def run_maintenance(session: Session, run_id: int | None = None, try_worker: boo
             cap.memory_layer = 'L5_COLD'
             cap.archive_status = 'cold'
             session.add(cap)
+            capsule_index.remove(cap.id)
             demoted += 1
         cluster = upsert_duplicate_cluster(session, cap)
         if cluster.cluster_size > 1:
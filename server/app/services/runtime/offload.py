@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from app import db
+from app.core.config import settings
+from app.services.runtime.percentiles import percentile
+
+
+T = TypeVar('T')
+
+
+class BlockingPool:
+    """Bounded thread pool that async handlers hand synchronous DB, HTTP and subprocess work to.
+
+    Calls run in a copy of the caller's context, tagged with the calling task
+    so the writer gate treats every offloaded step of one run as one writer.
+    A session may be handed between pool threads as long as the caller awaits
+    each call before touching it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._size = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.errors = 0
+        self._kinds: dict[str, dict[str, float]] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._size = max(1, settings.agentora_blocking_pool_size)
+                self._executor = ThreadPoolExecutor(max_workers=self._size, thread_name_prefix='agentora-blocking')
+            return self._executor
+
+    async def run(self, kind: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        ctx = contextvars.copy_context()
+        task = asyncio.current_task()
+        if task is not None:
+            ctx.run(db.writer_flow.set, id(task))
+        call = functools.partial(ctx.run, self._timed, kind, time.perf_counter(), fn, args, kwargs)
+        with self._lock:
+            if self.in_flight >= self._size:
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await loop.run_in_executor(executor, call)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _timed(self, kind: str, submitted: float, fn: Callable[..., T], args: tuple, kwargs: dict) -> T:
+        started = time.perf_counter()
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            done = time.perf_counter()
+            with self._lock:
+                row = self._kinds.setdefault(kind, {'calls': 0, 'errors': 0, 'queue_ms': 0.0, 'run_ms': 0.0, 'max_run_ms': 0.0})
+                row['calls'] += 1
+                row['queue_ms'] += (started - submitted) * 1000.0
+                row['run_ms'] += (done - started) * 1000.0
+                row['max_run_ms'] = max(row['max_run_ms'], (done - started) * 1000.0)
+                if failed:
+                    row['errors'] += 1
+                    self.errors += 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_workers': self._size or max(1, settings.agentora_blocking_pool_size),
+                'started': self._executor is not None,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'saturated': self.saturated,
+                'errors': self.errors,
+                'kinds': {
+                    kind: {
+                        'calls': int(row['calls']),
+                        'errors': int(row['errors']),
+                        'avg_queue_ms': round(row['queue_ms'] / row['calls'], 3) if row['calls'] else 0.0,
+                        'avg_run_ms': round(row['run_ms'] / row['calls'], 3) if row['calls'] else 0.0,
+                        'max_run_ms': round(row['max_run_ms'], 3),
+                    }
+                    for kind, row in sorted(self._kinds.items())
+                },
+            }
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how late a sleep of a fixed interval wakes up.
+
+    Anything that blocks the loop thread shows up directly as lag, so a
+    responsive loop keeps p95 near zero while blocking work runs in the pool.
+    """
+
+    def __init__(self, window: int = 1200):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+        self._lock = threading.Lock()
+        self.ticks = 0
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._task and not self._task.done())
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._loop(), name='agentora-loop-lag')
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self.ticks = 0
+            self.stalls = 0
+            self.max_lag_ms = 0.0
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = max(5, settings.agentora_loop_lag_interval_ms) / 1000.0
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.record(max(0.0, (loop.time() - expected) * 1000.0))
+
+    def record(self, lag_ms: float) -> None:
+        with self._lock:
+            self._samples.append(lag_ms)
+            self.ticks += 1
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms >= settings.agentora_loop_lag_warn_ms:
+                self.stalls += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = list(self._samples)
+            return {
+                'running': self.running,
+                'interval_ms': settings.agentora_loop_lag_interval_ms,
+                'warn_ms': settings.agentora_loop_lag_warn_ms,
+                'ticks': self.ticks,
+                'stalls': self.stalls,
+                'p50_ms': round(percentile(samples, 0.50), 3),
+                'p95_ms': round(percentile(samples, 0.95), 3),
+                'window_max_ms': round(max(samples), 3) if samples else 0.0,
+                'max_ms': round(self.max_lag_ms, 3),
+            }
+
+
+blocking_pool = BlockingPool()
+loop_lag = LoopLagMonitor()
@@ -0,0 +1,11 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """Percentile ``q`` (0..1) of ``values`` by nearest rank; 0.0 when there are none."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))]
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import func
+from sqlmodel import select
+
+from app import db
+from app.models import (
+    Capsule,
+    CapsuleEmbedding,
+    ContextActivation,
+    DuplicateCluster,
+    IntegrationRun,
+    MemoryCapsuleState,
+    MemoryConflict,
+    MemoryEdge,
+    MemoryUsefulnessMetric,
+    RunTrace,
+    WatcherEvent,
+    WorkerJob,
+)
+
+
+def hot_queries() -> dict[str, Any]:
+    """Representative shapes of the queries on the retrieval, trace and watcher paths."""
+    ids = [1, 2, 3]
+    return {
+        'retrieval_candidates': select(Capsule, CapsuleEmbedding).join(CapsuleEmbedding, Capsule.id == CapsuleEmbedding.capsule_id).where(Capsule.run_id == 1),
+        'recent_run_capsules': select(Capsule).where(Capsule.run_id == 1).order_by(Capsule.id.desc()).limit(30),
+        'capsule_embeddings': select(CapsuleEmbedding).where(CapsuleEmbedding.capsule_id.in_(ids)),
+        'run_trace': select(RunTrace).where(RunTrace.run_id == 1).order_by(RunTrace.id),
+        'run_trace_page': select(RunTrace).where(RunTrace.run_id == 1, RunTrace.id > 0).order_by(RunTrace.id).limit(200),
+        'run_trace_page_by_type': select(RunTrace).where(RunTrace.run_id == 1, RunTrace.event_type == 'tool_result', RunTrace.id > 0).order_by(RunTrace.id).limit(200),
+        'run_trace_event_counts': select(RunTrace.event_type, func.count()).where(RunTrace.run_id == 1).group_by(RunTrace.event_type),
+        'edge_lookup': select(MemoryEdge).where(MemoryEdge.from_capsule_id.in_(ids), MemoryEdge.to_capsule_id.in_(ids), MemoryEdge.edge_type == 'co_retrieval'),
+        'graph_neighbors': select(MemoryEdge).where(MemoryEdge.from_capsule_id.in_(ids) | MemoryEdge.to_capsule_id.in_(ids)),
+        'duplicate_clusters': select(DuplicateCluster).where(DuplicateCluster.hash_key.in_(['a', 'b'])),
+        'capsule_state': select(MemoryCapsuleState).where(MemoryCapsuleState.capsule_id.in_(ids)),
+        'usefulness_metrics': select(MemoryUsefulnessMetric).where(MemoryUsefulnessMetric.capsule_id.in_(ids)),
+        'admitted_conflicts': select(MemoryConflict).where(MemoryConflict.left_capsule_id.in_(ids) | MemoryConflict.right_capsule_id.in_(ids)),
+        'context_activations': select(ContextActivation).where(ContextActivation.run_id == 1).order_by(ContextActivation.id.desc()).limit(40),
+        'watcher_events_for_run': select(WatcherEvent).where(WatcherEvent.run_id == 1).order_by(WatcherEvent.created_at.asc()),
+        'watcher_recent': select(WatcherEvent).order_by(WatcherEvent.created_at.desc()).limit(50),
+        'watcher_active_runs': select(IntegrationRun).where(IntegrationRun.watch_enabled == True, IntegrationRun.status.in_(['created', 'running'])).order_by(IntegrationRun.updated_at.desc()).limit(20),  # noqa: E712
+        'integration_runs_by_status': select(IntegrationRun).where(IntegrationRun.status == 'completed').order_by(IntegrationRun.created_at.desc()).limit(50),
+        'run_lineage': select(IntegrationRun).where((IntegrationRun.root_run_id == 1) | (IntegrationRun.parent_run_id == 1)),
+        'worker_jobs_queued': select(WorkerJob).where(WorkerJob.status == 'queued').order_by(WorkerJob.priority, WorkerJob.created_at).limit(10),
+        'worker_leases_expired': select(WorkerJob).where(WorkerJob.status == 'leased', WorkerJob.lease_expires_at < datetime(2000, 1, 1)),
+    }
+
+
+def _full_scans(details: list[str]) -> list[str]:
+    # "SCAN t" reads every row; "SCAN t USING [COVERING] INDEX" walks an index in order instead.
+    return [d for d in details if d.startswith('SCAN ') and ' USING ' not in d]
+
+
+def explain_hot_queries() -> dict[str, Any]:
+    """Run ``EXPLAIN QUERY PLAN`` over :func:`hot_queries` and flag full table scans and temp sorts."""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return {'ok': True, 'supported': False, 'dialect': engine.dialect.name, 'queries': [], 'full_scans': []}
+    out: list[dict[str, Any]] = []
+    with engine.connect() as conn:
+        for name, stmt in hot_queries().items():
+            sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+            details = [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').fetchall()]
+            scans = _full_scans(details)
+            out.append({
+                'name': name,
+                'plan': details,
+                'full_scan': bool(scans),
+                'temp_sort': any('USE TEMP B-TREE' in d for d in details),
+                'sql': ' '.join(sql.split()),
+            })
+    flagged = [q['name'] for q in out if q['full_scan']]
+    return {'ok': not flagged, 'supported': True, 'dialect': 'sqlite', 'queries': out, 'full_scans': flagged}
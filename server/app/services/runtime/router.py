@@ -5,7 +5,7 @@ from sqlmodel import Session
 from app.core.config import settings
 from app.models import ModelCapability, WorkerJob
 
-from .capsules import ingest_text_as_capsules
+from .capsules import IngestDocument, ingest_documents
 from .worker_queue import worker_queue
 
 
@@ -37,9 +37,16 @@ def choose_model_for_role(session: Session, role: str, has_images: bool = False)
 
 
 async def route_capsule_ingest(session: Session, run_id: int, text: str, source: str, attachment_id: int | None = None) -> dict:
-    inserted = await ingest_text_as_capsules(session=session, run_id=run_id, text=text, source=source, attachment_id=attachment_id)
-    return {'ok': True, 'capsules_created': inserted}
+    result = await route_documents_ingest(session, [IngestDocument(run_id=run_id, text=text, source=source, attachment_id=attachment_id)])
+    return {'ok': True, 'capsules_created': result['capsules_created']}
 
 
-def route_worker_job(session: Session, job_type: str, payload: dict, priority: int = 5) -> WorkerJob:
-    return worker_queue.dispatch(session=session, job_type=job_type, payload=payload, priority=priority)
+async def route_documents_ingest(session: Session, documents: list[IngestDocument]) -> dict:
+    """Capsule ingest for uploaded documents; single uploads and batches both go through here."""
+    if not documents:
+        return {'ok': True, 'documents': 0, 'capsules_created': 0, 'items': []}
+    return {'ok': True, **await ingest_documents(session, documents)}
+
+
+def route_worker_job(session: Session, job_type: str, payload: dict, priority: int = 5, wait: bool = True) -> WorkerJob:
+    return worker_queue.dispatch(session=session, job_type=job_type, payload=payload, priority=priority, wait=wait)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator
+
+from app.core.config import settings
+
+
+# Trace event types that get their own stream event type; every other trace is sent as 'trace'.
+STREAM_EVENT_TYPES = {
+    'action_payload': 'action',
+    'tool_call': 'tool_call',
+    'tool_result': 'tool_result',
+    'final_answer': 'final',
+}
+
+TERMINAL = 'end'
+
+
+class Subscription:
+    """One consumer's bounded view of a run's events.
+
+    When the buffer is full the overflow policy decides: ``drop_oldest``
+    discards the oldest buffered event and reports the gap as a ``lag`` event
+    on the next read; ``disconnect`` closes the subscription instead.
+    """
+
+    def __init__(self, bus: 'RunEventBus', run_id: int, maxsize: int, policy: str):
+        self.run_id = run_id
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self._bus = bus
+        self._buffer: deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._pending_lag = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self.close_reason = ''
+
+    def push(self, event: dict) -> str:
+        """Buffer one event; returns ``'ok'``, ``'dropped'`` or ``'disconnected'``."""
+        outcome = 'ok'
+        with self._lock:
+            if self.closed:
+                return 'closed'
+            if len(self._buffer) >= self.maxsize:
+                if self.policy == 'disconnect':
+                    self.closed = True
+                    self.close_reason = 'lagged'
+                    outcome = 'disconnected'
+                else:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                    self._pending_lag += 1
+                    outcome = 'dropped'
+            if not self.closed:
+                self._buffer.append(event)
+        self._wake()
+        return outcome
+
+    def close(self, reason: str = 'closed') -> None:
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self.close_reason = reason
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass
+
+    def _take(self) -> list[dict]:
+        with self._lock:
+            out: list[dict] = []
+            if self._pending_lag:
+                out.append({'run_id': self.run_id, 'type': 'lag', 'seq': None, 'ts': time.time(), 'data': {'dropped': self._pending_lag, 'policy': self.policy}})
+                self._pending_lag = 0
+            out.extend(self._buffer)
+            self._buffer.clear()
+            self._ready.clear()
+            self.delivered += len(out)
+            return out
+
+    async def events(self, heartbeat_seconds: float | None = None) -> AsyncIterator[dict | None]:
+        """Yield events until the run ends or the subscription closes; ``None`` marks an idle heartbeat."""
+        try:
+            while True:
+                batch = self._take()
+                for event in batch:
+                    yield event
+                    if event['type'] == TERMINAL:
+                        return
+                if self.closed and not batch:
+                    yield {'run_id': self.run_id, 'type': TERMINAL, 'seq': None, 'ts': time.time(), 'data': {'reason': self.close_reason}}
+                    return
+                if batch:
+                    continue
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._bus.unsubscribe(self)
+
+
+class RunEventBus:
+    """In-process pub/sub of live run events (planner actions, tool results, traces, model tokens).
+
+    Publishers may be on any thread; each subscriber is woken on its own
+    event loop. A short per-run history lets late subscribers catch up.
+    """
+
+    def __init__(self, max_runs: int = 256):
+        self._lock = threading.Lock()
+        self._subs: dict[int, list[Subscription]] = {}
+        self._history: OrderedDict[int, deque[dict]] = OrderedDict()
+        self._seq: dict[int, itertools.count] = {}
+        self._max_runs = max_runs
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def subscribe(self, run_id: int, replay: bool = True) -> Subscription:
+        sub = Subscription(self, run_id, settings.agentora_stream_buffer_size, settings.agentora_stream_overflow_policy.lower())
+        with self._lock:
+            for event in list(self._history.get(run_id, ()))[-sub.maxsize:] if replay else []:
+                sub.push(event)
+            self._subs.setdefault(run_id, []).append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.run_id, [])
+            if sub in subs:
+                subs.remove(sub)
+            if not subs:
+                self._subs.pop(sub.run_id, None)
+
+    def has_subscribers(self, run_id: int) -> bool:
+        with self._lock:
+            return bool(self._subs.get(run_id))
+
+    def has_history(self, run_id: int) -> bool:
+        with self._lock:
+            return bool(self._history.get(run_id))
+
+    def publish(self, run_id: int, event_type: str, data: dict[str, Any]) -> None:
+        if not run_id:
+            return
+        with self._lock:
+            counter = self._seq.get(run_id)
+            if counter is None:
+                counter = self._seq[run_id] = itertools.count(1)
+            event = {'run_id': run_id, 'type': event_type, 'seq': next(counter), 'ts': time.time(), 'data': data}
+            history = self._history.get(run_id)
+            if history is None:
+                history = self._history[run_id] = deque(maxlen=max(1, settings.agentora_stream_history_size))
+                while len(self._history) > self._max_runs:
+                    evicted, _ = self._history.popitem(last=False)
+                    self._seq.pop(evicted, None)
+            else:
+                self._history.move_to_end(run_id)
+            # Tokens are only useful live; keeping them would push planner and tool events out of the replay window.
+            if event_type != 'token':
+                history.append(event)
+            self.published += 1
+            # Fan out under the lock so every subscriber sees a run's events in seq order.
+            for sub in self._subs.get(run_id, ()):
+                outcome = sub.push(event)
+                if outcome == 'dropped':
+                    self.dropped += 1
+                elif outcome == 'disconnected':
+                    self.disconnected += 1
+
+    def close_run(self, run_id: int, status: str) -> None:
+        """Publish the run's terminal event; a run that already ended is not ended twice."""
+        with self._lock:
+            history = self._history.get(run_id)
+            if history and history[-1]['type'] == TERMINAL:
+                return
+        self.publish(run_id, TERMINAL, {'status': status})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'buffer_size': settings.agentora_stream_buffer_size,
+                'overflow_policy': settings.agentora_stream_overflow_policy,
+                'runs_tracked': len(self._history),
+                'subscribers': sum(len(s) for s in self._subs.values()),
+                'published': self.published,
+                'dropped': self.dropped,
+                'disconnected': self.disconnected,
+            }
+
+
+class TokenSink:
+    """Forwards one model call's tokens to a run's subscribers and times the first token."""
+
+    def __init__(self, run_id: int, agent_id: int, step: int, model: str):
+        self.run_id = run_id
+        self.agent_id = agent_id
+        self.step = step
+        self.model = model
+        self.started = time.perf_counter()
+        self.ttft_ms: float | None = None
+        self.tokens = 0
+
+    def __call__(self, token: str) -> None:
+        if self.ttft_ms is None:
+            self.ttft_ms = round((time.perf_counter() - self.started) * 1000.0, 3)
+            run_events.publish(self.run_id, 'first_token', {'agent_id': self.agent_id, 'step': self.step, 'model': self.model, 'ttft_ms': self.ttft_ms})
+        self.tokens += 1
+        run_events.publish(self.run_id, 'token', {'agent_id': self.agent_id, 'step': self.step, 'text': token})
+
+    def summary(self) -> dict:
+        return {
+            'step': self.step,
+            'model': self.model,
+            'ttft_ms': self.ttft_ms,
+            'tokens': self.tokens,
+            'total_ms': round((time.perf_counter() - self.started) * 1000.0, 3),
+        }
+
+
+run_events = RunEventBus()
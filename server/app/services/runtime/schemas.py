@@ -6,6 +6,8 @@ from pydantic import BaseModel, Field
 class ToolInvocation(BaseModel):
     name: str
     args: dict = Field(default_factory=dict)
+    # Wait for every earlier call in the action before running (for calls that share state).
+    ordered: bool = False
 
 
 class RuntimeAction(BaseModel):
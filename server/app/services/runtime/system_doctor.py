@@ -7,9 +7,9 @@ import os
 import shutil
 import socket
 
-import requests
-
 from app.core.config import settings
+from app.services.http_pool import http_pool
+from app.services.runtime.query_plans import explain_hot_queries
 
 
 @dataclass
@@ -68,12 +68,21 @@ def run_doctor() -> dict:
     db_dir = Path(settings.database_url.replace('sqlite:///', '', 1)).parent if settings.database_url.startswith('sqlite:///') else Path('.')
     items.append(DiagnosticItem('database_dir', os_access_write(db_dir), 'error', f'database directory writable={os_access_write(db_dir)}', 'Ensure database parent directory is writable'))
 
+    try:
+        plans = explain_hot_queries()
+        scans = plans['full_scans']
+        plans_detail = f'full table scans on: {", ".join(scans)}' if scans else 'hot queries use indexes'
+        plans_ok = not scans
+    except Exception as exc:
+        plans_ok, plans_detail = False, f'query plan check failed: {exc}'
+    items.append(DiagnosticItem('db_query_plans', plans_ok, 'warn', plans_detail, 'Restart the server so the schema upgrade creates missing indexes'))
+
     ollama_ok = False
     ollama_detail = 'mock mode enabled'
     if not settings.agentora_use_mock_ollama:
         try:
-            r = requests.get(f"{settings.ollama_url.rstrip('/')}/api/tags", timeout=3)
-            ollama_ok = r.ok
+            r = http_pool.sync_client('ollama').get(f"{settings.ollama_url.rstrip('/')}/api/tags", timeout=3)
+            ollama_ok = r.is_success
             ollama_detail = f'ollama reachable status={r.status_code}'
         except Exception as exc:
             ollama_detail = f'ollama unavailable: {exc}'
@@ -7,10 +7,20 @@ from sqlmodel import Session, select
 
 from app.core.config import settings
 from app.models import Agent, AgentCapabilityProfile, AgentHandoff, CollaborationMetric, RunTrace, TeamPlan, TeamSubgoal
-from app.services.runtime.trace import add_trace, get_run_trace
+from app.services.runtime.trace import add_trace, count_run_events, get_run_trace
 
 
 COMPLEXITY_TERMS = {'and', 'then', 'compare', 'analyze', 'design', 'build', 'verify', 'critique', 'plan', 'steps'}
+COLLABORATION_METRIC_EVENTS = {
+    'agent_handoff', 'handoff_completed', 'worker_route_fallback', 'worker_route_selected',
+    'synthesis_completed', 'subgoal_assigned', 'subgoal_completed', 'warning',
+}
+COLLABORATION_TRACE_EVENTS = {
+    'team_plan_created', 'team_plan_revised', 'subgoal_assigned', 'subgoal_completed',
+    'agent_handoff', 'handoff_rejected', 'handoff_completed', 'handoff_escalated',
+    'debate_started', 'critique_issued', 'verification_failed', 'synthesis_completed',
+    'worker_route_selected', 'worker_route_fallback', 'worker_route_rejected',
+}
 
 
 def _is_complex_prompt(prompt: str) -> bool:
@@ -57,15 +67,27 @@ def ensure_capability_profile(session: Session, agent: Agent) -> AgentCapability
     return profile
 
 
+def _fanout_executors(agents: list[Agent]) -> list[Agent]:
+    """Agents that can each take one part of a fan-out plan; empty when fewer than two are available."""
+    reserved = ('planner', 'critic', 'synth')
+    executors = [a for a in agents if not any(r in (a.role or '').lower() for r in reserved)] or agents
+    executors = executors[: max(0, settings.agentora_team_fanout_width)]
+    return executors if len(executors) >= 2 else []
+
+
 def create_team_plan(session: Session, run_id: int, prompt: str, agents: list[Agent], requested_mode: str | None = None) -> TeamPlan:
     mode = requested_mode or settings.agentora_default_team_mode
     complex_prompt = _is_complex_prompt(prompt)
     use_single = settings.agentora_enable_single_agent_fallback and not complex_prompt
+    wants_fanout = mode == 'fanout' or settings.agentora_team_fanout_plans
+    fanout = _fanout_executors(agents) if wants_fanout and not use_single else []
+    if mode == 'fanout' and not fanout:
+        mode = settings.agentora_default_team_mode
 
     plan = TeamPlan(
         run_id=run_id,
         goal=prompt,
-        mode='single_agent' if use_single else mode,
+        mode='single_agent' if use_single else ('fanout' if fanout else mode),
         status='active',
         confidence=0.72 if complex_prompt else 0.85,
         urgency=0.6,
@@ -96,16 +118,22 @@ def create_team_plan(session: Session, run_id: int, prompt: str, agents: list[Ag
             )
         )
     else:
-        steps = [
-            ('Plan approach', f'Create concise plan for: {prompt}', 'planner'),
-            ('Execute draft output', f'Produce draft response for: {prompt}', 'executor'),
-        ]
+        # (title, detail, role hint, dependency positions within this plan, fixed assignee)
+        steps: list[tuple[str, str, str, list[int], Agent | None]] = [('Plan approach', f'Create concise plan for: {prompt}', 'planner', [], None)]
+        if fanout:
+            width = len(fanout)
+            for part, executor in enumerate(fanout, start=1):
+                steps.append((f'Execute part {part} of {width}', f'Produce part {part} of {width} of the draft, covering only your share, for: {prompt}', 'executor', [0], executor))
+        else:
+            steps.append(('Execute draft output', f'Produce draft response for: {prompt}', 'executor', [0], None))
+        drafts = list(range(1, len(steps)))
         if settings.agentora_enable_team_debate:
-            steps.append(('Critique draft', f'Critique and verify draft for: {prompt}', 'critic'))
-        steps.append(('Synthesize final', f'Synthesize final deliverable for: {prompt}', 'synthesizer'))
+            steps.append(('Critique draft', f'Critique and verify draft for: {prompt}', 'critic', drafts, None))
+            drafts = [len(steps) - 1]
+        steps.append(('Synthesize final', f'Synthesize final deliverable for: {prompt}', 'synthesizer', drafts, None))
 
-        for idx, (title, detail, role_hint) in enumerate(steps):
-            assigned = next((a for a in agents if role_hint in (a.role or '').lower()), agents[idx % len(agents)])
+        for idx, (title, detail, role_hint, deps, fixed) in enumerate(steps):
+            assigned = fixed or next((a for a in agents if role_hint in (a.role or '').lower()), agents[idx % len(agents)])
             session.add(
                 TeamSubgoal(
                     plan_id=plan.id or 0,
@@ -115,7 +143,7 @@ def create_team_plan(session: Session, run_id: int, prompt: str, agents: list[Ag
                     detail=detail,
                     assigned_agent_id=assigned.id,
                     assigned_agent_role=assigned.role,
-                    dependency_subgoal_ids_json=json.dumps([idx - 1] if idx > 0 else []),
+                    dependency_subgoal_ids_json=json.dumps(deps),
                     status='pending',
                     needs_worker=('execute' in title.lower()),
                     deliverable_type=_deliverable_for_text(detail),
@@ -193,8 +221,8 @@ def complete_handoff(session: Session, handoff_id: int, accepted: bool = True, e
 
 
 def record_collaboration_metrics(session: Session, run_id: int) -> CollaborationMetric:
-    trace = get_run_trace(session, run_id)
-    count = lambda e: sum(1 for t in trace if t['event_type'] == e)
+    counts = count_run_events(session, run_id, COLLABORATION_METRIC_EVENTS)
+    count = lambda e: counts.get(e, 0)
     handoffs = count('agent_handoff')
     completed = count('handoff_completed')
     fallback = count('worker_route_fallback')
@@ -219,10 +247,4 @@ def record_collaboration_metrics(session: Session, run_id: int) -> Collaboration
 
 
 def collaboration_trace(session: Session, run_id: int) -> list[dict]:
-    interesting = {
-        'team_plan_created', 'team_plan_revised', 'subgoal_assigned', 'subgoal_completed',
-        'agent_handoff', 'handoff_rejected', 'handoff_completed', 'handoff_escalated',
-        'debate_started', 'critique_issued', 'verification_failed', 'synthesis_completed',
-        'worker_route_selected', 'worker_route_fallback', 'worker_route_rejected',
-    }
-    return [t for t in get_run_trace(session, run_id) if t['event_type'] in interesting]
+    return get_run_trace(session, run_id, COLLABORATION_TRACE_EVENTS)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from app.core.config import settings
+from app.services.tools.registry import registry
+
+from .schemas import ToolInvocation
+
+
+@dataclass
+class ToolOutcome:
+    index: int
+    call: ToolInvocation
+    result: Any = None
+    error: BaseException | None = None
+    timed_out: bool = False
+    skipped: bool = False
+    elapsed_ms: float = 0.0
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None or self.timed_out or self.skipped
+
+
+def _wake(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class _ToolSlots:
+    """Counting semaphore for one tool that runs on any event loop.
+
+    Waiters queue in arrival order and are resumed on their own loop; a
+    released slot is handed straight to the next waiter, so nothing polls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self.held = 0
+
+    async def acquire(self, limit: int) -> None:
+        with self._lock:
+            if self.held < limit and not self._waiters:
+                self.held += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                handed = waiter not in self._waiters
+                if not handed:
+                    self._waiters.remove(waiter)
+            if handed:
+                # The slot was passed to us as we were cancelled; pass it on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, fut = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_wake, fut)
+                    return
+                except RuntimeError:
+                    continue  # its loop is closed
+            self.held -= 1
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+
+class ToolExecutor:
+    """Runs the tool calls of one planner action concurrently.
+
+    A call waits for the previous call to a tool in the same state group, and
+    a call marked ``ordered`` waits for every earlier call. Calls whose
+    prerequisite failed are skipped. Each tool has its own concurrency limit,
+    shared by every run, and a timeout; outcomes always come back in request
+    order. A call that times out is reported as such, but a tool running on a
+    pool thread cannot be interrupted, so it keeps its concurrency slot until
+    the thread actually returns.
+    """
+
+    def __init__(self):
+        # The executor is shared by runs on different event loops, so its counters sit behind a thread lock.
+        self._lock = threading.Lock()
+        self._slots: dict[str, _ToolSlots] = {}
+        self.batches = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.max_parallel = 0
+        self.overrunning = 0
+
+    def dependencies(self, calls: list[ToolInvocation]) -> list[list[int]]:
+        deps: list[list[int]] = []
+        last_in_group: dict[str, int] = {}
+        for idx, call in enumerate(calls):
+            before = set(range(idx)) if call.ordered else set()
+            group = self._state_group(call.name)
+            if group is not None:
+                if group in last_in_group:
+                    before.add(last_in_group[group])
+                last_in_group[group] = idx
+            deps.append(sorted(before))
+        return deps
+
+    @staticmethod
+    def _state_group(name: str) -> str | None:
+        spec = registry.spec(name)
+        if spec is None:
+            return None
+        # Tools that take the run's session must not share it across threads.
+        return spec.state_group or ('session' if registry.uses_session(name) else None)
+
+    @staticmethod
+    def _limit(name: str) -> int:
+        spec = registry.spec(name)
+        return max(1, (spec.max_concurrency if spec and spec.max_concurrency else settings.agentora_tool_max_parallel))
+
+    @staticmethod
+    def _timeout(name: str) -> float:
+        spec = registry.spec(name)
+        timeout = spec.timeout_seconds if spec and spec.timeout_seconds is not None else settings.agentora_tool_timeout_seconds
+        return max(0.0, float(timeout or 0.0))
+
+    def _slots_for(self, name: str) -> _ToolSlots:
+        with self._lock:
+            return self._slots.setdefault(name, _ToolSlots())
+
+    def _returned(self, slots: _ToolSlots, overran: list[bool], task: asyncio.Future) -> None:
+        slots.release()
+        with self._lock:
+            if overran[0]:
+                self.overrunning -= 1
+        if not task.cancelled():
+            task.exception()  # a timed-out call's late failure has no one left to report to
+
+    async def run(self, calls: list[ToolInvocation], invoke: Callable[[int, ToolInvocation], Awaitable[Any]]) -> list[ToolOutcome]:
+        outcomes = [ToolOutcome(idx, call) for idx, call in enumerate(calls)]
+        if not calls:
+            return outcomes
+        deps = self.dependencies(calls)
+        finished = [asyncio.Event() for _ in calls]
+        step_slots = asyncio.Semaphore(max(1, settings.agentora_tool_max_parallel))
+        active = 0
+
+        async def one(idx: int) -> None:
+            nonlocal active
+            outcome = outcomes[idx]
+            name = outcome.call.name
+            try:
+                for dep in deps[idx]:
+                    await finished[dep].wait()
+                if any(outcomes[dep].failed for dep in deps[idx]):
+                    outcome.skipped = True
+                    return
+                limit, timeout = self._limit(name), self._timeout(name)
+                slots = self._slots_for(name)
+                # The tool's slot first: a call queued behind a saturated tool holds no step slot meanwhile.
+                await slots.acquire(limit)
+                task = None
+                try:
+                    async with step_slots:
+                        overran = [False]
+                        task = asyncio.ensure_future(invoke(idx, outcome.call))
+                        task.add_done_callback(lambda t: self._returned(slots, overran, t))
+                        active += 1
+                        with self._lock:
+                            self.max_parallel = max(self.max_parallel, active)
+                        started = time.perf_counter()
+                        try:
+                            done, _ = await asyncio.wait({task}, timeout=timeout or None)
+                            if task in done:
+                                outcome.result = task.result()
+                            else:
+                                # Not cancelled: that would free the slot while a pool thread still runs the tool.
+                                outcome.timed_out = True
+                                outcome.result = {'ok': False, 'error': 'tool timeout', 'timeout_seconds': timeout}
+                                with self._lock:
+                                    overran[0] = True
+                                    self.overrunning += 1
+                        except asyncio.CancelledError:
+                            task.cancel()
+                            raise
+                        except Exception as exc:
+                            outcome.error = exc
+                        finally:
+                            active -= 1
+                            outcome.elapsed_ms = round((time.perf_counter() - started) * 1000.0, 3)
+                finally:
+                    if task is None:
+                        slots.release()  # cancelled before the call started; its done callback never will
+            finally:
+                finished[idx].set()
+
+        await asyncio.gather(*(one(idx) for idx in range(len(calls))))
+        with self._lock:
+            self.batches += 1
+            self.calls += len(calls)
+            self.timeouts += sum(1 for o in outcomes if o.timed_out)
+            self.skipped += sum(1 for o in outcomes if o.skipped)
+        return outcomes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'calls': self.calls,
+                'timeouts': self.timeouts,
+                'skipped': self.skipped,
+                'max_parallel': self.max_parallel,
+                'running_by_tool': {name: slots.held for name, slots in self._slots.items() if slots.held},
+                'waiting_by_tool': {name: slots.waiting for name, slots in self._slots.items() if slots.waiting},
+                'overrunning': self.overrunning,
+                'max_parallel_setting': settings.agentora_tool_max_parallel,
+                'timeout_seconds': settings.agentora_tool_timeout_seconds,
+            }
+
+
+tool_executor = ToolExecutor()
@@ -1,24 +1,274 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+import math
+import threading
+import zlib
+from datetime import datetime
+from typing import Any, Iterable, Iterator
 
+from sqlalchemy import event, func, insert
+from sqlalchemy.orm import Session as OrmSession
 from sqlmodel import Session, select
 
+from app.core.config import settings
 from app.models import RunTrace
+from app.services.runtime.run_events import STREAM_EVENT_TYPES, run_events
 
 
-def add_trace(session: Session, run_id: int, event_type: str, payload: dict[str, Any], agent_id: int = 0) -> None:
-    session.add(RunTrace(run_id=run_id, agent_id=agent_id, event_type=event_type, payload_json=json.dumps(payload)))
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30}
+
+# Per-step diagnostics: the bulk of a long run's trace rows.
+DEBUG_EVENTS = {
+    'memory_layer_query', 'context_admission', 'retrieval_score_breakdown', 'context_admission_reason',
+    'memory_conflict_admitted', 'duplicate_capsule_detected', 'memory_usefulness_update', 'memory_bookkeeping_flush',
+    'capability_profile', 'model_timing', 'tool_batch',
+}
+# Never sampled away, and kept at every level.
+WARNING_EVENTS = {
+    'warning', 'policy_blocked', 'verification_failed', 'handoff_rejected', 'handoff_escalated', 'subgoal_blocked',
+    'memory_conflict_detected', 'worker_breaker', 'worker_route_fallback', 'worker_fallback', 'action_worker_fallback',
+    'desktop_action_denied', 'approval_denied',
+}
+# Scalar fields longer than this are dropped when a payload is cut down to fit the size cap.
+_TRUNCATED_FIELD_CHARS = 256
+
 
+def event_level(event_type: str) -> str:
+    if event_type in WARNING_EVENTS:
+        return 'warning'
+    return 'debug' if event_type in DEBUG_EVENTS else 'info'
 
-def get_run_trace(session: Session, run_id: int) -> list[dict]:
-    rows = list(session.exec(select(RunTrace).where(RunTrace.run_id == run_id).order_by(RunTrace.id)))
-    out: list[dict] = []
-    for row in rows:
+
+def _parse_rates(spec: str) -> dict[str, float]:
+    rates: dict[str, float] = {}
+    for part in spec.split(','):
+        name, _, value = part.partition('=')
         try:
-            payload = json.loads(row.payload_json)
-        except Exception:
-            payload = {'raw': row.payload_json}
-        out.append({'id': row.id, 'run_id': row.run_id, 'agent_id': row.agent_id, 'event_type': row.event_type, 'payload': payload, 'created_at': row.created_at.isoformat()})
-    return out
+            rates[name.strip()] = max(0.0, min(1.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+class TraceWriter:
+    """Buffered writer behind :func:`add_trace`.
+
+    Events below ``AGENTORA_TRACE_LEVEL`` are dropped, and event types listed
+    in ``AGENTORA_TRACE_SAMPLE_RATES`` keep that fraction of their events
+    (every n-th, so the ratio is exact). Kept events are encoded as they are
+    recorded, so a caller reusing its payload dict cannot change the row, and
+    wait on the session to be bulk inserted in one statement when the session
+    commits or before the session reads its own trace; the run loop commits
+    at each step boundary, off the event loop. Once
+    ``AGENTORA_TRACE_BUFFER_EVENTS`` are pending the buffer is marked
+    :meth:`due` rather than written from whatever thread recorded the event.
+    A rollback discards them along with the rest of the transaction.
+
+    Payloads are stored as compact JSON; above ``AGENTORA_TRACE_COMPRESS_BYTES``
+    they go zlib-compressed into ``payload_blob``, and above
+    ``AGENTORA_TRACE_MAX_PAYLOAD_BYTES`` they keep only their short scalar
+    fields plus ``truncated`` and ``original_bytes``. A compressed row leaves
+    ``payload_json`` empty; read payloads through :func:`decode_payload`.
+    """
+
+    _KEY = '_agentora_trace_buffer'
+    _DUE = '_agentora_trace_due'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen: dict[str, int] = {}
+        self._rates_spec: str | None = None
+        self._rates: dict[str, float] = {}
+        self.recorded = 0
+        self.dropped_level = 0
+        self.sampled_out = 0
+        self.truncated = 0
+        self.compressed = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.discarded = 0
+        self.bytes_raw = 0
+        self.bytes_stored = 0
+
+    def _sample_rate(self, event_type: str) -> float:
+        spec = settings.agentora_trace_sample_rates
+        if spec != self._rates_spec:
+            self._rates, self._rates_spec = _parse_rates(spec), spec
+        return self._rates.get(event_type, 1.0)
+
+    def admits(self, event_type: str) -> bool:
+        """Level and sampling decision for one event; counts what it turns away."""
+        level = event_level(event_type)
+        with self._lock:
+            if LEVELS[level] < LEVELS.get(settings.agentora_trace_level.lower(), LEVELS['debug']):
+                self.dropped_level += 1
+                return False
+            if level == 'warning':
+                return True
+            rate = self._sample_rate(event_type)
+            if rate >= 1.0:
+                return True
+            seen = self._seen.get(event_type, 0) + 1
+            self._seen[event_type] = seen
+            if math.floor(seen * rate) > math.floor((seen - 1) * rate):
+                return True
+            self.sampled_out += 1
+            return False
+
+    def record(self, session: Session, run_id: int, event_type: str, payload: dict[str, Any], agent_id: int = 0) -> bool:
+        if not self.admits(event_type):
+            return False
+        if not session.in_transaction():
+            # Join the session's transaction the way session.add() would, so a rollback drops the event.
+            session.begin()
+        text, blob, size = self._encode(payload)
+        buffer = session.info.setdefault(self._KEY, [])
+        buffer.append((run_id, agent_id, event_type, text, blob, size, datetime.utcnow()))
+        with self._lock:
+            self.recorded += 1
+        if len(buffer) >= max(1, settings.agentora_trace_buffer_events):
+            session.info[self._DUE] = True
+        return True
+
+    def pending(self, session: Session) -> int:
+        return len(session.info.get(self._KEY) or ())
+
+    def due(self, session: Session) -> bool:
+        """Whether the buffer has reached ``AGENTORA_TRACE_BUFFER_EVENTS`` and its owner should commit or flush it."""
+        return bool(session.info.get(self._DUE))
+
+    def _encode(self, payload: Any) -> tuple[str, bytes | None, int]:
+        text = json.dumps(payload, separators=(',', ':'), default=str)
+        size = len(text)
+        if size > max(256, settings.agentora_trace_max_payload_bytes):
+            kept = {k: v for k, v in payload.items() if isinstance(v, (bool, int, float)) or (isinstance(v, str) and len(v) <= _TRUNCATED_FIELD_CHARS)} if isinstance(payload, dict) else {}
+            text = json.dumps({**kept, 'truncated': True, 'original_bytes': size}, separators=(',', ':'), default=str)
+            with self._lock:
+                self.truncated += 1
+        threshold = settings.agentora_trace_compress_bytes
+        if threshold > 0 and len(text) > threshold:
+            blob = zlib.compress(text.encode('utf-8'), 6)
+            if len(blob) < len(text):
+                with self._lock:
+                    self.compressed += 1
+                return '', blob, size
+        return text, None, size
+
+    def flush(self, session: Session) -> int:
+        """Bulk insert the session's buffered events; returns how many rows were written."""
+        session.info.pop(self._DUE, None)
+        buffer = session.info.pop(self._KEY, None)
+        if not buffer:
+            return 0
+        rows: list[dict[str, Any]] = []
+        raw = stored = 0
+        for run_id, agent_id, event_type, text, blob, size, created_at in buffer:
+            raw += size
+            stored += len(blob) if blob is not None else len(text)
+            rows.append({'run_id': run_id, 'agent_id': agent_id, 'event_type': event_type, 'payload_json': text, 'payload_blob': blob, 'created_at': created_at})
+        session.execute(insert(RunTrace), rows)
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(rows)
+            self.bytes_raw += raw
+            self.bytes_stored += stored
+        return len(rows)
+
+    def discard(self, session: Session) -> int:
+        session.info.pop(self._DUE, None)
+        buffer = session.info.pop(self._KEY, None) or []
+        with self._lock:
+            self.discarded += len(buffer)
+        return len(buffer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'level': settings.agentora_trace_level,
+                'sample_rates': _parse_rates(settings.agentora_trace_sample_rates),
+                'recorded': self.recorded,
+                'dropped_level': self.dropped_level,
+                'sampled_out': self.sampled_out,
+                'truncated': self.truncated,
+                'compressed': self.compressed,
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'rows_per_flush': round(self.rows_written / self.flushes, 2) if self.flushes else 0.0,
+                'discarded': self.discarded,
+                'bytes_raw': self.bytes_raw,
+                'bytes_stored': self.bytes_stored,
+            }
+
+
+trace_writer = TraceWriter()
+
+
+@event.listens_for(OrmSession, 'before_commit')
+def _flush_traces_on_commit(session):
+    trace_writer.flush(session)
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_traces_on_rollback(session):
+    trace_writer.discard(session)
+
+
+def add_trace(session: Session, run_id: int, event_type: str, payload: dict[str, Any], agent_id: int = 0) -> None:
+    if trace_writer.record(session, run_id, event_type, payload, agent_id=agent_id):
+        run_events.publish(run_id, STREAM_EVENT_TYPES.get(event_type, 'trace'), {'event_type': event_type, 'agent_id': agent_id, 'payload': payload})
+
+
+# Column-level selects keep trace reads out of the session's identity map.
+TRACE_COLUMNS = (RunTrace.id, RunTrace.run_id, RunTrace.agent_id, RunTrace.event_type, RunTrace.payload_json, RunTrace.payload_blob, RunTrace.created_at)
+
+
+def decode_payload(row: Any) -> Any:
+    """A trace row's payload, whether it was stored as JSON text or compressed."""
+    try:
+        if row.payload_blob is not None:
+            return json.loads(zlib.decompress(row.payload_blob))
+        return json.loads(row.payload_json)
+    except Exception:
+        return {'raw': row.payload_json}
+
+
+def _trace_item(row: Any) -> dict:
+    return {'id': row.id, 'run_id': row.run_id, 'agent_id': row.agent_id, 'event_type': row.event_type, 'payload': decode_payload(row), 'created_at': row.created_at.isoformat()}
+
+
+def run_trace_page(session: Session, run_id: int, event_types: Iterable[str] | None = None, after_id: int = 0, limit: int = 200) -> tuple[list[dict], int | None]:
+    """One page of a run's trace in id order after ``after_id``; also returns the cursor for the next page, None on the last."""
+    trace_writer.flush(session)
+    stmt = select(*TRACE_COLUMNS).where(RunTrace.run_id == run_id, RunTrace.id > after_id)
+    if event_types is not None:
+        wanted = sorted(set(event_types))
+        if not wanted:
+            return [], None
+        stmt = stmt.where(RunTrace.event_type == wanted[0] if len(wanted) == 1 else RunTrace.event_type.in_(wanted))
+    limit = max(1, limit)
+    rows = session.exec(stmt.order_by(RunTrace.id).limit(limit + 1)).all()
+    items = [_trace_item(row) for row in rows[:limit]]
+    return items, (items[-1]['id'] if len(rows) > limit else None)
+
+
+def iter_run_trace(session: Session, run_id: int, event_types: Iterable[str] | None = None, after_id: int = 0, batch_size: int = 500) -> Iterator[dict]:
+    """Walk a run's trace page by page, so only one batch of decoded events is held at a time."""
+    types = None if event_types is None else list(event_types)
+    cursor: int | None = after_id
+    while cursor is not None:
+        page, cursor = run_trace_page(session, run_id, types, after_id=cursor, limit=batch_size)
+        yield from page
+
+
+def count_run_events(session: Session, run_id: int, event_types: Iterable[str] | None = None) -> dict[str, int]:
+    """Events per type for a run, counted in SQL without decoding payloads."""
+    trace_writer.flush(session)
+    stmt = select(RunTrace.event_type, func.count()).where(RunTrace.run_id == run_id)
+    if event_types is not None:
+        stmt = stmt.where(RunTrace.event_type.in_(sorted(set(event_types))))
+    return {event_type: count for event_type, count in session.exec(stmt.group_by(RunTrace.event_type)).all()}
+
+
+def get_run_trace(session: Session, run_id: int, event_types: Iterable[str] | None = None) -> list[dict]:
+    return list(iter_run_trace(session, run_id, event_types))
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from app.models import CapsuleEmbedding
+
+
+VECTOR_DTYPE = np.float32
+
+
+def normalize_vector(vec: Sequence[float] | np.ndarray) -> np.ndarray:
+    arr = np.asarray(vec, dtype=VECTOR_DTYPE).reshape(-1)
+    norm = float(np.linalg.norm(arr)) if arr.size else 0.0
+    if norm == 0.0 or not np.isfinite(norm):
+        return np.zeros(arr.shape, dtype=VECTOR_DTYPE)
+    return arr / norm
+
+
+def pack_vector(vec: Sequence[float] | np.ndarray) -> bytes:
+    return normalize_vector(vec).tobytes()
+
+
+def unpack_vector(blob: bytes | None) -> np.ndarray:
+    if not blob:
+        return np.zeros(0, dtype=VECTOR_DTYPE)
+    return np.frombuffer(blob, dtype=VECTOR_DTYPE)
+
+
+def embedding_vector(emb: CapsuleEmbedding) -> np.ndarray:
+    """Return the unit-normalized float32 vector for an embedding row.
+
+    Rows written before the binary store existed only carry ``vector_json``;
+    those are decoded and normalized on the fly until the migration packs them.
+    """
+    if emb.vector_blob:
+        return unpack_vector(emb.vector_blob)
+    try:
+        raw = json.loads(emb.vector_json or '[]')
+    except Exception:
+        raw = []
+    return normalize_vector(raw)
+
+
+def build_embedding(capsule_id: int, vec: Sequence[float]) -> CapsuleEmbedding:
+    packed = normalize_vector(vec)
+    return CapsuleEmbedding(capsule_id=capsule_id, vector_json='[]', vector_blob=packed.tobytes(), vector_dim=int(packed.size))
+
+
+def stack_vectors(vectors: Iterable[np.ndarray], dim: int) -> np.ndarray:
+    rows = list(vectors)
+    if not rows:
+        return np.zeros((0, dim), dtype=VECTOR_DTYPE)
+    return np.vstack(rows).astype(VECTOR_DTYPE, copy=False)
+
+
+def cosine_scores(query_vector: Sequence[float] | np.ndarray, vectors: list[np.ndarray]) -> np.ndarray:
+    """Cosine similarity of one query against many pre-normalized vectors.
+
+    Rows sharing the query dimension are scored with a single matrix-vector
+    product. Mismatched rows keep the legacy semantics of truncating both sides
+    to the shorter length before comparing.
+    """
+    out = np.zeros(len(vectors), dtype=VECTOR_DTYPE)
+    q = np.asarray(query_vector, dtype=VECTOR_DTYPE).reshape(-1)
+    if not vectors or q.size == 0:
+        return out
+    qn = normalize_vector(q)
+    same = [i for i, v in enumerate(vectors) if v.size == q.size]
+    if same:
+        out[same] = stack_vectors((vectors[i] for i in same), q.size) @ qn
+    for i, v in enumerate(vectors):
+        if v.size == q.size or v.size == 0:
+            continue
+        n = min(v.size, q.size)
+        out[i] = float(normalize_vector(v[:n]) @ normalize_vector(q[:n]))
+    return out
+
+
+def cosine_scores_many(query_vectors: Sequence[Sequence[float] | np.ndarray], vectors: list[np.ndarray]) -> np.ndarray:
+    """Cosine similarity of several queries against many pre-normalized vectors, shaped (queries, vectors).
+
+    Queries sharing a dimension are scored together with one matrix product;
+    rows of another dimension fall back to :func:`cosine_scores` semantics.
+    """
+    out = np.zeros((len(query_vectors), len(vectors)), dtype=VECTOR_DTYPE)
+    if not vectors:
+        return out
+    queries = [np.asarray(q, dtype=VECTOR_DTYPE).reshape(-1) for q in query_vectors]
+    by_dim: dict[int, list[int]] = {}
+    for i, q in enumerate(queries):
+        if q.size:
+            by_dim.setdefault(q.size, []).append(i)
+    for dim, rows in by_dim.items():
+        same = [j for j, v in enumerate(vectors) if v.size == dim]
+        if same:
+            block = np.vstack([normalize_vector(queries[i]) for i in rows])
+            out[np.ix_(rows, same)] = (stack_vectors((vectors[j] for j in same), dim) @ block.T).T
+        other = [j for j, v in enumerate(vectors) if v.size != dim]
+        if other:
+            for i in rows:
+                out[i, other] = cosine_scores(queries[i], [vectors[j] for j in other])
+    return out
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    if scores.size == 0 or k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= scores.size:
+        return np.argsort(-scores, kind='stable')
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind='stable')]
+
+
+def top_k_cosine(query_vector: Sequence[float] | np.ndarray, ids: list[int], vectors: list[np.ndarray], k: int) -> list[tuple[int, float]]:
+    scores = cosine_scores(query_vector, vectors)
+    return [(ids[i], float(scores[i])) for i in top_k_indices(scores, k)]
@@ -2,14 +2,19 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 import json
+import random
+import threading
+import time
 from typing import Any
+import uuid
 
-import requests
+from sqlalchemy import func, or_, update
 from sqlmodel import Session, select
 
 from app.core.config import settings
 from app.models import WorkerNode, WorkerJob
 from app.services.runtime.trace import add_trace
+from app.services.runtime.worker_registry import WorkerRegistry
 
 
 TASK_CAPABILITY = {
@@ -33,14 +38,78 @@ TASK_CAPABILITY = {
     'workflow_run': 'workflow_run',
 }
 
-
 HEAVY_TASKS = {
     'embed_batch', 'capsule_ingest', 'summary_generation', 'archive_compaction', 'edge_recompute',
     'memory_maintenance', 'maintenance', 'large_attachment_processing', 'browser_action', 'workflow_run',
 }
 
+# Only these may run twice at once when hedged: re-embedding or re-fetching has no side effects.
+HEDGEABLE_TASKS = frozenset({'embed_batch', 'web_fetch'})
+
+TERMINAL_STATUSES = {'done', 'failed', 'fallback_local', 'cancelled'}
+
+
+def _elapsed_ms(started: datetime | None, now: datetime) -> float:
+    return max(0.0, (now - started).total_seconds() * 1000.0) if started else 0.0
+
+
+def _backoff_seconds(retries: int) -> float:
+    """Full-jitter exponential backoff before retry number ``retries + 1``."""
+    ceiling = min(settings.agentora_worker_retry_backoff_max_seconds, settings.agentora_worker_retry_backoff_seconds * (2 ** retries))
+    return random.uniform(0.0, max(0.0, ceiling))
+
+
+def _job_types_for(capabilities: set[str]) -> list[str]:
+    """Job types a worker with these capabilities can run; an unmapped type needs a capability of its own name."""
+    types = {job_type for job_type, capability in TASK_CAPABILITY.items() if capability in capabilities}
+    return sorted(types | {c for c in capabilities if c not in TASK_CAPABILITY})
+
+
+def _run_id(payload_json: str | None) -> int:
+    try:
+        return int(json.loads(payload_json or '{}').get('run_id', 0) or 0)
+    except Exception:
+        return 0
+
 
 class WorkerQueue:
+    """Durable job queue on the ``WorkerJob`` table.
+
+    Workers pull: they claim queued jobs matching their capabilities under a
+    time-limited lease, extend it with heartbeats while working and report the
+    result. A lease that runs out puts the job back in the queue. Every state
+    change is a conditional update on status and lease token, so a late or
+    duplicate report from a worker that lost its lease is rejected.
+
+    Dispatch routes each job to the node with the best expected completion
+    time in the in-memory :class:`WorkerRegistry`; that node gets the first
+    claim on it for ``AGENTORA_WORKER_AFFINITY_SECONDS``, after which any
+    eligible node may take it. A job no worker claims within
+    ``AGENTORA_WORKER_QUEUED_TTL_SECONDS`` is failed as ``unclaimed``.
+
+    Failed and expired jobs are retried after a jittered exponential backoff,
+    preferring a different node. With ``AGENTORA_WORKER_HEDGE_ENABLED`` a
+    job still running past the fleet's latency percentile for its type gets a
+    duplicate queued for a second node; whichever reports first wins and the
+    other is cancelled. Only the idempotent types in ``HEDGEABLE_TASKS`` are
+    hedged.
+    """
+
+    def __init__(self):
+        self.nodes = WorkerRegistry()
+        self._lock = threading.Lock()
+        self._waiters: dict[int, threading.Event] = {}
+        self.enqueued = 0
+        self.claimed = 0
+        self.completed = 0
+        self.requeued = 0
+        self.failed = 0
+        self.expired = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.cancelled = 0
+        self.unclaimed = 0
+
     def register(self, session: Session, name: str, url: str, capabilities: list[str]) -> WorkerNode:
         existing = session.exec(select(WorkerNode).where(WorkerNode.url == url)).first()
         if existing:
@@ -51,11 +120,13 @@ class WorkerQueue:
             session.add(existing)
             session.commit()
             session.refresh(existing)
+            self._registry(session).upsert(existing)
             return existing
         node = WorkerNode(name=name, url=url, capabilities_json=json.dumps(capabilities), status='idle', last_seen_at=datetime.utcnow())
         session.add(node)
         session.commit()
         session.refresh(node)
+        self._registry(session).upsert(node)
         return node
 
     def heartbeat(self, session: Session, worker_id: int, status: str = 'idle') -> WorkerNode | None:
@@ -67,6 +138,7 @@ class WorkerQueue:
         session.add(node)
         session.commit()
         session.refresh(node)
+        self._registry(session).upsert(node)
         return node
 
     def list_nodes(self, session: Session) -> list[WorkerNode]:
@@ -77,23 +149,17 @@ class WorkerQueue:
                 node.status = 'offline'
         return rows
 
-    def _parse_caps(self, node: WorkerNode) -> set[str]:
-        try:
-            return set(json.loads(node.capabilities_json or '[]'))
-        except Exception:
-            return set()
-
-    def _eligible_workers(self, session: Session, job_type: str) -> list[WorkerNode]:
-        needed = TASK_CAPABILITY.get(job_type, job_type)
-        workers = [w for w in self.list_nodes(session) if w.status in {'idle', 'busy'}]
-        return [w for w in workers if needed in self._parse_caps(w)]
+    def _registry(self, session: Session) -> WorkerRegistry:
+        self.nodes.ensure_loaded(session, HEAVY_TASKS)
+        return self.nodes
 
-    def _create_job(self, session: Session, job_type: str, payload: dict[str, Any], priority: int) -> WorkerJob:
+    def _create_job(self, session: Session, job_type: str, payload: dict[str, Any], priority: int, status: str = 'queued', worker_node_id: int | None = None) -> WorkerJob:
         job = WorkerJob(
             job_type=job_type,
             payload_json=json.dumps(payload),
             priority=max(1, min(10, priority)),
-            status='queued',
+            status=status,
+            worker_node_id=worker_node_id,
             max_retries=settings.agentora_max_worker_retries,
             retries=0,
             updated_at=datetime.utcnow(),
@@ -103,98 +169,455 @@ class WorkerQueue:
         session.refresh(job)
         return job
 
-    def _score_worker(self, node: WorkerNode, job_type: str) -> float:
-        caps = self._parse_caps(node)
-        capability_bonus = 1.0 if TASK_CAPABILITY.get(job_type, job_type) in caps else 0.0
-        load_penalty = 0.4 if node.status == 'busy' else 0.0
-        heavy_bonus = 0.3 if job_type in HEAVY_TASKS and 'maintenance' in ','.join(caps) else 0.0
-        return capability_bonus + heavy_bonus - load_penalty
+    def _fallback(self, session: Session, job_type: str, payload: dict, priority: int, run_id: int, reason: str, event: str = 'worker_route_fallback') -> WorkerJob:
+        if run_id:
+            add_trace(session, run_id, event, {'job_type': job_type, 'reason': reason}, agent_id=0)
+        job = self._create_job(session, job_type, payload, priority, status='fallback_local')
+        job.used_fallback_local = True
+        job.result_json = json.dumps({'mode': 'local', 'reason': reason})
+        job.finished_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+        return job
 
-    def dispatch(self, session: Session, job_type: str, payload: dict, priority: int = 5) -> WorkerJob:
-        job = self._create_job(session, job_type=job_type, payload=payload, priority=priority)
-        run_id = int(payload.get('run_id', 0) or 0)
-        urls = [u.strip() for u in settings.agentora_worker_urls.split(',') if u.strip()]
-        candidates = self._eligible_workers(session, job_type)
-        if not candidates and urls:
-            candidates = [WorkerNode(id=None, name='env-worker', url=u, capabilities_json='[]', status='idle') for u in urls]
+    def dispatch(self, session: Session, job_type: str, payload: dict, priority: int = 5, wait: bool = True) -> WorkerJob:
+        """Queue a job for workers to claim.
 
+        With ``wait`` the call blocks until a worker reports back, for at most
+        ``AGENTORA_WORKER_WAIT_SECONDS``; a job that failed or never finished,
+        or that no live node could claim, comes back as ``fallback_local`` for
+        the caller to run itself. Without it the queued job is returned at once.
+        """
+        run_id = int(payload.get('run_id', 0) or 0)
         if job_type in {'interactive_chat', 'tool_planning'} and priority >= 5:
             # keep interactive work local unless explicit worker-capable candidates are idle and stronger
-            if run_id:
-                add_trace(session, run_id, 'worker_route_rejected', {'job_type': job_type, 'reason': 'interactive_local_priority'}, agent_id=0)
-                session.commit()
-            job.status = 'fallback_local'
-            job.used_fallback_local = True
-            job.result_json = json.dumps({'mode': 'local', 'reason': 'interactive_local_priority'})
-            job.updated_at = datetime.utcnow()
-            session.add(job)
+            return self._fallback(session, job_type, payload, priority, run_id, 'interactive_local_priority', event='worker_route_rejected')
+        heavy = job_type in HEAVY_TASKS
+        picked = self._registry(session).pick(TASK_CAPABILITY.get(job_type, job_type), job_type, heavy)
+        # No live node can claim it: a waiting caller runs it now rather than sitting out the wait. Without
+        # ``wait`` it may still queue for workers listed in AGENTORA_WORKER_URLS that have yet to register.
+        if picked is None and (wait or not settings.agentora_worker_urls.strip()):
+            return self._fallback(session, job_type, payload, priority, run_id, 'no_worker_available')
+
+        node, expected_ms = picked if picked is not None else (None, 0.0)
+        job = self._create_job(session, job_type, payload, priority, worker_node_id=node.id if node else None)
+        self.nodes.assign(job.worker_node_id, heavy, +1)
+        with self._lock:
+            self.enqueued += 1
+        if run_id:
+            route = {'job_type': job_type, 'job_id': job.id, 'wait': wait, 'heavy': heavy}
+            if node is not None:
+                route.update(worker=node.name, worker_id=node.id, expected_ms=round(expected_ms, 3))
+            add_trace(session, run_id, 'worker_route_selected', route, agent_id=0)
             session.commit()
+        if not wait:
             return job
+        return self.wait(session, job, settings.agentora_worker_wait_seconds)
 
-        if not candidates:
-            if run_id:
-                add_trace(session, run_id, 'worker_route_fallback', {'job_type': job_type, 'reason': 'no_worker_available'}, agent_id=0)
-                session.commit()
-            job.status = 'fallback_local'
-            job.used_fallback_local = True
-            job.result_json = json.dumps({'mode': 'local', 'reason': 'no_worker_available'})
-            job.updated_at = datetime.utcnow()
-            session.add(job)
+    def wait(self, session: Session, job: WorkerJob, timeout: float) -> WorkerJob:
+        """Block until the job finishes or ``timeout`` passes; anything short of ``done`` is settled as ``fallback_local``."""
+        with self._lock:
+            event = self._waiters.setdefault(job.id, threading.Event())
+        deadline = time.monotonic() + max(0.0, timeout)
+        try:
+            while True:
+                session.refresh(job)
+                if job.status in TERMINAL_STATUSES:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Clearing the lease makes a late report from the worker bounce.
+                    if self._settle(session, job, {'queued', 'leased'}, 'worker_timeout'):
+                        break
+                    continue
+                # Completions in this process set the event; the timed wait also catches expiries and other writers.
+                event.wait(min(remaining, 0.5))
+                event.clear()
+        finally:
+            with self._lock:
+                self._waiters.pop(job.id, None)
+        if job.status == 'failed':
+            self._settle(session, job, {'failed'}, job.error or 'worker_failed')
+        run_id = int(json.loads(job.payload_json or '{}').get('run_id', 0) or 0)
+        if job.status == 'fallback_local' and run_id:
+            add_trace(session, run_id, 'worker_route_fallback', {'job_type': job.job_type, 'job_id': job.id, 'reason': job.error or 'worker_failed'}, agent_id=0)
             session.commit()
-            return job
+        return job
 
-        ranked = sorted(candidates, key=lambda n: self._score_worker(n, job_type), reverse=True)
-        node = ranked[0]
+    def _settle(self, session: Session, job: WorkerJob, expected: set[str], reason: str) -> bool:
+        now = datetime.utcnow()
+        prior_status, node_id, claimed_at = job.status, job.worker_node_id, job.claimed_at
+        changed = session.execute(
+            update(WorkerJob)
+            .where(WorkerJob.id == job.id, WorkerJob.status.in_(expected))
+            .values(
+                status='fallback_local',
+                used_fallback_local=True,
+                error=reason,
+                result_json=json.dumps({'mode': 'local', 'reason': reason}),
+                lease_token='',
+                lease_expires_at=None,
+                finished_at=now,
+                updated_at=now,
+            )
+        ).rowcount
+        session.commit()
+        session.refresh(job)
+        if changed:
+            heavy = job.job_type in HEAVY_TASKS
+            if prior_status == 'queued':
+                self.nodes.assign(node_id, heavy, -1)
+            elif prior_status == 'leased':
+                # The node held the job past the caller's patience: count it as a failure.
+                self._finished(session, node_id, job.job_type, _elapsed_ms(claimed_at, now), False, _run_id(job.payload_json), reason)
+            self._cancel_hedges(session, job.id)
+            session.commit()
+        return bool(changed)
+
+    def _finished(self, session: Session, node_id: int | None, job_type: str, elapsed_ms: float, ok: bool, run_id: int, reason: str = '') -> None:
+        """Feed a job outcome to the registry and trace any breaker transition it caused on the job's run."""
+        transition = self.nodes.finished(node_id, job_type, job_type in HEAVY_TASKS, elapsed_ms, ok, reason=reason)
+        if transition and run_id:
+            add_trace(session, run_id, 'worker_breaker', transition, agent_id=0)
+
+    def _retry_values(self, session: Session, job_id: int, job_type: str, retries: int, failed_node: int | None, run_id: int, reason: str, now: datetime) -> dict[str, Any]:
+        """Columns for putting a job back in the queue: backoff, and a preferred node other than the one that failed it."""
+        delay = _backoff_seconds(retries)
+        picked = self.nodes.pick(TASK_CAPABILITY.get(job_type, job_type), job_type, job_type in HEAVY_TASKS, exclude=frozenset({failed_node}) if failed_node else frozenset())
+        next_node = picked[0].id if picked else None
         if run_id:
-            add_trace(session, run_id, 'worker_route_selected', {'job_type': job_type, 'worker': node.name, 'worker_url': node.url, 'score': self._score_worker(node, job_type)}, agent_id=0)
+            add_trace(session, run_id, 'worker_retry_scheduled', {
+                'job_id': job_id, 'job_type': job_type, 'retry': retries + 1, 'backoff_ms': round(delay * 1000.0, 3),
+                'failed_worker_id': failed_node, 'next_worker_id': next_node, 'reason': reason,
+            }, agent_id=0)
+        return {'status': 'queued', 'retries': retries + 1, 'available_at': now + timedelta(seconds=delay), 'worker_node_id': next_node}
+
+    def _cancel_hedges(self, session: Session, job_id: int) -> int:
+        """Cancel unfinished hedges of a job that has already been decided; their late reports will bounce."""
+        hedges = session.exec(
+            select(WorkerJob.id, WorkerJob.status, WorkerJob.worker_node_id, WorkerJob.job_type)
+            .where(WorkerJob.hedge_of == job_id, WorkerJob.status.in_(['queued', 'leased']))
+        ).all()
+        now = datetime.utcnow()
+        cancelled = 0
+        for hedge_id, status, node_id, job_type in hedges:
+            changed = session.execute(
+                update(WorkerJob)
+                .where(WorkerJob.id == hedge_id, WorkerJob.status == status)
+                .values(status='cancelled', error='hedge_lost', lease_token='', lease_expires_at=None, finished_at=now, updated_at=now)
+            ).rowcount
+            if not changed:
+                continue
+            cancelled += 1
+            if status == 'queued':
+                self.nodes.assign(node_id, job_type in HEAVY_TASKS, -1)
+            else:
+                self.nodes.release(node_id, job_type in HEAVY_TASKS)
+        with self._lock:
+            self.cancelled += cancelled
+        return cancelled
+
+    def _hedge_stragglers(self, session: Session, now: datetime) -> int:
+        """Queue a duplicate of each leased job running past the latency percentile, preferred for a different node."""
+        leased = session.exec(
+            select(WorkerJob.id, WorkerJob.job_type, WorkerJob.worker_node_id, WorkerJob.claimed_at, WorkerJob.priority, WorkerJob.payload_json)
+            .where(WorkerJob.status == 'leased', WorkerJob.job_type.in_(HEDGEABLE_TASKS), WorkerJob.hedge_of == None, WorkerJob.hedged == False)  # noqa: E711,E712
+            .limit(50)
+        ).all()
+        hedged = 0
+        for job_id, job_type, node_id, claimed_at, priority, payload_json in leased:
+            threshold = self.nodes.latency_percentile(job_type, settings.agentora_worker_hedge_percentile)
+            if threshold is None or _elapsed_ms(claimed_at, now) < threshold:
+                continue
+            heavy = job_type in HEAVY_TASKS
+            picked = self.nodes.pick(TASK_CAPABILITY.get(job_type, job_type), job_type, heavy, exclude=frozenset({node_id}))
+            if picked is None:
+                continue
+            marked = session.execute(
+                update(WorkerJob).where(WorkerJob.id == job_id, WorkerJob.status == 'leased', WorkerJob.hedged == False).values(hedged=True)  # noqa: E712
+            ).rowcount
+            if not marked:
+                continue
+            node, expected_ms = picked
+            hedge = WorkerJob(
+                job_type=job_type, payload_json=payload_json, priority=priority, status='queued', worker_node_id=node.id,
+                max_retries=0, retries=0, hedge_of=job_id, created_at=now, updated_at=now,
+            )
+            session.add(hedge)
+            session.flush()
+            self.nodes.assign(node.id, heavy, +1)
+            hedged += 1
+            run_id = _run_id(payload_json)
+            if run_id:
+                add_trace(session, run_id, 'worker_hedge_started', {
+                    'job_id': job_id, 'hedge_job_id': hedge.id, 'job_type': job_type, 'threshold_ms': round(threshold, 3),
+                    'worker_id': node_id, 'hedge_worker_id': node.id, 'hedge_worker': node.name, 'expected_ms': round(expected_ms, 3),
+                }, agent_id=0)
+        if hedged:
             session.commit()
+            with self._lock:
+                self.hedges += hedged
+        return hedged
+
+    def _wake(self, job_id: int) -> None:
+        with self._lock:
+            event = self._waiters.get(job_id)
+        if event is not None:
+            event.set()
 
-        timeout = 12
-        for attempt in range(settings.agentora_max_worker_retries + 1):
-            job.retries = attempt
-            job.status = 'running'
-            job.worker_node_id = node.id
-            job.updated_at = datetime.utcnow()
-            session.add(job)
+    def claim(self, session: Session, worker_id: int, capabilities: list[str] | None = None, max_jobs: int = 1, lease_seconds: float | None = None) -> list[WorkerJob] | None:
+        """Lease up to ``max_jobs`` queued jobs the worker can run, lowest priority value first; None for an unknown worker."""
+        node = session.get(WorkerNode, worker_id)
+        if not node:
+            return None
+        registry = self._registry(session)
+        self.requeue_expired(session)
+        self.expire_unclaimed(session)
+        now = datetime.utcnow()
+        if settings.agentora_worker_hedge_enabled:
+            self._hedge_stragglers(session, now)
+        if not registry.admits(worker_id):
+            # Its breaker is open, or half-open with its probes out: it keeps polling and gets work once that changes.
+            node.last_seen_at = now
+            session.add(node)
             session.commit()
-            try:
-                r = requests.post(
-                    f'{node.url.rstrip("/")}/api/worker/execute',
-                    json={'job_id': job.id, 'type': job_type, 'payload': payload, 'priority': priority},
-                    timeout=timeout,
-                )
-                if r.ok:
-                    job.status = 'done'
-                    job.result_json = r.text[:8000]
-                    job.updated_at = datetime.utcnow()
-                    session.add(job)
-                    if node.id:
-                        db_node = session.get(WorkerNode, node.id)
-                        if db_node:
-                            db_node.status = 'idle'
-                            db_node.last_seen_at = datetime.utcnow()
-                            session.add(db_node)
-                    session.commit()
-                    return job
-                job.error = f'http {r.status_code}'
-            except requests.Timeout:
-                job.error = 'worker_timeout'
-            except Exception as exc:
-                job.error = str(exc)
-            job.updated_at = datetime.utcnow()
-            session.add(job)
+            registry.touch(worker_id, node.status, now)
+            return []
+        caps = set(capabilities) if capabilities is not None else set(json.loads(node.capabilities_json or '[]'))
+        lease = float(lease_seconds or settings.agentora_worker_lease_seconds)
+        max_jobs = max(1, max_jobs)
+        affinity_cutoff = now - timedelta(seconds=settings.agentora_worker_affinity_seconds)
+        # Filtered in SQL so jobs this worker cannot run never take up the scan window.
+        queued = session.exec(
+            select(WorkerJob.id, WorkerJob.job_type, WorkerJob.worker_node_id, WorkerJob.created_at, WorkerJob.available_at, WorkerJob.hedge_of)
+            .where(
+                WorkerJob.status == 'queued',
+                WorkerJob.job_type.in_(_job_types_for(caps)),
+                or_(WorkerJob.available_at == None, WorkerJob.available_at <= now),  # noqa: E711
+            )
+            .order_by(WorkerJob.priority, WorkerJob.created_at)
+            .limit(max_jobs * 20)
+        ).all()
+        claimed: list[int] = []
+        for job_id, job_type, preferred, created_at, available_at, hedge_of in queued:
+            # A retry's affinity window starts when its backoff ends.
+            if preferred not in (None, worker_id) and (available_at or created_at) > affinity_cutoff and registry.routable(preferred):
+                continue
+            if hedge_of is not None:
+                original = session.get(WorkerJob, hedge_of)
+                if original is not None and original.worker_node_id == worker_id:
+                    continue
+            if not registry.admits(worker_id):
+                break
+            # Only one of two racing workers moves the job out of 'queued'.
+            taken = session.execute(
+                update(WorkerJob)
+                .where(WorkerJob.id == job_id, WorkerJob.status == 'queued')
+                .values(status='leased', lease_token=uuid.uuid4().hex, lease_expires_at=now + timedelta(seconds=lease), worker_node_id=worker_id, claimed_at=now, updated_at=now)
+            ).rowcount
+            if taken:
+                heavy = job_type in HEAVY_TASKS
+                registry.assign(preferred, heavy, -1)
+                registry.started(worker_id, heavy)
+                claimed.append(job_id)
+                if len(claimed) >= max_jobs:
+                    break
+        node.status = 'busy' if claimed else 'idle'
+        node.last_seen_at = now
+        session.add(node)
+        session.commit()
+        registry.touch(worker_id, node.status, now)
+        with self._lock:
+            self.claimed += len(claimed)
+        jobs = [session.get(WorkerJob, job_id) for job_id in claimed]
+        for job in jobs:
+            session.refresh(job)
+        return jobs
+
+    def extend_lease(self, session: Session, job_id: int, lease_token: str, lease_seconds: float | None = None) -> datetime | None:
+        """Heartbeat from the worker running a job; None when its lease is gone (expired, re-queued or settled)."""
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=float(lease_seconds or settings.agentora_worker_lease_seconds))
+        changed = session.execute(
+            update(WorkerJob)
+            .where(WorkerJob.id == job_id, WorkerJob.status == 'leased', WorkerJob.lease_token == lease_token)
+            .values(lease_expires_at=expires, updated_at=now)
+        ).rowcount
+        session.commit()
+        return expires if changed else None
+
+    def complete(self, session: Session, job_id: int, lease_token: str, ok: bool, result: dict | None = None, error: str = '') -> WorkerJob | None:
+        """Record a worker's report. Failures are re-queued until ``max_retries``; None when the lease is gone."""
+        job = session.get(WorkerJob, job_id)
+        if not job or job.status != 'leased' or job.lease_token != lease_token:
+            return None
+        now = datetime.utcnow()
+        run_id = _run_id(job.payload_json)
+        # The conditional update below also refreshes ``job``; keep who ran it.
+        ran_on, claimed_at = job.worker_node_id, job.claimed_at
+        values: dict[str, Any] = {'lease_token': '', 'lease_expires_at': None, 'updated_at': now}
+        if ok:
+            values.update(status='done', result_json=json.dumps(result or {}), error='', finished_at=now)
+        elif job.retries < job.max_retries:
+            values.update(self._retry_values(session, job_id, job.job_type, job.retries, job.worker_node_id, run_id, error or 'worker_failed', now), error=error or 'worker_failed')
+        else:
+            values.update(status='failed', result_json=json.dumps(result or {}), error=error or 'worker_failed', finished_at=now)
+        changed = session.execute(
+            update(WorkerJob).where(WorkerJob.id == job_id, WorkerJob.status == 'leased', WorkerJob.lease_token == lease_token).values(**values)
+        ).rowcount
+        if not changed:
+            # Drop the retry trace staged for a report that lost the race.
+            session.rollback()
+            return None
+        node = session.get(WorkerNode, ran_on) if ran_on else None
+        if node:
+            node.status = 'idle'
+            node.last_seen_at = now
+            session.add(node)
+        self._finished(session, ran_on, job.job_type, _elapsed_ms(claimed_at, now), ok, run_id, '' if ok else (error or 'worker_failed'))
+        session.commit()
+        session.refresh(job)
+        if values['status'] == 'queued':
+            self.nodes.assign(job.worker_node_id, job.job_type in HEAVY_TASKS, +1)
+        if values['status'] in {'done', 'failed'}:
+            if job.hedge_of is None:
+                self._cancel_hedges(session, job.id)
+            elif ok:
+                self._hedge_won(session, job, now)
             session.commit()
+        with self._lock:
+            if job.status == 'done':
+                self.completed += 1
+            elif job.status == 'queued':
+                self.requeued += 1
+            else:
+                self.failed += 1
+        self._wake(job_id)
+        return job
 
+    def _hedge_won(self, session: Session, hedge: WorkerJob, now: datetime) -> None:
+        """The hedge answered first: finish the original with its result so the original's worker report bounces."""
+        original = session.get(WorkerJob, hedge.hedge_of)
+        if original is None:
+            return
+        session.refresh(original)
+        prior_status, prior_node = original.status, original.worker_node_id
+        changed = session.execute(
+            update(WorkerJob)
+            .where(WorkerJob.id == original.id, WorkerJob.status == prior_status, WorkerJob.status.in_(['queued', 'leased']))
+            .values(status='done', result_json=hedge.result_json, error='', worker_node_id=hedge.worker_node_id, lease_token='', lease_expires_at=None, finished_at=now, updated_at=now)
+        ).rowcount
+        if not changed:
+            return
+        heavy = original.job_type in HEAVY_TASKS
+        if prior_status == 'leased':
+            self.nodes.release(prior_node, heavy)
+        else:
+            self.nodes.assign(prior_node, heavy, -1)
+        run_id = _run_id(original.payload_json)
         if run_id:
-            add_trace(session, run_id, 'worker_route_fallback', {'job_type': job_type, 'reason': job.error or 'worker_failed'}, agent_id=0)
+            add_trace(session, run_id, 'worker_hedge_won', {'job_id': original.id, 'hedge_job_id': hedge.id, 'job_type': original.job_type, 'worker_id': hedge.worker_node_id, 'slow_worker_id': prior_node}, agent_id=0)
+        with self._lock:
+            self.hedge_wins += 1
+        self._wake(original.id)
+
+    def requeue_expired(self, session: Session) -> int:
+        """Put jobs whose lease ran out back in the queue, or fail them once their retries are spent."""
+        now = datetime.utcnow()
+        expired = session.exec(
+            select(WorkerJob.id, WorkerJob.lease_token, WorkerJob.retries, WorkerJob.max_retries, WorkerJob.worker_node_id, WorkerJob.job_type, WorkerJob.claimed_at, WorkerJob.payload_json, WorkerJob.hedge_of)
+            .where(WorkerJob.status == 'leased', WorkerJob.lease_expires_at < now)
+        ).all()
+        requeued: list[int] = []
+        failed: list[int] = []
+        for job_id, token, retries, max_retries, node_id, job_type, claimed_at, payload_json, hedge_of in expired:
+            run_id = _run_id(payload_json)
+            values: dict[str, Any] = {'lease_token': '', 'lease_expires_at': None, 'error': 'lease_expired', 'updated_at': now}
+            if retries < max_retries:
+                values.update(self._retry_values(session, job_id, job_type, retries, node_id, run_id, 'lease_expired', now))
+            else:
+                values.update(status='failed', finished_at=now)
+            changed = session.execute(
+                update(WorkerJob).where(WorkerJob.id == job_id, WorkerJob.status == 'leased', WorkerJob.lease_token == token).values(**values)
+            ).rowcount
+            if not changed:
+                continue
+            # A silent node is a failing node as far as routing is concerned.
+            self._finished(session, node_id, job_type, _elapsed_ms(claimed_at, now), False, run_id, 'lease_expired')
+            if values['status'] == 'queued':
+                self.nodes.assign(values['worker_node_id'], job_type in HEAVY_TASKS, +1)
+                requeued.append(job_id)
+            else:
+                if hedge_of is None:
+                    self._cancel_hedges(session, job_id)
+                failed.append(job_id)
+        if expired:
             session.commit()
-        job.status = 'fallback_local'
-        job.used_fallback_local = True
-        job.result_json = json.dumps({'mode': 'local', 'reason': job.error or 'worker_failed'})
-        job.updated_at = datetime.utcnow()
-        session.add(job)
-        session.commit()
-        return job
+        with self._lock:
+            self.expired += len(requeued) + len(failed)
+            self.requeued += len(requeued)
+            self.failed += len(failed)
+        for job_id in failed:
+            self._wake(job_id)
+        return len(requeued) + len(failed)
+
+    def expire_unclaimed(self, session: Session) -> int:
+        """Fail queued jobs nobody claimed within ``AGENTORA_WORKER_QUEUED_TTL_SECONDS``, such as a type no registered worker runs."""
+        ttl = settings.agentora_worker_queued_ttl_seconds
+        if ttl <= 0:
+            return 0
+        now = datetime.utcnow()
+        # A retry has been claimable only since its backoff ended.
+        stale = session.exec(
+            select(WorkerJob.id, WorkerJob.job_type, WorkerJob.worker_node_id, WorkerJob.payload_json)
+            .where(WorkerJob.status == 'queued', func.coalesce(WorkerJob.available_at, WorkerJob.created_at) < now - timedelta(seconds=ttl))
+            .limit(100)
+        ).all()
+        expired: list[int] = []
+        for job_id, job_type, node_id, payload_json in stale:
+            changed = session.execute(
+                update(WorkerJob)
+                .where(WorkerJob.id == job_id, WorkerJob.status == 'queued')
+                .values(status='failed', error='unclaimed', finished_at=now, updated_at=now)
+            ).rowcount
+            if not changed:
+                continue
+            self.nodes.assign(node_id, job_type in HEAVY_TASKS, -1)
+            run_id = _run_id(payload_json)
+            if run_id:
+                add_trace(session, run_id, 'worker_job_unclaimed', {'job_id': job_id, 'job_type': job_type, 'ttl_seconds': ttl}, agent_id=0)
+            expired.append(job_id)
+        if expired:
+            session.commit()
+        with self._lock:
+            self.unclaimed += len(expired)
+        for job_id in expired:
+            self._wake(job_id)
+        return len(expired)
+
+    def routing(self, session: Session) -> list[dict]:
+        return self._registry(session).snapshot()
+
+    def stats(self, session: Session) -> dict:
+        by_status = {status: count for status, count in session.exec(select(WorkerJob.status, func.count()).group_by(WorkerJob.status)).all()}
+        with self._lock:
+            return {
+                'by_status': by_status,
+                'waiting_callers': len(self._waiters),
+                'enqueued': self.enqueued,
+                'claimed': self.claimed,
+                'completed': self.completed,
+                'requeued': self.requeued,
+                'failed': self.failed,
+                'expired_leases': self.expired,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'cancelled': self.cancelled,
+                'unclaimed': self.unclaimed,
+                'lease_seconds': settings.agentora_worker_lease_seconds,
+                'wait_seconds': settings.agentora_worker_wait_seconds,
+                'queued_ttl_seconds': settings.agentora_worker_queued_ttl_seconds,
+            }
 
 
 worker_queue = WorkerQueue()
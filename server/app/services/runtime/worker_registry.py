@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import json
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.models import WorkerJob, WorkerNode
+
+# Latency assumed for a node before its first completed job, when no node has any samples either.
+DEFAULT_LATENCY_MS = 1000.0
+NODE_LIVENESS = timedelta(seconds=90)
+
+
+@dataclass
+class NodeState:
+    id: int
+    name: str
+    url: str
+    capabilities: frozenset[str]
+    status: str = 'idle'
+    last_seen_at: datetime = field(default_factory=datetime.utcnow)
+    inflight: int = 0
+    heavy_inflight: int = 0
+    assigned: int = 0
+    heavy_assigned: int = 0
+    latency_ms: float | None = None
+    latency_by_type: dict[str, float] = field(default_factory=dict)
+    error_rate: float = 0.0
+    consecutive_failures: int = 0
+    breaker: str = 'closed'
+    opened_at: float = 0.0
+    completed: int = 0
+    failed: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'url': self.url,
+            'capabilities': sorted(self.capabilities),
+            'status': self.status,
+            'last_seen_at': self.last_seen_at.isoformat(),
+            'inflight': self.inflight,
+            'heavy_inflight': self.heavy_inflight,
+            'assigned': self.assigned,
+            'heavy_assigned': self.heavy_assigned,
+            'latency_ms': round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            'latency_by_type': {k: round(v, 3) for k, v in self.latency_by_type.items()},
+            'error_rate': round(self.error_rate, 4),
+            'consecutive_failures': self.consecutive_failures,
+            'breaker': self.breaker,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+
+class WorkerRegistry:
+    """In-memory routing view of the worker nodes.
+
+    Loaded from the database once, then kept current by register, heartbeat,
+    claim and completion. Each node carries its parsed capabilities, in-flight
+    and assigned-but-unclaimed job counts, EWMA latency and error rate, and a
+    circuit breaker.
+
+    The breaker opens after ``AGENTORA_WORKER_BREAKER_FAILURES`` consecutive
+    failures. After the cooldown it turns half-open and admits up to
+    ``AGENTORA_WORKER_BREAKER_PROBES`` probe jobs: a successful probe closes
+    it, a failed one opens it again.
+    """
+
+    def __init__(self, alpha: float = 0.3, samples: int = 200, history: int = 100):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._nodes: dict[int, NodeState] = {}
+        self._samples: dict[str, deque[float]] = {}
+        self._sample_size = samples
+        self.transitions: deque[dict] = deque(maxlen=history)
+        self._loaded = False
+
+    def ensure_loaded(self, session: Session, heavy_types: set[str]) -> None:
+        if self._loaded:
+            return
+        nodes = list(session.exec(select(WorkerNode)))
+        counts = session.exec(
+            select(WorkerJob.worker_node_id, WorkerJob.job_type, WorkerJob.status, func.count())
+            .where(WorkerJob.status.in_(['queued', 'leased']), WorkerJob.worker_node_id != None)  # noqa: E711
+            .group_by(WorkerJob.worker_node_id, WorkerJob.job_type, WorkerJob.status)
+        ).all()
+        with self._lock:
+            if self._loaded:
+                return
+            for node in nodes:
+                self._upsert_locked(node)
+            for node_id, job_type, status, count in counts:
+                state = self._nodes.get(node_id)
+                if state is None:
+                    continue
+                heavy = job_type in heavy_types
+                if status == 'leased':
+                    state.inflight += count
+                    if heavy:
+                        state.heavy_inflight += count
+                else:
+                    state.assigned += count
+                    if heavy:
+                        state.heavy_assigned += count
+            self._loaded = True
+
+    def _upsert_locked(self, node: WorkerNode) -> NodeState:
+        try:
+            caps = frozenset(json.loads(node.capabilities_json or '[]'))
+        except Exception:
+            caps = frozenset()
+        state = self._nodes.get(node.id)
+        if state is None:
+            state = self._nodes[node.id] = NodeState(id=node.id, name=node.name, url=node.url, capabilities=caps)
+        state.name = node.name
+        state.url = node.url
+        state.capabilities = caps
+        state.status = node.status
+        state.last_seen_at = node.last_seen_at
+        return state
+
+    def upsert(self, node: WorkerNode) -> None:
+        with self._lock:
+            self._upsert_locked(node)
+
+    def touch(self, node_id: int, status: str, seen_at: datetime) -> None:
+        with self._lock:
+            state = self._nodes.get(node_id)
+            if state is not None:
+                state.status = status
+                state.last_seen_at = seen_at
+
+    def _live(self, state: NodeState, now: datetime) -> bool:
+        return state.status in {'idle', 'busy'} and state.last_seen_at >= now - NODE_LIVENESS
+
+    def _transition(self, state: NodeState, to: str, reason: str) -> dict:
+        event = {'at': datetime.utcnow().isoformat(), 'worker_id': state.id, 'worker': state.name, 'from': state.breaker, 'to': to, 'reason': reason}
+        state.breaker = to
+        if to == 'open':
+            state.opened_at = time.monotonic()
+        elif to == 'closed':
+            state.consecutive_failures = 0
+        self.transitions.append(event)
+        return event
+
+    def _breaker_allows(self, state: NodeState, claiming: bool = False) -> bool:
+        if state.breaker == 'open' and time.monotonic() - state.opened_at >= settings.agentora_worker_breaker_cooldown_seconds:
+            self._transition(state, 'half_open', 'cooldown_elapsed')
+        if state.breaker == 'half_open':
+            # Routing counts the probes already waiting for the node; claiming only those it is running.
+            outstanding = state.inflight if claiming else state.inflight + state.assigned
+            return outstanding < max(1, settings.agentora_worker_breaker_probes)
+        return state.breaker == 'closed'
+
+    def admits(self, node_id: int) -> bool:
+        """Whether the node's breaker lets it take work; unknown nodes are admitted."""
+        with self._lock:
+            state = self._nodes.get(node_id)
+            return state is None or self._breaker_allows(state, claiming=True)
+
+    def routable(self, node_id: int) -> bool:
+        with self._lock:
+            state = self._nodes.get(node_id)
+            return state is not None and self._live(state, datetime.utcnow()) and self._breaker_allows(state)
+
+    def _candidates_locked(self, capability: str, exclude: frozenset[int] = frozenset()) -> list[NodeState]:
+        now = datetime.utcnow()
+        return [s for s in self._nodes.values() if s.id not in exclude and capability in s.capabilities and self._live(s, now) and self._breaker_allows(s)]
+
+    def candidates(self, capability: str, exclude: frozenset[int] = frozenset()) -> list[NodeState]:
+        with self._lock:
+            return self._candidates_locked(capability, exclude)
+
+    def _prior_latency(self) -> float:
+        samples = [s.latency_ms for s in self._nodes.values() if s.latency_ms is not None]
+        return sum(samples) / len(samples) if samples else DEFAULT_LATENCY_MS
+
+    def expected_ms(self, state: NodeState, job_type: str, heavy: bool) -> float:
+        """Queue position times per-job latency, inflated by the retry cost of the node's error rate."""
+        latency = state.latency_by_type.get(job_type) or state.latency_ms or self._prior_latency()
+        cost = latency * (state.inflight + state.assigned + 1) / max(0.1, 1.0 - state.error_rate)
+        if heavy:
+            # Stack heavy jobs on a node only when the others are clearly worse.
+            cost += latency * (state.heavy_inflight + state.heavy_assigned)
+        return cost
+
+    def pick(self, capability: str, job_type: str, heavy: bool, exclude: frozenset[int] = frozenset()) -> tuple[NodeState, float] | None:
+        """The routable node with the lowest expected completion time, and that time in ms."""
+        with self._lock:
+            ranked = [(self.expected_ms(s, job_type, heavy), s.id, s) for s in self._candidates_locked(capability, exclude)]
+        if not ranked:
+            return None
+        expected, _, state = min(ranked, key=lambda r: (r[0], r[1]))
+        return state, expected
+
+    def assign(self, node_id: int | None, heavy: bool, delta: int) -> None:
+        with self._lock:
+            state = self._nodes.get(node_id) if node_id is not None else None
+            if state is not None:
+                state.assigned = max(0, state.assigned + delta)
+                if heavy:
+                    state.heavy_assigned = max(0, state.heavy_assigned + delta)
+
+    def started(self, node_id: int, heavy: bool) -> None:
+        with self._lock:
+            state = self._nodes.get(node_id)
+            if state is not None:
+                state.inflight += 1
+                if heavy:
+                    state.heavy_inflight += 1
+
+    def release(self, node_id: int | None, heavy: bool) -> None:
+        """Drop an in-flight job that was cancelled rather than finished; it says nothing about the node."""
+        with self._lock:
+            state = self._nodes.get(node_id) if node_id is not None else None
+            if state is not None:
+                state.inflight = max(0, state.inflight - 1)
+                if heavy:
+                    state.heavy_inflight = max(0, state.heavy_inflight - 1)
+
+    def finished(self, node_id: int | None, job_type: str, heavy: bool, elapsed_ms: float, ok: bool, reason: str = '') -> dict | None:
+        """Record a finished job; returns the breaker transition it caused, if any."""
+        with self._lock:
+            state = self._nodes.get(node_id) if node_id is not None else None
+            if state is None:
+                return None
+            state.inflight = max(0, state.inflight - 1)
+            if heavy:
+                state.heavy_inflight = max(0, state.heavy_inflight - 1)
+            state.error_rate += self.alpha * ((0.0 if ok else 1.0) - state.error_rate)
+            if ok:
+                state.completed += 1
+                state.consecutive_failures = 0
+                state.latency_ms = elapsed_ms if state.latency_ms is None else state.latency_ms + self.alpha * (elapsed_ms - state.latency_ms)
+                previous = state.latency_by_type.get(job_type)
+                state.latency_by_type[job_type] = elapsed_ms if previous is None else previous + self.alpha * (elapsed_ms - previous)
+                self._samples.setdefault(job_type, deque(maxlen=self._sample_size)).append(elapsed_ms)
+                if state.breaker == 'half_open':
+                    return self._transition(state, 'closed', 'probe_succeeded')
+                return None
+            state.failed += 1
+            state.consecutive_failures += 1
+            if state.breaker == 'half_open':
+                return self._transition(state, 'open', f'probe_failed:{reason}' if reason else 'probe_failed')
+            if state.breaker == 'closed' and state.consecutive_failures >= max(1, settings.agentora_worker_breaker_failures):
+                return self._transition(state, 'open', f'{state.consecutive_failures} consecutive failures' + (f' ({reason})' if reason else ''))
+            return None
+
+    def latency_percentile(self, job_type: str, percentile: float, min_samples: int = 5) -> float | None:
+        """Fleet-wide completion latency percentile for a job type; None until enough jobs have finished."""
+        with self._lock:
+            samples = sorted(self._samples.get(job_type, ()))
+        if len(samples) < min_samples:
+            return None
+        rank = max(0, min(len(samples) - 1, math.ceil(percentile / 100.0 * len(samples)) - 1))
+        return samples[rank]
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            for state in self._nodes.values():
+                self._breaker_allows(state)
+            return [s.as_dict() for s in sorted(self._nodes.values(), key=lambda s: s.id)]
+
+    def breaker_history(self) -> list[dict]:
+        with self._lock:
+            return list(self.transitions)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.core.config import settings
+from app.services.http_pool import http_pool
+from app.services.runtime.actions import _browser_execute, _desktop_execute
+from app.services.tools.registry import registry
+
+
+def _denied(name: str, payload: dict) -> dict | None:
+    """The inline path's checks, repeated here: the run's allowed tools travel with the job, the runtime policy is this node's."""
+    denied = registry.denial(name, list(payload.get('allowed_tools') or []))
+    return {'ok': False, 'error': denied[1]} if denied else None
+
+
+def _python_exec(payload: dict) -> dict:
+    args = payload.get('args') or {}
+    return _denied('python_exec', payload) or registry.invoke('python_exec', python_code=args.get('python_code', payload.get('code', '')))
+
+
+def _web_fetch(payload: dict) -> dict:
+    args = payload.get('args') or {}
+    return _denied('http_fetch', payload) or registry.invoke('http_fetch', url=args.get('url', payload.get('url', '')))
+
+
+def _long_tool_job(payload: dict) -> dict:
+    # Action jobs were approved on the hub; the worker still applies its runtime policy and its own path and domain policy.
+    name = str(payload.get('tool_name', ''))
+    params = payload.get('params') or {}
+    if name.startswith(('browser_', 'desktop_')):
+        if not registry.allowed_by_policy(name):
+            return {'ok': False, 'error': 'tool blocked by policy'}
+        return _browser_execute(name, params) if name.startswith('browser_') else _desktop_execute(name, params)
+    if registry.spec(name) is None or registry.uses_session(name):
+        return {'ok': False, 'error': f'tool not runnable on a worker: {name}'}
+    return _denied(name, payload) or registry.invoke(name, **params)
+
+
+JOB_HANDLERS: dict[str, Callable[[dict], Any]] = {
+    'python_exec': _python_exec,
+    'web_fetch': _web_fetch,
+    'long_tool_job': _long_tool_job,
+}
+
+
+class WorkerRuntime:
+    """Worker-node side of the job queue (``AGENTORA_WORKER_MODE``).
+
+    Registers with the hub, claims jobs it has handlers for, extends each
+    lease while the job runs and reports the result. A worker that dies stops
+    heartbeating, so the hub re-queues its jobs when their leases run out.
+    """
+
+    def __init__(self, history: int = 200):
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[int, dict] = OrderedDict()
+        self._history = history
+        self._active = 0
+        self.worker_id: int | None = None
+        self.executed = 0
+        self.failed = 0
+        self.leases_lost = 0
+
+    def capabilities(self) -> list[str]:
+        configured = [c.strip() for c in settings.agentora_worker_capabilities.split(',') if c.strip()]
+        return [c for c in configured if c in JOB_HANDLERS] if configured else sorted(JOB_HANDLERS)
+
+    def execute(self, job_type: str, payload: dict) -> dict:
+        """Run one job locally; handler errors become a failed result rather than an exception."""
+        handler = JOB_HANDLERS.get(job_type)
+        if handler is None:
+            return {'ok': False, 'error': f'unsupported job type: {job_type}'}
+        try:
+            result = handler(payload)
+        except Exception as exc:
+            return {'ok': False, 'error': str(exc)}
+        return result if isinstance(result, dict) else {'ok': True, 'result': result}
+
+    def record(self, job_id: int, status: str, result: dict | None = None) -> None:
+        with self._lock:
+            self._jobs[job_id] = {'job_id': job_id, 'status': status, 'result': result or {}}
+            self._jobs.move_to_end(job_id)
+            while len(self._jobs) > self._history:
+                self._jobs.popitem(last=False)
+
+    def job(self, job_id: int) -> dict | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self) -> None:
+        if not settings.agentora_worker_mode or not settings.agentora_worker_hub_url or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='agentora-worker-runtime', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+        self._thread = None
+
+    def _hub(self, path: str) -> str:
+        return f'{settings.agentora_worker_hub_url.rstrip("/")}/api/workers{path}'
+
+    def register(self) -> int:
+        name = settings.agentora_worker_name
+        response = http_pool.sync_client('worker').post(self._hub('/register'), json={'name': name, 'url': f'pull://{name}', 'capabilities': self.capabilities()})
+        response.raise_for_status()
+        self.worker_id = int(response.json()['worker']['id'])
+        return self.worker_id
+
+    def poll_once(self, pool: ThreadPoolExecutor) -> int:
+        """Claim as many jobs as there are free slots and start them; returns how many were claimed."""
+        if self.worker_id is None:
+            self.register()
+        with self._lock:
+            free = max(0, settings.agentora_worker_concurrency - self._active)
+        if not free:
+            return 0
+        response = http_pool.sync_client('worker').post(
+            self._hub('/claim'),
+            json={'worker_id': self.worker_id, 'capabilities': self.capabilities(), 'max_jobs': free, 'lease_seconds': settings.agentora_worker_lease_seconds},
+        )
+        if response.status_code == 404:
+            # The hub forgot this worker (fresh database); register again on the next poll.
+            self.worker_id = None
+            return 0
+        response.raise_for_status()
+        jobs = response.json().get('jobs', [])
+        for job in jobs:
+            with self._lock:
+                self._active += 1
+            self.record(job['id'], 'running')
+            pool.submit(self._run_leased, job)
+        return len(jobs)
+
+    def _run_leased(self, job: dict) -> None:
+        client = http_pool.sync_client('worker')
+        lost = threading.Event()
+        done = threading.Event()
+
+        def keep_alive() -> None:
+            interval = max(0.5, settings.agentora_worker_lease_seconds / 3.0)
+            while not done.wait(interval):
+                try:
+                    r = client.post(self._hub(f'/jobs/{job["id"]}/heartbeat'), json={'lease_token': job['lease_token'], 'lease_seconds': settings.agentora_worker_lease_seconds})
+                except Exception:
+                    continue
+                if r.status_code == 409:
+                    lost.set()
+                    return
+
+        beat = threading.Thread(target=keep_alive, name=f'agentora-worker-lease-{job["id"]}', daemon=True)
+        beat.start()
+        try:
+            result = self.execute(job['job_type'], job.get('payload') or {})
+        finally:
+            done.set()
+            beat.join(timeout=1.0)
+        ok = bool(result.get('ok', True))
+        try:
+            r = client.post(
+                self._hub(f'/jobs/{job["id"]}/complete'),
+                json={'lease_token': job['lease_token'], 'ok': ok, 'result': result, 'error': '' if ok else str(result.get('error', 'worker_failed'))},
+            )
+            lost_lease = lost.is_set() or r.status_code == 409
+        except Exception:
+            # The hub is unreachable; the lease will expire and the job will be re-queued there.
+            lost_lease = True
+        with self._lock:
+            self._active -= 1
+            self.executed += 1
+            if not ok:
+                self.failed += 1
+            if lost_lease:
+                self.leases_lost += 1
+        self.record(job['id'], 'lease_lost' if lost_lease else ('done' if ok else 'failed'), result)
+
+    def _loop(self) -> None:
+        with ThreadPoolExecutor(max_workers=max(1, settings.agentora_worker_concurrency), thread_name_prefix='agentora-worker-job') as pool:
+            while not self._stop.is_set():
+                try:
+                    claimed = self.poll_once(pool)
+                except Exception:
+                    claimed = 0
+                    self._stop.wait(max(1.0, settings.agentora_worker_poll_seconds) * 5)
+                if not claimed:
+                    self._stop.wait(max(0.05, settings.agentora_worker_poll_seconds))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': settings.agentora_worker_mode,
+                'running': self.running,
+                'hub_url': settings.agentora_worker_hub_url,
+                'worker_id': self.worker_id,
+                'capabilities': self.capabilities(),
+                'active': self._active,
+                'executed': self.executed,
+                'failed': self.failed,
+                'leases_lost': self.leases_lost,
+            }
+
+
+worker_runtime = WorkerRuntime()
@@ -0,0 +1,483 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import bindparam, case, insert, update
+from sqlmodel import Session, select
+
+from app import db
+from app.core.config import settings
+from app.models import Capsule, MemoryCapsuleState, MemoryEdge, MemoryUsefulnessMetric
+from app.services.runtime.bookkeeping import retrieval_bookkeeping
+from app.services.runtime.quality import apply_usefulness
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _AdmissionDelta:
+    layer: str
+    hits: int = 0
+    last_accessed_at: datetime | None = None
+
+
+@dataclass
+class _EdgeDelta:
+    weight: float
+    confidence: float
+    trust_score: float
+    hits: int = 0
+    last_reinforced_at: datetime | None = None
+
+
+@dataclass
+class _Pending:
+    admissions: dict[int, _AdmissionDelta] = field(default_factory=dict)
+    edges: dict[tuple[int, int, str], _EdgeDelta] = field(default_factory=dict)
+    # Usefulness updates clamp and feed back into each other, so they are replayed in order per capsule.
+    usefulness: dict[int, list[tuple[bool, bool, bool]]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.admissions) + len(self.edges) + len(self.usefulness)
+
+
+def _greatest(column, value):
+    return case((column > value, column), else_=value)
+
+
+class MemoryWriteBehind:
+    """Coalescing write-behind queue for retrieval side effects.
+
+    Admission counters, co-retrieval edge reinforcement and usefulness updates
+    are merged per capsule/edge in memory and written by a background thread on
+    a size or time threshold. Pending counters are overlaid onto scoring so
+    admission matches what an inline write would have produced. A failed
+    flush puts its batch back in the queue; after
+    ``AGENTORA_MEMORY_WRITE_BEHIND_MAX_RETRIES`` failures in a row the queue
+    is dropped and logged.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Held across a flush commit and across a reader's row load + overlay read, so a reader never
+        # sees a batch both in the database and in the overlay (or in neither).
+        self._commit_lock = threading.RLock()
+        self._pending = _Pending()
+        self._inflight = _Pending()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._oldest: float | None = None
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self) -> None:
+        if not settings.agentora_memory_write_behind_enabled or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='agentora-memory-write-behind', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+        self._thread = None
+        # Drain whatever the writer did not get to before shutdown.
+        self.flush()
+
+    def _loop(self) -> None:
+        interval = max(10, settings.agentora_memory_write_behind_interval_ms) / 1000.0
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+            except Exception:
+                self._flush_failed()
+
+    def _flush_failed(self) -> None:
+        # flush() has already requeued the batch and counted the error.
+        with self._lock:
+            self.consecutive_failures += 1
+            failures = self.consecutive_failures
+            give_up = failures >= max(1, settings.agentora_memory_write_behind_max_retries)
+            if give_up:
+                dropped = len(self._pending)
+                self.dropped += dropped
+                self._pending = _Pending()
+                self._oldest = None
+                self.consecutive_failures = 0
+        logger.exception('memory write-behind flush failed (%d in a row)', failures)
+        if give_up:
+            logger.error('memory write-behind dropped %d queued updates after %d failed flushes', dropped, failures)
+
+    def nudge(self) -> None:
+        """Ask the writer thread to flush now instead of at its next interval."""
+        if self.running:
+            self._wake.set()
+
+    def _enqueued(self, events: int, merged: int) -> None:
+        # Caller holds ``self._lock``.
+        self.enqueued += events
+        self.coalesced += merged
+        if self._oldest is None and events:
+            self._oldest = time.monotonic()
+
+    def _after_enqueue(self, session: Session | None) -> None:
+        if not settings.agentora_memory_write_behind_enabled:
+            self.flush(session)
+            return
+        with self._lock:
+            full = len(self._pending) >= max(1, settings.agentora_memory_write_behind_max_pending)
+        if full:
+            if self.running:
+                self._wake.set()
+            else:
+                self.flush(session)
+
+    def record_admissions(self, admitted: list[tuple[int, str]], now: datetime | None = None, session: Session | None = None) -> None:
+        if not admitted:
+            return
+        now = now or datetime.utcnow()
+        with self._lock:
+            merged = 0
+            for capsule_id, layer in admitted:
+                delta = self._pending.admissions.get(capsule_id)
+                if delta is None:
+                    delta = self._pending.admissions[capsule_id] = _AdmissionDelta(layer=layer)
+                else:
+                    merged += 1
+                delta.hits += 1
+                delta.last_accessed_at = now
+            self._enqueued(len(admitted), merged)
+        self._after_enqueue(session)
+
+    def record_edges(
+        self,
+        pairs: list[tuple[int, int]],
+        edge_type: str = 'co_retrieval',
+        weight: float = 0.6,
+        confidence: float = 0.6,
+        trust_score: float = 0.6,
+        now: datetime | None = None,
+        session: Session | None = None,
+    ) -> None:
+        pairs = [(a, b) for a, b in dict.fromkeys(pairs) if a != b]
+        if not pairs:
+            return
+        now = now or datetime.utcnow()
+        with self._lock:
+            merged = 0
+            for source, target in pairs:
+                key = (source, target, edge_type)
+                delta = self._pending.edges.get(key)
+                if delta is None:
+                    delta = self._pending.edges[key] = _EdgeDelta(weight=weight, confidence=confidence, trust_score=trust_score)
+                else:
+                    merged += 1
+                    delta.weight = max(delta.weight, weight)
+                    delta.confidence = max(delta.confidence, confidence)
+                    delta.trust_score = max(delta.trust_score, trust_score)
+                delta.hits += 1
+                delta.last_reinforced_at = now
+            self._enqueued(len(pairs), merged)
+        self._after_enqueue(session)
+
+    def record_usefulness(
+        self,
+        retrieved_capsule_ids: list[int],
+        used_capsule_ids: list[int],
+        helped_final_answer: bool = False,
+        helped_tool_execution: bool = False,
+        session: Session | None = None,
+    ) -> int:
+        used = set(used_capsule_ids)
+        ids = [cid for cid in retrieved_capsule_ids if cid]
+        if not ids:
+            return 0
+        with self._lock:
+            merged = 0
+            for cid in ids:
+                events = self._pending.usefulness.setdefault(cid, [])
+                merged += 1 if events else 0
+                events.append((cid in used, helped_final_answer, helped_tool_execution))
+            self._enqueued(len(ids), merged)
+        self._after_enqueue(session)
+        return len(ids)
+
+    @contextmanager
+    def consistent_read(self):
+        with self._commit_lock:
+            yield
+
+    def pending_hits(self, capsule_ids: list[int]) -> dict[int, int]:
+        with self._lock:
+            out: dict[int, int] = {}
+            for batch in (self._inflight, self._pending):
+                for cid in capsule_ids:
+                    delta = batch.admissions.get(cid)
+                    if delta:
+                        out[cid] = out.get(cid, 0) + delta.hits
+            return out
+
+    def pending_edges(self, capsule_ids: list[int]) -> list[MemoryEdge]:
+        """Unwritten edges touching ``capsule_ids`` as transient rows for graph scoring."""
+        wanted = set(capsule_ids)
+        merged: dict[tuple[int, int, str], MemoryEdge] = {}
+        with self._lock:
+            for batch in (self._inflight, self._pending):
+                for (source, target, edge_type), delta in batch.edges.items():
+                    if source not in wanted and target not in wanted:
+                        continue
+                    edge = merged.get((source, target, edge_type))
+                    if edge is None:
+                        merged[(source, target, edge_type)] = MemoryEdge(
+                            from_capsule_id=source,
+                            to_capsule_id=target,
+                            edge_type=edge_type,
+                            weight=delta.weight,
+                            confidence=delta.confidence,
+                            trust_score=delta.trust_score,
+                            usage_count=delta.hits,
+                        )
+                    else:
+                        edge.weight = max(edge.weight, delta.weight)
+                        edge.confidence = max(edge.confidence, delta.confidence)
+                        edge.trust_score = max(edge.trust_score, delta.trust_score)
+                        edge.usage_count += delta.hits
+        return list(merged.values())
+
+    def has_pending_usefulness(self, capsule_ids: list[int]) -> bool:
+        with self._lock:
+            return any(cid in self._pending.usefulness or cid in self._inflight.usefulness for cid in capsule_ids)
+
+    def flush(self, session: Session | None = None) -> dict:
+        """Write everything queued. Uses and commits ``session`` when given, else a private one."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, _Pending()
+                self._inflight = batch
+                self._oldest = None
+            started = time.perf_counter()
+            try:
+                if session is not None:
+                    written, bookkeeping = self._write_and_commit(session, batch)
+                else:
+                    # ``db.engine`` rather than an imported name: init_db may swap the engine.
+                    with Session(db.engine) as own:
+                        written, bookkeeping = self._write_and_commit(own, batch)
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                raise
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            with self._lock:
+                self.consecutive_failures = 0
+                self.flushes += 1
+                self.rows_written += written
+                self.last_flush_ms = round(elapsed_ms, 3)
+        return {'rows_written': written, 'flush_ms': round(elapsed_ms, 3), **bookkeeping}
+
+    def _write_and_commit(self, session: Session, batch: _Pending) -> tuple[int, dict]:
+        try:
+            written = self._write(session, batch) if len(batch) else 0
+            with self._commit_lock:
+                session.commit()
+                with self._lock:
+                    self._inflight = _Pending()
+        except Exception:
+            session.rollback()
+            with self._lock:
+                self._inflight = _Pending()
+                self._requeue(batch)
+            raise
+        try:
+            bookkeeping = retrieval_bookkeeping.flush(session)
+        except Exception:
+            # The memory writes above are committed; bookkeeping kept its own ids queued, so this is not a failed flush.
+            logger.exception('retrieval bookkeeping flush failed')
+            bookkeeping = {'bookkeeping_failed': True}
+        return written, bookkeeping
+
+    def _requeue(self, batch: _Pending) -> None:
+        # Caller holds ``self._lock``; the failed batch is older than anything queued since.
+        for cid, delta in batch.admissions.items():
+            current = self._pending.admissions.get(cid)
+            if current:
+                delta.hits += current.hits
+                delta.last_accessed_at = current.last_accessed_at
+            self._pending.admissions[cid] = delta
+        for key, delta in batch.edges.items():
+            current = self._pending.edges.get(key)
+            if current:
+                delta.hits += current.hits
+                delta.weight = max(delta.weight, current.weight)
+                delta.confidence = max(delta.confidence, current.confidence)
+                delta.trust_score = max(delta.trust_score, current.trust_score)
+                delta.last_reinforced_at = current.last_reinforced_at
+            self._pending.edges[key] = delta
+        for cid, events in batch.usefulness.items():
+            self._pending.usefulness[cid] = events + self._pending.usefulness.get(cid, [])
+        if len(self._pending) and self._oldest is None:
+            self._oldest = time.monotonic()
+
+    def _write(self, session: Session, batch: _Pending) -> int:
+        written = 0
+        # Core executemany bypasses the ORM flush hooks, so take the writer gate explicitly.
+        db.writer_gate.acquire(session)
+        conn = session.connection()
+        if batch.admissions:
+            caps = Capsule.__table__
+            conn.execute(
+                update(caps)
+                .where(caps.c.id == bindparam('b_id'))
+                .values(
+                    retrieval_count=caps.c.retrieval_count + bindparam('b_hits'),
+                    recency_score=case((caps.c.recency_score + bindparam('b_recency') > 1.0, 1.0), else_=caps.c.recency_score + bindparam('b_recency')),
+                    last_accessed_at=bindparam('b_at'),
+                ),
+                [{'b_id': cid, 'b_hits': d.hits, 'b_recency': 0.03 * d.hits, 'b_at': d.last_accessed_at} for cid, d in batch.admissions.items()],
+            )
+            written += self._write_states(session, batch.admissions)
+        if batch.edges:
+            written += self._write_edges(session, batch.edges)
+        if batch.usefulness:
+            written += self._write_usefulness(session, batch.usefulness)
+        return written + len(batch.admissions)
+
+    def _write_states(self, session: Session, admissions: dict[int, _AdmissionDelta]) -> int:
+        states = MemoryCapsuleState.__table__
+        existing: dict[int, int] = {}
+        for state_id, capsule_id in session.exec(select(MemoryCapsuleState.id, MemoryCapsuleState.capsule_id).where(MemoryCapsuleState.capsule_id.in_(list(admissions)))):
+            existing[capsule_id] = state_id
+        conn = session.connection()
+        updates = [{'b_id': existing[cid], 'b_hits': d.hits, 'b_at': d.last_accessed_at} for cid, d in admissions.items() if cid in existing]
+        if updates:
+            conn.execute(
+                update(states)
+                .where(states.c.id == bindparam('b_id'))
+                .values(
+                    retrieval_count=states.c.retrieval_count + bindparam('b_hits'),
+                    usage_count=states.c.usage_count + bindparam('b_hits'),
+                    last_accessed_at=bindparam('b_at'),
+                    updated_at=bindparam('b_at'),
+                ),
+                updates,
+            )
+        inserts = [
+            MemoryCapsuleState(capsule_id=cid, layer=d.layer, retrieval_count=d.hits, usage_count=d.hits, last_accessed_at=d.last_accessed_at, updated_at=d.last_accessed_at).model_dump(exclude={'id'})
+            for cid, d in admissions.items()
+            if cid not in existing
+        ]
+        if inserts:
+            conn.execute(insert(states), inserts)
+        return len(updates) + len(inserts)
+
+    def _write_edges(self, session: Session, edges: dict[tuple[int, int, str], _EdgeDelta]) -> int:
+        table = MemoryEdge.__table__
+        existing: dict[tuple[int, int, str], int] = {}
+        rows = session.exec(
+            select(MemoryEdge.id, MemoryEdge.from_capsule_id, MemoryEdge.to_capsule_id, MemoryEdge.edge_type).where(
+                MemoryEdge.from_capsule_id.in_(sorted({k[0] for k in edges})),
+                MemoryEdge.to_capsule_id.in_(sorted({k[1] for k in edges})),
+                MemoryEdge.edge_type.in_(sorted({k[2] for k in edges})),
+            )
+        )
+        for edge_id, source, target, edge_type in rows:
+            existing.setdefault((source, target, edge_type), edge_id)
+        conn = session.connection()
+        updates = [
+            {'b_id': existing[key], 'b_hits': d.hits, 'b_weight': d.weight, 'b_confidence': d.confidence, 'b_trust': d.trust_score, 'b_at': d.last_reinforced_at}
+            for key, d in edges.items()
+            if key in existing
+        ]
+        if updates:
+            conn.execute(
+                update(table)
+                .where(table.c.id == bindparam('b_id'))
+                .values(
+                    weight=_greatest(table.c.weight, bindparam('b_weight')),
+                    confidence=_greatest(table.c.confidence, bindparam('b_confidence')),
+                    trust_score=_greatest(table.c.trust_score, bindparam('b_trust')),
+                    usage_count=table.c.usage_count + bindparam('b_hits'),
+                    last_reinforced_at=bindparam('b_at'),
+                ),
+                updates,
+            )
+        inserts = [
+            MemoryEdge(
+                from_capsule_id=source,
+                to_capsule_id=target,
+                edge_type=edge_type,
+                weight=d.weight,
+                confidence=d.confidence,
+                trust_score=d.trust_score,
+                usage_count=d.hits,
+                last_reinforced_at=d.last_reinforced_at,
+            ).model_dump(exclude={'id'})
+            for (source, target, edge_type), d in edges.items()
+            if (source, target, edge_type) not in existing
+        ]
+        if inserts:
+            conn.execute(insert(table), inserts)
+        return len(updates) + len(inserts)
+
+    def _write_usefulness(self, session: Session, usefulness: dict[int, list[tuple[bool, bool, bool]]]) -> int:
+        ids = list(usefulness)
+        caps = {c.id: c for c in session.exec(select(Capsule).where(Capsule.id.in_(ids)))}
+        metrics: dict[int, MemoryUsefulnessMetric] = {}
+        for metric in session.exec(select(MemoryUsefulnessMetric).where(MemoryUsefulnessMetric.capsule_id.in_(ids)).order_by(MemoryUsefulnessMetric.id)):
+            metrics.setdefault(metric.capsule_id, metric)
+        now = datetime.utcnow()
+        written = 0
+        for cid, events in usefulness.items():
+            cap = caps.get(cid)
+            if cap is None:
+                continue
+            metric = metrics.get(cid) or MemoryUsefulnessMetric(capsule_id=cid)
+            for used, helped_final_answer, helped_tool_execution in events:
+                apply_usefulness(cap, metric, used, helped_final_answer, helped_tool_execution, now)
+            session.add(cap)
+            session.add(metric)
+            written += 2
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': settings.agentora_memory_write_behind_enabled,
+                'running': self.running,
+                'pending': len(self._pending),
+                'oldest_pending_seconds': round(time.monotonic() - self._oldest, 3) if self._oldest is not None else 0.0,
+                'enqueued': self.enqueued,
+                'coalesced': self.coalesced,
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'errors': self.errors,
+                'consecutive_failures': self.consecutive_failures,
+                'dropped': self.dropped,
+                'last_flush_ms': self.last_flush_ms,
+            }
+
+
+memory_write_behind = MemoryWriteBehind()
@@ -14,23 +14,30 @@ class ToolSpec:
     schema: dict
     permission: str
     fn: Callable[..., Any]
+    # Calls to tools in the same state group run in request order; None means independent.
+    state_group: str | None = None
+    # Concurrent calls of this tool within one step; 0 uses AGENTORA_TOOL_MAX_PARALLEL.
+    max_concurrency: int = 0
+    # None uses AGENTORA_TOOL_TIMEOUT_SECONDS; 0 disables the timeout.
+    timeout_seconds: float | None = None
 
 
 class ToolRegistry:
     def __init__(self):
         self._tools: dict[str, ToolSpec] = {
-            'notes_append': ToolSpec('notes_append', {'run_id': 'int', 'text': 'string'}, 'artifact:write', builtins.notes_append),
-            'local_files_write': ToolSpec('local_files_write', {'run_id': 'int', 'path': 'string', 'content': 'string'}, 'artifact:write', builtins.local_files_write),
-            'local_files_read': ToolSpec('local_files_read', {'run_id': 'int', 'path': 'string'}, 'artifact:read', builtins.local_files_read),
-            'capsule_search': ToolSpec('capsule_search', {'query': 'string', 'run_id': 'int'}, 'memory:read', builtins.capsule_search),
-            'http_fetch': ToolSpec('http_fetch', {'url': 'string'}, 'network:http', builtins.http_fetch),
-            'python_exec': ToolSpec('python_exec', {'python_code': 'string'}, 'sandbox:exec', builtins.python_exec),
+            'notes_append': ToolSpec('notes_append', {'run_id': 'int', 'text': 'string'}, 'artifact:write', builtins.notes_append, state_group='run_files'),
+            'local_files_write': ToolSpec('local_files_write', {'run_id': 'int', 'path': 'string', 'content': 'string'}, 'artifact:write', builtins.local_files_write, state_group='run_files'),
+            'local_files_read': ToolSpec('local_files_read', {'run_id': 'int', 'path': 'string'}, 'artifact:read', builtins.local_files_read, state_group='run_files'),
+            # Searches through the run's own session, so it cannot be abandoned mid-call by a timeout.
+            'capsule_search': ToolSpec('capsule_search', {'query': 'string', 'run_id': 'int'}, 'memory:read', builtins.capsule_search, state_group='session', timeout_seconds=0),
+            'http_fetch': ToolSpec('http_fetch', {'url': 'string'}, 'network:http', builtins.http_fetch, max_concurrency=4),
+            'python_exec': ToolSpec('python_exec', {'python_code': 'string'}, 'sandbox:exec', builtins.python_exec, max_concurrency=2),
         }
 
     def list(self) -> list[dict]:
         return [{'name': t.name, 'schema': t.schema, 'permission': t.permission} for t in self._tools.values()]
 
-    def _allowed_by_policy(self, name: str) -> bool:
+    def allowed_by_policy(self, name: str) -> bool:
         blocked = settings.blocked_tool_names
         if name in blocked:
             return False
@@ -39,22 +46,35 @@ class ToolRegistry:
             return False
         return True
 
+    def spec(self, name: str) -> ToolSpec | None:
+        return self._tools.get(name)
+
+    def uses_session(self, name: str) -> bool:
+        spec = self._tools.get(name)
+        return bool(spec) and 'session' in inspect.signature(spec.fn).parameters
+
+    def denial(self, name: str, allowed: list) -> tuple[str, str] | None:
+        """Why a call may not run, as (trace message, error), or None when it is permitted."""
+        if name not in self._tools:
+            return f'unknown tool requested: {name}', 'unknown tool'
+        if name not in allowed:
+            return f'tool blocked by agent allowlist: {name}', 'tool not allowed'
+        if not self.allowed_by_policy(name):
+            return f'tool blocked by runtime policy: {name}', 'tool blocked by policy'
+        return None
+
     def call(self, name: str, allowed: list, **kwargs):
         run_id = int(kwargs.get('run_id') or 0)
         session = kwargs.get('session')
-        if name not in self._tools:
-            if session and run_id:
-                add_trace(session, run_id, 'warning', {'message': f'unknown tool requested: {name}'})
-            return {'ok': False, 'error': 'unknown tool'}
-        if name not in allowed:
-            if session and run_id:
-                add_trace(session, run_id, 'warning', {'message': f'tool blocked by agent allowlist: {name}'})
-            return {'ok': False, 'error': 'tool not allowed'}
-        if not self._allowed_by_policy(name):
+        denied = self.denial(name, allowed)
+        if denied:
             if session and run_id:
-                add_trace(session, run_id, 'warning', {'message': f'tool blocked by runtime policy: {name}'})
-            return {'ok': False, 'error': 'tool blocked by policy'}
+                add_trace(session, run_id, 'warning', {'message': denied[0]})
+            return {'ok': False, 'error': denied[1]}
+        return self.invoke(name, **kwargs)
 
+    def invoke(self, name: str, **kwargs):
+        """Run a permitted tool, passing only the keyword arguments it accepts."""
         fn = self._tools[name].fn
         sig = inspect.signature(fn)
         accepts_kwargs = any(p.kind == inspect.Parameter.VAR_KEYWORD for p in sig.parameters.values())
@@ -1,14 +1,255 @@
+from __future__ import annotations
+
+import json
+import os
+import select
+import shutil
 import subprocess
+import sys
 import tempfile
+import threading
+import time
 from pathlib import Path
 
+from app.core.config import settings
 
-def run_python_sandboxed(code: str, timeout: int = 2) -> dict:
+ZYGOTE_SCRIPT = Path(__file__).with_name('sandbox_zygote.py')
+
+
+def _result(stdout: str, stderr: str, code: int) -> dict:
+    return {'ok': True, 'stdout': stdout[:1000], 'stderr': stderr[:1000], 'code': code}
+
+
+def _run_cold(code: str, timeout: int) -> dict:
     with tempfile.TemporaryDirectory() as td:
         p = Path(td) / 'snippet.py'
         p.write_text(code, encoding='utf-8')
         try:
             proc = subprocess.run(['python', str(p)], capture_output=True, text=True, timeout=timeout)
-            return {'ok': True, 'stdout': proc.stdout[:1000], 'stderr': proc.stderr[:1000], 'code': proc.returncode}
+            return _result(proc.stdout, proc.stderr, proc.returncode)
         except subprocess.TimeoutExpired:
             return {'ok': False, 'error': 'timed_out'}
+
+
+class _SandboxBroken(Exception):
+    pass
+
+
+class _WarmSandbox:
+    """One pre-started sandbox process; the snippet itself runs in a child it forks per request."""
+
+    def __init__(self):
+        self.workdir = tempfile.mkdtemp(prefix='agentora-sandbox-')
+        self.proc = subprocess.Popen(
+            [sys.executable, str(ZYGOTE_SCRIPT), self.workdir],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        self.executions = 0
+        self._buffer = b''
+        try:
+            self._read_reply(10.0)
+        except Exception:
+            self.close()
+            raise
+
+    def _read_reply(self, wait: float) -> dict:
+        fd = self.proc.stdout.fileno()
+        deadline = time.monotonic() + wait
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _SandboxBroken('sandbox did not reply in time')
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise _SandboxBroken(f'sandbox exited with {self.proc.poll()}')
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b'\n')
+        return json.loads(line)
+
+    def execute(self, code: str, timeout: float) -> dict:
+        request = {'code': code, 'timeout': timeout, 'memory_mb': settings.agentora_sandbox_memory_mb}
+        try:
+            self.proc.stdin.write((json.dumps(request) + '\n').encode('utf-8'))
+            # The sandbox enforces the timeout itself; the grace period only covers a wedged process.
+            reply = self._read_reply(timeout + 5.0)
+        except (OSError, ValueError) as exc:
+            raise _SandboxBroken(str(exc)) from exc
+        self.executions += 1
+        if 'error' in reply:
+            raise _SandboxBroken(reply['error'])
+        return reply
+
+    def close(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                stream.close()
+            except Exception:
+                pass
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class SandboxPool:
+    """Pool of warm python_exec sandboxes.
+
+    Each sandbox is a long-lived interpreter that forks a fresh, resource-limited
+    child per snippet, so a call pays for a fork rather than interpreter
+    startup. A sandbox is recycled after ``AGENTORA_SANDBOX_MAX_EXECUTIONS``
+    snippets or as soon as it misbehaves, and replaced in the background.
+    Nothing is forked unless ``AGENTORA_ENABLE_CODE_EXEC`` is on; platforms
+    without ``fork`` keep the one-process-per-call path.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._idle: list[_WarmSandbox] = []
+        self._size = 0
+        self.executions = 0
+        self.spawned = 0
+        self.recycled = 0
+        self.crashed = 0
+        self.cold_runs = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.agentora_enable_code_exec and settings.agentora_sandbox_pool_size > 0 and hasattr(os, 'fork')
+
+    def start(self, wait: bool = False) -> None:
+        """Pre-start sandboxes up to the pool size so the first calls are warm too."""
+        if not self.enabled:
+            return
+        with self._cond:
+            missing = max(0, settings.agentora_sandbox_pool_size - self._size)
+        threads = [threading.Thread(target=self._replenish, name='agentora-sandbox-start', daemon=True) for _ in range(missing)]
+        for thread in threads:
+            thread.start()
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def stop(self) -> None:
+        """Close idle sandboxes. Busy ones finish their snippet first; a sandbox also exits on its own once its stdin closes."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for sandbox in idle:
+            sandbox.close()
+
+    def _spawn(self) -> _WarmSandbox:
+        sandbox = _WarmSandbox()
+        with self._cond:
+            self.spawned += 1
+        return sandbox
+
+    def _replenish(self) -> None:
+        with self._cond:
+            if self._size >= settings.agentora_sandbox_pool_size:
+                return
+            self._size += 1
+        try:
+            sandbox = self._spawn()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(sandbox)
+            self._cond.notify()
+
+    def _acquire(self, wait: float) -> _WarmSandbox | None:
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while not self._idle:
+                if self._size < settings.agentora_sandbox_pool_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            else:
+                return self._idle.pop()
+        try:
+            return self._spawn()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return None
+
+    def _release(self, sandbox: _WarmSandbox, broken: bool) -> None:
+        retire = broken or sandbox.executions >= max(1, settings.agentora_sandbox_max_executions)
+        with self._cond:
+            if not retire:
+                self._idle.append(sandbox)
+                self._cond.notify()
+                return
+            self._size -= 1
+            if broken:
+                self.crashed += 1
+            else:
+                self.recycled += 1
+        sandbox.close()
+        threading.Thread(target=self._replenish, name='agentora-sandbox-replenish', daemon=True).start()
+
+    def execute(self, code: str, timeout: float) -> dict | None:
+        """Run a snippet in a warm sandbox; None when the pool is off or no sandbox could be started (caller runs cold)."""
+        if not self.enabled:
+            return None
+        sandbox = self._acquire(wait=timeout)
+        if sandbox is None:
+            return None
+        broken = False
+        try:
+            reply = sandbox.execute(code, timeout)
+        except _SandboxBroken:
+            broken = True
+            # Not retried: the snippet may already have had side effects.
+            return {'ok': False, 'error': 'sandbox_crashed'}
+        finally:
+            self._release(sandbox, broken)
+            with self._cond:
+                self.executions += 1
+        if reply.get('timed_out'):
+            return {'ok': False, 'error': 'timed_out'}
+        return _result(reply.get('stdout', ''), reply.get('stderr', ''), int(reply.get('code', 1)))
+
+    def run_cold(self, code: str, timeout: float) -> dict:
+        """Run a snippet in a one-off interpreter, counted as a cold run."""
+        with self._cond:
+            self.cold_runs += 1
+        return _run_cold(code, timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'size': settings.agentora_sandbox_pool_size,
+                'live': self._size,
+                'idle': len(self._idle),
+                'max_executions': settings.agentora_sandbox_max_executions,
+                'executions': self.executions,
+                'spawned': self.spawned,
+                'recycled': self.recycled,
+                'crashed': self.crashed,
+                'cold_runs': self.cold_runs,
+            }
+
+
+sandbox_pool = SandboxPool()
+
+
+def run_python_sandboxed(code: str, timeout: int = 2) -> dict:
+    result = sandbox_pool.execute(code, timeout)
+    return result if result is not None else sandbox_pool.run_cold(code, timeout)
@@ -0,0 +1,172 @@
+"""Warm sandbox process: reads python_exec requests on stdin and forks one child per snippet.
+
+Runs as a standalone script (standard library only). Each request is one JSON
+line ``{"code", "timeout", "memory_mb"}``; each reply is one JSON line with
+``stdout``/``stderr``/``code`` or ``timed_out``. The forked child gets fresh
+``__main__`` state, its own scratch directory, resource limits, and no
+network, child processes or ``ctypes``, so nothing leaks from one snippet to
+the next while interpreter startup is paid once per process.
+"""
+import atexit
+import builtins
+import json
+import math
+import os
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+import types
+
+MAX_CAPTURE = 64 * 1024
+MAX_FILE_BYTES = 64 * 1024 * 1024
+
+
+# Audit events that start another program (which would run without this hook) or reach native code.
+DENIED_EVENTS = {'subprocess.Popen', 'os.system', 'os.exec', 'os.posix_spawn', 'os.spawn', 'os.fork', 'os.forkpty'}
+# Imported only to start processes without the subprocess.Popen event.
+DENIED_IMPORTS = {'_posixsubprocess'}
+
+
+def _deny_escape(event, args):
+    if event.startswith('socket.'):
+        raise PermissionError('network access is disabled in the sandbox')
+    if event in DENIED_EVENTS or (event == 'import' and args and args[0] in DENIED_IMPORTS):
+        raise PermissionError('starting processes is disabled in the sandbox')
+    if event.startswith('ctypes.'):
+        raise PermissionError('ctypes is disabled in the sandbox')
+
+
+def _limit(kind, value):
+    try:
+        resource.setrlimit(kind, (value, value))
+    except (ValueError, OSError):
+        pass
+
+
+def _child(path, out_path, err_path, timeout, memory_mb):
+    status = 1
+    try:
+        os.setsid()
+        os.chdir(os.path.dirname(path))
+        null = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null, 0)
+        os.dup2(os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 1)
+        os.dup2(os.open(err_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 2)
+        sys.stdin = sys.__stdin__ = open(0, 'r', closefd=False)
+        sys.stdout = sys.__stdout__ = open(1, 'w', closefd=False)
+        sys.stderr = sys.__stderr__ = open(2, 'w', closefd=False)
+
+        # The wall-clock timeout is enforced by the parent; the CPU limit is a backstop behind it.
+        _limit(resource.RLIMIT_CPU, int(math.ceil(timeout)) + 1)
+        if memory_mb > 0:
+            _limit(resource.RLIMIT_AS, memory_mb * 1024 * 1024)
+        _limit(resource.RLIMIT_FSIZE, MAX_FILE_BYTES)
+        sys.addaudithook(_deny_escape)
+
+        sys.argv = [path]
+        sys.path[0] = os.path.dirname(path)
+        main = types.ModuleType('__main__')
+        main.__file__ = path
+        main.__builtins__ = builtins
+        sys.modules['__main__'] = main
+        try:
+            with open(path, encoding='utf-8') as fh:
+                code = compile(fh.read(), path, 'exec')
+            exec(code, main.__dict__)
+            status = 0
+        except SystemExit as exc:
+            if exc.code is None:
+                status = 0
+            elif isinstance(exc.code, int):
+                status = exc.code
+            else:
+                print(exc.code, file=sys.stderr)
+                status = 1
+        except BaseException as exc:
+            # Drop this function's frame so the traceback reads like `python snippet.py`.
+            tb = exc.__traceback__.tb_next if exc.__traceback__ is not None else None
+            traceback.print_exception(type(exc), exc, tb)
+            status = 1
+        try:
+            atexit._run_exitfuncs()
+        except BaseException:
+            pass
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except BaseException:
+                pass
+    finally:
+        os._exit(status & 0xFF if status >= 0 else 0xFF)
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as fh:
+            data = fh.read(MAX_CAPTURE)
+    except OSError:
+        return ''
+    # Match subprocess text mode: decode and translate newlines.
+    return data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _run(request, workdir):
+    # A scratch directory per snippet: files one snippet leaves behind are gone before the next runs.
+    rundir = tempfile.mkdtemp(prefix='run-', dir=workdir)
+    try:
+        return _run_in(request, rundir)
+    finally:
+        shutil.rmtree(rundir, ignore_errors=True)
+
+
+def _run_in(request, rundir):
+    path = os.path.join(rundir, 'snippet.py')
+    out_path = os.path.join(rundir, 'stdout.txt')
+    err_path = os.path.join(rundir, 'stderr.txt')
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write(request.get('code', ''))
+    timeout = float(request.get('timeout', 2))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        _child(path, out_path, err_path, timeout, int(request.get('memory_mb', 0)))
+    deadline = time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        if time.monotonic() >= deadline:
+            for kill in (lambda: os.killpg(pid, signal.SIGKILL), lambda: os.kill(pid, signal.SIGKILL)):
+                try:
+                    kill()
+                except OSError:
+                    pass
+            os.waitpid(pid, 0)
+            return {'timed_out': True}
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
+    return {'stdout': _read(out_path), 'stderr': _read(err_path), 'code': os.waitstatus_to_exitcode(status)}
+
+
+def main():
+    workdir = sys.argv[1]
+    reply = sys.stdout.buffer
+    reply.write(b'{"ready": true}\n')
+    reply.flush()
+    for line in sys.stdin.buffer:
+        try:
+            result = _run(json.loads(line), workdir)
+        except Exception as exc:
+            result = {'error': f'{type(exc).__name__}: {exc}'}
+        reply.write((json.dumps(result) + '\n').encode('utf-8'))
+        reply.flush()
+
+
+if __name__ == '__main__':
+    main()
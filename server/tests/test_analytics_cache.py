@@ -0,0 +1,95 @@
+import threading
+import time
+import uuid
+
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import IntegrationRun
+from app.services.analytics_cache import ALL_REPOS_TAG, AnalyticsCache, analytics_cache, repo_tag
+from app.services.integration_orchestrator import IntegrationOrchestrator
+
+
+def _payload(n: int) -> dict:
+    return {'rows': ['x' * 90] * n}
+
+
+def test_lru_eviction_ttl_and_tag_invalidation(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_enabled', True)
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_max_entries', 3)
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_max_bytes', 0)
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_ttl_seconds', 60)
+    cache = AnalyticsCache()
+    for key, repo in (('a', 'r1'), ('b', 'r2'), ('c', None)):
+        cache.get_or_compute(key, lambda: _payload(1), tags={repo_tag(repo)}, row_count=lambda p: len(p['rows']))
+    assert cache.get('a') is not None  # 'a' is now the most recently used
+    cache.get_or_compute('d', lambda: _payload(1), tags={repo_tag('r1')})
+    assert cache.get('b') is None and cache.evictions == 1
+    assert [e['cache_key'] for e in cache.status()['entries']] == ['d', 'a', 'c']
+    assert cache.status()['entries'][1]['row_count'] == 1
+
+    # Byte cap: a large entry pushes out the least recently used ones.
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_max_bytes', 1000)
+    cache.get_or_compute('big', lambda: _payload(8), tags={ALL_REPOS_TAG})
+    assert cache.bytes <= 1000 and cache.get('big') is not None and len(cache) < 4
+
+    # A change in r1 drops r1's aggregates and the cross-repo ones, nothing else.
+    cache.get_or_compute('r2-only', lambda: _payload(1), tags={repo_tag('r2')})
+    cache.get_or_compute('r1-only', lambda: _payload(1), tags={repo_tag('r1')})
+    assert cache.invalidate_repos(['r1']) >= 2
+    assert cache.get('r1-only') is None and cache.get('big') is None and cache.get('r2-only') is not None
+
+    cache._entries['r2-only'].stored_at -= 61
+    assert cache.get('r2-only') is None and cache.expirations == 1 and cache.bytes == 0
+
+
+def test_concurrent_misses_compute_once_and_racing_invalidation_is_not_cached(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_enabled', True)
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_ttl_seconds', 60)
+    cache = AnalyticsCache()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'rows': [len(calls)]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('trend', slow).payload)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and results == [{'rows': [1]}] * 8
+    assert (cache.misses, cache.coalesced) == (1, 7)
+
+    def invalidated_midway():
+        cache.invalidate(tags={ALL_REPOS_TAG})
+        return {'rows': []}
+
+    assert cache.get_or_compute('stale', invalidated_midway).payload == {'rows': []}
+    assert cache.get('stale') is None and cache.uncached == 1
+
+
+def test_committed_run_change_drops_only_its_repo(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_enabled', True)
+    monkeypatch.setattr(settings, 'agentora_analytics_cache_ttl_seconds', 999)
+    create_db_and_tables()
+    repo_a, repo_b = (f'owner/cache-{uuid.uuid4().hex[:8]}' for _ in range(2))
+    with Session(engine) as session:
+        run = IntegrationRun(repo=repo_a, persona_id='persona-1', status='running', mission_score=20)
+        session.add_all([run, IntegrationRun(repo=repo_b, persona_id='persona-1', status='completed', mission_score=70)])
+        session.commit()
+        orch = IntegrationOrchestrator(session)
+        keys = {name: orch.get_persona_trends(window='all', repo=repo)['cache_metadata']['cache_key'] for name, repo in (('a', repo_a), ('b', repo_b), ('all', None))}
+        assert orch.get_persona_trends(window='all', repo=repo_a)['persona_trends'][0]['average_score'] == 20
+
+        run.mission_score = 90
+        session.add(run)
+        session.flush()
+        assert analytics_cache.get(keys['a']) is not None  # not yet committed
+        session.commit()
+        assert analytics_cache.get(keys['a']) is None and analytics_cache.get(keys['all']) is None
+        assert analytics_cache.get(keys['b']) is not None
+        assert orch.get_persona_trends(window='all', repo=repo_a)['persona_trends'][0]['average_score'] == 90
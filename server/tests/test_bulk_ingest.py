@@ -0,0 +1,94 @@
+import asyncio
+from io import BytesIO
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.db import create_db_and_tables, engine
+from app.models import Capsule, CapsuleEmbedding
+from app.services.runtime import capsules
+from app.services.runtime.capsules import IngestDocument, ingest_documents, ingest_text_as_capsules
+from app.services.runtime.embedding_cache import cached_embed_texts
+from app.services.runtime.vectors import embedding_vector, normalize_vector
+
+from .conftest import make_client
+
+
+def _run_id() -> int:
+    create_db_and_tables()
+    return 930000 + uuid4().int % 30000
+
+
+def test_ingest_writes_document_in_one_commit_with_matching_embeddings():
+    run_id = _run_id()
+    text = ' '.join(f'bulk{uuid4().hex[:6]} sentence {i}.' for i in range(300))
+    with Session(engine) as session:
+        commits = []
+        event.listen(session, 'after_commit', lambda s: commits.append(1))
+        inserted = asyncio.run(ingest_text_as_capsules(session, run_id=run_id, text=text, source='doc'))
+        assert len(commits) == 1
+
+        rows = list(session.exec(
+            select(Capsule, CapsuleEmbedding).join(CapsuleEmbedding, Capsule.id == CapsuleEmbedding.capsule_id).where(Capsule.run_id == run_id).order_by(Capsule.id)
+        ))
+        assert len(rows) == inserted > 2
+        assert [cap.chunk_index for cap, _ in rows] == list(range(inserted))
+        assert rows[0][0].is_summary is True
+        expected = asyncio.run(cached_embed_texts([cap.text for cap, _ in rows]))
+        for (cap, emb), vec in zip(rows, expected):
+            assert embedding_vector(emb).tolist() == pytest.approx(normalize_vector(vec).tolist(), abs=1e-6)
+
+
+def test_pipeline_streams_documents_with_bounded_backpressure(monkeypatch):
+    run_id = _run_id()
+    depth = 1
+    produced = []
+    lead = []
+    real_insert = capsules.insert_capsules_bulk
+
+    def tracking_insert(session, doc, chunks, vectors, summary_added=False):
+        lead.append(len(produced) - len(lead))
+        return real_insert(session, doc, chunks, vectors, summary_added)
+
+    async def documents():
+        for i in range(12):
+            produced.append(i)
+            yield IngestDocument(run_id=run_id, text=f'pipeline doc {i} {uuid4().hex} ' * 20, source=f'file{i}.txt')
+
+    monkeypatch.setattr(capsules, 'insert_capsules_bulk', tracking_insert)
+    with Session(engine) as session:
+        result = asyncio.run(ingest_documents(session, documents(), depth=depth))
+        assert result['documents'] == 12
+        assert [item['source'] for item in result['items']] == [f'file{i}.txt' for i in range(12)]
+        stored = session.exec(select(Capsule).where(Capsule.run_id == run_id)).all()
+        assert len(stored) == result['capsules_created']
+    # Two bounded queues plus one item held by each stage.
+    assert max(lead) <= 2 * depth + 3
+
+
+def test_pipeline_surfaces_embed_failures(monkeypatch):
+    async def broken(texts, model=None):
+        raise RuntimeError('embedder down')
+
+    monkeypatch.setattr(capsules, 'cached_embed_texts', broken)
+    docs = [IngestDocument(run_id=_run_id(), text=f'doc {i} text', source='x') for i in range(10)]
+    with Session(engine) as session:
+        with pytest.raises(RuntimeError, match='embedder down'):
+            asyncio.run(ingest_documents(session, docs, depth=1))
+
+
+def test_batch_attachment_upload_ingests_every_file():
+    c = make_client()
+    t = c.post('/api/teams', json={'name': 'Bulk', 'mode': 'sequential', 'description': '', 'yaml_text': ''}).json()
+    run = c.post('/api/runs', json={'team_id': t['id'], 'prompt': 'x', 'max_turns': 1, 'max_seconds': 10, 'token_budget': 200, 'consensus_threshold': 1}).json()
+    files = [
+        ('files', ('a.txt', BytesIO(f'alpha notes {uuid4().hex}'.encode()), 'text/plain')),
+        ('files', ('b.txt', BytesIO(f'beta notes {uuid4().hex}'.encode()), 'text/plain')),
+        ('files', ('c.bin', BytesIO(b'\x00\x01'), 'application/octet-stream')),
+    ]
+    body = c.post(f"/api/runs/{run['run_id']}/attachments/batch", files=files).json()
+    assert body['ok'] is True
+    assert [a['capsules_created'] for a in body['attachments']] == [1, 1, 0]
+    assert body['capsules_created'] == 2
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import numpy as np
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import Capsule
+from app.services.runtime.ann_index import BruteForceIndex, CapsuleIndex, IVFIndex, capsule_index
+from app.services.runtime.layers import layered_retrieval
+from app.services.runtime.maintenance import demote_capsule
+from app.services.runtime.vectors import build_embedding, normalize_vector
+
+
+def test_ivf_index_recall_against_brute_force():
+    rng = np.random.default_rng(3)
+    data = rng.normal(size=(600, 16))
+    brute = BruteForceIndex()
+    ivf = IVFIndex(nprobe=6)
+    for i, vec in enumerate(data):
+        brute.add(i, i % 3, normalize_vector(vec))
+        ivf.add(i, i % 3, normalize_vector(vec))
+    assert ivf.needs_training
+    ivf.train()
+    assert ivf._centroids.shape[0] and not ivf.needs_training
+    query = normalize_vector(data[17])
+    exact = {cid for cid, _ in brute.search(query, 20)}
+    approx = {cid for cid, _ in ivf.search(query, 20)}
+    assert 17 in approx
+    assert len(exact & approx) >= 14
+    scoped = ivf.search(query, 5, run_id=1)
+    assert scoped and all(cid % 3 == 1 for cid, _ in scoped)
+    ivf.remove(17)
+    assert 17 not in {cid for cid, _ in ivf.search(query, 20)}
+
+    # Once enough rows are dead the matrix is compacted; survivors keep their ids and lists.
+    for i in range(0, 400):
+        ivf.remove(i)
+    assert ivf._size < 600 and len(ivf) == 200
+    assert {cid for cid, _ in ivf.search(normalize_vector(data[450]), 1)} == {450}
+    assert {cid for cid, _ in brute.search(normalize_vector(data[450]), 1)} == {450}
+
+
+def test_ivf_lists_are_trained_in_the_background_not_by_the_adding_call():
+    index = CapsuleIndex()
+    index._backend = 'ivf'
+    rng = np.random.default_rng(5)
+    with index._lock:
+        for i, vec in enumerate(rng.normal(size=(100, 8))):
+            index._add(SimpleNamespace(id=i, run_id=1), normalize_vector(vec))
+        ivf = index._indexes[8]
+        # Adding never trains inline.
+        assert not ivf._centroids.shape[0] and ivf.needs_training
+        index._schedule_training()
+    assert index.wait_trained()
+    assert ivf._centroids.shape[0] and not ivf.needs_training
+    assert index.stats()['trainings'] == 1 and index.stats()['training_dims'] == []
+
+
+def test_layered_retrieval_prefilters_through_index_and_tracks_demotion(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_memory_ann_min_rows', 2)
+    monkeypatch.setattr(settings, 'agentora_memory_ann_candidates', 3)
+    create_db_and_tables()
+    run_id = 960000 + uuid4().int % 30000
+    with Session(engine) as session:
+        caps = []
+        for i, vec in enumerate([[1.0, 0.0, 0.0, 0.0], [0.9, 0.1, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]]):
+            cap = Capsule(run_id=run_id, source='unit', text=f'ann capsule {i}', memory_layer='L4_SPARSE', project_key=f'run:{run_id}', session_key=f'run:{run_id}')
+            session.add(cap)
+            session.commit()
+            session.refresh(cap)
+            session.add(build_embedding(cap.id, vec))
+            session.commit()
+            caps.append(cap)
+
+        capsule_index.sync(session)
+        assert capsule_index.covers([1.0, 0.0, 0.0, 0.0])
+        result = layered_retrieval(session, query_vector=[1.0, 0.0, 0.0, 0.0], query='ann', run_id=run_id, top_k=4)
+        assert result['meta']['candidate_count'] <= 3
+        assert result['items'][0]['capsule_id'] == caps[0].id
+
+        demote_capsule(session, caps[0].id)
+        assert caps[0].memory_layer == 'L5_COLD'
+        hits = {cid for cid, _ in capsule_index.search([1.0, 0.0, 0.0, 0.0], 3, run_id=run_id)}
+        assert caps[0].id not in hits
+
+
+def test_index_syncs_new_embeddings_incrementally_and_keeps_dimensions_apart():
+    create_db_and_tables()
+    run_id = 990000 + uuid4().int % 9000
+
+    def add(session, vec):
+        cap = Capsule(run_id=run_id, source='unit', text=f'dim {len(vec)}', memory_layer='L2_SESSION')
+        session.add(cap)
+        session.commit()
+        session.refresh(cap)
+        session.add(build_embedding(cap.id, vec))
+        session.commit()
+        return cap
+
+    with Session(engine) as session:
+        three = add(session, [0.0, 1.0, 0.0])
+        four = add(session, [0.0, 1.0, 0.0, 0.0])
+        capsule_index.sync(session)
+        assert capsule_index.count(run_id, dim=3) == 1 and capsule_index.count(run_id, dim=4) == 1
+        assert [cid for cid, _ in capsule_index.search([0.0, 1.0, 0.0], 5, run_id=run_id)] == [three.id]
+        assert [cid for cid, _ in capsule_index.search([0.0, 1.0, 0.0, 0.0], 5, run_id=run_id)] == [four.id]
+
+        later = add(session, [0.0, 0.9, 0.1])
+        capsule_index.sync(session)
+        assert capsule_index.count(run_id, dim=3) == 2
+        assert {cid for cid, _ in capsule_index.search([0.0, 1.0, 0.0], 5, run_id=run_id)} == {three.id, later.id}
@@ -0,0 +1,65 @@
+import asyncio
+from uuid import uuid4
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import Capsule
+from app.services.runtime.capsules import IngestDocument, ingest_documents
+from app.services.runtime.chunking import chunk_token_budget, estimate_tokens, iter_chunks
+
+
+def test_chunks_end_on_sentence_boundaries_within_budget():
+    text = ' '.join(f'Sentence number {i} talks about topic {i % 7} in detail.' for i in range(200))
+    chunks = list(iter_chunks([text], max_tokens=60, overlap_tokens=0))
+    assert len(chunks) > 5
+    assert all(c.endswith('.') for c in chunks)
+    assert all(estimate_tokens(c) <= 60 for c in chunks)
+    assert ' '.join(chunks) == text
+
+
+def test_sentences_and_paragraphs_span_block_boundaries():
+    pages = ['First page starts here and the sentence', 'continues on page two. Short one.\n\nNew paragraph on page', 'three.']
+    chunks = list(iter_chunks(pages, max_tokens=20, overlap_tokens=0))
+    assert chunks == ['First page starts here and the sentence continues on page two. Short one.', 'New paragraph on page three.']
+
+
+def test_overlap_repeats_whole_trailing_sentences():
+    text = ' '.join(f'Fact {i} is here.' for i in range(40))
+    chunks = list(iter_chunks([text], max_tokens=30, overlap_tokens=8))
+    for prev, nxt in zip(chunks, chunks[1:]):
+        first_sentence = nxt.split('. ', 1)[0] + '.'
+        assert first_sentence in prev
+        assert prev.rsplit('. ', 1)[-1] in nxt
+
+
+def test_oversized_sentence_splits_on_word_boundaries_and_chunks_are_lazy():
+    words = ' '.join('word' for _ in range(500))
+    chunks = list(iter_chunks([words], max_tokens=50, overlap_tokens=0))
+    assert all(estimate_tokens(c) <= 50 for c in chunks)
+    assert all(set(c.split()) == {'word'} for c in chunks)
+
+    def endless():
+        while True:
+            yield 'A sentence that repeats forever. '
+
+    stream = iter_chunks(endless(), max_tokens=40, overlap_tokens=0)
+    assert estimate_tokens(next(stream)) <= 40
+
+
+def test_budget_respects_embed_model_context(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_chunk_max_tokens', 4000)
+    assert chunk_token_budget('all-minilm:latest') == 230
+    assert chunk_token_budget('unknown-model') == 4000
+
+
+def test_pipeline_chunks_lazy_blocks():
+    create_db_and_tables()
+    run_id = 900000 + uuid4().int % 30000
+    pages = (f'Page {i} {uuid4().hex} describes the system. It has several sentences.' for i in range(30))
+    with Session(engine) as session:
+        result = asyncio.run(ingest_documents(session, [IngestDocument(run_id=run_id, text='', source='paged.pdf', blocks=pages)]))
+        caps = session.exec(select(Capsule).where(Capsule.run_id == run_id).order_by(Capsule.chunk_index)).all()
+    assert result['capsules_created'] == len(caps) > 1
+    assert all(c.text.endswith('.') for c in caps)
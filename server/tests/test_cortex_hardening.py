@@ -1,6 +1,7 @@
 import asyncio
+import json
+import uuid
 
-import requests
 from sqlmodel import Session, select
 
 from app.db import engine
@@ -9,6 +10,7 @@ from app.services.runtime.loop import runtime_loop
 from app.services.runtime.router import choose_model_for_role
 from app.services.runtime.worker_queue import WorkerQueue
 from app.services.runtime.capsules import ingest_text_as_capsules, search_capsules
+from app.services.runtime.trace import decode_payload
 from app.services.tools.registry import registry
 from app.core.config import settings
 from .conftest import make_client
@@ -75,29 +77,30 @@ def test_image_input_triggers_vision_fallback():
 
 def test_worker_timeout_fallback(monkeypatch):
     q = WorkerQueue()
+    monkeypatch.setattr(settings, 'agentora_worker_wait_seconds', 0.2)
     with Session(engine) as session:
         node = q.register(session, 'w1', 'http://worker.local', ['embed_batch'])
-
-        def timeout(*args, **kwargs):
-            raise requests.Timeout('timeout')
-
-        monkeypatch.setattr(requests, 'post', timeout)
+        # The worker never claims, so the awaiting caller gives up and runs locally.
         job = q.dispatch(session, 'embed_batch', {'items': ['x']}, priority=3)
+        q.heartbeat(session, node.id, 'offline')
         assert job.used_fallback_local is True
+        assert job.error == 'worker_timeout'
 
 
 def test_worker_retries_cap(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_worker_retry_backoff_seconds', 0.0)
     q = WorkerQueue()
     with Session(engine) as session:
-        q.register(session, 'w2', 'http://worker2.local', ['python_exec'])
-
-        class Resp:
-            ok = False
-            status_code = 500
-            text = ''
-
-        monkeypatch.setattr(requests, 'post', lambda *a, **k: Resp())
-        job = q.dispatch(session, 'python_exec', {'code': 'print(1)'}, priority=1)
+        job_type = f'retry_probe_{uuid.uuid4().hex[:8]}'
+        node = q.register(session, 'w2', 'http://worker2.local', [job_type])
+        job = q.dispatch(session, job_type, {'code': 'print(1)'}, priority=1, wait=False)
+        for _ in range(settings.agentora_max_worker_retries + 1):
+            leased = [j for j in q.claim(session, node.id) if j.id == job.id]
+            assert leased
+            q.complete(session, job.id, leased[0].lease_token, ok=False, error='http 500')
+        q.heartbeat(session, node.id, 'offline')
+        session.refresh(job)
+        assert job.status == 'failed'
         assert job.retries <= settings.agentora_max_worker_retries
 
 
@@ -143,7 +146,7 @@ def test_blocked_tool_denied_and_logged(monkeypatch):
     rr = c.post('/api/runs', json={'team_id': t['id'], 'prompt': 'hi', 'max_turns': 2, 'max_seconds': 20, 'token_budget': 800, 'consensus_threshold': 1}).json()
     with Session(engine) as session:
         traces = list(session.exec(select(RunTrace).where(RunTrace.run_id == rr['run_id'])))
-        assert any('blocked' in x.payload_json for x in traces)
+        assert any('blocked' in json.dumps(decode_payload(x)) for x in traces)
     settings.agentora_blocked_tool_names = original
 
 
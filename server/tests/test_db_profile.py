@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, select
+
+from app.db import _build_engine, writer_gate
+from app.models import RunTrace
+
+from .conftest import make_client
+
+
+def test_wal_profile_pragmas_and_read_only_pool(tmp_path):
+    url = f'sqlite:///{tmp_path / "profile.db"}'
+    writer = _build_engine(url, profile='wal')
+    reader = _build_engine(url, read_only=True, profile='wal')
+    SQLModel.metadata.create_all(writer, tables=[RunTrace.__table__])
+    with writer.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+    with Session(writer) as session:
+        session.add(RunTrace(run_id=1, event_type='unit'))
+        session.commit()
+    with Session(reader) as session:
+        assert session.exec(select(RunTrace)).first().event_type == 'unit'
+        session.add(RunTrace(run_id=2, event_type='blocked'))
+        with pytest.raises(OperationalError):
+            session.commit()
+
+
+def test_writer_gate_serializes_concurrent_write_transactions(tmp_path):
+    engine = _build_engine(f'sqlite:///{tmp_path / "gate.db"}', profile='wal')
+    SQLModel.metadata.create_all(engine, tables=[RunTrace.__table__])
+    active = []
+    overlaps = []
+    before = writer_gate.stats()['contended']
+
+    def write(i: int) -> None:
+        with Session(engine) as session:
+            session.add(RunTrace(run_id=i, event_type='gate'))
+            session.flush()
+            active.append(i)
+            if len(active) > 1:
+                overlaps.append(tuple(active))
+            time.sleep(0.02)
+            active.remove(i)
+            session.commit()
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not overlaps
+    assert writer_gate.stats()['contended'] > before
+    assert not writer_gate.stats()['held']
+    with Session(engine) as session:
+        assert len(session.exec(select(RunTrace).where(RunTrace.event_type == 'gate')).all()) == 6
+
+
+def test_read_pool_endpoints_and_db_report():
+    client = make_client()
+    assert client.get('/api/analytics/overview').status_code == 200
+    assert client.get('/api/runs').status_code == 200
+    report = client.get('/api/system/db').json()
+    assert report['ok'] is True
+    assert report['journal_mode'] == 'wal'
+    assert report['split_read_pool'] is True
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import httpx
+
+from app.core.config import settings
+from app.services.http_pool import http_pool
+from app.services.ollama_client import OllamaClient, embed_metrics
+
+from .conftest import make_client
+
+
+def _patch_transport(monkeypatch, handler):
+    monkeypatch.setattr(settings, 'agentora_use_mock_ollama', False)
+    monkeypatch.setattr(http_pool, 'async_client', lambda name: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def test_embed_texts_uses_batched_endpoint_and_splits_by_size(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        calls.append((request.url.path, len(body['input'])))
+        return httpx.Response(200, json={'embeddings': [[float(len(t)), 1.0] for t in body['input']]})
+
+    _patch_transport(monkeypatch, handler)
+    monkeypatch.setattr(settings, 'agentora_embed_batch_size', 2)
+    vecs = asyncio.run(OllamaClient().embed_texts(['a', 'bb', 'ccc', 'dddd', 'eeeee']))
+    assert [v[0] for v in vecs] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert calls == [('/api/embed', 2), ('/api/embed', 2), ('/api/embed', 1)]
+
+
+def test_embed_texts_halves_oversized_batches(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if len(body['input']) > 1:
+            return httpx.Response(413, json={'error': 'too large'})
+        return httpx.Response(200, json={'embeddings': [[1.0, 0.0]]})
+
+    _patch_transport(monkeypatch, handler)
+    before = embed_metrics.splits
+    vecs = asyncio.run(OllamaClient().embed_texts(['one', 'two', 'three']))
+    assert len(vecs) == 3
+    assert embed_metrics.splits - before == 2
+
+
+def test_embed_texts_falls_back_to_concurrent_legacy_endpoint(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == '/api/embed':
+            return httpx.Response(404, json={'error': 'not found'})
+        body = json.loads(request.content)
+        return httpx.Response(200, json={'embedding': [float(len(body['prompt']))]})
+
+    _patch_transport(monkeypatch, handler)
+    monkeypatch.setattr(OllamaClient, '_batch_embed_supported', True)
+    vecs = asyncio.run(OllamaClient().embed_texts(['x', 'yy', 'zzz']))
+    assert vecs == [[1.0], [2.0], [3.0]]
+    assert OllamaClient._batch_embed_supported is False
+    assert embed_metrics.snapshot()['recent'][-1]['mode'] == 'concurrent'
+
+
+def test_system_embeddings_endpoint_reports_batches():
+    c = make_client()
+    body = c.get('/api/system/embeddings').json()
+    assert body['ok'] is True
+    assert 'p95_batch_latency_ms' in body['batches']
+
+
+def test_server_errors_are_retried_whole_not_split(monkeypatch):
+    sizes = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        sizes.append(len(body['input']))
+        if len(sizes) < 3:
+            return httpx.Response(500, json={'error': 'model is loading'})
+        return httpx.Response(200, json={'embeddings': [[1.0]] * len(body['input'])})
+
+    _patch_transport(monkeypatch, handler)
+    monkeypatch.setattr(settings, 'agentora_embed_retry_backoff_seconds', 0.0)
+    before = embed_metrics.splits
+    assert len(asyncio.run(OllamaClient().embed_texts(['a', 'b', 'c', 'd']))) == 4
+    assert sizes == [4, 4, 4] and embed_metrics.splits == before
+
+    sizes.clear()
+    monkeypatch.setattr(settings, 'agentora_embed_retries', 0)
+    try:
+        asyncio.run(OllamaClient().embed_texts(['a', 'b']))
+    except httpx.HTTPStatusError as exc:
+        assert exc.response.status_code == 500
+    else:
+        raise AssertionError('an outage should surface, not fan out')
+    assert sizes == [2]
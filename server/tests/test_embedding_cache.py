@@ -0,0 +1,52 @@
+import asyncio
+from uuid import uuid4
+
+from app.core.config import settings
+from app.services.ollama_client import OllamaClient
+from app.services.runtime.embedding_cache import cache_key, cached_embed_texts, embedding_cache
+
+from .conftest import make_client
+
+
+def test_cache_sends_only_misses_and_normalizes_whitespace(monkeypatch):
+    sent: list[list[str]] = []
+    real_embed = OllamaClient.embed_texts
+
+    async def counting_embed(self, texts, model=None):
+        sent.append(list(texts))
+        return await real_embed(self, texts, model=model)
+
+    monkeypatch.setattr(OllamaClient, 'embed_texts', counting_embed)
+    token = uuid4().hex
+    first = asyncio.run(cached_embed_texts([f'alpha {token}', f'beta {token}', f'alpha {token}']))
+    assert sent == [[f'alpha {token}', f'beta {token}']]
+    assert first[0] == first[2]
+
+    embedding_cache.clear_memory()
+    before = embedding_cache.stats()
+    again = asyncio.run(cached_embed_texts([f'  alpha   {token} ', f'gamma {token}']))
+    assert sent[-1] == [f'gamma {token}']
+    assert again[0] == first[0]
+    after = embedding_cache.stats()
+    assert after['db_hits'] - before['db_hits'] == 1
+    assert after['misses'] - before['misses'] == 1
+
+    asyncio.run(cached_embed_texts([f'gamma {token}']))
+    assert len(sent) == 2
+    assert embedding_cache.stats()['memory_hits'] > after['memory_hits']
+
+
+def test_cache_evicts_least_recently_used_rows(monkeypatch):
+    total = embedding_cache.count()
+    monkeypatch.setattr(settings, 'agentora_embed_cache_max_entries', total + 2)
+    token = uuid4().hex
+    asyncio.run(cached_embed_texts([f'evict {i} {token}' for i in range(6)]))
+    assert embedding_cache.count() <= total + 2
+    assert embedding_cache.contains(cache_key(settings.agentora_embed_model, f'evict 5 {token}'))
+    assert embedding_cache.stats()['evictions'] > 0
+
+
+def test_system_embeddings_reports_cache_counters():
+    c = make_client()
+    cache = c.get('/api/system/embeddings').json()['cache']
+    assert {'hits', 'misses', 'hit_rate', 'evictions'} <= set(cache)
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.config import settings
+from app.services.http_pool import HttpPool
+
+from .conftest import make_client
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        return None
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_client_reuses_keepalive_connection(local_server):
+    pool = HttpPool()
+    client = pool.sync_client('worker')
+    assert pool.sync_client('worker') is client
+    for _ in range(3):
+        assert client.get(f'{local_server}/ping').is_success
+    stats = pool.stats()['upstreams']['worker']
+    assert stats['requests'] == 3
+    assert stats['new_connections'] == 1
+    assert stats['reused_connections'] == 2
+    assert stats['in_flight'] == 0
+    pool.close()
+    assert pool.sync_client('worker') is not client
+
+
+def test_async_clients_are_scoped_to_their_event_loop(local_server):
+    pool = HttpPool()
+
+    async def burst(close: bool = True):
+        client = pool.async_client('ollama')
+        assert pool.async_client('ollama') is client
+        for _ in range(2):
+            assert (await client.get(f'{local_server}/ping')).is_success
+        if close:
+            assert await pool.aclose_loop() == 1
+        return client
+
+    first = asyncio.run(burst())
+    second = asyncio.run(burst())
+    assert first is not second and first.is_closed and second.is_closed
+    stats = pool.stats()
+    assert stats['upstreams']['ollama']['requests'] == 4
+    assert stats['upstreams']['ollama']['new_connections'] == 2
+    assert stats['upstreams']['ollama']['reused_connections'] == 2
+    assert stats['async_clients_open'] == 0
+
+    # A loop that ends without closing its clients is noticed by the next loop and counted.
+    leaked = asyncio.run(burst(close=False))
+    assert pool.stats()['async_clients_open'] == 1
+    asyncio.run(burst())
+    assert not leaked.is_closed and pool.stats()['abandoned_async_clients'] == 1
+
+
+def test_pool_limits_override_and_failures_are_counted(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_http_pool_limits', '{"worker": 3}')
+    pool = HttpPool()
+    assert pool._limits('worker').max_connections == 3
+    assert pool._limits('ollama').max_connections == 8
+    with pytest.raises(Exception):
+        pool.sync_client('worker').get('http://127.0.0.1:9/unreachable', timeout=0.5)
+    stats = pool.stats()['upstreams']['worker']
+    assert stats['max_connections'] == 3
+    assert stats['errors'] == 1
+    assert stats['in_flight'] == 0
+    pool.close()
+
+
+def test_system_http_pool_endpoint():
+    c = make_client()
+    body = c.get('/api/system/http-pool').json()
+    assert body['ok'] is True
+    assert 'http2' in body and isinstance(body['upstreams'], dict)
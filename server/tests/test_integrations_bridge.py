@@ -427,6 +427,9 @@ def test_analytics_cache_hit_and_invalidate(monkeypatch):
     inv = client.post('/api/integrations/analytics/cache/invalidate', json={})
     assert inv.status_code == 200
     assert inv.json()['ok'] is True
+    assert client.post('/api/integrations/analytics/cache/invalidate', json={'tags': 'repo:none/such'}).json()['ok'] is True
+    assert client.post('/api/integrations/analytics/cache/invalidate', json={'tags': 5}).status_code == 400
+    assert client.post('/api/integrations/analytics/cache/invalidate', json={'tags': ['repo:x', 3]}).status_code == 400
 
 
 def test_recommendation_explanation_metadata(monkeypatch):
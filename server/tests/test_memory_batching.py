@@ -0,0 +1,74 @@
+import asyncio
+import uuid
+
+import numpy as np
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import Agent
+from app.services.ollama_client import OllamaClient
+from app.services.runtime.capsules import ingest_text_as_capsules, search_capsules_many, search_capsules_sync
+from app.services.runtime.loop import runtime_loop
+from app.services.runtime.vectors import cosine_scores, cosine_scores_many, normalize_vector
+
+
+def _count_embed_requests(monkeypatch) -> list[int]:
+    calls: list[int] = []
+    original = OllamaClient.embed_texts
+
+    async def counting(self, texts, model=None):
+        calls.append(len(texts))
+        return await original(self, texts, model=model)
+
+    monkeypatch.setattr(OllamaClient, 'embed_texts', counting)
+    return calls
+
+
+def test_cosine_scores_many_matches_single_query_scoring():
+    vectors = [normalize_vector([1.0, 0.0, 0.0]), normalize_vector([0.0, 1.0, 0.0]), normalize_vector([1.0, 1.0]), normalize_vector([])]
+    queries = [[1.0, 0.0, 0.0], [0.3, 0.9, 0.1], [], [1.0, 2.0]]
+    matrix = cosine_scores_many(queries, vectors)
+    assert matrix.shape == (4, 4)
+    for row, query in zip(matrix, queries):
+        assert np.allclose(row, cosine_scores(query, vectors), atol=1e-6)
+
+
+def test_multi_query_search_embeds_once_and_matches_single_searches(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_enable_layered_memory', False)
+    create_db_and_tables()
+    run_id = 960000 + uuid.uuid4().int % 10000
+    with Session(engine) as session:
+        asyncio.run(ingest_text_as_capsules(session, run_id=run_id, text='release notes for the beta\n' * 40 + 'deploy checklist and rollback plan\n' * 40, source='unit-test'))
+        calls = _count_embed_requests(monkeypatch)
+        queries = [f'{topic} {uuid.uuid4().hex}' for topic in ('release notes', 'rollback plan', 'beta deploy', 'checklist')]
+        batched = asyncio.run(search_capsules_many(session, queries, run_id=run_id, top_k=2))
+        assert calls == [4]
+
+        vectors = asyncio.run(OllamaClient().embed_texts(queries))
+        for query, vector, items in zip(queries, vectors, batched):
+            single = search_capsules_sync(session, query_vector=vector, run_id=run_id, top_k=2, query=query)
+            assert [i['capsule_id'] for i in items] == [i['capsule_id'] for i in single]
+            assert items and all(i['run_id'] == run_id for i in items)
+
+
+def test_run_agent_step_batches_its_memory_queries(monkeypatch):
+    create_db_and_tables()
+    run_id = 970000 + uuid.uuid4().int % 10000
+    tag = uuid.uuid4().hex
+
+    async def fake_chat_structured(*args, **kwargs):
+        return {'thought': 'look things up', 'need_memory': True, 'memory_queries': [f'{q} {tag}' for q in ('owners', 'deadlines', 'risks', 'budget')], 'tool_calls': [], 'final': 'done', 'handoff': '', 'done': True}
+
+    monkeypatch.setattr(runtime_loop.client, 'chat_structured', fake_chat_structured)
+    with Session(engine) as session:
+        asyncio.run(ingest_text_as_capsules(session, run_id=run_id, text='owners deadlines risks and budget for the launch\n' * 30, source='unit-test'))
+        agent = Agent(name='Recaller', model='mock-mini', role='researcher', system_prompt='recall', tools_json='[]')
+        session.add(agent)
+        session.commit()
+        session.refresh(agent)
+        calls = _count_embed_requests(monkeypatch)
+        result = asyncio.run(runtime_loop.run_agent(session, run_id=run_id, agent=agent, prompt=f'summarize the launch {tag}'))
+    assert result.final_text == 'done'
+    # One request for the subgoal lookup before planning, one for all four memory queries.
+    assert calls == [1, 4]
@@ -0,0 +1,117 @@
+import uuid
+
+from sqlmodel import Session, select
+
+from app.db import create_db_and_tables, engine, writer_gate
+from app.models import IntegrationRun, MissionRollupMember
+from app.services import mission_rollups
+from app.services.integration_orchestrator import IntegrationOrchestrator
+
+from .conftest import make_client
+
+
+def _repo() -> str:
+    return f'owner/rollup-{uuid.uuid4().hex[:8]}'
+
+
+def _seed(session: Session, repo: str) -> list[IntegrationRun]:
+    runs = [
+        IntegrationRun(repo=repo, persona_id='persona-1', status='running', mission_score=40, risk_signal='low', confidence_level='medium', branch_strategy='minimal_patch'),
+        IntegrationRun(repo=repo, persona_id='persona-1', status='completed', mission_score=80, risk_signal='medium', confidence_level='high', pr_url='https://example.test/pr/1'),
+        IntegrationRun(repo=repo, persona_id='persona-1', assigned_persona_id='skeptic', status='failed', mission_score=10, branch_strategy='conservative_fix'),
+    ]
+    session.add_all(runs)
+    session.commit()
+    return runs
+
+
+def _matches_runs(session: Session, repo: str) -> bool:
+    rows = session.exec(select(IntegrationRun).where(IntegrationRun.repo == repo)).all()
+    group_by = ('persona', 'strategy', 'status')
+    ordered = lambda items: sorted(items, key=lambda r: tuple(r[k] for k in group_by))  # noqa: E731
+    return ordered(mission_rollups.totals(session, group_by, repo=repo)) == ordered(mission_rollups.fold(rows, group_by))
+
+
+def test_rollups_follow_every_run_change_and_match_a_rebuild():
+    create_db_and_tables()
+    repo = _repo()
+    with Session(engine) as session:
+        runs = _seed(session, repo)
+        assert _matches_runs(session, repo)
+        orch = IntegrationOrchestrator(session)
+
+        runs[0].status, runs[0].refresh_count, runs[0].writeback_status = 'completed', 3, 'written'
+        session.add(runs[0])
+        session.commit()
+        orch.apply_operator_override(runs[1].id, {'decision': 'accept_recommendation', 'note': 'ok', 'shortlisted': True})
+        orch.set_branch_decision(runs[2].id, eliminated=True)
+        assert _matches_runs(session, repo)
+
+        by_status = mission_rollups.merge(mission_rollups.totals(session, ('status',), repo=repo), lambda r: r['status'])
+        assert by_status['completed']['count'] == 2 and by_status['completed']['writeback_written'] == 1 and 'running' not in by_status
+        persona = mission_rollups.merge(mission_rollups.totals(session, ('persona', 'status'), repo=repo), lambda r: r['persona'])
+        assert persona['persona-1']['override_accept'] == 1 and persona['persona-1']['terminal_success'] == 2
+        assert persona['skeptic']['eliminated'] == 1 and persona['skeptic']['terminal_total'] == 1
+
+        # A rolled-back change never reaches the rollups; a deleted run leaves them.
+        runs[1].mission_score = 5
+        session.add(runs[1])
+        session.flush()
+        session.rollback()
+        assert _matches_runs(session, repo)
+        session.delete(session.get(IntegrationRun, runs[2].id))
+        session.commit()
+        assert _matches_runs(session, repo) and session.get(MissionRollupMember, runs[2].id) is None
+
+        before = mission_rollups.totals(session, ('day', 'repo', 'persona', 'strategy', 'status'))
+        result = mission_rollups.rebuild(session)
+        assert result['runs'] >= 2
+        assert sorted(mission_rollups.totals(session, ('day', 'repo', 'persona', 'strategy', 'status')), key=str) == sorted(before, key=str)
+
+
+def test_backfill_folds_in_untracked_runs_and_skips_when_all_are_tracked():
+    create_db_and_tables()
+    repo = _repo()
+    with Session(engine) as session:
+        runs = _seed(session, repo)
+        # As if the runs predated the rollup tables.
+        for run in runs:
+            mission_rollups.drop_run(session.connection(), run.id)
+        session.commit()
+        assert mission_rollups.totals(session, repo=repo) == []
+        acquired = writer_gate.stats()['acquired']
+        assert mission_rollups.backfill(session) >= len(runs)
+        assert writer_gate.stats()['acquired'] > acquired
+        assert _matches_runs(session, repo)
+        assert mission_rollups.backfill(session) == 0
+
+
+def test_analytics_endpoints_answer_from_rollups():
+    create_db_and_tables()
+    repo = _repo()
+    with Session(engine) as session:
+        runs = _seed(session, repo)
+        # Simulate a run written before the rollups existed; startup backfill folds it in.
+        mission_rollups.drop_run(session.connection(), runs[0].id)
+        session.commit()
+        assert session.get(MissionRollupMember, runs[0].id) is None
+    client = make_client()
+
+    trends = client.get('/api/integrations/persona-trends', params={'window': '7d', 'repo': repo}).json()['persona_trends']
+    by_persona = {t['persona_id']: t for t in trends}
+    assert by_persona['persona-1']['mission_count'] == 2 and by_persona['persona-1']['average_score'] == 60
+    assert by_persona['persona-1']['pr_rate'] == 0.5 and by_persona['persona-1']['terminal_success_rate'] == 1.0
+    assert by_persona['skeptic']['terminal_success_rate'] == 0.0
+
+    matrix = client.get('/api/integrations/persona-trends/matrix', params={'window': 'all', 'repo': repo}).json()['matrix']
+    assert {(m['persona_id'], m['strategy'], m['count']) for m in matrix} == {('persona-1', 'minimal_patch', 1), ('persona-1', 'unspecified', 1), ('skeptic', 'conservative_fix', 1)}
+
+    cohorts = {g['group']: g for g in client.get('/api/integrations/cohorts', params={'group_by': 'repo'}).json()['groups']}
+    assert cohorts[repo]['count'] == 3 and cohorts[repo]['terminal_success_rate'] == 0.5
+
+    insights = client.get('/api/integrations/insights').json()
+    assert insights['missions_by_persona']['skeptic'] >= 1 and insights['missions_by_status']['running'] >= 1
+
+    rebuilt = client.post('/api/integrations/analytics/rollups/rebuild').json()
+    status = client.get('/api/integrations/analytics/rollups').json()
+    assert rebuilt['ok'] is True and status['runs_tracked'] == rebuilt['runs'] and status['rollup_rows'] == rebuilt['rollup_rows']
@@ -10,3 +10,24 @@ def test_attachment_upload_and_pdf_extract_route():
     up = c.post(f"/api/runs/{run['run_id']}/attachments", files={'file': ('a.pdf', BytesIO(pdf_bytes), 'application/pdf')})
     assert up.status_code == 200
     assert up.json()['ok'] is True
+
+
+def test_pdf_pages_are_parsed_once_and_ingested_whole_on_both_routes(monkeypatch):
+    from app.routers import multimodal
+
+    calls = []
+    pages = ['First page sentence about the launch. ' * 400, 'Closing page mentions the zebra budget. ' * 200]
+
+    def fake_pages(path):
+        calls.append(path)
+        yield from pages
+
+    monkeypatch.setattr(multimodal, 'iter_pdf_pages', fake_pages)
+    c = make_client()
+    t = c.post('/api/teams', json={'name': 'MM2', 'mode': 'sequential', 'description': '', 'yaml_text': ''}).json()
+    run = c.post('/api/runs', json={'team_id': t['id'], 'prompt': 'x', 'max_turns': 1, 'max_seconds': 10, 'token_budget': 200, 'consensus_threshold': 1}).json()
+    single = c.post(f"/api/runs/{run['run_id']}/attachments", files={'file': ('one.pdf', BytesIO(b'%PDF-1.1'), 'application/pdf')}).json()
+    batch = c.post(f"/api/runs/{run['run_id']}/attachments/batch", files=[('files', ('two.pdf', BytesIO(b'%PDF-1.1'), 'application/pdf'))]).json()
+    assert len(calls) == 2
+    # The stored extract is capped, but both routes chunk every page, so both create the same capsules.
+    assert len(''.join(pages)) > 20000 and single['capsules_created'] == batch['capsules_created'] > 1
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import WriterBusyError, create_db_and_tables, engine, writer_flow, writer_gate
+from app.models import Agent, ToolCall
+from app.services.runtime.loop import runtime_loop
+from app.services.runtime.offload import blocking_pool, loop_lag
+from app.services.tools.registry import ToolSpec, registry
+
+from .conftest import make_client
+
+
+async def _with_lag_monitor(coro):
+    loop_lag.reset()
+    loop_lag.start()
+    try:
+        return await coro
+    finally:
+        await loop_lag.stop()
+
+
+def test_loop_lag_sees_stalls_only_when_work_stays_on_the_loop(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_loop_lag_interval_ms', 10)
+
+    async def offloaded():
+        await asyncio.sleep(0.05)
+        await asyncio.gather(*[blocking_pool.run('subprocess', time.sleep, 0.3) for _ in range(3)])
+
+    async def inline():
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(_with_lag_monitor(offloaded()))
+    responsive = loop_lag.stats()
+    assert responsive['ticks'] >= 10
+    assert responsive['max_ms'] < 150 and responsive['stalls'] == 0
+    assert blocking_pool.stats()['kinds']['subprocess']['calls'] >= 3
+
+    asyncio.run(_with_lag_monitor(inline()))
+    assert loop_lag.stats()['max_ms'] >= 250
+    assert loop_lag.stats()['stalls'] >= 1
+
+
+def test_slow_tool_in_run_agent_does_not_block_the_loop(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setattr(settings, 'agentora_loop_lag_interval_ms', 10)
+    tool_threads = []
+
+    def slow_fetch(url: str) -> dict:
+        tool_threads.append(threading.get_ident())
+        time.sleep(0.4)
+        return {'ok': True, 'url': url}
+
+    async def fake_chat_structured(*args, **kwargs):
+        return {'thought': 'fetch', 'need_memory': False, 'memory_queries': [], 'tool_calls': [{'name': 'http_fetch', 'args': {'url': 'http://example.invalid'}}], 'final': 'fetched', 'handoff': '', 'done': True}
+
+    monkeypatch.setitem(registry._tools, 'http_fetch', ToolSpec('http_fetch', {'url': 'string'}, 'network:http', slow_fetch))
+    monkeypatch.setattr(runtime_loop.client, 'chat_structured', fake_chat_structured)
+    with Session(engine) as session:
+        agent = Agent(name='Fetcher', model='mock-mini', role='ops', system_prompt='fetch', tools_json='["http_fetch"]')
+        session.add(agent)
+        session.commit()
+        session.refresh(agent)
+        run_id = 940000 + (agent.id or 0)
+        result = asyncio.run(_with_lag_monitor(runtime_loop.run_agent(session, run_id=run_id, agent=agent, prompt='fetch it')))
+        assert result.final_text == 'fetched' and result.tool_calls_count == 1
+        assert session.exec(select(ToolCall).where(ToolCall.run_id == run_id)).first().tool_name == 'http_fetch'
+    assert tool_threads and tool_threads[0] != threading.main_thread().ident
+    assert loop_lag.stats()['max_ms'] < 200
+    assert blocking_pool.stats()['kinds']['http']['max_run_ms'] >= 350
+
+
+def test_offloaded_calls_share_one_writer_flow_per_task(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_sqlite_busy_timeout_ms', 200)
+
+    class _Probe:
+        def __init__(self):
+            self.info = {}
+
+    async def task_flow():
+        flows = [await blocking_pool.run('db', writer_flow.get) for _ in range(3)]
+        return flows
+
+    async def main():
+        return await asyncio.gather(task_flow(), task_flow())
+
+    first, second = asyncio.run(main())
+    assert len(set(first)) == 1 and len(set(second)) == 1 and first[0] != second[0]
+
+    holder, nested, other = _Probe(), _Probe(), _Probe()
+    before = writer_gate.stats()
+    token = writer_flow.set(first[0])
+    try:
+        writer_gate.acquire(holder)
+
+        def same_flow():
+            writer_flow.set(first[0])
+            writer_gate.acquire(nested)
+
+        def other_flow():
+            writer_flow.set(second[0])
+            try:
+                writer_gate.acquire(other)
+            except WriterBusyError as exc:
+                errors.append(exc)
+
+        errors = []
+
+        for target in (same_flow, other_flow):
+            t = threading.Thread(target=target)
+            t.start()
+            t.join()
+        after = writer_gate.stats()
+        # Same flow on another thread passes through; a different flow waits out the busy timeout and is refused.
+        assert not nested.info and not other.info and len(errors) == 1
+        assert after['timeouts'] - before['timeouts'] == 1
+    finally:
+        writer_gate.release(holder)
+        writer_flow.reset(token)
+
+
+def test_gate_has_no_thread_passthrough_and_never_waits_on_the_loop(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_sqlite_busy_timeout_ms', 2000)
+
+    class _Probe:
+        def __init__(self):
+            self.info = {}
+
+    holder, same_thread, on_loop = _Probe(), _Probe(), _Probe()
+    before = writer_gate.stats()
+    writer_gate.acquire(holder)
+    try:
+        monkeypatch.setattr(settings, 'agentora_sqlite_busy_timeout_ms', 50)
+        # Another session on the holder's thread, outside any writer flow, is just another writer.
+        with pytest.raises(WriterBusyError):
+            writer_gate.acquire(same_thread)
+        monkeypatch.setattr(settings, 'agentora_sqlite_busy_timeout_ms', 2000)
+
+        async def write_on_loop():
+            started = time.monotonic()
+            with pytest.raises(WriterBusyError):
+                writer_gate.acquire(on_loop)
+            return time.monotonic() - started
+
+        assert asyncio.run(write_on_loop()) < 0.5
+    finally:
+        writer_gate.release(holder)
+    after = writer_gate.stats()
+    assert not same_thread.info and not on_loop.info
+    assert after['timeouts'] - before['timeouts'] == 1 and after['loop_refusals'] - before['loop_refusals'] == 1
+
+
+def test_write_refused_by_a_busy_gate_is_a_503(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_sqlite_busy_timeout_ms', 100)
+
+    class _Probe:
+        def __init__(self):
+            self.info = {}
+
+    holder = _Probe()
+    client = make_client()
+    writer_gate.acquire(holder)
+    try:
+        resp = client.post('/api/teams', json={'name': 'Busy', 'mode': 'sequential', 'description': '', 'yaml_text': ''})
+    finally:
+        writer_gate.release(holder)
+    assert resp.status_code == 503 and resp.json()['error'] == 'database_busy'
+    assert resp.headers['retry-after'] == '1'
+
+
+def test_loop_lag_endpoint_reports_monitor_and_pool():
+    with make_client() as client:
+        payload = client.get('/api/system/loop-lag').json()
+    assert payload['ok'] is True
+    assert payload['loop_lag']['running'] is True
+    assert 'max_workers' in payload['blocking_pool']
@@ -0,0 +1,72 @@
+from uuid import uuid4
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.db import create_db_and_tables, engine
+from app.models import Capsule, CapsuleEmbedding, DuplicateCluster, MemoryCapsuleState, MemoryConflict, MemoryEdge
+from app.services.runtime.bookkeeping import retrieval_bookkeeping
+from app.services.runtime.conflicts import text_hash
+from app.services.runtime.layers import layered_retrieval
+from app.services.runtime.write_behind import memory_write_behind
+
+
+def _seed(session: Session, run_id: int, texts: list[str], layer: str = 'L1_SHORT') -> list[int]:
+    caps = [Capsule(run_id=run_id, source='unit', text=t, memory_layer=layer, project_key=f'run:{run_id}', session_key=f'run:{run_id}') for t in texts]
+    session.add_all(caps)
+    session.commit()
+    session.add_all([CapsuleEmbedding(capsule_id=c.id, vector_json='[1.0,0.0,0.0]') for c in caps])
+    session.commit()
+    return [c.id for c in caps]
+
+
+def test_retrieval_commits_once_and_defers_bookkeeping():
+    create_db_and_tables()
+    run_id = 880000 + uuid4().int % 30000
+    tag = uuid4().hex[:8]
+    with Session(engine) as session:
+        ids = _seed(session, run_id, [f'{tag} deploy should not skip review', f'{tag} deploy should skip review', f'{tag} notes on rollout'])
+        ids += _seed(session, run_id, [f'{tag} extra context'], layer='L2_SESSION')
+        commits = []
+        event.listen(session, 'after_commit', lambda s: commits.append(1))
+        result = layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='deploy', run_id=run_id, top_k=6)
+        assert len(commits) == 1
+        assert any(item['conflict_flag'] for item in result['items'])
+        assert result['meta']['conflict_count'] >= 1
+
+        # Counters, edges, clusters and conflicts all wait for the write-behind flush.
+        admitted = [item['capsule_id'] for item in result['items']]
+        assert not session.exec(select(MemoryCapsuleState).where(MemoryCapsuleState.capsule_id.in_(admitted))).all()
+        assert not session.exec(select(MemoryConflict).where(MemoryConflict.left_capsule_id.in_(ids))).all()
+        assert retrieval_bookkeeping.stats()['pending_runs'] >= 1
+        flushed = memory_write_behind.flush(session)
+        assert flushed['conflicts'] >= 1 and flushed['clustered'] >= len(ids)
+        assert session.exec(select(MemoryConflict).where(MemoryConflict.left_capsule_id.in_(ids))).all()
+        states = session.exec(select(MemoryCapsuleState).where(MemoryCapsuleState.capsule_id.in_(admitted))).all()
+        assert {s.capsule_id for s in states} == set(admitted)
+        edges = session.exec(select(MemoryEdge).where(MemoryEdge.from_capsule_id.in_(ids), MemoryEdge.edge_type == 'co_retrieval')).all()
+        assert len(edges) == min(4, len(admitted)) * (min(4, len(admitted)) - 1) // 2
+        session.expire_all()
+        assert all(session.get(Capsule, cid).duplicate_cluster_id for cid in ids)
+
+        layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='deploy', run_id=run_id, top_k=6)
+        memory_write_behind.flush(session)
+        reinforced = session.exec(select(MemoryEdge).where(MemoryEdge.from_capsule_id.in_(ids), MemoryEdge.edge_type == 'co_retrieval')).all()
+        pairs = [(e.from_capsule_id, e.to_capsule_id) for e in reinforced]
+        assert len(pairs) == len(set(pairs))
+        assert any(e.usage_count == 2 for e in reinforced)
+
+
+def test_batched_clusters_suppress_normalized_duplicates():
+    create_db_and_tables()
+    run_id = 880000 + uuid4().int % 30000
+    tag = uuid4().hex[:8]
+    with Session(engine) as session:
+        _seed(session, run_id, [f'{tag} Same   fact', f'{tag} same fact', f'{tag} different fact'])
+        first = layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='fact', run_id=run_id, top_k=6)
+        memory_write_behind.flush(session)
+        second = layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='fact', run_id=run_id, top_k=6)
+        assert len(first['items']) == len(second['items']) == 2
+        cluster = session.exec(select(DuplicateCluster).where(DuplicateCluster.hash_key == text_hash(f'{tag} same fact'))).first()
+        assert cluster.cluster_size == 2
+        assert cluster.id in {item['duplicate_cluster_id'] for item in second['items']}
@@ -0,0 +1,209 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import Agent, Run, RunTrace, Team, TeamAgent
+from app.services.orchestration.engine import OrchestrationEngine
+from app.services.orchestration.scheduler import RunScheduler
+from app.services.runtime.loop import runtime_loop
+from app.services.runtime.offload import blocking_pool
+
+from .conftest import make_client
+
+
+class _FakeResult:
+    tool_calls_count = 0
+    stop_reason = 'completed'
+    warnings: list = []
+    worker_used = False
+    model_used = ['mock-mini']
+
+    def __init__(self, text: str):
+        self.final_text = text
+
+
+def _seed_team(session: Session) -> int:
+    agent = Agent(name='Solo', model='mock-mini', role='executor', system_prompt='do', tools_json='[]')
+    team = Team(name='SchedTeam', description='team', mode='single_agent', yaml_text='')
+    session.add(agent)
+    session.add(team)
+    session.commit()
+    session.add(TeamAgent(team_id=team.id, agent_id=agent.id, position=0))
+    session.commit()
+    return team.id
+
+
+def _wait_for(predicate, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_background_run_submit_and_poll(monkeypatch):
+    async def fake_run_agent(session, run_id, agent, prompt, image_paths=None, max_steps=None):
+        await asyncio.sleep(0.05)
+        return _FakeResult(f'{agent.role} done')
+
+    monkeypatch.setattr(runtime_loop, 'run_agent', fake_run_agent)
+    create_db_and_tables()
+    with Session(engine) as session:
+        team_id = _seed_team(session)
+    with make_client() as client:
+        submitted = client.post('/api/runs', json={'team_id': team_id, 'prompt': 'write the release notes', 'background': True, 'priority': 2})
+        assert submitted.status_code == 202
+        body = submitted.json()
+        assert body['status'] == 'queued' and body['poll'] == f"/api/runs/{body['run_id']}"
+
+        assert _wait_for(lambda: client.get(body['poll']).json()['run']['status'] == 'completed')
+        polled = client.get(body['poll']).json()
+        assert polled['run']['priority'] == 2 and polled['messages']
+        stats = client.get('/api/runs/scheduler').json()
+        assert stats['completed'] >= 1 and stats['queue_depth'] == 0
+        assert stats['wait_ms']['max'] >= 0 and stats['run_ms']['max'] > 0
+    with Session(engine) as session:
+        events = [t.event_type for t in session.exec(select(RunTrace).where(RunTrace.run_id == body['run_id']))]
+        assert 'run_started' in events
+
+
+def test_scheduler_limits_priorities_fairness_and_pause(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_run_scheduler_max_concurrent', 2)
+    monkeypatch.setattr(settings, 'agentora_run_scheduler_max_per_team', 1)
+    create_db_and_tables()
+    started: list[int] = []
+    release: dict[int, threading.Event] = {}
+
+    async def fake_execute(self, session, run, prompt, reflection=False):
+        started.append(run.id)
+        while not release[run.id].is_set():
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(OrchestrationEngine, 'execute', fake_execute)
+    scheduler = RunScheduler()
+    scheduler.start()
+    try:
+        with Session(engine) as session:
+            runs = [Run(team_id=team, status='pending', prompt='p') for team in (9101, 9101, 9101, 9102, 9103)]
+            session.add_all(runs)
+            session.commit()
+            a1, a2, a3, b1, c1 = [r.id for r in runs]
+        release.update({rid: threading.Event() for rid in (a1, a2, a3, b1, c1)})
+
+        # Hold everything while submitting so dispatch order is decided by the queue, not arrival timing.
+        for rid in (a1, a2, a3, b1, c1):
+            scheduler.pause(rid)
+        for rid, team, priority in ((a1, 9101, 5), (a2, 9101, 5), (a3, 9101, 5), (b1, 9102, 5), (c1, 9103, 1)):
+            scheduler.submit(rid, team, 'p', priority=priority)
+        with scheduler._lock:
+            scheduler._paused.clear()
+        scheduler.pause(a3)
+        scheduler.resume(a1)
+
+        # Both start together; their order in `started` depends on which DB write lands first.
+        assert _wait_for(lambda: sorted(started) == sorted([c1, a1]))
+        time.sleep(0.1)
+        assert scheduler.stats()['active_runs'] == 2 and scheduler.stats()['queue_depth'] == 3
+
+        release[c1].set()
+        # Team 9101 is at its per-team limit, so the other team's run goes next.
+        assert _wait_for(lambda: started[2:] == [b1])
+        release[a1].set()
+        assert _wait_for(lambda: started[2:] == [b1, a2])
+        release[b1].set()
+        release[a2].set()
+        assert _wait_for(lambda: scheduler.stats()['active_runs'] == 0)
+        assert a3 not in started and scheduler.is_queued(a3)
+
+        scheduler.resume(a3)
+        assert _wait_for(lambda: started[-1] == a3)
+        release[a3].set()
+        assert _wait_for(lambda: scheduler.stats()['completed'] == 5)
+        stats = scheduler.stats()
+        assert stats['queue_depth'] == 0 and stats['failed'] == 0
+        assert stats['wait_ms']['max'] >= 100
+    finally:
+        for event in release.values():
+            event.set()
+        scheduler.stop()
+    with Session(engine) as session:
+        assert session.get(Run, a3).status == 'running' and session.get(Run, a3).wait_ms >= 100
+
+
+def test_pause_gates_a_running_run_between_subgoals(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_enable_single_agent_fallback', False)
+    create_db_and_tables()
+    calls: list[float] = []
+
+    async def fake_run_agent(session, run_id, agent, prompt, image_paths=None, max_steps=None):
+        calls.append(time.monotonic())
+        await asyncio.sleep(0.1)
+        return _FakeResult(f'step {len(calls)}')
+
+    monkeypatch.setattr(runtime_loop, 'run_agent', fake_run_agent)
+    with Session(engine) as session:
+        team_id = _seed_team(session)
+        helper = Agent(name='Critic', model='mock-mini', role='critic', system_prompt='check', tools_json='[]')
+        session.add(helper)
+        session.commit()
+        session.add(TeamAgent(team_id=team_id, agent_id=helper.id, position=1))
+        session.commit()
+    with make_client() as client:
+        run_id = client.post('/api/runs', json={'team_id': team_id, 'prompt': 'plan then build then verify', 'background': True}).json()['run_id']
+        assert _wait_for(lambda: len(calls) >= 1)
+        assert client.post(f'/api/runs/{run_id}/pause').status_code == 200
+        time.sleep(0.4)
+        frozen = len(calls)
+        time.sleep(0.3)
+        assert len(calls) == frozen < 4
+        with Session(engine) as session:
+            assert session.get(Run, run_id).status == 'paused'
+
+        assert client.post(f'/api/runs/{run_id}/resume').json() == {'ok': True, 'status': 'running'}
+        assert _wait_for(lambda: client.get(f'/api/runs/{run_id}').json()['run']['status'] == 'completed')
+        assert len(calls) == 4
+        assert client.post(f'/api/runs/{run_id}/resume').status_code == 409
+    with Session(engine) as session:
+        events = [t.event_type for t in session.exec(select(RunTrace).where(RunTrace.run_id == run_id))]
+        assert 'run_paused' in events and 'run_resumed' in events
+
+
+def test_recover_holds_paused_unstarted_runs_and_records_failures(monkeypatch):
+    create_db_and_tables()
+
+    async def failing_execute(self, session, run, prompt, reflection=False):
+        run.result_summary = 'half written'
+        session.add(run)
+        # Leaves an open write transaction behind, as a step failing mid-write would.
+        await blocking_pool.run('db', session.flush)
+        raise RuntimeError('agent crashed')
+
+    monkeypatch.setattr(OrchestrationEngine, 'execute', failing_execute)
+    with Session(engine) as session:
+        queued_at = datetime.utcnow()
+        run = Run(team_id=9201, status='paused', prompt='p', queued_at=queued_at, started_at=queued_at)
+        session.add(run)
+        session.commit()
+        run_id = run.id
+    scheduler = RunScheduler()
+    scheduler.start()
+    try:
+        assert scheduler.is_queued(run_id) and scheduler.is_paused(run_id)
+        scheduler.resume(run_id)
+
+        def ended():
+            with Session(engine) as session:
+                return session.get(Run, run_id).status == 'failed'
+
+        assert _wait_for(ended)
+    finally:
+        scheduler.stop()
+    with Session(engine) as session:
+        assert 'agent crashed' in session.get(Run, run_id).result_summary
+    assert not scheduler.is_paused(run_id)
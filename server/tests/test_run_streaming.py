@@ -0,0 +1,185 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import Agent, Message, Run, RunTrace, Team, TeamAgent
+from app.services.ollama_client import OllamaClient
+from app.services.orchestration.engine import OrchestrationEngine
+from app.services.runtime.loop import runtime_loop
+from app.services.runtime.run_events import RunEventBus, run_events
+from app.services.runtime.trace import decode_payload
+
+from .conftest import make_client
+
+
+def _parse_sse(body: str) -> list[dict]:
+    events = []
+    for block in body.split('\n\n'):
+        data = [line[len('data: '):] for line in block.splitlines() if line.startswith('data: ')]
+        if data:
+            events.append(json.loads(data[0]))
+    return events
+
+
+def test_bounded_subscribers_drop_oldest_or_disconnect(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_stream_buffer_size', 3)
+
+    async def drop_oldest():
+        bus = RunEventBus()
+        sub = bus.subscribe(7)
+        for i in range(10):
+            bus.publish(7, 'token', {'i': i})
+        # Publishing from another thread wakes the subscriber's loop.
+        threading.Thread(target=bus.close_run, args=(7, 'completed')).start()
+        return [e async for e in sub.events(heartbeat_seconds=1.0)], bus
+
+    events, bus = asyncio.run(drop_oldest())
+    assert events[0]['type'] == 'lag' and events[0]['data']['dropped'] >= 7
+    kept = [e['data']['i'] for e in events if e['type'] == 'token']
+    assert kept and kept == list(range(10 - len(kept), 10))
+    assert events[-1]['type'] == 'end' and events[-1]['data'] == {'status': 'completed'}
+    assert bus.stats()['dropped'] >= 7 and bus.stats()['subscribers'] == 0
+
+    monkeypatch.setattr(settings, 'agentora_stream_overflow_policy', 'disconnect')
+
+    async def disconnect():
+        bus = RunEventBus()
+        sub = bus.subscribe(8)
+        for i in range(5):
+            bus.publish(8, 'token', {'i': i})
+        return [e async for e in sub.events(heartbeat_seconds=1.0)], bus
+
+    events, bus = asyncio.run(disconnect())
+    assert [e['data']['i'] for e in events if e['type'] == 'token'] == [0, 1, 2]
+    assert events[-1]['type'] == 'end' and events[-1]['data'] == {'reason': 'lagged'}
+    assert bus.stats()['disconnected'] == 1
+
+
+def test_live_stream_pushes_actions_tokens_and_traces(monkeypatch):
+    create_db_and_tables()
+    original = OllamaClient.chat_structured
+
+    async def wait_for_subscriber(self, *args, **kwargs):
+        # Hold the planner call until the SSE client is attached so no live token is missed.
+        for _ in range(500):
+            if any(run_events.has_subscribers(rid) for rid in submitted):
+                break
+            await asyncio.sleep(0.01)
+        return await original(self, *args, **kwargs)
+
+    submitted: list[int] = []
+    monkeypatch.setattr(runtime_loop.client.__class__, 'chat_structured', wait_for_subscriber)
+    with Session(engine) as session:
+        agent = Agent(name='Streamer', model='mock-mini', role='executor', system_prompt='do', tools_json='[]')
+        team = Team(name='StreamTeam', description='team', mode='single_agent', yaml_text='')
+        session.add(agent)
+        session.add(team)
+        session.commit()
+        session.add(TeamAgent(team_id=team.id, agent_id=agent.id, position=0))
+        session.commit()
+        team_id = team.id
+
+    with make_client() as client:
+        run_id = client.post('/api/runs', json={'team_id': team_id, 'prompt': 'summarize the notes', 'background': True}).json()['run_id']
+        submitted.append(run_id)
+        with client.stream('GET', f'/api/runs/{run_id}/stream') as resp:
+            assert resp.headers['content-type'].startswith('text/event-stream')
+            body = ''.join(resp.iter_text())
+        events = _parse_sse(body)
+        types = [e['type'] for e in events]
+        for expected in ('trace', 'first_token', 'token', 'action', 'final'):
+            assert expected in types, expected
+        assert types[-1] == 'end' and events[-1]['data']['status'] == 'completed'
+        seqs = [e['seq'] for e in events if e['seq'] is not None]
+        assert seqs == sorted(seqs) and len(seqs) == len(set(seqs))
+        assert types.index('first_token') < types.index('action')
+        tokens = ''.join(e['data']['text'] for e in events if e['type'] == 'token')
+        assert json.loads(tokens)['done'] is True
+
+        stats = client.get('/api/system/streaming').json()
+        assert stats['ttft']['calls'] >= 1 and stats['ttft']['max_ttft_ms'] >= 0
+        assert stats['events']['published'] >= len(events) - 1
+
+    with Session(engine) as session:
+        timing = session.exec(select(RunTrace).where(RunTrace.run_id == run_id, RunTrace.event_type == 'model_timing')).first()
+        assert decode_payload(timing)['ttft_ms'] is not None
+
+
+def test_finished_run_stream_replays_persisted_messages():
+    create_db_and_tables()
+    with Session(engine) as session:
+        run = Run(team_id=1, status='completed')
+        session.add(run)
+        session.commit()
+        session.add(Message(run_id=run.id, role='user', content='hi'))
+        session.add(Message(run_id=run.id, role='assistant', content='hello'))
+        session.commit()
+        run_id = run.id
+    client = make_client()
+    events = _parse_sse(client.get(f'/api/runs/{run_id}/stream').text)
+    assert [(e['type'], e['data'].get('content')) for e in events] == [('message', 'hi'), ('message', 'hello'), ('end', None)]
+    assert client.get('/api/runs/99999999/stream').status_code == 404
+
+
+def test_failed_run_publishes_end_and_ended_runs_stream_without_waiting(monkeypatch):
+    create_db_and_tables()
+
+    def broken_prepare(self, session, run, prompt):
+        raise RuntimeError('planner down')
+
+    monkeypatch.setattr(OrchestrationEngine, '_prepare', broken_prepare)
+    with Session(engine) as session:
+        run = Run(team_id=1, status='running')
+        session.add(run)
+        session.commit()
+        run_id = run.id
+        run_events.publish(run_id, 'trace', {'event_type': 'run_started'})
+        with pytest.raises(RuntimeError, match='planner down'):
+            asyncio.run(OrchestrationEngine().execute(session, run, 'x'))
+        run_events.close_run(run_id, 'failed')
+        run.status = 'failed'
+        session.add(run)
+        session.commit()
+    client = make_client()
+    events = _parse_sse(client.get(f'/api/runs/{run_id}/stream').text)
+    assert [(e['type'], e['data'].get('status')) for e in events] == [('trace', None), ('end', 'failed')]
+    # Without replay there is nothing buffered to send, so the stream ends at once rather than hanging.
+    assert [e['type'] for e in _parse_sse(client.get(f'/api/runs/{run_id}/stream', params={'replay': False}).text)] == ['end']
+
+
+def test_stream_ends_for_runs_that_finish_while_subscribing_or_that_nothing_executes(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setattr(settings, 'agentora_stream_heartbeat_seconds', 0.05)
+    with Session(engine) as session:
+        finishing, orphaned = Run(team_id=1, status='running'), Run(team_id=1, status='running')
+        session.add(finishing)
+        session.add(orphaned)
+        session.commit()
+        finishing_id, orphaned_id = finishing.id, orphaned.id
+    subscribe = run_events.subscribe
+
+    def finish_then_subscribe(run_id, replay=True):
+        if run_id == finishing_id:
+            # The run ends, and publishes its end, between the route's status check and the subscription.
+            with Session(engine) as session:
+                run = session.get(Run, run_id)
+                run.status = 'completed'
+                session.add(run)
+                session.commit()
+            run_events.close_run(run_id, 'completed')
+        return subscribe(run_id, replay=replay)
+
+    monkeypatch.setattr(run_events, 'subscribe', finish_then_subscribe)
+    client = make_client()
+    events = _parse_sse(client.get(f'/api/runs/{finishing_id}/stream', params={'replay': False}).text)
+    assert [(e['type'], e['data']) for e in events] == [('end', {'reason': 'completed'})]
+
+    # Left 'running' by a crashed process: no one will publish its end, so the stream gives up once idle.
+    monkeypatch.setattr(settings, 'agentora_stream_idle_seconds', 0.2)
+    events = _parse_sse(client.get(f'/api/runs/{orphaned_id}/stream').text)
+    assert [(e['type'], e['data']) for e in events] == [('end', {'reason': 'idle'})]
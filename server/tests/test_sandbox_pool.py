@@ -0,0 +1,85 @@
+import os
+import re
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.tools.sandbox import SandboxPool, _run_cold
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='warm sandboxes need fork')
+
+
+def _normalized(result: dict) -> dict:
+    if result.get('ok'):
+        result = {**result, 'stderr': re.sub(r'"[^"]*snippet\.py"', '"snippet.py"', result['stderr'])}
+    return result
+
+
+def test_warm_sandbox_output_matches_a_fresh_interpreter(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_enable_code_exec', True)
+    monkeypatch.setattr(settings, 'agentora_sandbox_pool_size', 1)
+    pool = SandboxPool()
+    pool.start(wait=True)
+    snippets = [
+        "import sys\nprint('out')\nprint('err', file=sys.stderr)",
+        "raise ValueError('boom')",
+        "def broken(:\n    pass",
+        "import sys\nsys.exit(3)",
+        "print(__name__, __file__.endswith('snippet.py'))",
+        "import atexit\natexit.register(lambda: print('bye'))",
+        "print('x' * 5000)",
+        "while True:\n    pass",
+    ]
+    try:
+        for code in snippets:
+            assert _normalized(pool.execute(code, 1)) == _normalized(_run_cold(code, 1)), code
+        # State never leaks between snippets: each one runs in a fresh child.
+        pool.execute('leaked = 1', 1)
+        assert 'NameError' in pool.execute('print(leaked)', 1)['stderr']
+        denied = pool.execute("import socket\nsocket.socket()", 1)
+        assert denied['code'] == 1 and 'network access is disabled' in denied['stderr']
+        # The hook would not follow a child process, so starting one is refused too.
+        for escape in ("import subprocess\nsubprocess.run(['true'])", "import os\nos.system('true')", "import os\nos.fork()", "import ctypes"):
+            refused = pool.execute(escape, 1)
+            assert refused['code'] == 1 and 'disabled in the sandbox' in refused['stderr'], escape
+        # Each snippet gets its own scratch directory, removed once it finishes.
+        first = pool.execute("import os\nopen('left.txt', 'w').write('x')\nprint(os.getcwd())", 1)['stdout'].strip()
+        assert not os.path.exists(first)
+        assert pool.execute("import os\nprint(os.path.exists('left.txt'))", 1)['stdout'] == 'False\n'
+        assert pool.stats()['spawned'] == 1 and pool.stats()['cold_runs'] == 0
+    finally:
+        pool.stop()
+
+
+def test_sandboxes_are_recycled_after_max_executions_and_crashes(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_enable_code_exec', True)
+    monkeypatch.setattr(settings, 'agentora_sandbox_pool_size', 1)
+    monkeypatch.setattr(settings, 'agentora_sandbox_max_executions', 3)
+    pool = SandboxPool()
+    try:
+        for _ in range(4):
+            assert pool.execute("print('ok')", 2)['stdout'] == 'ok\n'
+        assert pool.stats()['recycled'] == 1
+
+        crashed = pool.execute('import os, signal\nos.kill(os.getppid(), signal.SIGKILL)', 2)
+        assert crashed == {'ok': False, 'error': 'sandbox_crashed'}
+        assert pool.stats()['crashed'] == 1
+        deadline = time.monotonic() + 5
+        while pool.stats()['idle'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert pool.execute('print(2 + 2)', 2)['stdout'] == '4\n'
+        assert pool.stats()['live'] == 1
+    finally:
+        pool.stop()
+
+
+def test_a_disabled_install_never_forks_a_sandbox(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_enable_code_exec', False)
+    monkeypatch.setattr(settings, 'agentora_sandbox_pool_size', 2)
+    pool = SandboxPool()
+    pool.start(wait=True)
+    assert pool.execute("print('ok')", 2) is None
+    assert pool.run_cold("print('ok')", 2)['stdout'] == 'ok\n'
+    stats = pool.stats()
+    assert stats['enabled'] is False and stats['spawned'] == 0 and stats['live'] == 0 and stats['cold_runs'] == 1
@@ -0,0 +1,37 @@
+from app.db import create_db_and_tables, engine, upgrade_schema
+from app.services.runtime.query_plans import explain_hot_queries
+
+from .conftest import make_client
+
+
+def _indexes() -> set[str]:
+    with engine.connect() as conn:
+        return {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+
+
+def test_upgrade_recreates_missing_indexes_idempotently():
+    create_db_and_tables()
+    assert {'ix_capsule_run_id', 'ix_memoryedge_from_to_type', 'ix_watcherevent_run_created', 'ix_integrationrun_watch_updated'} <= _indexes()
+    with engine.connect() as conn:
+        conn.exec_driver_sql('DROP INDEX ix_capsule_run_id')
+        conn.exec_driver_sql('DROP INDEX ix_memoryedge_from_to_type')
+        conn.commit()
+    report = upgrade_schema()
+    assert set(report['indexes_created']) == {'ix_capsule_run_id', 'ix_memoryedge_from_to_type'}
+    assert upgrade_schema() == {'columns_added': [], 'indexes_created': []}
+
+
+def test_hot_queries_avoid_full_table_scans():
+    create_db_and_tables()
+    report = explain_hot_queries()
+    assert report['supported'] and report['ok'], report['full_scans']
+    plans = {q['name']: q for q in report['queries']}
+    assert any('ix_capsule_run_id' in d for d in plans['retrieval_candidates']['plan'])
+    assert not any(q['temp_sort'] for q in report['queries'])
+
+
+def test_query_plan_endpoint_reports_queries():
+    client = make_client()
+    body = client.get('/api/system/query-plans').json()
+    assert body['ok'] is True
+    assert {'run_trace', 'graph_neighbors', 'worker_jobs_queued'} <= {q['name'] for q in body['queries']}
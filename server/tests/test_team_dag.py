@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import AgentHandoff, Agent, Run, RunTrace, Team, TeamAgent, TeamPlan, TeamSubgoal
+from app.services.orchestration.engine import OrchestrationEngine
+from app.services.runtime.loop import runtime_loop
+from app.services.runtime.trace import decode_payload
+
+PROMPT = 'Plan and build then verify the release notes'
+
+
+class _FakeResult:
+    tool_calls_count = 0
+    stop_reason = 'completed'
+    warnings: list = []
+    worker_used = False
+    model_used = ['mock-mini']
+
+    def __init__(self, text: str):
+        self.final_text = text
+
+
+def _seed_fanout_team(session: Session) -> Run:
+    roles = [('Planner', 'planner'), ('Writer', 'executor'), ('Researcher', 'researcher'), ('Coder', 'coder'), ('Critic', 'critic'), ('Synth', 'synthesizer')]
+    agents = [Agent(name=name, model='mock-mini', role=role, system_prompt=role, tools_json='[]') for name, role in roles]
+    team = Team(name='FanoutTeam', description='team', mode='fanout', yaml_text='')
+    session.add_all(agents + [team])
+    session.commit()
+    for pos, agent in enumerate(agents):
+        session.add(TeamAgent(team_id=team.id, agent_id=agent.id, position=pos))
+    run = Run(team_id=team.id, status='running', mode='fanout', max_turns=6, max_seconds=60, token_budget=3000, consensus_threshold=1)
+    session.add(run)
+    session.commit()
+    session.refresh(run)
+    return run
+
+
+def _subgoals(session: Session, run_id: int) -> list[TeamSubgoal]:
+    plan = session.exec(select(TeamPlan).where(TeamPlan.run_id == run_id).order_by(TeamPlan.id.desc())).first()
+    return list(session.exec(select(TeamSubgoal).where(TeamSubgoal.plan_id == plan.id).order_by(TeamSubgoal.id)))
+
+
+def _trace(session: Session, run_id: int, event_type: str) -> list[dict]:
+    rows = session.exec(select(RunTrace).where(RunTrace.run_id == run_id, RunTrace.event_type == event_type).order_by(RunTrace.id))
+    return [decode_payload(r) for r in rows]
+
+
+def test_fanout_subgoals_run_in_parallel_under_the_llm_cap(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_team_llm_concurrency', 2)
+    monkeypatch.setattr(settings, 'agentora_team_fanout_width', 3)
+    create_db_and_tables()
+    active = {'now': 0, 'peak': 0}
+    finished: list[str] = []
+
+    async def fake_run_agent(session, run_id, agent, prompt, image_paths=None, max_steps=None):
+        active['now'] += 1
+        active['peak'] = max(active['peak'], active['now'])
+        await asyncio.sleep(0.2)
+        active['now'] -= 1
+        finished.append(agent.role)
+        return _FakeResult(f'{agent.role} output')
+
+    monkeypatch.setattr(runtime_loop, 'run_agent', fake_run_agent)
+    with Session(engine) as session:
+        run = _seed_fanout_team(session)
+        started = time.perf_counter()
+        asyncio.run(OrchestrationEngine().execute(session, run, PROMPT, False))
+        elapsed = time.perf_counter() - started
+
+        subgoals = _subgoals(session, run.id)
+        titles = [sg.title for sg in subgoals]
+        assert titles == ['Plan approach', 'Execute part 1 of 3', 'Execute part 2 of 3', 'Execute part 3 of 3', 'Critique draft', 'Synthesize final']
+        deps = [json.loads(sg.dependency_subgoal_ids_json) for sg in subgoals]
+        assert deps == [[], [0], [0], [0], [1, 2, 3], [4]]
+        assert len({sg.assigned_agent_id for sg in subgoals[1:4]}) == 3
+        assert all(sg.status == 'done' for sg in subgoals)
+
+        # Six 0.2s steps: plan, three parts two at a time, critique, synthesis -> five rounds instead of six.
+        assert active['peak'] == 2
+        assert elapsed < 1.15
+        assert finished[0] == 'planner' and finished[-2:] == ['critic', 'synthesizer']
+        summary = _trace(session, run.id, 'team_schedule_summary')[-1]
+        assert summary['max_parallel'] == 2 and summary['completed'] == 6
+        assert session.get(Run, run.id).status == 'completed'
+
+
+def test_dag_stops_launching_at_the_handoff_limit(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_max_handoffs', 2)
+    monkeypatch.setattr(settings, 'agentora_team_llm_concurrency', 3)
+    create_db_and_tables()
+
+    async def fake_run_agent(session, run_id, agent, prompt, image_paths=None, max_steps=None):
+        await asyncio.sleep(0.01)
+        return _FakeResult(f'{agent.role} output')
+
+    monkeypatch.setattr(runtime_loop, 'run_agent', fake_run_agent)
+    with Session(engine) as session:
+        run = _seed_fanout_team(session)
+        asyncio.run(OrchestrationEngine().execute(session, run, PROMPT, False))
+
+        handoffs = list(session.exec(select(AgentHandoff).where(AgentHandoff.run_id == run.id)))
+        assert len(handoffs) == 2 and all(h.status != 'pending' for h in handoffs)
+        assert _trace(session, run.id, 'handoff_escalated')[0]['reason'] == 'max_handoffs_reached'
+        statuses = [sg.status for sg in _subgoals(session, run.id)]
+        assert statuses.count('done') == 3 and statuses[-1] == 'pending'
+        assert session.get(Run, run.id).status == 'completed'
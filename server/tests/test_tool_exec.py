@@ -0,0 +1,171 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import Agent, RunTrace, ToolCall
+from app.services.runtime.loop import runtime_loop
+from app.services.runtime.schemas import ToolInvocation
+from app.services.runtime.tool_exec import ToolExecutor
+from app.services.runtime.trace import decode_payload
+from app.services.tools.registry import ToolSpec, registry
+
+
+def test_executor_limits_orders_times_out_and_skips(monkeypatch):
+    monkeypatch.setitem(registry._tools, 'python_exec', ToolSpec('python_exec', {}, 'sandbox:exec', lambda: None, max_concurrency=2))
+    monkeypatch.setitem(registry._tools, 'http_fetch', ToolSpec('http_fetch', {}, 'network:http', lambda: None, timeout_seconds=0.1))
+    active = {'now': 0, 'peak': 0}
+    ran: list[int] = []
+
+    async def invoke(idx, call):
+        ran.append(idx)
+        if call.name == 'local_files_write' and call.args.get('fail'):
+            raise RuntimeError('disk full')
+        sandboxed = call.name == 'python_exec'
+        active['now'] += sandboxed
+        active['peak'] = max(active['peak'], active['now'])
+        await asyncio.sleep(call.args.get('sleep', 0.05))
+        active['now'] -= sandboxed
+        return {'ok': True, 'idx': idx}
+
+    calls = [ToolInvocation(name='python_exec') for _ in range(4)]
+    calls += [
+        ToolInvocation(name='http_fetch', args={'sleep': 1.0}),
+        ToolInvocation(name='local_files_write', args={'fail': True}),
+        ToolInvocation(name='local_files_read'),
+        ToolInvocation(name='notes_append', args={'sleep': 0.0}, ordered=True),
+    ]
+    executor = ToolExecutor()
+    assert executor.dependencies(calls)[6] == [5] and executor.dependencies(calls)[7] == list(range(7))
+    outcomes = asyncio.run(executor.run(calls, invoke))
+
+    assert [o.index for o in outcomes] == list(range(8))
+    assert active['peak'] == 2
+    assert all(o.result['ok'] for o in outcomes[:4])
+    assert outcomes[4].timed_out and outcomes[4].result['error'] == 'tool timeout'
+    assert isinstance(outcomes[5].error, RuntimeError)
+    # The read shares state with the failed write, and the ordered call follows every failure.
+    assert outcomes[6].skipped and outcomes[7].skipped and 6 not in ran and 7 not in ran
+    assert executor.stats()['timeouts'] == 1 and executor.stats()['skipped'] == 2
+
+
+def test_timed_out_thread_keeps_its_slot_until_it_returns(monkeypatch):
+    monkeypatch.setitem(registry._tools, 'http_fetch', ToolSpec('http_fetch', {}, 'network:http', lambda: None, max_concurrency=1, timeout_seconds=0.05))
+    threads: list[int] = []
+
+    def blocking_fetch() -> dict:
+        threads.append(threading.get_ident())
+        time.sleep(0.3 if len(threads) == 1 else 0.0)
+        return {'ok': True}
+
+    async def invoke(idx, call):
+        return await asyncio.get_running_loop().run_in_executor(None, blocking_fetch)
+
+    executor = ToolExecutor()
+
+    async def main():
+        first = await executor.run([ToolInvocation(name='http_fetch')], invoke)
+        overrun = executor.stats()
+        started = time.perf_counter()
+        second = await executor.run([ToolInvocation(name='http_fetch')], invoke)
+        return first, overrun, second, time.perf_counter() - started
+
+    first, overrun, second, waited = asyncio.run(main())
+    assert first[0].timed_out and overrun['running_by_tool'] == {'http_fetch': 1} and overrun['overrunning'] == 1
+    # The next call only starts once the timed-out thread has returned.
+    assert second[0].result == {'ok': True} and waited >= 0.15
+    assert executor.stats()['running_by_tool'] == {} and executor.stats()['overrunning'] == 0
+
+
+def test_calls_wait_for_their_tool_without_holding_a_step_slot_across_loops(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_tool_max_parallel', 1)
+    monkeypatch.setitem(registry._tools, 'python_exec', ToolSpec('python_exec', {}, 'sandbox:exec', lambda: None, max_concurrency=1))
+    executor = ToolExecutor()
+    release = threading.Event()
+    order: list[str] = []
+
+    async def invoke(idx, call):
+        order.append(call.name)
+        if call.name == 'python_exec' and len(order) == 1:
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+        return {'ok': True}
+
+    # Another run on its own loop holds the only python_exec slot.
+    holder = threading.Thread(target=lambda: asyncio.run(executor.run([ToolInvocation(name='python_exec')], invoke)))
+    holder.start()
+    while executor.stats()['running_by_tool'] != {'python_exec': 1}:
+        time.sleep(0.005)
+
+    async def main():
+        calls = [ToolInvocation(name='python_exec'), ToolInvocation(name='local_files_read')]
+        pending = asyncio.ensure_future(executor.run(calls, invoke))
+        while 'local_files_read' not in order:
+            await asyncio.sleep(0.01)
+        # The queued call is parked, not polling, and the unrelated call used the lone step slot.
+        waiting = executor.stats()['waiting_by_tool']
+        release.set()
+        return waiting, await asyncio.wait_for(pending, 5)
+
+    waiting, outcomes = asyncio.run(main())
+    holder.join(5)
+    assert waiting == {'python_exec': 1}
+    assert order == ['python_exec', 'local_files_read', 'python_exec']
+    assert all(o.result == {'ok': True} for o in outcomes)
+    assert executor.stats()['running_by_tool'] == {} and executor.stats()['waiting_by_tool'] == {}
+
+
+def test_run_agent_runs_independent_tools_concurrently_and_records_in_order(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setattr(settings, 'agentora_file_write_root', 'server/data/artifacts')
+    run_id = 980000 + uuid.uuid4().int % 10000
+
+    def slow_fetch(url: str) -> dict:
+        time.sleep(0.3)
+        return {'ok': True, 'url': url}
+
+    async def fake_chat_structured(*args, **kwargs):
+        return {
+            'thought': 'fetch three pages and keep notes',
+            'need_memory': False,
+            'memory_queries': [],
+            'tool_calls': [
+                {'name': 'http_fetch', 'args': {'url': 'http://a.invalid'}},
+                {'name': 'local_files_write', 'args': {'path': 'draft.md', 'content': 'hello'}},
+                {'name': 'http_fetch', 'args': {'url': 'http://b.invalid'}},
+                {'name': 'local_files_read', 'args': {'path': 'draft.md'}},
+                {'name': 'http_fetch', 'args': {'url': 'http://c.invalid'}},
+            ],
+            'final': 'fetched',
+            'handoff': '',
+            'done': True,
+        }
+
+    monkeypatch.setitem(registry._tools, 'http_fetch', ToolSpec('http_fetch', {'url': 'string'}, 'network:http', slow_fetch, max_concurrency=4))
+    monkeypatch.setattr(runtime_loop.client, 'chat_structured', fake_chat_structured)
+    with Session(engine) as session:
+        agent = Agent(name='Gatherer', model='mock-mini', role='researcher', system_prompt='gather', tools_json='["http_fetch", "local_files_write", "local_files_read"]')
+        session.add(agent)
+        session.commit()
+        session.refresh(agent)
+        started = time.perf_counter()
+        result = asyncio.run(runtime_loop.run_agent(session, run_id=run_id, agent=agent, prompt='gather sources'))
+        elapsed = time.perf_counter() - started
+        session.commit()
+
+        assert result.tool_calls_count == 5 and result.stop_reason == 'completed'
+        assert elapsed < 0.75
+        rows = list(session.exec(select(ToolCall).where(ToolCall.run_id == run_id).order_by(ToolCall.id)))
+        assert [r.tool_name for r in rows] == ['http_fetch', 'local_files_write', 'http_fetch', 'local_files_read', 'http_fetch']
+        assert [json.loads(r.result_json).get('url') for r in rows if r.tool_name == 'http_fetch'] == ['http://a.invalid', 'http://b.invalid', 'http://c.invalid']
+        assert json.loads(rows[3].result_json)['content'] == 'hello'
+
+        traces = list(session.exec(select(RunTrace).where(RunTrace.run_id == run_id).order_by(RunTrace.id)))
+        results = [decode_payload(t)['tool'] for t in traces if t.event_type == 'tool_result']
+        assert results == [r.tool_name for r in rows]
+        batch = next(decode_payload(t) for t in traces if t.event_type == 'tool_batch')
+        assert batch['calls'] == 5 and batch['serial_ms'] > batch['wall_ms']
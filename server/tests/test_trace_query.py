@@ -0,0 +1,77 @@
+import json
+
+from sqlmodel import Session
+
+from app.db import create_db_and_tables, engine
+from app.models import Run
+from app.services.runtime.team import collaboration_trace, record_collaboration_metrics
+from app.services.runtime.trace import add_trace, count_run_events, get_run_trace, run_trace_page
+
+from .conftest import make_client
+
+
+def _traced_run() -> int:
+    create_db_and_tables()
+    with Session(engine) as session:
+        run = Run(team_id=1, status='completed')
+        session.add(run)
+        session.commit()
+        session.refresh(run)
+        for step in range(7):
+            add_trace(session, run.id, 'tool_call', {'step': step})
+            add_trace(session, run.id, 'tool_result', {'step': step, 'result': {'ok': step != 3}})
+        add_trace(session, run.id, 'subgoal_assigned', {'subgoal': 1})
+        add_trace(session, run.id, 'subgoal_completed', {'subgoal': 1})
+        add_trace(session, run.id, 'worker_route_selected', {'job_id': 1})
+        add_trace(session, run.id, 'warning', {'message': 'slow'})
+        session.commit()
+        return run.id
+
+
+def test_cursor_pages_filters_and_counts():
+    run_id = _traced_run()
+    with Session(engine) as session:
+        full = get_run_trace(session, run_id)
+        assert len(full) == 18
+
+        walked, cursor = [], 0
+        while cursor is not None:
+            page, cursor = run_trace_page(session, run_id, after_id=cursor, limit=5)
+            assert len(page) <= 5
+            walked.extend(page)
+        assert walked == full
+
+        results, cursor = run_trace_page(session, run_id, ['tool_result'], limit=3)
+        assert [t['payload']['step'] for t in results] == [0, 1, 2] and cursor == results[-1]['id']
+        assert [t['event_type'] for t in get_run_trace(session, run_id, ['warning', 'subgoal_completed'])] == ['subgoal_completed', 'warning']
+        assert get_run_trace(session, run_id, []) == []
+
+        assert count_run_events(session, run_id) == {'tool_call': 7, 'tool_result': 7, 'subgoal_assigned': 1, 'subgoal_completed': 1, 'worker_route_selected': 1, 'warning': 1}
+        assert count_run_events(session, run_id, ['warning', 'agent_handoff']) == {'warning': 1}
+
+        metric = record_collaboration_metrics(session, run_id)
+        assert metric.plan_execution_consistency == 1.0 and metric.worker_route_success_rate == 1.0 and metric.no_progress_terminations == 1
+        assert [t['event_type'] for t in collaboration_trace(session, run_id)] == ['subgoal_assigned', 'subgoal_completed', 'worker_route_selected']
+
+
+def test_trace_endpoints_page_stream_and_count():
+    run_id = _traced_run()
+    client = make_client()
+    whole = client.get(f'/api/runs/{run_id}/trace').json()
+    assert len(whole['trace']) == 18 and 'next_after_id' not in whole
+
+    first = client.get(f'/api/runs/{run_id}/trace', params={'limit': 10}).json()
+    second = client.get(f'/api/runs/{run_id}/trace', params={'limit': 10, 'after_id': first['next_after_id']}).json()
+    assert first['trace'] + second['trace'] == whole['trace'] and second['next_after_id'] is None
+
+    filtered = client.get(f'/api/runs/{run_id}/trace', params=[('event_type', 'tool_call'), ('event_type', 'warning')]).json()['trace']
+    assert {t['event_type'] for t in filtered} == {'tool_call', 'warning'} and len(filtered) == 8
+
+    streamed = client.get(f'/api/runs/{run_id}/trace/ndjson', params={'event_type': 'tool_result', 'after_id': whole['trace'][3]['id']})
+    assert streamed.headers['content-type'].startswith('application/x-ndjson')
+    lines = [json.loads(line) for line in streamed.text.splitlines()]
+    assert [t['payload']['step'] for t in lines] == [2, 3, 4, 5, 6]
+
+    counts = client.get(f'/api/runs/{run_id}/trace/counts').json()
+    assert counts['total'] == 18 and counts['counts']['tool_result'] == 7
+    assert client.get('/api/runs/999999999/trace/ndjson').status_code == 404
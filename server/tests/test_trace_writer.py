@@ -0,0 +1,112 @@
+import json
+import uuid
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import RunTrace
+from app.services.runtime.trace import add_trace, decode_payload, get_run_trace, trace_writer
+
+from .conftest import make_client
+
+
+def _run_id() -> int:
+    return 800000 + uuid.uuid4().int % 100000
+
+
+def _rows(run_id: int) -> list[RunTrace]:
+    with Session(engine) as session:
+        return list(session.exec(select(RunTrace).where(RunTrace.run_id == run_id).order_by(RunTrace.id)))
+
+
+def test_events_are_buffered_until_commit_and_discarded_on_rollback():
+    create_db_and_tables()
+    run_id = _run_id()
+    with Session(engine) as session:
+        add_trace(session, run_id, 'tool_call', {'step': 0, 'tool': 'http_fetch'}, agent_id=3)
+        add_trace(session, run_id, 'tool_result', {'step': 0, 'tool': 'http_fetch', 'result': {'ok': True}}, agent_id=3)
+        assert trace_writer.pending(session) == 2 and _rows(run_id) == []
+        session.commit()
+        assert trace_writer.pending(session) == 0
+
+        add_trace(session, run_id, 'warning', {'message': 'never written'})
+        session.rollback()
+        assert trace_writer.pending(session) == 0
+
+        # Reading the trace writes what this session still holds.
+        add_trace(session, run_id, 'final_answer', {'final_text': 'done'})
+        trace = get_run_trace(session, run_id)
+        session.commit()
+    assert [t['event_type'] for t in trace] == ['tool_call', 'tool_result', 'final_answer']
+    assert set(trace[0]) == {'id', 'run_id', 'agent_id', 'event_type', 'payload', 'created_at'}
+    assert trace[0]['agent_id'] == 3 and trace[1]['payload'] == {'step': 0, 'tool': 'http_fetch', 'result': {'ok': True}}
+    assert decode_payload(_rows(run_id)[0]) == {'step': 0, 'tool': 'http_fetch'}
+
+
+def test_a_full_buffer_is_marked_due_instead_of_written_inline(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_trace_buffer_events', 3)
+    create_db_and_tables()
+    run_id = _run_id()
+    with Session(engine) as session:
+        for step in range(4):
+            add_trace(session, run_id, 'tool_call', {'step': step})
+        assert trace_writer.due(session) and trace_writer.pending(session) == 4 and _rows(run_id) == []
+        session.commit()
+        assert not trace_writer.due(session)
+    assert len(_rows(run_id)) == 4
+
+
+def test_payloads_are_captured_when_recorded_not_when_flushed():
+    create_db_and_tables()
+    run_id = _run_id()
+    payload = {'step': 0, 'items': [1, 2]}
+    with Session(engine) as session:
+        add_trace(session, run_id, 'tool_result', payload)
+        # The caller goes on to reuse its dict before the step commits.
+        payload['step'] = 1
+        payload['items'].append(3)
+        session.commit()
+    assert decode_payload(_rows(run_id)[0]) == {'step': 0, 'items': [1, 2]}
+
+
+def test_level_and_sampling_decide_what_is_kept(monkeypatch):
+    create_db_and_tables()
+    run_id = _run_id()
+    monkeypatch.setattr(settings, 'agentora_trace_level', 'info')
+    monkeypatch.setattr(settings, 'agentora_trace_sample_rates', 'tool_call=0.25,warning=0.0,bogus')
+    with Session(engine) as session:
+        add_trace(session, run_id, 'retrieval_score_breakdown', {'step': 0, 'items': []})
+        for step in range(8):
+            add_trace(session, run_id, 'tool_call', {'step': step})
+        add_trace(session, run_id, 'warning', {'message': 'kept regardless of sampling'})
+        session.commit()
+    rows = _rows(run_id)
+    assert [r.event_type for r in rows].count('retrieval_score_breakdown') == 0
+    assert [r.event_type for r in rows].count('tool_call') == 2
+    assert rows[-1].event_type == 'warning'
+    assert trace_writer.stats()['sample_rates'] == {'tool_call': 0.25, 'warning': 0.0}
+
+
+def test_large_payloads_are_compressed_and_oversized_ones_truncated(monkeypatch):
+    create_db_and_tables()
+    run_id = _run_id()
+    monkeypatch.setattr(settings, 'agentora_trace_compress_bytes', 512)
+    monkeypatch.setattr(settings, 'agentora_trace_max_payload_bytes', 4096)
+    big = {'step': 1, 'tool': 'python_exec', 'result': {'stdout': 'line\n' * 1000}}
+    medium = {'step': 2, 'items': [{'capsule_id': i, 'layer': 'L1'} for i in range(40)]}
+    with Session(engine) as session:
+        add_trace(session, run_id, 'tool_result', big)
+        add_trace(session, run_id, 'retrieval_score_breakdown', medium)
+        session.commit()
+    rows = _rows(run_id)
+    assert rows[1].payload_json == '' and rows[1].payload_blob is not None and len(rows[1].payload_blob) < len(json.dumps(medium))
+    with Session(engine) as session:
+        trace = get_run_trace(session, run_id)
+    assert trace[1]['payload'] == medium
+    truncated = trace[0]['payload']
+    assert truncated['truncated'] is True and truncated['original_bytes'] > 4096
+    assert (truncated['step'], truncated['tool']) == (1, 'python_exec') and 'result' not in truncated
+
+    stats = make_client().get('/api/system/traces').json()['traces']
+    assert stats['truncated'] >= 1 and stats['compressed'] >= 1 and stats['bytes_stored'] < stats['bytes_raw']
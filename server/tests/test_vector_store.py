@@ -0,0 +1,53 @@
+import uuid
+
+from sqlmodel import Session, select
+
+from app.db import create_db_and_tables, engine, migrate_capsule_embedding_vectors
+from app.models import Capsule, CapsuleEmbedding
+from app.services.runtime.capsules import search_capsules_sync
+from app.services.runtime.vectors import cosine_scores, embedding_vector, normalize_vector, pack_vector, top_k_cosine, unpack_vector
+
+
+def test_packed_vectors_are_normalized_float32():
+    packed = pack_vector([3.0, 4.0])
+    vec = unpack_vector(packed)
+    assert len(packed) == 8
+    assert abs(float(vec[0]) - 0.6) < 1e-6
+    assert abs(float(vec[1]) - 0.8) < 1e-6
+    assert unpack_vector(pack_vector([0.0, 0.0])).tolist() == [0.0, 0.0]
+
+
+def test_cosine_scores_and_top_k_match_legacy_semantics():
+    vectors = [normalize_vector([1.0, 0.0, 0.0]), normalize_vector([0.0, 1.0, 0.0]), normalize_vector([1.0, 1.0]), normalize_vector([])]
+    scores = cosine_scores([1.0, 0.0, 0.0], vectors)
+    assert abs(float(scores[0]) - 1.0) < 1e-6
+    assert abs(float(scores[1])) < 1e-6
+    assert abs(float(scores[2]) - 0.70710677) < 1e-5
+    assert float(scores[3]) == 0.0
+    top = top_k_cosine([1.0, 0.0, 0.0], [11, 12, 13, 14], vectors, k=2)
+    assert [cid for cid, _ in top] == [11, 13]
+
+
+def test_migration_packs_legacy_json_vectors_in_place():
+    create_db_and_tables()
+    # The test database persists between runs; a fresh run id keeps earlier capsules out of the search.
+    run_id = 9_000_000 + uuid.uuid4().int % 1_000_000
+    with Session(engine) as session:
+        cap = Capsule(run_id=run_id, source='unit', text='legacy json embedding', memory_layer='L2_SESSION')
+        session.add(cap)
+        session.commit()
+        session.refresh(cap)
+        session.add(CapsuleEmbedding(capsule_id=cap.id, vector_json='[0.0,2.0,0.0]'))
+        session.commit()
+
+        assert migrate_capsule_embedding_vectors() >= 1
+        session.expire_all()
+        emb = session.exec(select(CapsuleEmbedding).where(CapsuleEmbedding.capsule_id == cap.id)).first()
+        assert emb.vector_blob
+        assert emb.vector_dim == 3
+        assert emb.vector_json == '[]'
+        assert embedding_vector(emb).tolist() == [0.0, 1.0, 0.0]
+
+        items = search_capsules_sync(session, query_vector=[0.0, 1.0, 0.0], run_id=run_id, top_k=1, query='legacy')
+        assert items[0]['capsule_id'] == cap.id
+        assert items[0]['score_breakdown']['semantic'] > 0.99
@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import WorkerJob
+from app.services.http_pool import http_pool
+from app.services.runtime.worker_queue import worker_queue
+from app.services.runtime.worker_runtime import WorkerRuntime
+from app.services.tools.registry import registry
+
+from .conftest import make_client
+
+
+def test_jobs_are_claimed_by_priority_and_expired_leases_requeued(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_worker_retry_backoff_seconds', 0.0)
+    create_db_and_tables()
+    job_type = f'lease_probe_{uuid.uuid4().hex[:8]}'
+    with Session(engine) as session:
+        node = worker_queue.register(session, 'lease-node', f'pull://lease-{job_type}', [job_type])
+        low = worker_queue.dispatch(session, job_type, {'n': 1}, priority=7, wait=False)
+        high = worker_queue.dispatch(session, job_type, {'n': 2}, priority=2, wait=False)
+        assert low.status == high.status == 'queued'
+
+        first = worker_queue.claim(session, node.id, max_jobs=1, lease_seconds=0.05)
+        assert [j.id for j in first] == [high.id] and first[0].status == 'leased'
+        stale_token = first[0].lease_token
+        time.sleep(0.1)
+        assert worker_queue.extend_lease(session, high.id, stale_token, lease_seconds=0.05) is not None
+
+        time.sleep(0.1)
+        assert worker_queue.requeue_expired(session) >= 1
+        session.refresh(high)
+        assert high.status == 'queued' and high.retries == 1 and high.error == 'lease_expired'
+        # The node that let the lease lapse is no longer the job's preferred node.
+        assert high.worker_node_id is None
+        # The worker that lost the lease can neither heartbeat nor report.
+        assert worker_queue.extend_lease(session, high.id, stale_token) is None
+        assert worker_queue.complete(session, high.id, stale_token, ok=True, result={'late': True}) is None
+
+        again = worker_queue.claim(session, node.id, max_jobs=5)
+        assert [j.id for j in again] == [high.id, low.id]
+        assert again[0].lease_token != stale_token
+        done = worker_queue.complete(session, high.id, again[0].lease_token, ok=True, result={'value': 2})
+        assert done.status == 'done' and json.loads(done.result_json) == {'value': 2}
+        failed = worker_queue.complete(session, low.id, again[1].lease_token, ok=False, error='boom')
+        assert failed.status == 'queued' and failed.retries == 1 and failed.worker_node_id is None
+        retry = worker_queue.claim(session, node.id, max_jobs=1)
+        assert [j.id for j in retry] == [low.id]
+        worker_queue.complete(session, low.id, retry[0].lease_token, ok=True)
+        worker_queue.heartbeat(session, node.id, 'offline')
+        assert worker_queue.stats(session)['by_status'].get('done', 0) >= 2
+
+
+def test_claim_skips_jobs_it_cannot_run_and_unclaimed_jobs_expire(monkeypatch):
+    # A configured worker that never registers: jobs for it wait in the queue.
+    monkeypatch.setattr(settings, 'agentora_worker_urls', 'http://never-registers.invalid')
+    create_db_and_tables()
+    tag = uuid.uuid4().hex[:8]
+    runnable, orphan = f'claim_probe_{tag}', f'orphan_probe_{tag}'
+    with Session(engine) as session:
+        node = worker_queue.register(session, 'claim-node', f'pull://claim-{tag}', [runnable])
+        # More unrunnable jobs ahead of it than the claim's scan window holds.
+        orphans = [worker_queue.dispatch(session, orphan, {'n': n}, priority=1, wait=False) for n in range(25)]
+        wanted = worker_queue.dispatch(session, runnable, {}, priority=9, wait=False)
+        got = worker_queue.claim(session, node.id, max_jobs=1)
+        assert [j.id for j in got] == [wanted.id]
+        worker_queue.complete(session, wanted.id, got[0].lease_token, ok=True)
+
+        monkeypatch.setattr(settings, 'agentora_worker_queued_ttl_seconds', 0.05)
+        time.sleep(0.1)
+        before = worker_queue.stats(session)['unclaimed']
+        assert worker_queue.expire_unclaimed(session) >= len(orphans)
+        for job in orphans:
+            session.refresh(job)
+            assert job.status == 'failed' and job.error == 'unclaimed'
+        assert worker_queue.stats(session)['unclaimed'] >= before + len(orphans)
+        worker_queue.heartbeat(session, node.id, 'offline')
+
+
+def test_waiting_dispatch_falls_back_at_once_when_no_live_node_can_claim(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_worker_urls', 'http://never-registers.invalid')
+    monkeypatch.setattr(settings, 'agentora_worker_wait_seconds', 30.0)
+    create_db_and_tables()
+    tag = uuid.uuid4().hex[:8]
+    with Session(engine) as session:
+        node = worker_queue.register(session, 'other-node', f'pull://other-{tag}', [f'other_probe_{tag}'])
+        started = time.perf_counter()
+        job = worker_queue.dispatch(session, f'lonely_probe_{tag}', {}, wait=True)
+        assert job.status == 'fallback_local' and json.loads(job.result_json)['reason'] == 'no_worker_available'
+        assert time.perf_counter() - started < 1.0
+        worker_queue.heartbeat(session, node.id, 'offline')
+
+
+def test_worker_applies_the_runs_allowed_tools_and_its_policy(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_enable_code_exec', True)
+    runtime = WorkerRuntime()
+    code = {'args': {'python_code': 'print(1)'}}
+    assert runtime.execute('python_exec', code) == {'ok': False, 'error': 'tool not allowed'}
+    assert runtime.execute('python_exec', {**code, 'allowed_tools': ['python_exec']})['stdout'] == '1\n'
+    assert runtime.execute('long_tool_job', {'tool_name': 'python_exec', 'params': {'python_code': 'print(1)'}}) == {'ok': False, 'error': 'tool not allowed'}
+    monkeypatch.setattr(type(registry), 'allowed_by_policy', lambda self, name: False)
+    assert runtime.execute('python_exec', {**code, 'allowed_tools': ['python_exec']}) == {'ok': False, 'error': 'tool blocked by policy'}
+    assert runtime.execute('long_tool_job', {'tool_name': 'browser_open_url', 'params': {'url': 'http://example.com'}}) == {'ok': False, 'error': 'tool blocked by policy'}
+
+
+def test_awaiting_dispatch_gets_the_result_from_a_pulling_worker(monkeypatch):
+    client = make_client()
+    monkeypatch.setattr(settings, 'agentora_enable_code_exec', True)
+    monkeypatch.setattr(settings, 'agentora_worker_hub_url', 'http://testserver')
+    monkeypatch.setattr(settings, 'agentora_worker_name', f'pull-test-{uuid.uuid4().hex[:8]}')
+    monkeypatch.setattr(settings, 'agentora_worker_capabilities', 'python_exec')
+    monkeypatch.setattr(settings, 'agentora_worker_lease_seconds', 2.0)
+    monkeypatch.setattr(http_pool, 'sync_client', lambda name: client)
+    runtime = WorkerRuntime()
+    runtime.register()
+    stop = threading.Event()
+
+    def pull() -> None:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            while not stop.is_set():
+                if not runtime.poll_once(pool):
+                    stop.wait(0.05)
+
+    puller = threading.Thread(target=pull, daemon=True)
+    puller.start()
+    try:
+        with Session(engine) as session:
+            job = worker_queue.dispatch(session, 'python_exec', {'args': {'python_code': 'print(6 * 7)'}, 'allowed_tools': ['python_exec']}, priority=3)
+        assert job.status == 'done' and not job.used_fallback_local
+        assert json.loads(job.result_json)['stdout'] == '42\n'
+
+        queued = client.post('/api/workers/dispatch', json={'job_type': 'python_exec', 'payload': {'args': {'python_code': 'print(1)'}, 'allowed_tools': ['python_exec']}, 'priority': 3, 'wait': False}).json()['job']
+        assert queued['status'] == 'queued'
+        deadline = time.monotonic() + 10
+        while client.get(f"/api/workers/jobs/{queued['id']}").json()['job']['status'] != 'done' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert client.get(f"/api/workers/jobs/{queued['id']}").json()['job']['status'] == 'done'
+    finally:
+        stop.set()
+        puller.join(timeout=5)
+        with Session(engine) as session:
+            worker_queue.heartbeat(session, runtime.worker_id, 'offline')
+    with Session(engine) as session:
+        assert session.get(WorkerJob, job.id).worker_node_id == runtime.worker_id
+    assert runtime.job(job.id)['status'] == 'done' and runtime.stats()['executed'] >= 2
+    assert client.post(f"/api/workers/jobs/{queued['id']}/complete", json={'lease_token': 'stale'}).status_code == 409
+    assert client.get('/api/workers/queue').json()['queue']['completed'] >= 2
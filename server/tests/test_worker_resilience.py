@@ -0,0 +1,143 @@
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import WorkerJob
+from app.services.runtime import worker_queue as worker_queue_module
+from app.services.runtime.trace import get_run_trace
+from app.services.runtime.worker_queue import WorkerQueue
+
+
+def _events(session: Session, run_id: int, event_type: str) -> list[dict]:
+    return [t['payload'] for t in get_run_trace(session, run_id) if t['event_type'] == event_type]
+
+
+def test_breaker_opens_then_lets_one_probe_through_before_closing(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setattr(settings, 'agentora_worker_breaker_failures', 1)
+    monkeypatch.setattr(settings, 'agentora_worker_breaker_cooldown_seconds', 60.0)
+    monkeypatch.setattr(settings, 'agentora_worker_retry_backoff_seconds', 0.0)
+    job_type = f'breaker_probe_{uuid.uuid4().hex[:8]}'
+    run_id = 900000 + uuid.uuid4().int % 100000
+    q = WorkerQueue()
+    with Session(engine) as session:
+        node = q.register(session, 'breaker-node', f'pull://breaker-{job_type}', [job_type])
+        first = q.dispatch(session, job_type, {'run_id': run_id}, priority=3, wait=False)
+        leased = q.claim(session, node.id)
+        assert [j.id for j in leased] == [first.id]
+        q.complete(session, first.id, leased[0].lease_token, ok=False, error='http 500')
+        assert _events(session, run_id, 'worker_breaker')[-1]['to'] == 'open'
+        # Open: the retried job waits even though this is the only node.
+        assert q.claim(session, node.id) == []
+
+        monkeypatch.setattr(settings, 'agentora_worker_breaker_cooldown_seconds', 0.0)
+        second = q.dispatch(session, job_type, {'run_id': run_id}, priority=3, wait=False)
+        probe = q.claim(session, node.id, max_jobs=5)
+        assert [j.id for j in probe] == [first.id]
+        assert {n['id']: n for n in q.routing(session)}[node.id]['breaker'] == 'half_open'
+        assert q.claim(session, node.id, max_jobs=5) == []
+
+        q.complete(session, first.id, probe[0].lease_token, ok=True, result={'probe': True})
+        transition = _events(session, run_id, 'worker_breaker')[-1]
+        assert (transition['from'], transition['to'], transition['worker_id']) == ('half_open', 'closed', node.id)
+        rest = q.claim(session, node.id, max_jobs=5)
+        assert [j.id for j in rest] == [second.id]
+        q.complete(session, second.id, rest[0].lease_token, ok=True)
+        q.heartbeat(session, node.id, 'offline')
+    assert [(t['from'], t['to']) for t in q.nodes.breaker_history()] == [('closed', 'open'), ('open', 'half_open'), ('half_open', 'closed')]
+
+
+def test_failed_job_backs_off_and_retries_on_another_node(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setattr(settings, 'agentora_worker_retry_backoff_seconds', 5.0)
+    monkeypatch.setattr(worker_queue_module.random, 'uniform', lambda low, high: high)
+    job_type = f'backoff_probe_{uuid.uuid4().hex[:8]}'
+    run_id = 900000 + uuid.uuid4().int % 100000
+    q = WorkerQueue()
+    with Session(engine) as session:
+        a = q.register(session, 'backoff-a', f'pull://a-{job_type}', [job_type])
+        b = q.register(session, 'backoff-b', f'pull://b-{job_type}', [job_type])
+        job = q.dispatch(session, job_type, {'run_id': run_id}, priority=3, wait=False)
+        assert job.worker_node_id == a.id
+        leased = q.claim(session, a.id)
+        q.complete(session, job.id, leased[0].lease_token, ok=False, error='http 503')
+        session.refresh(job)
+        assert job.status == 'queued' and job.retries == 1 and job.worker_node_id == b.id
+        assert job.available_at > datetime.utcnow() + timedelta(seconds=4)
+        retry = _events(session, run_id, 'worker_retry_scheduled')[-1]
+        assert retry['backoff_ms'] == 5000.0 and retry['failed_worker_id'] == a.id and retry['next_worker_id'] == b.id
+        assert q.claim(session, b.id) == []
+
+        # Backoff over: the failing node keeps its hands off while the other one has first claim.
+        session.execute(update(WorkerJob).where(WorkerJob.id == job.id).values(available_at=datetime.utcnow() - timedelta(milliseconds=10)))
+        session.commit()
+        assert q.claim(session, a.id) == []
+        taken = q.claim(session, b.id)
+        assert [j.id for j in taken] == [job.id]
+        q.complete(session, job.id, taken[0].lease_token, ok=True)
+        q.heartbeat(session, a.id, 'offline')
+        q.heartbeat(session, b.id, 'offline')
+
+
+def test_straggler_is_hedged_and_first_answer_wins(monkeypatch):
+    create_db_and_tables()
+    monkeypatch.setattr(settings, 'agentora_worker_hedge_enabled', True)
+    monkeypatch.setattr(settings, 'agentora_worker_hedge_percentile', 95.0)
+    monkeypatch.setattr(settings, 'agentora_worker_affinity_seconds', 60.0)
+    job_type = f'hedge_probe_{uuid.uuid4().hex[:8]}'
+    run_id = 900000 + uuid.uuid4().int % 100000
+    q = WorkerQueue()
+    with Session(engine) as session:
+        a = q.register(session, 'hedge-a', f'pull://a-{job_type}', [job_type])
+        b = q.register(session, 'hedge-b', f'pull://b-{job_type}', [job_type])
+        for _ in range(5):
+            q.nodes.started(b.id, False)
+            q.nodes.finished(b.id, job_type, False, 5.0, ok=True)
+        q.nodes.assign(b.id, False, +2)  # keep the originals on node a
+        monkeypatch.setattr(worker_queue_module, 'HEDGEABLE_TASKS', frozenset({job_type}))
+
+        slow = q.dispatch(session, job_type, {'run_id': run_id, 'n': 1}, priority=3, wait=False)
+        original = q.claim(session, a.id)
+        assert [j.id for j in original] == [slow.id]
+        time.sleep(0.03)
+        # Past the p95 of 5ms: a hedge is queued for node b, which node a may not take.
+        assert q.claim(session, a.id) == []
+        hedge = q.claim(session, b.id)
+        assert len(hedge) == 1 and hedge[0].hedge_of == slow.id
+        q.complete(session, hedge[0].id, hedge[0].lease_token, ok=True, result={'who': 'hedge'})
+        session.refresh(slow)
+        assert slow.status == 'done' and json.loads(slow.result_json) == {'who': 'hedge'} and slow.worker_node_id == b.id
+        assert q.complete(session, slow.id, original[0].lease_token, ok=True, result={'who': 'original'}) is None
+        assert _events(session, run_id, 'worker_hedge_started')[-1]['hedge_job_id'] == hedge[0].id
+        assert _events(session, run_id, 'worker_hedge_won')[-1]['slow_worker_id'] == a.id
+
+        # This time the original answers first and its hedge is cancelled.
+        fast = q.dispatch(session, job_type, {'run_id': run_id, 'n': 2}, priority=3, wait=False)
+        original = q.claim(session, a.id)
+        time.sleep(0.03)
+        hedge = q.claim(session, b.id)
+        assert len(hedge) == 1 and hedge[0].hedge_of == fast.id
+        assert q.complete(session, fast.id, original[0].lease_token, ok=True, result={'who': 'original'}).status == 'done'
+        assert session.get(WorkerJob, hedge[0].id).status == 'cancelled'
+        assert q.complete(session, hedge[0].id, hedge[0].lease_token, ok=True) is None
+        stats = q.stats(session)
+        assert stats['hedges'] == 2 and stats['hedge_wins'] == 1 and stats['cancelled'] == 1
+
+        # A type outside the idempotent allowlist is never run twice.
+        monkeypatch.setattr(worker_queue_module, 'HEDGEABLE_TASKS', frozenset({'embed_batch', 'web_fetch'}))
+        unsafe = q.dispatch(session, job_type, {'run_id': run_id, 'n': 3}, priority=3, wait=False)
+        holder, other = (a, b) if unsafe.worker_node_id == a.id else (b, a)
+        original = q.claim(session, holder.id)
+        assert [j.id for j in original] == [unsafe.id]
+        time.sleep(0.03)
+        assert q.claim(session, other.id) == []
+        q.complete(session, unsafe.id, original[0].lease_token, ok=True)
+        assert q.stats(session)['hedges'] == 2
+        q.heartbeat(session, a.id, 'offline')
+        q.heartbeat(session, b.id, 'offline')
@@ -1,17 +1,26 @@
+import json
+import uuid
+from datetime import datetime
+
 from sqlmodel import Session
 
+from app.core.config import settings
 from app.db import engine
 from app.models import WorkerNode
 from app.services.runtime.worker_queue import WorkerQueue
+from app.services.runtime.worker_registry import WorkerRegistry
 
 
-def test_worker_routing_prefers_heavy_capability():
+def test_worker_routing_prefers_heavy_capability(monkeypatch):
+    monkeypatch.setattr(settings, 'agentora_worker_wait_seconds', 0.2)
     with Session(engine) as session:
         q = WorkerQueue()
         w1 = q.register(session, 'heavy-node', 'http://127.0.0.1:9991', ['memory_maintenance', 'embed_batch'])
         w2 = q.register(session, 'light-node', 'http://127.0.0.1:9992', ['interactive_chat'])
-        # force timeout/fallback locally in test env but ensure route attempt is valid
+        # no worker pulls in the test env, so the awaited job falls back locally
         job = q.dispatch(session, 'memory_maintenance', {'run_id': 555}, priority=3)
+        for node in (w1, w2):
+            q.heartbeat(session, node.id, 'offline')
         assert job.status in {'running', 'done', 'fallback_local'}
 
 
@@ -21,3 +30,66 @@ def test_interactive_task_stays_local_guardrail():
         q.register(session, 'chat-node', 'http://127.0.0.1:9993', ['interactive_chat'])
         job = q.dispatch(session, 'interactive_chat', {'run_id': 556}, priority=8)
         assert job.status == 'fallback_local'
+
+
+def _node(node_id: int, caps: list[str]) -> WorkerNode:
+    return WorkerNode(id=node_id, name=f'node-{node_id}', url=f'pull://node-{node_id}', capabilities_json=json.dumps(caps), status='idle', last_seen_at=datetime.utcnow())
+
+
+def test_registry_picks_best_expected_completion_and_spreads_heavy_jobs(monkeypatch):
+    reg = WorkerRegistry()
+    reg.upsert(_node(1, ['python_exec', 'embed_batch']))
+    reg.upsert(_node(2, ['python_exec', 'embed_batch']))
+    for _ in range(3):
+        for node_id, latency in ((1, 100.0), (2, 400.0)):
+            reg.started(node_id, False)
+            reg.finished(node_id, 'python_exec', False, latency, ok=True)
+    assert reg.pick('python_exec', 'python_exec', False)[0].id == 1
+    # Four jobs waiting on the fast node make the slow idle one the quicker finish.
+    for _ in range(4):
+        reg.assign(1, False, +1)
+    assert reg.pick('python_exec', 'python_exec', False)[0].id == 2
+
+    reg = WorkerRegistry()
+    reg.upsert(_node(1, ['embed_batch']))
+    reg.upsert(_node(2, ['embed_batch']))
+    reg.assign(1, True, +1)
+    reg.assign(2, False, +1)
+    assert reg.pick('embed_batch', 'embed_batch', True)[0].id == 2
+    assert reg.pick('embed_batch', 'python_exec', False)[0].id == 1
+
+    monkeypatch.setattr(settings, 'agentora_worker_breaker_failures', 3)
+    for _ in range(3):
+        reg.started(1, True)
+        reg.finished(1, 'embed_batch', True, 50.0, ok=False)
+    state = {n['id']: n for n in reg.snapshot()}[1]
+    assert state['breaker'] == 'open' and state['error_rate'] > 0.5 and state['inflight'] == 0
+    assert [n.id for n in reg.candidates('embed_batch')] == [2]
+    monkeypatch.setattr(settings, 'agentora_worker_breaker_cooldown_seconds', 0.0)
+    # Half-open after the cooldown, but the job already waiting on it is its one probe.
+    assert not reg.routable(1) and {n['id']: n for n in reg.snapshot()}[1]['breaker'] == 'half_open'
+    reg.assign(1, True, -1)
+    assert reg.routable(1)
+
+
+def test_preferred_node_gets_first_claim_then_others_may_steal(monkeypatch):
+    job_type = f'affinity_probe_{uuid.uuid4().hex[:8]}'
+    with Session(engine) as session:
+        q = WorkerQueue()
+        a = q.register(session, 'node-a', f'pull://a-{job_type}', [job_type])
+        b = q.register(session, 'node-b', f'pull://b-{job_type}', [job_type])
+        job = q.dispatch(session, job_type, {}, priority=3, wait=False)
+        assert job.worker_node_id == a.id
+        assert {n['id']: n for n in q.routing(session)}[a.id]['assigned'] == 1
+
+        assert q.claim(session, b.id) == []
+        monkeypatch.setattr(settings, 'agentora_worker_affinity_seconds', 0.0)
+        stolen = q.claim(session, b.id)
+        assert [j.id for j in stolen] == [job.id] and stolen[0].worker_node_id == b.id
+        q.complete(session, job.id, stolen[0].lease_token, ok=True)
+
+        nodes = {n['id']: n for n in q.routing(session)}
+        assert nodes[a.id]['assigned'] == 0 and nodes[b.id]['inflight'] == 0
+        assert nodes[b.id]['completed'] == 1 and nodes[b.id]['latency_by_type'][job_type] >= 0
+        for node in (a, b):
+            q.heartbeat(session, node.id, 'offline')
@@ -0,0 +1,162 @@
+from uuid import uuid4
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import create_db_and_tables, engine
+from app.models import Capsule, CapsuleEmbedding, MemoryCapsuleState, MemoryEdge, MemoryUsefulnessMetric
+from app.services.runtime import bookkeeping
+from app.services.runtime.bookkeeping import retrieval_bookkeeping
+from app.services.runtime.layers import layered_retrieval
+from app.services.runtime.write_behind import memory_write_behind
+
+
+def _seed(session: Session, run_id: int, count: int) -> list[int]:
+    caps = [Capsule(run_id=run_id, source='unit', text=f'{run_id} note {i}', memory_layer='L1_SHORT', project_key=f'run:{run_id}', session_key=f'run:{run_id}') for i in range(count)]
+    session.add_all(caps)
+    session.commit()
+    session.add_all([CapsuleEmbedding(capsule_id=c.id, vector_json=f'[1.0,{0.05 * i:.2f},0.0]') for i, c in enumerate(caps)])
+    session.commit()
+    return [c.id for c in caps]
+
+
+def _admissions(session: Session, run_id: int, rounds: int) -> list[list[tuple[int, float]]]:
+    out = []
+    for _ in range(rounds):
+        result = layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='note', run_id=run_id, top_k=6)
+        out.append([(item['capsule_id'] - min(x['capsule_id'] for x in result['items']), item['score_breakdown']['access_frequency']) for item in result['items']])
+    return out
+
+
+def test_repeated_retrievals_coalesce_into_one_write_per_row():
+    create_db_and_tables()
+    memory_write_behind.flush()
+    run_id = 920000 + uuid4().int % 30000
+    with Session(engine) as session:
+        ids = _seed(session, run_id, 3)
+        before = memory_write_behind.stats()
+        for _ in range(5):
+            layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='note', run_id=run_id, top_k=6)
+        memory_write_behind.record_usefulness(ids, ids[:1], helped_final_answer=True)
+        memory_write_behind.record_usefulness(ids, ids[:1], helped_final_answer=True)
+        after = memory_write_behind.stats()
+        # 5 rounds x (3 admissions + 3 edges) + 6 usefulness events land on at most 3 + 6 + 3 rows.
+        assert after['enqueued'] - before['enqueued'] == 5 * 6 + 6
+        assert after['pending'] <= 3 + 6 + 3
+        assert after['coalesced'] - before['coalesced'] == after['enqueued'] - before['enqueued'] - after['pending']
+
+        flushed = memory_write_behind.flush()
+        assert flushed['rows_written'] > 0
+        session.expire_all()
+        caps = session.exec(select(Capsule).where(Capsule.id.in_(ids))).all()
+        assert all(c.retrieval_count == 5 for c in caps)
+        assert [c.success_count for c in sorted(caps, key=lambda c: c.id)] == [2, 0, 0]
+        states = session.exec(select(MemoryCapsuleState).where(MemoryCapsuleState.capsule_id.in_(ids))).all()
+        assert sorted(s.usage_count for s in states) == [5, 5, 5]
+        edges = session.exec(select(MemoryEdge).where(MemoryEdge.from_capsule_id.in_(ids))).all()
+        assert sum(e.usage_count for e in edges) == 5 * 3
+        metrics = session.exec(select(MemoryUsefulnessMetric).where(MemoryUsefulnessMetric.capsule_id.in_(ids))).all()
+        assert sorted(m.retrieved_count for m in metrics) == [2, 2, 2]
+
+
+def test_admission_matches_inline_writes(monkeypatch):
+    create_db_and_tables()
+    memory_write_behind.flush()
+    inline_run = 950000 + uuid4().int % 30000
+    deferred_run = inline_run + 1
+    with Session(engine) as session:
+        _seed(session, inline_run, 10)
+        _seed(session, deferred_run, 10)
+        monkeypatch.setattr(settings, 'agentora_memory_write_behind_enabled', False)
+        inline = _admissions(session, inline_run, 6)
+        monkeypatch.setattr(settings, 'agentora_memory_write_behind_enabled', True)
+        deferred = _admissions(session, deferred_run, 6)
+        assert memory_write_behind.stats()['pending'] > 0
+        memory_write_behind.flush()
+    assert deferred == inline
+
+
+def test_writer_thread_flushes_on_interval_and_drains_on_stop(monkeypatch):
+    create_db_and_tables()
+    memory_write_behind.flush()
+    monkeypatch.setattr(settings, 'agentora_memory_write_behind_interval_ms', 20)
+    run_id = 980000 + uuid4().int % 10000
+    with Session(engine) as session:
+        ids = _seed(session, run_id, 2)
+        memory_write_behind.start()
+        try:
+            layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='note', run_id=run_id, top_k=6)
+            for _ in range(100):
+                if not memory_write_behind.stats()['pending']:
+                    break
+                memory_write_behind._stop.wait(0.02)
+            assert memory_write_behind.stats()['pending'] == 0
+            memory_write_behind.record_edges([(ids[0], ids[1])], edge_type='unit')
+        finally:
+            memory_write_behind.stop()
+        assert not memory_write_behind.running
+        assert session.exec(select(MemoryEdge).where(MemoryEdge.from_capsule_id == ids[0], MemoryEdge.edge_type == 'unit')).first()
+
+
+def test_failed_background_flushes_are_counted_then_dropped(monkeypatch, caplog):
+    create_db_and_tables()
+    memory_write_behind.flush()
+    run_id = 990000 + uuid4().int % 9000
+    with Session(engine) as session:
+        ids = _seed(session, run_id, 2)
+        # Retrieval never writes queued usefulness itself; that is the writer thread's job.
+        memory_write_behind.record_usefulness(ids, ids[:1])
+        layered_retrieval(session, query_vector=[1.0, 0.0, 0.0], query='note', run_id=run_id, top_k=6)
+        assert memory_write_behind.has_pending_usefulness(ids)
+
+    def broken(session, batch):
+        raise RuntimeError('disk full')
+
+    before = memory_write_behind.stats()
+    monkeypatch.setattr(memory_write_behind, '_write', broken)
+    monkeypatch.setattr(settings, 'agentora_memory_write_behind_interval_ms', 20)
+    monkeypatch.setattr(settings, 'agentora_memory_write_behind_max_retries', 2)
+    memory_write_behind.start()
+    try:
+        for _ in range(100):
+            if memory_write_behind.stats()['dropped'] > before['dropped']:
+                break
+            memory_write_behind._stop.wait(0.02)
+    finally:
+        memory_write_behind._stop.set()
+        memory_write_behind._wake.set()
+        memory_write_behind._thread.join(timeout=5.0)
+        memory_write_behind._thread = None
+    after = memory_write_behind.stats()
+    assert after['dropped'] > before['dropped'] and after['errors'] >= before['errors'] + 2
+    assert after['pending'] == 0 and after['consecutive_failures'] == 0
+    assert 'disk full' in caplog.text and 'dropped' in caplog.text
+
+
+def test_failed_bookkeeping_keeps_its_ids_and_is_not_a_write_behind_failure(monkeypatch, caplog):
+    create_db_and_tables()
+    memory_write_behind.flush()
+    run_id = 990000 + uuid4().int % 9000
+    with Session(engine) as session:
+        ids = _seed(session, run_id, 2)
+    memory_write_behind.record_usefulness(ids, ids[:1])
+    retrieval_bookkeeping.defer(ids, run_id)
+
+    def broken(session, run_id):
+        raise RuntimeError('conflict scan failed')
+
+    monkeypatch.setattr(bookkeeping, 'detect_conflicts_for_run', broken)
+    before, kept = memory_write_behind.stats(), retrieval_bookkeeping.stats()
+    result = memory_write_behind.flush()
+    assert result['bookkeeping_failed'] and result['rows_written'] >= 1
+    after = memory_write_behind.stats()
+    assert after['errors'] == before['errors'] and after['consecutive_failures'] == 0
+    assert not memory_write_behind.has_pending_usefulness(ids)
+    stats = retrieval_bookkeeping.stats()
+    assert stats['errors'] == kept['errors'] + 1
+    assert stats['pending_capsules'] >= 2 and stats['pending_runs'] >= 1
+    assert 'conflict scan failed' in caplog.text
+
+    monkeypatch.undo()
+    assert memory_write_behind.flush()['runs_scanned'] >= 1
+    assert retrieval_bookkeeping.stats()['pending_runs'] == 0